@@ -0,0 +1,240 @@
+"""
+Receiving many UDP flows with a single trigger.
+All examples are guaranteed to work with Python 2.7 and above
+
+A trigger per flow is the simplest way to count the received frames of every
+flow, but with thousands of flows it means thousands of triggers to create,
+refresh and evaluate on the server.
+
+An AggregatedReceiver groups the flows towards the same destination (a
+ByteBlower port and IP address) under a single trigger, its BPF filter
+matches the UDP destination ports of all flows.  The trigger counts the
+received frames of all flows together, exactly.
+
+The breakdown per flow comes from a capture with the same filter.  The
+capture is restarted every time it is sampled, so the samples are spread
+over the test.  The received frames of a flow are estimated as its share of
+the sampled frames times the frames counted by the trigger:
+
+    rx(flow) = rx(trigger) * sampled(flow) / sampled(all flows)
+
+When the capture saw every frame, the breakdown is exact.  Otherwise the
+standard error of the estimate is reported along.  The flows are told apart
+by their UDP destination port, which is not changed by a NAT gateway.
+
+Usage:
+    receiver = AggregatedReceiver(rx_port, ['ip dst 10.1.0.2'])
+    receiver.add_flow('flow 1', 4097)
+    receiver.add_flow('flow 2', 4098)
+    receiver.create()
+    ...start the traffic...
+    while running:
+        ...refresh the results...
+        receiver.sample()
+    receiver.sample()
+    breakdown = receiver.breakdown()
+"""
+from __future__ import division
+from __future__ import print_function
+
+import math
+from collections import defaultdict
+
+
+def udp_destination_port(data):
+    """The UDP destination port of an Ethernet frame, None when it is not
+    a UDP frame
+
+    Much faster than dissecting the frame with scapy, which matters for the
+    thousands of frames of a capture.
+
+    :param data: the frame
+    :type data: bytearray
+    """
+    offset = 12
+    ethertype = (data[offset] << 8) | data[offset + 1]
+    # VLAN tags
+    while ethertype in (0x8100, 0x88a8):
+        offset += 4
+        ethertype = (data[offset] << 8) | data[offset + 1]
+    offset += 2
+    if ethertype == 0x0800:
+        protocol = data[offset + 9]
+        offset += (data[offset] & 0x0f) * 4
+    elif ethertype == 0x86dd:
+        protocol = data[offset + 6]
+        offset += 40
+    else:
+        return None
+    if protocol != 17 or len(data) < offset + 4:
+        return None
+    return (data[offset + 2] << 8) | data[offset + 3]
+
+
+def port_filter(ports):
+    """BPF expression matching the UDP destination ports
+
+    Consecutive ports are merged into a portrange, which keeps the filter
+    short for the usual numbering of the flows.
+    """
+    ports = sorted(set(ports))
+    ranges = []
+    for port in ports:
+        if ranges and ranges[-1][1] == port - 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+
+    elements = []
+    for first, last in ranges:
+        if first == last:
+            elements.append("udp dst port %d" % first)
+        else:
+            elements.append("udp dst portrange %d-%d" % (first, last))
+    if len(elements) == 1:
+        return elements[0]
+    return "(" + " or ".join(elements) + ")"
+
+
+class AggregatedReceiver(object):
+    """A single trigger for the flows towards a destination
+
+    :param port: The receiving ByteBlower port
+    :param filter_elements: BPF elements which select the destination, e.g.
+                            ['vlan 2', 'ip dst 10.1.0.2'].  The UDP ports
+                            are added by the receiver.
+    :param sampling: Whether to sample the frames with a capture for the
+                     breakdown per flow.
+    """
+
+    def __init__(self, port, filter_elements, sampling=True):
+        self.port = port
+        self.filter_elements = list(filter_elements)
+        self.sampling = sampling
+        # UDP destination port -> name of the flow
+        self.flows = {}
+        self.trigger = None
+        self.capture = None
+        # Sampled frames per UDP destination port
+        self.sampled = defaultdict(int)
+        self.sample_size = 0
+
+    def add_flow(self, name, udp_port):
+        """Adds a flow, must be done before create()
+
+        :param udp_port: The UDP destination port of the flow, as received
+        """
+        if udp_port in self.flows:
+            raise ValueError("Flows %s and %s have the same UDP destination "
+                             "port %d" % (self.flows[udp_port], name, udp_port))
+        self.flows[udp_port] = name
+
+    def bpf_filter(self):
+        return ' and '.join(self.filter_elements + [port_filter(self.flows)])
+
+    def create(self):
+        """Creates the trigger (and capture) for all added flows"""
+        bpf_filter = self.bpf_filter()
+        self.trigger = self.port.RxTriggerBasicAdd()
+        self.trigger.FilterSet(bpf_filter)
+        if self.sampling:
+            self._start_capture()
+
+    def _start_capture(self):
+        self.capture = self.port.RxCaptureBasicAdd()
+        self.capture.FilterSet(self.bpf_filter())
+        self.capture.Start()
+
+    def get_results_to_refresh(self):
+        return [self.trigger.ResultGet(), self.trigger.ResultHistoryGet()]
+
+    def reset_results(self):
+        """Clears the trigger and restarts the sampling"""
+        self.trigger.ResultClear()
+        self.sampled.clear()
+        self.sample_size = 0
+        if self.capture is not None:
+            self.capture.Stop()
+            self.port.RxCaptureBasicRemove(self.capture)
+            self._start_capture()
+
+    def sample(self):
+        """Adds the frames captured since the last sample, and restarts
+        the capture
+
+        Sampling often spreads the samples over the test, the capture buffer
+        on the server is limited.
+
+        :return: the number of new samples
+        """
+        if self.capture is None:
+            return 0
+        self.capture.Stop()
+        result = self.capture.ResultGet()
+        result.Refresh()
+        new = 0
+        for frame in result.FramesGet():
+            udp_port = udp_destination_port(bytearray(frame.BufferGet()))
+            if udp_port in self.flows:
+                self.sampled[udp_port] += 1
+                new += 1
+        self.sample_size += new
+        self.port.RxCaptureBasicRemove(self.capture)
+        self._start_capture()
+        return new
+
+    def share(self, udp_port):
+        """The fraction of the received frames which belong to the flow,
+        None without samples"""
+        if not self.sample_size:
+            return None
+        return self.sampled[udp_port] / self.sample_size
+
+    def received(self, udp_port, total=None, interval=False):
+        """Estimates the received frames of a flow
+
+        :param total: The frames received by the trigger, by default its
+                      cumulative result.
+        :param interval: `total` is the result of a single interval.  The
+                         samples are not kept per interval, the share of the
+                         flow over all samples is applied to the interval,
+                         so its breakdown is never exact.
+        :return: tuple (frames, standard error), the error is 0 when the
+                 capture saw every frame
+        """
+        if total is None:
+            total = self.trigger.ResultGet().PacketCountGet()
+        share = self.share(udp_port)
+        if share is None:
+            # Without samples, the frames are spread evenly
+            share = 1 / len(self.flows)
+        if not interval and self.sample_size >= total:
+            return int(round(total * share)), 0.0
+        error = total * math.sqrt(share * (1 - share) / self.sample_size) \
+            if self.sample_size else float(total)
+        return int(round(total * share)), error
+
+    def breakdown(self):
+        """The received frames per flow
+
+        :return: dict name -> {'rx_frames', 'rx_frames_error', 'sampled'}
+        """
+        total = self.trigger.ResultGet().PacketCountGet()
+        results = {}
+        for udp_port, name in self.flows.items():
+            frames, error = self.received(udp_port, total)
+            results[name] = {
+                'rx_frames': frames,
+                'rx_frames_error': error,
+                'sampled': self.sampled[udp_port],
+            }
+        return results
+
+    def destroy(self):
+        if self.capture is not None:
+            self.capture.Stop()
+            self.port.RxCaptureBasicRemove(self.capture)
+            self.capture = None
+        if self.trigger is not None:
+            self.port.RxTriggerBasicRemove(self.trigger)
+            self.trigger = None
@@ -0,0 +1,297 @@
+"""
+Online change-point detection on interval results.
+All examples are guaranteed to work with Python 2.7 and above
+
+Long (soak) tests produce long interval series.  Instead of searching the
+charts for the moment the throughput collapsed or the latency jumped, the
+detectors below flag those moments while the samples arrive.
+
+PageHinkley runs a two-sided Page-Hinkley (CUSUM) test:
+  - bootstrap: the first `warmup` samples estimate the mean and the
+    standard deviation of the series,
+  - the cumulative deviation from that mean is followed upwards and
+    downwards.  When it exceeds `threshold` standard deviations, a change
+    is detected.  The detector bootstraps again on the new level, after
+    which the change point is reported with its old and new level.
+
+The memory used does not depend on the length of the series.
+
+Usage:
+    detector = ChangeDetector(['throughput', 'latency'])
+    for sample in samples:
+        for change in detector.add(sample['timestamp'], sample):
+            print(describe_change(change))
+    detector.flush()
+
+LiveChangeDetector follows a result history while the test runs: every
+poll() feeds the new intervals to the detector and prints the changes as
+soon as they are known.
+
+    live = LiveChangeDetector(history, ['throughput'], convert)
+    while running:
+        history.Refresh()
+        live.poll()
+    history.Refresh()
+    live.finish()
+"""
+from __future__ import division
+from __future__ import print_function
+
+import datetime
+
+from history_manager import DrainedHistory
+from rolling_stats import Welford
+
+
+class PageHinkley(object):
+    """Two-sided Page-Hinkley test on a single series
+
+    :param warmup: Number of samples to estimate the level of the series
+    :param drift: Tolerated deviation from the mean, in standard deviations.
+                  Noise smaller than this does not accumulate.
+    :param threshold: Cumulative deviation which flags a change,
+                      in standard deviations
+    :param min_relative_change: Changes smaller than this fraction of the
+                                mean are ignored, this protects series with
+                                (almost) no noise.
+    """
+
+    def __init__(self, warmup=10, drift=1.0, threshold=8.0,
+                 min_relative_change=0.05):
+        self.warmup = warmup
+        self.drift = drift
+        self.threshold = threshold
+        self.min_relative_change = min_relative_change
+        self.reset()
+
+    def reset(self):
+        self.bootstrap = Welford()
+        self.mean = None
+        self.sigma = None
+        self.pending = None
+
+        # Cumulative deviation upwards and downwards, and the sample at
+        # which it started to grow: the start of the change.
+        self.up = 0.0
+        self.down = 0.0
+        self.up_start = None
+        self.down_start = None
+
+    def _start(self):
+        """Ends the bootstrap, the level of the series is known"""
+        self.mean = self.bootstrap.mean
+        self.sigma = max(self.bootstrap.stddev,
+                         abs(self.mean) * self.min_relative_change / self.threshold,
+                         1e-12)
+
+    def add(self, timestamp, value):
+        """Processes the next sample
+
+        A change is reported once the new level is known, `warmup` samples
+        after it was detected.
+
+        :return: a change point dict, or None.  The change point contains
+                 'timestamp' (start of the change), 'detected_at',
+                 'direction' ('up' or 'down'), 'before' and 'after' (the
+                 mean level) and 'severity' (the shift in standard
+                 deviations of the old level).
+        """
+        if self.mean is None:
+            self.bootstrap.add(value)
+            if self.bootstrap.count >= self.warmup:
+                self._start()
+                return self._finish_pending()
+            return None
+
+        deviation = (value - self.mean) / self.sigma
+
+        # The sample which makes the cumulative sum positive, starts the
+        # candidate change.
+        if self.up == 0.0:
+            self.up_start = timestamp
+        if self.down == 0.0:
+            self.down_start = timestamp
+        self.up = max(0.0, self.up + deviation - self.drift)
+        self.down = max(0.0, self.down - deviation - self.drift)
+
+        if self.up > self.threshold:
+            start, direction = self.up_start, 'up'
+        elif self.down > self.threshold:
+            start, direction = self.down_start, 'down'
+        else:
+            return None
+
+        pending = {
+            'timestamp': start,
+            'detected_at': timestamp,
+            'direction': direction,
+            'before': self.mean,
+            'sigma': self.sigma,
+        }
+
+        # Learn the new level, the change is complete afterwards
+        self.reset()
+        self.pending = pending
+        self.bootstrap.add(value)
+        return None
+
+    def flush(self):
+        """Reports a change which is still learning its new level
+
+        Call this at the end of the series.
+        """
+        if self.pending is None or self.bootstrap.count == 0:
+            return None
+        self.mean = self.bootstrap.mean
+        return self._finish_pending()
+
+    def _finish_pending(self):
+        change, self.pending = self.pending, None
+        if change is None:
+            return None
+        sigma = change.pop('sigma')
+        change['after'] = self.mean
+        change['severity'] = abs(self.mean - change['before']) / sigma
+        return change
+
+
+class ChangeDetector(object):
+    """Runs a PageHinkley detector on multiple metrics of a sample
+
+    :param metrics: Names of the metrics (keys of the samples) to follow
+    :param kwargs: Settings of the PageHinkley detectors
+    """
+
+    def __init__(self, metrics, **kwargs):
+        self.detectors = dict((metric, PageHinkley(**kwargs))
+                              for metric in metrics)
+        self.change_points = []
+
+    def add(self, timestamp, sample):
+        """Processes a sample, a dict with at least the followed metrics
+
+        :return: the change points flagged by this sample
+        """
+        changes = []
+        for metric, detector in sorted(self.detectors.items()):
+            value = sample.get(metric)
+            if value is None:
+                continue
+            change = detector.add(timestamp, value)
+            if change is not None:
+                change['metric'] = metric
+                changes.append(change)
+        self.change_points.extend(changes)
+        return changes
+
+    def flush(self):
+        """Reports the changes which are still pending, at the end of
+        the series
+
+        :return: the change points flagged by the flush
+        """
+        changes = []
+        for metric, detector in sorted(self.detectors.items()):
+            change = detector.flush()
+            if change is not None:
+                change['metric'] = metric
+                changes.append(change)
+        self.change_points.extend(changes)
+        return changes
+
+
+class LiveChangeDetector(object):
+    """Detects changes in the intervals of a result history while the test
+    runs
+
+    :param history: The result history, the caller refreshes it
+    :param metrics: Names of the metrics (keys of the samples) to follow
+    :param convert: function(interval) -> dict with the sample to keep, with
+                    at least the timestamp and the followed metrics
+    :param timestamp_key: Key of the timestamp in the samples
+    :param kwargs: Settings of the PageHinkley detectors
+    """
+
+    def __init__(self, history, metrics, convert, timestamp_key='timestamp',
+                 **kwargs):
+        self.timestamp_key = timestamp_key
+        self.history = DrainedHistory('live', history,
+                                      history.SamplingIntervalDurationGet(),
+                                      None, convert)
+        self.detector = ChangeDetector(metrics, **kwargs)
+
+    @property
+    def samples(self):
+        return self.history.samples
+
+    @property
+    def change_points(self):
+        return self.detector.change_points
+
+    def poll(self):
+        """Processes the intervals which are new since the previous poll
+
+        :return: the change points flagged by the new intervals
+        """
+        new = self.history.drain()
+        changes = []
+        for sample in self.samples[len(self.samples) - new:]:
+            changes.extend(self.detector.add(sample[self.timestamp_key],
+                                             sample))
+        self.report(changes)
+        return changes
+
+    def finish(self):
+        """Processes the last intervals and the pending changes, after the
+        test
+
+        :return: the change points flagged by the last intervals
+        """
+        changes = self.poll()
+        flushed = self.detector.flush()
+        self.report(flushed)
+        return changes + flushed
+
+    def report(self, changes):
+        start = self.samples[0][self.timestamp_key] if self.samples else None
+        for change in changes:
+            print("Change detected at", describe_change(change, start))
+
+
+def detect(samples, timestamp_key, metrics, **kwargs):
+    """Change points in a list of samples (dicts), oldest first"""
+    detector = ChangeDetector(metrics, **kwargs)
+    for sample in samples:
+        detector.add(sample[timestamp_key], sample)
+    detector.flush()
+    return sorted(detector.change_points, key=lambda change: change['timestamp'])
+
+
+def describe_change(change, start_timestamp=None):
+    """Human readable description of a change point
+
+    :param start_timestamp: When given, the time of the change is printed
+                            relative to it, otherwise as date (timestamps
+                            in nanoseconds since the epoch).
+    """
+    if start_timestamp is not None:
+        moment = "%.1fs" % ((change['timestamp'] - start_timestamp) / 1e9)
+    else:
+        moment = str(datetime.datetime.fromtimestamp(change['timestamp'] / 1e9))
+    return "%s: %s went %s from %.6g to %.6g (severity %.1f)" % (
+        moment, change['metric'], change['direction'],
+        change['before'], change['after'], change['severity'])
+
+
+def plot_lines(changes, to_x):
+    """Highcharts xAxis plotLines marking the change points
+
+    :param to_x: function which converts a timestamp to the x value
+    """
+    return [{
+        'value': to_x(change['timestamp']),
+        'color': '#EC008C' if change['direction'] == 'down' else '#F7941C',
+        'width': 2,
+        'dashStyle': 'Dash',
+        'label': {'text': '%s %s' % (change['metric'], change['direction'])},
+    } for change in changes]
@@ -0,0 +1,228 @@
+"""
+Loss, throughput and fairness of many flows at once.
+All examples are guaranteed to work with Python 2.7 and above
+
+The FlowMatrix keeps the counters of all flows in arrays, one row per flow:
+  - collect() reads the TX and RX counters of every flow, cumulative or of
+    the latest interval,
+  - the loss and throughput of all flows follow from array operations,
+  - flows are grouped by labels (e.g. the direction, VLAN or port pair),
+    the totals, loss and Jain fairness index per group are calculated
+    without a loop over the flows.
+
+Flows which did not send anything have no loss: their loss is NaN in the
+arrays and None in the reports, instead of a division by zero.
+
+Usage:
+    matrix = FlowMatrix()
+    matrix.add_flow('flow 1', stream, trigger, direction='downstream')
+    ...
+    counters = matrix.collect()
+    counters.loss_percent()
+    matrix.summary(counters, 'direction')
+"""
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+
+
+def _optional(value):
+    """None instead of NaN, e.g. for JSON output"""
+    value = float(value)
+    return None if numpy.isnan(value) else value
+
+
+class FlowCounters(object):
+    """The TX and RX counters of all flows, as arrays
+
+    :param duration_ns: The time in which the frames were counted, for the
+                        throughput.  None when unknown.
+    """
+
+    def __init__(self, tx_frames, tx_bytes, rx_frames, rx_bytes,
+                 duration_ns=None):
+        self.tx_frames = numpy.asarray(tx_frames, dtype=numpy.int64)
+        self.tx_bytes = numpy.asarray(tx_bytes, dtype=numpy.int64)
+        self.rx_frames = numpy.asarray(rx_frames, dtype=numpy.int64)
+        self.rx_bytes = numpy.asarray(rx_bytes, dtype=numpy.int64)
+        self.duration_ns = duration_ns
+
+    def lost_frames(self):
+        return self.tx_frames - self.rx_frames
+
+    def loss_percent(self):
+        """Loss per flow, NaN for flows which sent nothing"""
+        tx_frames = self.tx_frames.astype(numpy.float64)
+        sent = tx_frames > 0
+        loss = numpy.full(len(tx_frames), numpy.nan)
+        loss[sent] = 100.0 * self.lost_frames()[sent] / tx_frames[sent]
+        return loss
+
+    def throughput(self):
+        """Received bits per second per flow, NaN without a duration"""
+        if not self.duration_ns:
+            return numpy.full(len(self.rx_bytes), numpy.nan)
+        return self.rx_bytes * 8 * 1e9 / self.duration_ns
+
+
+class FlowMatrix(object):
+    """The counters of a set of flows
+
+    Every flow has a stream, and a trigger or an AggregatedReceiver (see
+    aggregated_receive.py) which receives it.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.streams = []
+        self.triggers = []
+        # Rows received by an AggregatedReceiver: index -> (receiver, port)
+        self.receivers = {}
+        # Label name -> list with a label per flow
+        self.labels = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_flow(self, name, stream, trigger, receiver=None, udp_port=None,
+                 **labels):
+        """Adds a flow
+
+        :param trigger: The trigger of the flow, or the trigger of the
+                        receiver when the flow is aggregated
+        :param receiver: The AggregatedReceiver of the flow, if any
+        :param udp_port: The UDP destination port of the aggregated flow
+        :param labels: Labels to group the flows by, e.g. direction='upstream'
+        :return: the row of the flow
+        """
+        index = len(self.names)
+        for key in labels:
+            if key not in self.labels:
+                self.labels[key] = [None] * index
+        for key, values in self.labels.items():
+            values.append(labels.get(key))
+
+        self.names.append(name)
+        self.streams.append(stream)
+        self.triggers.append(trigger)
+        if receiver is not None:
+            self.receivers[index] = (receiver, udp_port)
+        return index
+
+    def collect(self, interval=False, duration_ns=None):
+        """Reads the counters of all flows
+
+        The results must be refreshed before.
+
+        :param interval: Counters of the latest interval instead of the
+                         cumulative counters
+        :param duration_ns: Duration of the counters, for the throughput.
+                            By default the interval duration of the streams
+                            for an interval, unknown for cumulative counters.
+        :rtype: FlowCounters
+        """
+        if interval:
+            tx = [s.ResultHistoryGet().IntervalLatestGet()
+                  for s in self.streams]
+            rx = [t.ResultHistoryGet().IntervalLatestGet()
+                  for t in self.triggers]
+        else:
+            tx = [s.ResultGet() for s in self.streams]
+            rx = [t.ResultGet() for t in self.triggers]
+
+        count = len(self.names)
+        rx_frames = numpy.fromiter((r.PacketCountGet() for r in rx),
+                                   numpy.int64, count)
+        rx_bytes = numpy.fromiter((r.ByteCountGet() for r in rx),
+                                  numpy.int64, count)
+        # Aggregated flows get their share of the shared trigger
+        for index, (receiver, udp_port) in self.receivers.items():
+            shared_frames = rx_frames[index]
+            frames = receiver.received(udp_port, shared_frames,
+                                       interval=interval)[0]
+            rx_frames[index] = frames
+            if shared_frames:
+                rx_bytes[index] = rx_bytes[index] * frames // shared_frames
+
+        if duration_ns is None and interval and count:
+            duration_ns = self.streams[0].ResultHistoryGet() \
+                .SamplingIntervalDurationGet()
+
+        return FlowCounters(
+            numpy.fromiter((r.PacketCountGet() for r in tx), numpy.int64,
+                           count),
+            numpy.fromiter((r.ByteCountGet() for r in tx), numpy.int64,
+                           count),
+            rx_frames, rx_bytes, duration_ns)
+
+    def groups(self, key):
+        """The label of every flow for `key`, and the distinct labels
+
+        :return: tuple (labels, index of the label of every flow)
+        """
+        labels = [str(label) for label in self.labels[key]]
+        return numpy.unique(labels, return_inverse=True)
+
+    def summary(self, counters, key):
+        """Totals, loss, throughput and fairness per group of flows
+
+        The fairness is Jain's index of the received frames of the flows in
+        the group.
+
+        :param counters: see collect()
+        :param key: The label to group by
+        :return: dict label -> dict with the group results
+        """
+        labels, group = self.groups(key)
+        number_of_groups = len(labels)
+
+        def per_group(values):
+            return numpy.bincount(group, weights=values,
+                                  minlength=number_of_groups)
+
+        flows = numpy.bincount(group, minlength=number_of_groups)
+        tx_frames = per_group(counters.tx_frames)
+        rx_frames = per_group(counters.rx_frames)
+        rx_bytes = per_group(counters.rx_bytes)
+        tx_sent = tx_frames > 0
+        loss = numpy.full(number_of_groups, numpy.nan)
+        loss[tx_sent] = (100.0 * (tx_frames[tx_sent] - rx_frames[tx_sent])
+                         / tx_frames[tx_sent])
+
+        # Jain's index: (sum x)^2 / (n * sum x^2)
+        rx_squares = per_group(counters.rx_frames.astype(numpy.float64) ** 2)
+        fairness = numpy.full(number_of_groups, numpy.nan)
+        nonzero = rx_squares > 0
+        fairness[nonzero] = (rx_frames[nonzero] ** 2
+                             / (flows[nonzero] * rx_squares[nonzero]))
+
+        throughput = numpy.full(number_of_groups, numpy.nan)
+        if counters.duration_ns:
+            throughput = rx_bytes * 8 * 1e9 / counters.duration_ns
+
+        return dict(
+            (str(label), {
+                'flows': int(flows[index]),
+                'tx_frames': int(tx_frames[index]),
+                'rx_frames': int(rx_frames[index]),
+                'loss_percent': _optional(loss[index]),
+                'throughput': _optional(throughput[index]),
+                'fairness': _optional(fairness[index]),
+            }) for index, label in enumerate(labels))
+
+    def flow_results(self, counters):
+        """The results per flow, as dicts"""
+        loss = counters.loss_percent()
+        throughput = counters.throughput()
+        return [{
+            'name': name,
+            'tx_frames': int(counters.tx_frames[index]),
+            'tx_bytes': int(counters.tx_bytes[index]),
+            'rx_frames': int(counters.rx_frames[index]),
+            'rx_bytes': int(counters.rx_bytes[index]),
+            'lost_frames': int(counters.tx_frames[index]
+                               - counters.rx_frames[index]),
+            'loss_percent': _optional(loss[index]),
+            'throughput': _optional(throughput[index]),
+        } for index, name in enumerate(self.names)]
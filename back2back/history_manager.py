@@ -0,0 +1,215 @@
+"""
+Sizing and draining of result histories.
+All examples are guaranteed to work with Python 2.7 and above
+
+A result history on the ByteBlower server keeps a limited number of
+intervals (the sampling buffer).  When a test runs longer than the buffer,
+the oldest intervals are silently dropped before the final IntervalGet().
+
+The HistoryManager:
+  - sets the buffer length of every registered history, from the duration
+    of the test and the sampling interval of the history,
+  - drains the histories into local storage: every call to drain() reads
+    and keeps only the intervals which were not seen before.  For long tests the buffer
+    is capped (max_buffer_length), the server memory stays bounded as long
+    as drain() is called at least every `drain_period` seconds,
+  - detects dropped intervals: gaps between the timestamps of consecutive
+    intervals.  With the start of the test (start()), the intervals which
+    were dropped before the first drain are detected as well.
+
+Usage:
+    histories = HistoryManager(duration_ns)
+    histories.register('flow_1.tx', stream.ResultHistoryGet())
+    histories.register('flow_1.rx', trigger.ResultHistoryGet())
+    ...start the traffic...
+    histories.start(server.TimestampGet())
+    while running:
+        ...refresh the results...
+        histories.drain()
+    histories.drain()
+    intervals = histories.intervals('flow_1.rx')
+"""
+from __future__ import division
+from __future__ import print_function
+
+import math
+
+
+def required_buffer_length(duration_ns, interval_ns, margin_s=20):
+    """Number of intervals a history needs to keep a whole test
+
+    :param duration_ns: Duration of the test
+    :param interval_ns: Sampling interval of the history
+    :param margin_s: Extra time, e.g. the wait for frames in transit
+    """
+    return int(math.ceil((duration_ns + margin_s * 1e9) / interval_ns))
+
+
+def size_history(history, duration_ns, margin_s=20):
+    """Sets the sampling buffer of a history to keep a whole test
+
+    :return: the buffer length
+    """
+    length = required_buffer_length(
+        duration_ns, history.SamplingIntervalDurationGet(), margin_s)
+    history.SamplingBufferLengthSet(length)
+    return length
+
+
+def interval_counters(interval):
+    """Default conversion of an interval of a stream or trigger"""
+    return {
+        'timestamp': interval.TimestampGet(),
+        'bytes': interval.ByteCountGet(),
+        'frames': interval.PacketCountGet(),
+    }
+
+
+class DrainedHistory(object):
+    """The intervals of a single history, kept locally
+
+    :param convert: function(interval) -> dict with the sample to keep
+    """
+
+    def __init__(self, name, history, interval_ns, buffer_length, convert):
+        self.name = name
+        self.history = history
+        self.interval_ns = interval_ns
+        self.buffer_length = buffer_length
+        self.convert = convert
+        self.samples = []
+        self.gaps = []
+        self.last_timestamp = None
+        # Start of the test, the first interval is compared with it
+        self.start_timestamp = None
+
+    def drain(self):
+        """Stores the intervals which are new since the last drain
+
+        The history must be refreshed before.  Only the new intervals are
+        read: they are at the end of the history, the history is walked
+        back to the last interval which was stored before.
+
+        :return: the number of new intervals
+        """
+        length = self.history.IntervalLengthGet()
+        first = length
+        while first > 0:
+            if self.last_timestamp is not None:
+                interval = self.history.IntervalGetByIndex(first - 1)
+                if interval.TimestampGet() <= self.last_timestamp:
+                    break
+            first -= 1
+
+        for index in range(first, length):
+            interval = self.history.IntervalGetByIndex(index)
+            timestamp = interval.TimestampGet()
+            missing = 0
+            if self.last_timestamp is not None:
+                # The number of intervals between both timestamps, rounded:
+                # a timestamp may be up to half an interval late or early
+                # before an interval counts as missing.
+                missing = int(round((timestamp - self.last_timestamp)
+                                    / self.interval_ns)) - 1
+            elif self.start_timestamp is not None:
+                # The first interval starts at or before the start of the
+                # test, the buffer overflowed before the first drain when
+                # it starts later.
+                missing = int(math.ceil((timestamp - self.start_timestamp)
+                                        / self.interval_ns))
+            if missing > 0:
+                self.gaps.append({
+                    'timestamp': timestamp - missing * self.interval_ns,
+                    'missing': missing,
+                })
+            self.samples.append(self.convert(interval))
+            self.last_timestamp = timestamp
+        return length - first
+
+    @property
+    def dropped(self):
+        return sum(gap['missing'] for gap in self.gaps)
+
+
+class HistoryManager(object):
+    """Sizes and drains the registered result histories
+
+    :param duration_ns: Expected duration of the test
+    :param margin_s: Extra time in the buffers
+    :param max_buffer_length: Maximum number of intervals kept on the
+                              server per history.  When the test needs more,
+                              drain() must be called during the test.
+    """
+
+    def __init__(self, duration_ns, margin_s=20, max_buffer_length=3600):
+        self.duration_ns = duration_ns
+        self.margin_s = margin_s
+        self.max_buffer_length = max_buffer_length
+        self.histories = {}
+        self.start_timestamp = None
+
+    def register(self, name, history, convert=interval_counters):
+        """Sizes the buffer of a history and follows it up
+
+        :param name: Name to retrieve the intervals with
+        :param history: A result history, e.g. stream.ResultHistoryGet()
+        """
+        interval_ns = history.SamplingIntervalDurationGet()
+        length = min(required_buffer_length(self.duration_ns, interval_ns,
+                                            self.margin_s),
+                     self.max_buffer_length)
+        history.SamplingBufferLengthSet(length)
+        drained = DrainedHistory(name, history, interval_ns, length, convert)
+        drained.start_timestamp = self.start_timestamp
+        self.histories[name] = drained
+        return drained
+
+    def start(self, timestamp_ns):
+        """Marks the start of the test
+
+        Intervals which are dropped before the first drain are only
+        detected with the start of the test.
+
+        :param timestamp_ns: Start of the test, on the clock of the
+                             histories, e.g. server.TimestampGet() right
+                             after the traffic was started
+        """
+        self.start_timestamp = timestamp_ns
+        for history in self.histories.values():
+            history.start_timestamp = timestamp_ns
+
+    @property
+    def drain_period(self):
+        """Maximum time between drains (in seconds) without losing intervals
+
+        Half of the shortest buffer, None when the buffers hold the whole
+        test.
+        """
+        periods = [h.buffer_length * h.interval_ns / 2e9
+                   for h in self.histories.values()
+                   if h.buffer_length < required_buffer_length(
+                       self.duration_ns, h.interval_ns, self.margin_s)]
+        return min(periods) if periods else None
+
+    def drain(self):
+        """Stores the new intervals of all histories
+
+        :return: the number of new intervals
+        """
+        return sum(history.drain() for history in self.histories.values())
+
+    def intervals(self, name):
+        return self.histories[name].samples
+
+    def gaps(self, name):
+        return self.histories[name].gaps
+
+    def dropped(self, name):
+        return self.histories[name].dropped
+
+    def describe_gaps(self):
+        """A warning per history which lost intervals"""
+        return ["%s: %d intervals were dropped (%d gaps)"
+                % (name, history.dropped, len(history.gaps))
+                for name, history in sorted(self.histories.items())
+                if history.gaps]
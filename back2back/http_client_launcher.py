@@ -0,0 +1,233 @@
+"""
+Helper to launch and follow up large numbers of HTTP clients.
+All examples are guaranteed to work with Python 2.7 and above
+
+Creating and polling HTTP clients one by one does not scale: with thousands
+of clients, refreshing every client every second takes longer than the test
+itself.  The HTTPClientLauncher:
+  - creates the clients in batches, spread over all client ports
+  - schedules the start of every client, following a start pattern:
+      * None: all clients start at once
+      * {'type': 'ramp', 'clients_per_second': 200}:
+            clients start at a constant rate
+      * {'type': 'poisson', 'clients_per_second': 200, 'seed': 1}:
+            clients arrive as a Poisson process with the given rate
+  - follows up the clients:
+      * clients which are not scheduled to start yet are not polled
+      * the sessions of running clients are refreshed in one API call
+      * clients which are Finished or in Error are not polled anymore
+
+Usage:
+    launcher = HTTPClientLauncher(stagger={'type': 'ramp',
+                                           'clients_per_second': 200})
+    launcher.create(client_ports, 2000, configure_client)
+    launcher.start()
+    while launcher.running():
+        time.sleep(1)
+        launcher.poll()
+"""
+# Needed for python2 / python3 print function compatibility
+from __future__ import division
+from __future__ import print_function
+
+import random
+import time
+from collections import deque
+
+# import the ByteBlower module
+from byteblowerll.byteblower import AbstractRefreshableResultList
+from byteblowerll.byteblower import ByteBlower, ByteBlowerPortList
+from byteblowerll.byteblower import HTTPRequestStatus, RequestStartType
+
+# Clients in one of these states will not change anymore
+finished_states = [HTTPRequestStatus.Error, HTTPRequestStatus.Finished]
+
+
+class StartSchedule(object):
+    """Generates the initial time to wait of consecutive clients
+
+    :param stagger: Start pattern, see the module documentation
+    """
+
+    def __init__(self, stagger=None):
+        self.stagger = stagger
+        self.offset = 0.0
+        self.generator = None
+
+        if stagger is not None:
+            if stagger['type'] not in ['ramp', 'poisson']:
+                raise ValueError("Unknown start pattern '%s'" % stagger['type'])
+            self.rate = float(stagger['clients_per_second'])
+            self.generator = random.Random(stagger.get('seed'))
+
+    def next_offset(self):
+        """Initial time to wait for the next client, in nanoseconds"""
+        offset = int(self.offset * 1e9)
+        if self.stagger is None:
+            pass
+        elif self.stagger['type'] == 'ramp':
+            self.offset += 1.0 / self.rate
+        else:
+            # The time between two arrivals of a Poisson process
+            # follows an exponential distribution
+            self.offset += self.generator.expovariate(self.rate)
+        return offset
+
+
+def start_offsets(count, stagger=None):
+    """Computes the initial time to wait for a number of clients
+
+    :param count: Number of clients
+    :param stagger: Start pattern, see the module documentation
+    :return: list with the initial time to wait of each client,
+             in nanoseconds
+    """
+    schedule = StartSchedule(stagger)
+    return [schedule.next_offset() for _ in range(count)]
+
+
+class LaunchedClient(object):
+    """An HTTP client together with its scheduled start"""
+
+    def __init__(self, http_client, start_offset):
+        self.http_client = http_client
+        self.start_offset = start_offset
+        self.session_info = None
+        self.status = None
+
+    @property
+    def finished(self):
+        return self.status in finished_states
+
+
+class HTTPClientLauncher(object):
+    """Creates, starts and follows up many HTTP clients
+
+    :param stagger: Start pattern, see the module documentation
+    :param batch_size: Number of clients to create before reporting progress
+    """
+
+    def __init__(self, stagger=None, batch_size=250):
+        self.schedule = StartSchedule(stagger)
+        self.batch_size = batch_size
+
+        self.clients = []
+        self.ports = []
+        self.start_moment = None
+
+        # Clients which are not scheduled to start yet
+        self._pending = deque()
+        # Clients which are started, but have no session yet
+        self._connecting = []
+        # Clients with a session, which are still running
+        self._running = []
+        self._results_to_refresh = None
+
+    def create(self, ports, count, configure):
+        """Create `count` HTTP clients, spread over `ports`
+
+        The clients are scheduled after all clients created before.
+
+        :param ports: ByteBlower ports to create the clients on
+        :param count: Total number of clients to create
+        :param configure: function(http_client, index) which configures
+                          the remote address, method, duration, ...
+        :return: list of created HTTP clients
+        """
+        for port in ports:
+            if port not in self.ports:
+                self.ports.append(port)
+
+        created = []
+        for batch_start in range(0, count, self.batch_size):
+            batch_end = min(count, batch_start + self.batch_size)
+            for index in range(batch_start, batch_end):
+                # Round robin over the ports, consecutive starts will
+                # use different ports.
+                port = ports[index % len(ports)]
+                http_client = port.ProtocolHttpClientAdd()
+                configure(http_client, index)
+
+                http_client.RequestStartTypeSet(RequestStartType.Scheduled)
+                offset = self.schedule.next_offset()
+                http_client.RequestInitialTimeToWaitSet(offset)
+
+                self.clients.append(LaunchedClient(http_client, offset))
+                created.append(http_client)
+            if count > self.batch_size:
+                print("Created %d of %d HTTP clients" % (batch_end, count))
+
+        return created
+
+    def start(self):
+        """Start all ports, and thus all scheduled HTTP clients, at once"""
+        ports_to_start = ByteBlowerPortList()
+        for port in self.ports:
+            ports_to_start.push_back(port)
+
+        self.start_moment = time.time()
+        ByteBlower.InstanceGet().PortsStart(ports_to_start)
+
+        # The clients start in order of their offset
+        self._pending = deque(sorted(self.clients, key=lambda c: c.start_offset))
+
+    def poll(self):
+        """Update the status of all clients which may still change
+
+        :return: dict with the number of clients per status
+        """
+        elapsed_ns = (time.time() - self.start_moment) * 1e9
+
+        # Clients which reached their start moment are polled individually
+        # until they have a session.
+        while self._pending and self._pending[0].start_offset <= elapsed_ns:
+            self._connecting.append(self._pending.popleft())
+
+        still_connecting = []
+        for client in self._connecting:
+            client.http_client.Refresh()
+            client.status = client.http_client.RequestStatusGet()
+            if client.http_client.HasSession():
+                client.session_info = client.http_client.HttpSessionInfoGet()
+                self._running.append(client)
+                self._results_to_refresh = None
+            elif not client.finished:
+                still_connecting.append(client)
+        self._connecting = still_connecting
+
+        # All running sessions are refreshed in a single API call.
+        if self._running:
+            if self._results_to_refresh is None:
+                self._results_to_refresh = AbstractRefreshableResultList()
+                for client in self._running:
+                    self._results_to_refresh.append(client.session_info)
+            ByteBlower.InstanceGet().ResultsRefresh(self._results_to_refresh)
+
+            still_running = []
+            for client in self._running:
+                client.status = client.session_info.RequestStatusGet()
+                if not client.finished:
+                    still_running.append(client)
+
+            if len(still_running) != len(self._running):
+                # Finished clients are not refreshed anymore
+                self._running = still_running
+                self._results_to_refresh = None
+
+        return self.status_counts()
+
+    def running(self):
+        """True as long as not all clients are Finished or in Error"""
+        return bool(self._pending or self._connecting or self._running)
+
+    def status_counts(self):
+        """Number of clients per state, Finished includes Error"""
+        counts = {'Scheduled': len(self._pending),
+                  'Connecting': len(self._connecting),
+                  'Running': len(self._running)}
+        counts['Finished'] = len(self.clients) - sum(counts.values())
+        return counts
+
+    def last_start_offset(self):
+        """Scheduled start of the last client, in nanoseconds"""
+        return max([c.start_offset for c in self.clients] or [0])
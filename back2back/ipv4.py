@@ -12,6 +12,8 @@ from time import sleep
 
 from byteblowerll.byteblower import ByteBlower
 
+from rolling_stats import FlowStatistics, ThresholdRules
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
@@ -63,6 +65,14 @@ configuration = {
     # be used.
     # Units: Mbit/s
     # 'throughput': 400
+
+    # Rules on the rolling statistics of the last 'window' seconds, see
+    # rolling_stats.ThresholdRules.  A violated 'hard' rule stops the stream.
+    'window': 30,
+    'rules': [
+        {'metric': 'loss_avg', 'above': 1.0},
+        {'metric': 'loss_ewma', 'above': 10.0, 'hard': True},
+    ],
 }
 
 
@@ -77,6 +87,9 @@ class Example:
 
         self.interframegap_ns = kwargs['interframegap_nanoseconds']
 
+        self.window = kwargs.get('window', 30)
+        self.rules = ThresholdRules(kwargs.get('rules', []))
+
         throughput = kwargs.pop('throughput', None)
         if throughput is not None:
             self.interframegap_ns = self.calculate_interframegap(throughput)
@@ -244,6 +257,8 @@ class Example:
         duration_ns = self.interframegap_ns * self.number_of_frames
         duration_s = duration_ns / 1000000000 + 1
 
+        statistics = FlowStatistics(window=self.window)
+
         stream.Start()
 
         # duration_s is a float, so we need to cast it to an integer first
@@ -265,7 +280,24 @@ class Example:
                 RX=last_interval_rx.PacketCountGet()
             ))
 
-        print("Done sending traffic (time elapsed)")
+            # Keep the statistics over the last seconds, every update
+            # takes the same time, no matter how long the test runs.
+            statistics.add_interval(
+                last_interval_tx.TimestampGet(),
+                last_interval_tx.PacketCountGet(),
+                last_interval_rx.PacketCountGet(),
+                last_interval_rx.ByteCountGet(),
+                duration_ns=stream_history.SamplingIntervalDurationGet())
+
+            violations = self.rules.evaluate(statistics.metrics())
+            for violation in violations:
+                print(ThresholdRules.describe(violation))
+            if ThresholdRules.has_hard_failure(violations):
+                print("Stopping the stream early")
+                stream.Stop()
+                break
+        else:
+            print("Done sending traffic (time elapsed)")
 
         # Waiting for a second after the stream is finished.
         # This has the advantage that frames that were transmitted
@@ -9,12 +9,19 @@ Copyright 2020, Excentis N.V.
 
 from __future__ import print_function
 
+import os
+import sys
 from time import sleep
 
 from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import AbstractRefreshableResultList
 from byteblowerll.byteblower import ByteBlowerPortList
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from aggregated_receive import AggregatedReceiver
+from flow_matrix import FlowMatrix
+from provisioning import provision_port
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
@@ -54,7 +61,13 @@ configuration = {
     # - Downstream: traffic from port_1 to port_2
     # - Upstream: traffic from port_2 to port_1
     'number_of_downstream_flows': 3,
-    'number_of_upstream_flows': 2
+    'number_of_upstream_flows': 2,
+
+    # Receive the flows towards a port with a single trigger instead of a
+    # trigger per flow.  The received frames per flow are then estimated
+    # from a sampling capture, see aggregated_receive.py.
+    # This scales to thousands of flows.
+    'aggregate_receive': False,
 }
 
 
@@ -69,6 +82,9 @@ class Example:
 
         self.number_of_downstream_flows = kwargs['number_of_downstream_flows']
         self.number_of_upstream_flows = kwargs['number_of_upstream_flows']
+        self.aggregate_receive = kwargs.get('aggregate_receive', False)
+        # The AggregatedReceiver per receiving port
+        self.receivers = {}
 
         self.server = None
         self.port_1 = None
@@ -104,12 +120,13 @@ class Example:
             for i in range(number_of_flows):
                 print("Creating flow {i} from {src_ip} to {dst_ip}".format(
                     i=i + 1,
-                    src_ip=src_port.Layer3IPv4Get().IpGet(),
-                    dst_ip=dst_port.Layer3IPv4Get().IpGet()
+                    src_ip=src_port.ip,
+                    dst_ip=dst_port.ip
                 ))
+                udp_port = self.udp_dst
                 stream, trigger = self.create_flow(src_port=src_port,
                                                    dst_port=dst_port)
-                flows.append((src_port, dst_port, stream, trigger))
+                flows.append((src_port, dst_port, stream, trigger, udp_port))
 
                 transmitting_ports.add(src_port)
 
@@ -117,27 +134,42 @@ class Example:
                 # we want to refresh
                 results_to_refresh.append(stream.ResultGet())
                 results_to_refresh.append(stream.ResultHistoryGet())
-                results_to_refresh.append(trigger.ResultGet())
-                results_to_refresh.append(trigger.ResultHistoryGet())
+                if trigger is not None:
+                    results_to_refresh.append(trigger.ResultGet())
+                    results_to_refresh.append(trigger.ResultHistoryGet())
+
+        # In aggregated mode, the triggers are created once all flows are
+        # known.
+        for receiver in self.receivers.values():
+            receiver.create()
+            for result in receiver.get_results_to_refresh():
+                results_to_refresh.append(result)
+
+        # The counters of all flows are collected into arrays, the loss and
+        # fairness follow without a loop over the flows.
+        matrix = self.create_flow_matrix(flows)
 
         # print the configuration, this makes it easy to review what we have
         # done until now
         print("Current ByteBlower configuration:")
-        print("port1:", self.port_1.DescriptionGet())
-        print("port2:", self.port_2.DescriptionGet())
+        print("port1:", self.port_1.port.DescriptionGet())
+        print("port2:", self.port_2.port.DescriptionGet())
 
         # start the traffic, clear the trigger.  Triggers are active as soon
         # they are created, so  we may want to clear the data it already has
         # collected.
 
         print("Clearing triggers")
-        for tx_port, rx_port, stream, trigger in flows:
-            trigger.ResultClear()
+        for tx_port, rx_port, stream, trigger, udp_port in flows:
+            if trigger is not None:
+                trigger.ResultClear()
+        for receiver in self.receivers.values():
+            receiver.reset_results()
 
         print("Starting traffic")
         ports_to_start = ByteBlowerPortList()
         for tx_port in transmitting_ports:
-            ports_to_start.push_back(tx_port)
+            ports_to_start.push_back(tx_port.port)
         # Start all ports at the same time.
         self.server.PortsStart(ports_to_start)
 
@@ -165,17 +197,16 @@ class Example:
             # These roundtrips can be significant when comparing results from
             # e.g. a Stream and a Trigger.
             byteblower_instance.ResultsRefresh(results_to_refresh)
+            for receiver in self.receivers.values():
+                receiver.sample()
 
-            for i, (src_port, dst_port, stream, trigger) in enumerate(flows):
-                tx_interval = stream.ResultHistoryGet().IntervalLatestGet()
-                rx_interval = trigger.ResultHistoryGet().IntervalLatestGet()
-
+            counters = matrix.collect(interval=True)
+            for i, (src_port, dst_port, stream, trigger, udp_port) in enumerate(flows):
                 print("  Flow %d from %s to %s sent %d frames, "
                       "received %d frames" % (i + 1,
-                                              src_port.Layer3IPv4Get().IpGet(),
-                                              dst_port.Layer3IPv4Get().IpGet(),
-                                              tx_interval.PacketCountGet(),
-                                              rx_interval.PacketCountGet())
+                                              src_port.ip, dst_port.ip,
+                                              counters.tx_frames[i],
+                                              counters.rx_frames[i])
                       )
 
         print("Done sending traffic (time elapsed)")
@@ -183,21 +214,29 @@ class Example:
         # During the test itself we queried the interval counters, there are
         # also cumulative counters.  The last cumulative counter available in
         # the history is also available as the Result
+        counters = matrix.collect()
         result = []
-        for i, (src_port, dst_port, stream, trigger) in enumerate(flows):
-            tx_result = stream.ResultGet()
-            rx_result = trigger.ResultGet()
-
-            tx_frames = tx_result.PacketCountGet()
-            rx_frames = rx_result.PacketCountGet()
+        for i, (src_port, dst_port, stream, trigger, udp_port) in enumerate(flows):
+            tx_frames = int(counters.tx_frames[i])
+            rx_frames = int(counters.rx_frames[i])
             print("Flow %d from %s to %s sent %d frames, "
                   "received %d frames" % (i + 1,
-                                          src_port.Layer3IPv4Get().IpGet(),
-                                          dst_port.Layer3IPv4Get().IpGet(),
+                                          src_port.ip, dst_port.ip,
                                           tx_frames, rx_frames)
                   )
             result.append((tx_frames, rx_frames))
 
+        # The loss and fairness (Jain's index of the received frames) per
+        # direction.  A direction without flows or traffic has no loss.
+        for direction, group in sorted(matrix.summary(counters,
+                                                      'direction').items()):
+            print("%s: %d flows, loss %s, fairness %s" % (
+                direction, group['flows'],
+                '-' if group['loss_percent'] is None
+                else '%.2f%%' % group['loss_percent'],
+                '-' if group['fairness'] is None
+                else '%.3f' % group['fairness']))
+
         return result
 
     def cleanup(self):
@@ -206,11 +245,15 @@ class Example:
         It is considered good practice to clean up your objects.  This tells
         the ByteBlower server it can clean up its resources.
         """
+        for receiver in self.receivers.values():
+            receiver.destroy()
+        self.receivers = {}
+
         if self.port_1:
-            self.server.PortDestroy(self.port_1)
+            self.server.PortDestroy(self.port_1.port)
             self.port_1 = None
         if self.port_2:
-            self.server.PortDestroy(self.port_2)
+            self.server.PortDestroy(self.port_2.port)
             self.port_2 = None
 
         # Disconnect from the ByteBlower server
@@ -219,70 +262,51 @@ class Example:
             self.server = None
 
     def provision_port(self, config):
-        port = self.server.PortCreate(config['interface'])
-        port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(config['mac'])
-
-        ip_config = config['ip']
-        if not isinstance(ip_config, list):
-            # Config is not static, DHCP or slaac
-            if ip_config.lower() == "dhcpv4":
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpGet()
-            elif ip_config.lower() == "dhcpv6":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpDhcpGet()
-            elif ip_config.lower() == "slaac":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.StatelessAutoconfiguration()
-                config['ip_address'] = port_l3.IpStatelessGet()
-        else:
-            # Static configuration
-            if len(ip_config) == 3:
-                # IPv4
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.IpSet(ip_config[0])
-                port_l3.NetmaskSet(ip_config[1])
-                port_l3.GatewaySet(ip_config[2])
-                config['ip_address'] = port_l3.IpGet()
-            elif len(ip_config) == 2:
-                port_l3 = port.Layer3IPv6Set()
-                # IPv6
-                address = ip_config[0]
-                prefix_length = ip_config[1]
-                ip = "{}/{}".format(address, prefix_length)
-                port_l3.IpManualAdd(ip)
-                config['ip_address'] = ip_config[0]
-
-        if not isinstance(config['ip_address'], str):
-            ip = config['ip_address'][0]
-            if '/' in ip:
-                config['ip_address'] = ip.split('/')[0]
-
-        print("Created port", port.DescriptionGet())
+        """Creates the port, see provisioning.py
+
+        The addresses of the port are read once, creating the flows needs
+        no further round trips for them.
+
+        :rtype: provisioning.ProvisionedPort
+        """
+        port = provision_port(self.server, config)
+        print("Created port", port.port.DescriptionGet())
         return port
 
+    def create_flow_matrix(self, flows):
+        """Collects the flows in a FlowMatrix, grouped by direction
+
+        Flows received by an AggregatedReceiver share its trigger.
+        """
+        matrix = FlowMatrix()
+        for i, (src_port, dst_port, stream, trigger, udp_port) in enumerate(flows):
+            receiver = self.receivers.get(dst_port)
+            if receiver is not None:
+                trigger = receiver.trigger
+            direction = 'downstream' if src_port is self.port_1 else 'upstream'
+            matrix.add_flow("Flow %d" % (i + 1), stream, trigger,
+                            receiver=receiver, udp_port=udp_port,
+                            direction=direction)
+        return matrix
+
     def create_flow(self, src_port, dst_port):
         """Create a ByteBlower stream and matching Trigger
 
         Returns a tuple of byteblowerll.byteblower.TxStream and
-        a byteblowerll.byteblower.RxTriggerBasic
+        a byteblowerll.byteblower.RxTriggerBasic.  With aggregate_receive,
+        the flow is added to the AggregatedReceiver of dst_port and the
+        trigger is None.
 
         :param src_port: Port to create the transmitting side of the flow on
-        :type src_port: byteblowerll.byteblower.ByteBlowerPort
+        :type src_port: provisioning.ProvisionedPort
         :param dst_port: Port to create the receiving side of the flow on.
-        :type dst_port: byteblowerll.byteblower.ByteBlowerPort
+        :type dst_port: provisioning.ProvisionedPort
 
         :rtype: tuple
         """
 
-        src_port_l3 = src_port.Layer3IPv4Get()
-        dst_port_l3 = dst_port.Layer3IPv4Get()
-
         # Create the stream
-        stream = src_port.TxStreamAdd()
+        stream = src_port.port.TxStreamAdd()
 
         # set the number of frames to transmit
         stream.NumberOfFramesSet(self.number_of_frames)
@@ -295,18 +319,19 @@ class Example:
         frame = stream.FrameAdd()
 
         # collect the frame header info.  We need to provide the
-        # Layer2 (ethernet) and Layer3 (IPv4) addresses.
-        src_ip = src_port_l3.IpGet()
-        src_mac = src_port.Layer2EthIIGet().MacGet()
+        # Layer2 (ethernet) and Layer3 (IPv4) addresses.  They were read
+        # once, while provisioning the ports.
+        src_ip = src_port.ip
+        src_mac = src_port.mac
 
-        dst_ip = dst_port_l3.IpGet()
+        dst_ip = dst_port.ip
 
         # the destination MAC is the MAC address of the destination port if the
         # destination port is in the same subnet as the source port, otherwise
         # it will be the MAC address of the gateway.  ByteBlower has a function
         # to resolve the correct MAC address in the Layer3 configuration
-        # object.
-        dst_mac = src_port_l3.Resolve(dst_ip)
+        # object.  The provisioned port resolves every address only once.
+        dst_mac = src_port.resolve(dst_ip)
 
         frame_size = 512
 
@@ -328,9 +353,23 @@ class Example:
 
         frame.BytesSet(hexbytes)
 
+        if self.aggregate_receive:
+            # A single trigger receives all flows to the destination port
+            receiver = self.receivers.get(dst_port)
+            if receiver is None:
+                receiver = AggregatedReceiver(dst_port.port,
+                                              dst_port.filter_elements())
+                self.receivers[dst_port] = receiver
+            receiver.add_flow("flow to udp port %d" % self.udp_dst,
+                              self.udp_dst)
+
+            self.udp_src += 1
+            self.udp_dst += 1
+            return stream, None
+
         # create a trigger.  A trigger is an object which receives data.
         # The Basic trigger just count packets
-        trigger = dst_port.RxTriggerBasicAdd()
+        trigger = dst_port.port.RxTriggerBasicAdd()
 
         # every trigger needs to know on which frames it will work.  The
         # default filter is no filter, so it will analyze every frame, which
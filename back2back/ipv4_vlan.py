@@ -17,10 +17,15 @@ Copyright 2019, Excentis N.V.
 
 from __future__ import print_function
 
+import os
+import sys
 from time import sleep
 
 from byteblowerll.byteblower import ByteBlower
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from provisioning import provision_port
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
@@ -101,10 +106,12 @@ class Example:
         self.server = byteblower_instance.ServerAdd(self.server_address)
 
         print("Creating ports")
-        # Do check the provision_port code. The vlan has
-        # a small impact there.
-        self.port_1 = self.provision_port(self.port_1_config)
-        self.port_2 = self.provision_port(self.port_2_config)
+        # Do check the provision_port code in provisioning.py. The vlan
+        # has a small impact there.
+        tx_port = self.provision_port(self.port_1_config)
+        self.port_1 = tx_port.port
+        rx_port = self.provision_port(self.port_2_config)
+        self.port_2 = rx_port.port
 
         # Creating the stream where we'll sent the traffic from.
         # Most is the same as the basic IPv4 example.
@@ -116,11 +123,11 @@ class Example:
 
         # Collect the basic addressing info for the Tx side.
         # VLAN id handled lower in the code.
-        src_ip = self.port_1_config['ip_address']
-        src_mac = self.port_1.Layer2EthIIGet().MacGet()
+        src_ip = tx_port.ip
+        src_mac = tx_port.mac
 
-        dst_ip = self.port_2_config['ip_address']
-        dst_mac = self.port_1.Layer3IPv4Get().Resolve(dst_ip)
+        dst_ip = rx_port.ip
+        dst_mac = tx_port.resolve(dst_ip)
 
         frame_size = 512
         udp_src = 4096
@@ -143,12 +150,11 @@ class Example:
         # When the Tx ByteBlower port has a VLAN, we need to add it to frame to
         # be sent.  The following lines are the only difference compared to
         # the basic IPv4 example.
-        if 'vlan' in self.port_1_config:
-            vlan_id = self.port_1_config['vlan']
-            vlan_header = Dot1Q(vlan=vlan_id)
-            scapy_frame = eth_header / vlan_header / ip_header / udp_header / udp_payload
-        else:
-            scapy_frame = eth_header / ip_header / udp_header / udp_payload
+        # The provisioned port knows its VLANs, outer VLAN first.
+        scapy_frame = eth_header
+        for vlan_id in tx_port.vlans:
+            scapy_frame = scapy_frame / Dot1Q(vlan=vlan_id)
+        scapy_frame = scapy_frame / ip_header / udp_header / udp_payload
 
         # As noted above, the remainder of the stream config is the same again.
         frame_content = bytearray(bytes(scapy_frame))
@@ -165,12 +171,10 @@ class Example:
         #
         # When we expect to receive packets with a VLAN, we need to add
         # this element to the filter.
-        if 'vlan' in self.port_2_config:
-            rx_vlan_id = str(self.port_2_config['vlan'])
-            bpf_filter = "vlan {} and ip dst {} and udp port {}".format(
-                rx_vlan_id, dst_ip, udp_dest)
-        else:
-            bpf_filter = "ip dst {} and udp port {}".format(dst_ip, udp_dest)
+        # filter_elements() gives "vlan 2 and ip dst ..." for a port with
+        # a VLAN, and only "ip dst ..." without.
+        bpf_filter = " and ".join(rx_port.filter_elements()
+                                  + ["udp port {}".format(udp_dest)])
         trigger.FilterSet(bpf_filter)
 
         # The above filter was the last change necessary in this method.
@@ -234,67 +238,22 @@ class Example:
         info we suggest to look there.
 
         The VLAN config is new. As you'll notice this is only a small part of
-        the config.
-        """
-        port = self.server.PortCreate(config['interface'])
-        port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(config['mac'])
+        the config: provisioning.py adds a Layer25Vlan to the port for the
+        'vlan' of the config.  The extra layer ensures that the ByteBlowerPort
+        performs basic functionality (DHCP, ARP,..) in the configured VLAN.
 
-        # When the config has vlan, add this layer to the ByteBlower port.
-        # The extra layer ensures that the ByteBlowerPort performs basic
-        # functionality (DHCP, ARP,..) in the configured VLAN.
-        #
-        # This is the only change in this method compared to ipv4.py
-        #
-        # To keep things simple we'll only configure the Vlan ID. In the api
-        # reference, you'll find that it's also possible to configure priority
-        # count and drop eligable indicator.
-        if 'vlan' in config:
-            vlan_id = int(config['vlan'])
-            port_l2_5 = port.Layer25VlanAdd()
-            port_l2_5.IDSet(vlan_id)
-
-        # The remainder of the config is independent of a VLAN config. When
-        # necessary the ByteBlower will automatically add the VLAN to the
-        # appropriate protocols.
-        ip_config = config['ip']
-        if not isinstance(ip_config, list):
-            if ip_config.lower() == "dhcpv4":
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpGet()
-            elif ip_config.lower() == "dhcpv6":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpDhcpGet()
-            elif ip_config.lower() == "slaac":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.StatelessAutoconfiguration()
-                config['ip_address'] = port_l3.IpStatelessGet()
-        else:
-            # Static configuration
-            if len(ip_config) == 3:
-                # IPv4
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.IpSet(ip_config[0])
-                port_l3.NetmaskSet(ip_config[1])
-                port_l3.GatewaySet(ip_config[2])
-                config['ip_address'] = port_l3.IpGet()
-            elif len(ip_config) == 2:
-                port_l3 = port.Layer3IPv6Set()
-                # IPv6
-                address = ip_config[0]
-                prefix_length = ip_config[1]
-                ip = "{}/{}".format(address, prefix_length)
-                port_l3.IpManualAdd(ip)
-                config['ip_address'] = ip_config[0]
-
-        if not isinstance(config['ip_address'], str):
-            ip = config['ip_address'][0]
-            if '/' in ip:
-                config['ip_address'] = ip.split('/')[0]
-
-        print("Created port", port.DescriptionGet())
+        To keep things simple only the VLAN ID is configured. In the api
+        reference, you'll find that it's also possible to configure priority
+        and drop eligible indicator.
+
+        The remainder of the config is independent of a VLAN config. When
+        necessary the ByteBlower will automatically add the VLAN to the
+        appropriate protocols.
+
+        :rtype: provisioning.ProvisionedPort
+        """
+        port = provision_port(self.server, config)
+        print("Created port", port.port.DescriptionGet())
         return port
 
 
@@ -8,8 +8,13 @@ Copyright 2018, Excentis N.V.
 from __future__ import print_function
 from byteblowerll.byteblower import ByteBlower
 
+import os
+import sys
 from time import sleep
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from provisioning import provision_port
+
 
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
@@ -88,11 +93,13 @@ class Example:
 
         # Create the port which will be the HTTP server (port_1)
         print("Creating TX port")
-        self.port_1 = self.provision_port(self.port_1_config)
+        tx_port = self.provision_port(self.port_1_config)
+        self.port_1 = tx_port.port
 
         print("Creating RX port")
         # Create the port which will be the HTTP client (port_2)
-        self.port_2 = self.provision_port(self.port_2_config)
+        rx_port = self.provision_port(self.port_2_config)
+        self.port_2 = rx_port.port
 
         # now create the stream.
         # A stream transmits frames on the port on which it is created.
@@ -109,18 +116,19 @@ class Example:
         frame = stream.FrameAdd()
 
         # collect the frame header info.  We need to provide the
-        # Layer2 (ethernet) and Layer3 (IPv4) addresses.
-        src_ip = self.port_1_config['ip_address']
-        src_mac = self.port_1.Layer2EthIIGet().MacGet()
+        # Layer2 (ethernet) and Layer3 (IPv6) addresses.  They were read
+        # once while provisioning the ports.
+        src_ip = tx_port.ip
+        src_mac = tx_port.mac
 
-        dst_ip = self.port_2_config['ip_address']
+        dst_ip = rx_port.ip
 
         # the destination MAC is the MAC address of the destination port if
         # the destination port is in the same subnet as the source port,
         # otherwise it will be the MAC address of the gateway.
         # ByteBlower has a function to resolve the correct MAC address in
         # the Layer3 configuration object
-        dst_mac = self.port_1.Layer3IPv6Get().Resolve(dst_ip)
+        dst_mac = tx_port.resolve(dst_ip)
 
         frame_size = 512
         udp_src = 4096
@@ -219,49 +227,12 @@ class Example:
         return [tx_frames, rx_frames]
 
     def provision_port(self, config):
-        port = self.server.PortCreate(config['interface'])
-        port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(config['mac'])
-
-        ip_config = config['ip']
-        if not isinstance(ip_config, list):
-            # Config is not static, DHCP or slaac
-            if ip_config.lower() == "dhcpv4":
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpGet()
-            elif ip_config.lower() == "dhcpv6":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpDhcpGet()
-            elif ip_config.lower() == "slaac":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.StatelessAutoconfiguration()
-                config['ip_address'] = port_l3.IpStatelessGet()
-        else:
-            # Static configuration
-            if len(ip_config) == 3:
-                # IPv4
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.IpSet(ip_config[0])
-                port_l3.NetmaskSet(ip_config[1])
-                port_l3.GatewaySet(ip_config[2])
-                config['ip_address'] = port_l3.IpGet()
-            elif len(ip_config) == 2:
-                port_l3 = port.Layer3IPv6Set()
-                # IPv6
-                address = ip_config[0]
-                prefix_length = ip_config[1]
-                ip = "{}/{}".format(address, prefix_length)
-                port_l3.IpManualAdd(ip)
-                config['ip_address'] = ip_config[0]
-
-        if not isinstance(config['ip_address'], str):
-            ip = config['ip_address'][0]
-            if '/' in ip:
-                config['ip_address'] = ip.split('/')[0]
-
-        print("Created port", port.DescriptionGet())
+        """Creates the port, see provisioning.py
+
+        :rtype: provisioning.ProvisionedPort
+        """
+        port = provision_port(self.server, config)
+        print("Created port", port.port.DescriptionGet())
         return port
 
 
@@ -0,0 +1,546 @@
+"""
+IGMPv3 / MLDv2 channel-zapping benchmark using the ByteBlower Python API.
+
+Where ipv4_multicast_igmpv3.py and ipv6_multicast_mldv2.py join a single
+group on a single receiver, this example measures the join and leave
+latency of a multicast network the way an IPTV customer experiences it:
+  - one stream per multicast group ("channel") is created up front on the
+    TX port.  All channels are sent continuously during the test.
+  - multiple RX ports "zap" between the channels: every zap leaves the
+    current group and joins a randomly chosen new one.
+  - for every zap, the RX port captures the traffic of the old and the new
+    group.  The capture timestamps are used to calculate
+      * the join latency: from the join until the first frame of the
+        new group
+      * the leave latency: from the leave until the last frame of the
+        old group
+
+The moment of the join/leave is the server timestamp halfway the
+MulticastListen call.  The error on this moment is half the duration of
+that call, it is reported along the results.  The resolution of the
+latencies is also limited by the interframegap of the channels.
+
+Copyright 2022, Excentis N.V.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import ipaddress
+import random
+import struct
+from time import sleep
+
+from byteblowerll.byteblower import ByteBlower
+from byteblowerll.byteblower import MulticastSourceFilter
+from byteblowerll.byteblower import StringList
+
+configuration = {
+    # Address (IP or FQDN) of the ByteBlower server to use
+    'server_address': 'byteblower-dev-4100-3.lab.byteblower.excentis.com',
+
+    # Configuration for the sender ByteBlower port.
+    'tx_port_config': {
+        'interface': 'trunk-1-13',
+        'mac': '00:bb:01:00:00:01',
+        # IP configuration for the ByteBlower Port.
+        # Options are 'DHCPv4', 'DHCPv6', 'SLAAC', 'static'
+        # if DHCPv4, use "dhcpv4"
+        'ip': 'dhcpv4',
+        # if DHCPv6, use "dhcpv6"
+        # 'ip': 'dhcpv6',
+        # if SLAAC, use "slaac"
+        # 'ip': 'slaac',
+        # if staticv4, use ["ipaddress", netmask, gateway]
+        # 'ip': ['192.168.0.2', "255.255.255.0", "192.168.0.1"],
+        # if staticv6, use ["ipaddress", prefixlength]
+        # 'ip': ['3000:3128::24', '64'],
+    },
+
+    # Configuration for the receiver ByteBlower ports.
+    # Every receiver zaps independently.
+    'rx_port_configs': [
+        {
+            'interface': 'trunk-1-19',
+            'mac': '00:bb:01:00:00:02',
+            'ip': 'dhcpv4',
+        },
+        {
+            'interface': 'trunk-1-20',
+            'mac': '00:bb:01:00:00:03',
+            'ip': 'dhcpv4',
+        },
+    ],
+
+    # IP version of the multicast groups: 4 for IGMPv3, 6 for MLDv2
+    # The ports must be configured with the same IP version.
+    'ip_version': 4,
+
+    # The first multicast group, the next groups are consecutive addresses.
+    'multicast_base_ip': '232.8.1.1',
+    # 'multicast_base_ip': 'ff05::2:1',
+
+    # Number of multicast groups (channels)
+    'number_of_groups': 100,
+
+    # Size of the frames to be sent (without CRC).
+    # Unit: Bytes
+    'frame_size': 512,
+
+    # Every channel sends 1000 frames per second.  This is also the
+    # resolution of the measured latencies.
+    'interframegap_nanoseconds': 1000000,  # 1ms
+
+    # Number of zaps done by every receiver
+    'zaps_per_receiver': 20,
+
+    # Time to wait after a zap before stopping the captures, in seconds.
+    # Must be longer than the expected join and leave latency.
+    'settle_time': 2,
+
+    # Seed for the random channel selection, makes runs reproducible.
+    'seed': 1,
+
+    # Percentiles to report for the join and leave latencies
+    'percentiles': [50, 90, 99],
+}
+
+UDP_SRC_PORT = 5001
+UDP_DST_PORT = 5002
+
+
+class Receiver(object):
+    """A receiving ByteBlower port together with its multicast state"""
+
+    def __init__(self, port, multicast_protocol):
+        self.port = port
+        self.protocol = multicast_protocol
+        self.sessions = {}
+        self.current_group = None
+
+    def session(self, group):
+        """IGMPv3 or MLDv2 session for a group, created on first use"""
+        if group not in self.sessions:
+            if isinstance(group, ipaddress.IPv4Address):
+                session = self.protocol.SessionV3Add(str(group))
+            else:
+                session = self.protocol.SessionV2Add(str(group))
+            self.sessions[group] = session
+        return self.sessions[group]
+
+
+class Example:
+    def __init__(self, **kwargs):
+        self.server_address = kwargs['server_address']
+        self.tx_port_config = kwargs['tx_port_config']
+        self.rx_port_configs = kwargs['rx_port_configs']
+
+        self.ip_version = kwargs['ip_version']
+        self.multicast_base_ip = kwargs['multicast_base_ip']
+        self.number_of_groups = kwargs['number_of_groups']
+
+        self.frame_size = kwargs['frame_size']
+        self.interframegap_ns = kwargs['interframegap_nanoseconds']
+
+        self.zaps_per_receiver = kwargs['zaps_per_receiver']
+        self.settle_time = kwargs['settle_time']
+        self.seed = kwargs.get('seed')
+        self.percentiles = kwargs.get('percentiles', [50, 90, 99])
+
+        self.server = None
+        self.bbport_tx = None
+        self.bbports_rx = []
+
+    def cleanup(self):
+        """Clean up the created objects"""
+        byteblower_instance = ByteBlower.InstanceGet()
+        if self.bbport_tx:
+            self.server.PortDestroy(self.bbport_tx)
+            self.bbport_tx = None
+
+        for port in self.bbports_rx:
+            self.server.PortDestroy(port)
+        self.bbports_rx = []
+
+        if self.server is not None:
+            byteblower_instance.ServerRemove(self.server)
+            self.server = None
+
+    def run(self):
+        byteblower_instance = ByteBlower.InstanceGet()
+
+        print("Connecting to ByteBlower server %s..." % self.server_address)
+        self.server = byteblower_instance.ServerAdd(self.server_address)
+
+        print("Creating TX port")
+        self.bbport_tx = self.provision_port(self.tx_port_config)
+
+        receivers = []
+        for config in self.rx_port_configs:
+            print("Creating RX port")
+            port = self.provision_port(config)
+            self.bbports_rx.append(port)
+            if self.ip_version == 4:
+                protocol = port.Layer3IPv4Get().ProtocolIgmpGet()
+            else:
+                protocol = port.Layer3IPv6Get().ProtocolMldGet()
+            receivers.append(Receiver(port, protocol))
+
+        groups = self.multicast_groups()
+
+        # One stream per channel, all channels are sent during the whole test
+        src_ip = self.tx_port_config['ip_address']
+        src_mac = self.bbport_tx.Layer2EthIIGet().MacGet()
+        # Enough frames to keep the channels on the air during all zaps
+        duration_ns = (self.zaps_per_receiver * (self.settle_time + 1) + 10) * 1e9
+        number_of_frames = int(duration_ns / self.interframegap_ns)
+        print("Creating %d multicast streams" % len(groups))
+        for group in groups:
+            stream = self.bbport_tx.TxStreamAdd()
+            stream.NumberOfFramesSet(number_of_frames)
+            stream.InterFrameGapSet(self.interframegap_ns)
+            frame = stream.FrameAdd()
+            frame.BytesSet(self.generate_frame_string(
+                src_mac, src_ip, UDP_SRC_PORT,
+                self.convert_multicast_ip_to_mac(group), str(group),
+                UDP_DST_PORT))
+
+        # Starting the port starts all its streams at once
+        self.bbport_tx.Start()
+
+        # Maps the packed destination address on the group, this makes
+        # parsing the captured frames a dictionary lookup.
+        packed_groups = dict((group.packed, group) for group in groups)
+
+        generator = random.Random(self.seed)
+        zaps = []
+        try:
+            for zap_round in range(self.zaps_per_receiver):
+                round_zaps = self.zap_round(receivers, groups, generator)
+                for zap in round_zaps:
+                    self.process_capture(zap, packed_groups)
+                    print(self.describe_zap(zap_round, zap))
+                zaps.extend(round_zaps)
+        finally:
+            # Leave all groups before stopping the traffic
+            for receiver in receivers:
+                if receiver.current_group is not None:
+                    receiver.session(receiver.current_group).MulticastListen(
+                        MulticastSourceFilter.Include, StringList())
+                    receiver.current_group = None
+            self.bbport_tx.Stop()
+
+        results = self.summarize(zaps)
+        self.print_results(results)
+        return results
+
+    def multicast_groups(self):
+        """The multicast group addresses, consecutive from the base IP"""
+        base = ipaddress.ip_address(u"{}".format(self.multicast_base_ip))
+        if base.version != self.ip_version:
+            raise ValueError("multicast_base_ip '%s' is not an IPv%d address"
+                             % (self.multicast_base_ip, self.ip_version))
+        if not base.is_multicast:
+            raise ValueError("multicast_base_ip '%s' is not a multicast address"
+                             % self.multicast_base_ip)
+        return [base + index for index in range(self.number_of_groups)]
+
+    def zap_round(self, receivers, groups, generator):
+        """Let every receiver leave its group and join a new one
+
+        The captures of all receivers run in parallel, so a round takes
+        one settle time, regardless of the number of receivers.
+
+        :return: list of zaps, one per receiver
+        """
+        zaps = []
+        for receiver in receivers:
+            new_group = generator.choice(groups)
+            while len(groups) > 1 and new_group == receiver.current_group:
+                new_group = generator.choice(groups)
+
+            zap = {
+                'receiver': receiver.port.DescriptionGet().splitlines()[0],
+                'old_group': receiver.current_group,
+                'new_group': new_group,
+                'leave': None,
+                'join': None,
+            }
+
+            # Only capture the traffic of the groups involved in this zap
+            capture_groups = [new_group]
+            if receiver.current_group is not None:
+                capture_groups.append(receiver.current_group)
+            ip_filter = ' or '.join(
+                '{} dst {}'.format('ip' if self.ip_version == 4 else 'ip6', g)
+                for g in capture_groups)
+            capture = receiver.port.RxCaptureBasicAdd()
+            capture.FilterSet('({}) and udp dst port {}'.format(
+                ip_filter, UDP_DST_PORT))
+            capture.Start()
+            zap['capture'] = capture
+
+            if receiver.current_group is not None:
+                zap['leave'] = self.timed_listen(
+                    receiver.session(receiver.current_group),
+                    MulticastSourceFilter.Include)
+            zap['join'] = self.timed_listen(
+                receiver.session(new_group), MulticastSourceFilter.Exclude)
+
+            receiver.current_group = new_group
+            zap['port'] = receiver.port
+            zaps.append(zap)
+
+        sleep(self.settle_time)
+
+        for zap in zaps:
+            zap['capture'].Stop()
+        return zaps
+
+    def timed_listen(self, session, source_filter):
+        """Perform a MulticastListen call and timestamp it
+
+        An empty 'exclude' filter joins the group for all sources,
+        an empty 'include' filter leaves the group.
+
+        :return: tuple (moment, error), in nanoseconds server time
+        """
+        before = self.server.TimestampGet()
+        session.MulticastListen(source_filter, StringList())
+        after = self.server.TimestampGet()
+        return (before + after) // 2, (after - before) // 2
+
+    def process_capture(self, zap, packed_groups):
+        """Find the first frame of the new group and the last of the old one"""
+        first_new = None
+        last_old = None
+        for frame in zap['capture'].ResultGet().FramesGet():
+            group = self.destination_group(bytearray(frame.BufferGet()),
+                                           packed_groups)
+            timestamp = frame.TimestampGet()
+            if group == zap['new_group'] and timestamp >= zap['join'][0]:
+                if first_new is None or timestamp < first_new:
+                    first_new = timestamp
+            elif group == zap['old_group']:
+                if last_old is None or timestamp > last_old:
+                    last_old = timestamp
+
+        zap['port'].RxCaptureBasicRemove(zap['capture'])
+        del zap['capture']
+        del zap['port']
+
+        zap['join_latency'] = None
+        if first_new is not None:
+            zap['join_latency'] = first_new - zap['join'][0]
+
+        zap['leave_latency'] = None
+        if zap['leave'] is not None:
+            if last_old is None or last_old < zap['leave'][0]:
+                # No frames after the leave: the network stopped forwarding
+                # the group immediately.
+                zap['leave_latency'] = 0
+            else:
+                zap['leave_latency'] = last_old - zap['leave'][0]
+
+    def destination_group(self, frame, packed_groups):
+        """Destination multicast group of a captured frame
+
+        Only the Ethernet header (and optional VLAN tags) is parsed, the
+        destination address is then looked up in `packed_groups`.
+        """
+        offset = 12
+        ethertype = struct.unpack_from('!H', frame, offset)[0]
+        while ethertype in (0x8100, 0x88a8):
+            offset += 4
+            ethertype = struct.unpack_from('!H', frame, offset)[0]
+        offset += 2
+
+        if ethertype == 0x0800:
+            destination = frame[offset + 16:offset + 20]
+        elif ethertype == 0x86dd:
+            destination = frame[offset + 24:offset + 40]
+        else:
+            return None
+        return packed_groups.get(bytes(destination))
+
+    @staticmethod
+    def describe_zap(zap_round, zap):
+        def ms(value):
+            if value is None:
+                return "n/a"
+            return "{:.3f} ms".format(value / 1e6)
+
+        return ("Zap {}: {}: {} -> {}: leave latency {}, join latency {}"
+                " (+/- {})".format(zap_round, zap['receiver'],
+                                   zap['old_group'], zap['new_group'],
+                                   ms(zap['leave_latency']),
+                                   ms(zap['join_latency']),
+                                   ms(zap['join'][1])))
+
+    def summarize(self, zaps):
+        """Join and leave latency statistics, overall and per group"""
+        per_group = {}
+        for zap in zaps:
+            per_group.setdefault(zap['new_group'], {'join': [], 'leave': []})
+            if zap['join_latency'] is not None:
+                per_group[zap['new_group']]['join'].append(zap['join_latency'])
+            if zap['old_group'] is not None:
+                per_group.setdefault(zap['old_group'], {'join': [], 'leave': []})
+                if zap['leave_latency'] is not None:
+                    per_group[zap['old_group']]['leave'].append(zap['leave_latency'])
+
+        errors = [zap['join'][1] for zap in zaps]
+        return {
+            'zaps': len(zaps),
+            'failed_joins': len([z for z in zaps if z['join_latency'] is None]),
+            'max_timestamp_error': max(errors) if errors else None,
+            'join': self.statistics([z['join_latency'] for z in zaps
+                                     if z['join_latency'] is not None]),
+            'leave': self.statistics([z['leave_latency'] for z in zaps
+                                      if z['leave_latency'] is not None]),
+            'per_group': dict(
+                (str(group), {'join': self.statistics(values['join']),
+                              'leave': self.statistics(values['leave'])})
+                for group, values in per_group.items()),
+        }
+
+    def statistics(self, values):
+        """Minimum, average, maximum and percentiles, in nanoseconds"""
+        if not values:
+            return None
+        values = sorted(values)
+        result = {
+            'count': len(values),
+            'minimum': values[0],
+            'average': sum(values) / len(values),
+            'maximum': values[-1],
+        }
+        for percentile in self.percentiles:
+            index = min(len(values) - 1,
+                        int(round(percentile / 100 * (len(values) - 1))))
+            result['p{}'.format(percentile)] = values[index]
+        return result
+
+    def print_results(self, results):
+        def line(name, stats):
+            if stats is None:
+                return "{}: no measurements".format(name)
+            text = "{}: min {:.3f} ms, avg {:.3f} ms, max {:.3f} ms".format(
+                name, stats['minimum'] / 1e6, stats['average'] / 1e6,
+                stats['maximum'] / 1e6)
+            for percentile in self.percentiles:
+                text += ", p{} {:.3f} ms".format(
+                    percentile, stats['p{}'.format(percentile)] / 1e6)
+            return text
+
+        print("")
+        print("Per group:")
+        for group in sorted(results['per_group']):
+            stats = results['per_group'][group]
+            print("  " + line(group + " join", stats['join']))
+            print("  " + line(group + " leave", stats['leave']))
+
+        print("")
+        print("{} zaps, {} without a frame of the new group".format(
+            results['zaps'], results['failed_joins']))
+        if results['max_timestamp_error'] is not None:
+            print("Maximum error on the join/leave moment: {:.3f} ms".format(
+                results['max_timestamp_error'] / 1e6))
+        print(line("Join latency", results['join']))
+        print(line("Leave latency", results['leave']))
+
+    def provision_port(self, config):
+        port = self.server.PortCreate(config['interface'])
+        port_l2 = port.Layer2EthIISet()
+        port_l2.MacSet(config['mac'])
+
+        ip_config = config['ip']
+        if not isinstance(ip_config, list):
+            # Config is not static, DHCP or slaac
+            if ip_config.lower() == "dhcpv4":
+                port_l3 = port.Layer3IPv4Set()
+                port_l3.ProtocolDhcpGet().Perform()
+                config['ip_address'] = port_l3.IpGet()
+            elif ip_config.lower() == "dhcpv6":
+                port_l3 = port.Layer3IPv6Set()
+                port_l3.ProtocolDhcpGet().Perform()
+                config['ip_address'] = port_l3.IpDhcpGet()
+            elif ip_config.lower() == "slaac":
+                port_l3 = port.Layer3IPv6Set()
+                port_l3.StatelessAutoconfiguration()
+                config['ip_address'] = port_l3.IpStatelessGet()
+        else:
+            # Static configuration
+            if len(ip_config) == 3:
+                # IPv4
+                port_l3 = port.Layer3IPv4Set()
+                port_l3.IpSet(ip_config[0])
+                port_l3.NetmaskSet(ip_config[1])
+                port_l3.GatewaySet(ip_config[2])
+                config['ip_address'] = port_l3.IpGet()
+            elif len(ip_config) == 2:
+                port_l3 = port.Layer3IPv6Set()
+                # IPv6
+                address = ip_config[0]
+                prefix_length = ip_config[1]
+                ip = "{}/{}".format(address, prefix_length)
+                port_l3.IpManualAdd(ip)
+                config['ip_address'] = ip_config[0]
+
+        if not isinstance(config['ip_address'], str):
+            ip = config['ip_address'][0]
+            if '/' in ip:
+                config['ip_address'] = ip.split('/')[0]
+
+        print("Created port", port.DescriptionGet())
+        return port
+
+    def generate_frame_string(self, src_mac, src_ip, udp_src_port, dst_mac, dst_ip, udp_dst_port):
+        ethernet_header_len = 14
+        ip_header_len = 20 if self.ip_version == 4 else 40
+        udp_header_len = 8
+        total_header_len = ethernet_header_len + ip_header_len + udp_header_len
+        payload = 'a' * (self.frame_size - total_header_len)
+
+        from scapy.layers.inet import UDP, IP, Ether
+        from scapy.layers.inet6 import IPv6
+        from scapy.all import Raw
+        udp_payload = Raw(payload.encode('ascii', 'strict'))
+        udp_header = UDP(dport=udp_dst_port, sport=udp_src_port)
+        if self.ip_version == 4:
+            ip_header = IP(src=src_ip, dst=dst_ip)
+        else:
+            ip_header = IPv6(src=src_ip, dst=dst_ip)
+        eth_header = Ether(src=src_mac, dst=dst_mac)
+        scapy_frame = eth_header / ip_header / udp_header / udp_payload
+
+        frame_content = bytearray(bytes(scapy_frame))
+
+        # The ByteBlower API expects an 'str' as input for the
+        # frame::BytesSet() method, we need to convert the bytearray
+        return ''.join((format(b, "02x") for b in frame_content))
+
+    @staticmethod
+    def convert_multicast_ip_to_mac(group):
+        """Multicast MAC address of an IPv4 or IPv6 multicast group
+
+        IPv4: 01:00:5e followed by the lower 23 bits of the address
+        IPv6: 33:33 followed by the lower 32 bits of the address
+        """
+        digits = bytearray(group.packed)
+        if group.version == 4:
+            return "01:00:5e:{:02x}:{:02x}:{:02x}".format(
+                digits[1] & 0x7f, digits[2], digits[3])
+        return "33:33:{:02x}:{:02x}:{:02x}:{:02x}".format(
+            digits[12], digits[13], digits[14], digits[15])
+
+
+# When this python module is called stand-alone, the run-function must be
+# called.  This approach makes it possible to include it in a series of
+# examples.
+if __name__ == "__main__":
+    example = Example(**configuration)
+    try:
+        example.run()
+    finally:
+        example.cleanup()
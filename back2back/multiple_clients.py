@@ -16,11 +16,13 @@ from __future__ import print_function
 import time
 
 # import the ByteBlower module
-from byteblowerll.byteblower import ByteBlower, RequestStartType
+from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import ConvertHTTPRequestStatusToString
-from byteblowerll.byteblower import HTTPRequestMethod, HTTPRequestStatus
+from byteblowerll.byteblower import HTTPRequestMethod
 from byteblowerll.byteblower import ParseHTTPRequestMethodFromString
 
+from http_client_launcher import HTTPClientLauncher
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-tutorial-3100.lab.byteblower.excentis.com',
@@ -60,7 +62,15 @@ configuration = {
          'duration': 15000000000},
         {'http_method': 'PUT',
          'duration': 10000000000},
-    ]
+    ],
+
+    # When to start each of the HTTP clients.
+    # Special value: None, all clients start at the same time.
+    # 'ramp': the clients start one after the other, at a constant rate.
+    # 'poisson': the clients arrive randomly, with the given average rate.
+    'start_stagger': None,
+    # 'start_stagger': {'type': 'ramp', 'clients_per_second': 10},
+    # 'start_stagger': {'type': 'poisson', 'clients_per_second': 10, 'seed': 1},
 }
 
 
@@ -79,6 +89,7 @@ class Example:
                 'http_method': http_method,
                 'duration': config_duration
             })
+        self.start_stagger = kwargs.get('start_stagger', None)
 
         self.server = None
         self.server_bb_port = None
@@ -111,46 +122,39 @@ class Example:
 
         # This section differs from the basic TCP example.
         # We will create multiple clients onto the same the ByteBlowerPort.
-        http_clients = []
-
-        # We'll use the max_duration for the stop condition further in
-        # the script.
-        max_duration = 0
+        # The launcher creates the clients and schedules when each one
+        # starts, following the configured start pattern.
+        launcher = HTTPClientLauncher(stagger=self.start_stagger)
 
-        # Configure each client one-by-one.
-        # This part is the same as the basic TCP example.
-        for client_config in self.http_client_configs:
-            # create a new HTTP Client and configure it.
+        def configure_client(http_client, index):
             # This part is the same for 1 or multiple ones.
             #
             # You can configure multiple clients to connect to the
             # the same server. You can even mix different HTTP Methods.
-            http_client = self.client_bb_port.ProtocolHttpClientAdd()
-
+            client_config = self.http_client_configs[index]
             http_client.RemoteAddressSet(http_server_ip_address)
             http_client.RemotePortSet(server_tcp_port)
 
             http_client.HttpMethodSet(client_config['http_method'])
             http_client.RequestDurationSet(client_config['duration'])
 
-            # The client configured duration is in nanoseconds, we want to keep
-            # the max_duration as simple as 'seconds', so convert the value.
-            client_duration_s = client_config['duration'] / 1e9
-            max_duration = max(max_duration, client_duration_s)
+        http_clients = launcher.create([self.client_bb_port],
+                                       len(self.http_client_configs),
+                                       configure_client)
 
-            # The RequestStartType is the main configuration difference 
-            # Between 2 TCP clients and multiple ones. Rather than starting
-            # the client directly, we'll schedule when to start.
-            http_client.RequestStartTypeSet(RequestStartType.Scheduled)
-            http_clients.append(http_client)
+        # We'll use the max_duration for the stop condition further in
+        # the script.  The client configured duration is in nanoseconds, we
+        # want to keep the max_duration as simple as 'seconds'.
+        max_duration = max([c['duration'] for c in self.http_client_configs] or [0])
+        max_duration = (max_duration + launcher.last_start_offset()) / 1e9
 
         print("Server port:", self.server_bb_port.DescriptionGet())
         print("Client port:", self.client_bb_port.DescriptionGet())
 
         # This is another difference with the basic TCP example.
-        # The Start method on a ByteBlower Port starts all scheduled traffic
+        # Starting a ByteBlower Port starts all scheduled traffic
         # types.  This example this means all configured HTTPClients.
-        self.client_bb_port.Start()
+        launcher.start()
 
         # Unlike before we now have several HTTPClients running together.
         # This makes determining when the scenario is finished more 
@@ -171,31 +175,18 @@ class Example:
             time.sleep(1)
 
             time_elapsed = time.time() - start_moment
-            print('%.2fs :: Waiting for clients to finish.' % time_elapsed)
 
             # Below is the second type of stop condition, a client based one.
-            any_client_running = False
-
-            # Consider a client finished when the state is either:
-            # - Finished
-            # - Error
-            finished_states = [
-                HTTPRequestStatus.Error,
-                HTTPRequestStatus.Finished
-            ]
-
-            for http_client in http_clients:
-                # Update the local API object with the  with the info on the
-                # ByteBlowerServer.
-                http_client.Refresh()
-
-                # Check the status.
-                status = http_client.RequestStatusGet()
-                this_client_running = status not in finished_states
-                any_client_running = any_client_running or this_client_running
+            # The launcher only polls the clients which are running, clients
+            # which are Finished or in Error are not refreshed anymore.
+            counts = launcher.poll()
+            print('%.2fs :: Waiting for clients to finish '
+                  '(%d scheduled, %d connecting, %d running, %d finished).' % (
+                      time_elapsed, counts['Scheduled'], counts['Connecting'],
+                      counts['Running'], counts['Finished']))
 
             # all clients finished?  No need to wait any longer.
-            if not any_client_running:
+            if not launcher.running():
                 break
 
         # Stop the HTTP Server. 
@@ -218,6 +209,9 @@ class Example:
         # Process each of the clients.
         results = []
         for client in http_clients:
+            # Finished clients were not polled anymore, fetch their
+            # final state.
+            client.Refresh()
             results.append(self.process_http_client(client))
 
         return results
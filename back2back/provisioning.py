@@ -0,0 +1,184 @@
+"""
+Provisioning of ByteBlower ports, shared by the examples.
+All examples are guaranteed to work with Python 2.7 and above
+
+Every example creates its ports from the same kind of configuration:
+
+    {
+        'interface': 'trunk-1-19',
+        'mac': '00:bb:01:00:00:01',
+        # Optional, a VLAN ID or a stack of VLAN IDs (outer VLAN first).
+        # None or 0: no VLAN.
+        'vlan': 2,
+        # 'dhcpv4', 'dhcpv6', 'slaac', [ip, netmask, gateway] or
+        # [ipv6 address, prefix length]
+        'ip': 'dhcpv4',
+    }
+
+provision_port() creates the port and returns a ProvisionedPort: the MAC
+address, the VLAN stack and the IP address, netmask (or prefix length) and
+gateway are read once, after provisioning, and kept as attributes.  Getters
+like Layer3IPv4Get().IpGet() or Layer2EthIIGet().MacGet() are round trips to
+the server, building thousands of flows no longer repeats them for every
+flow.  The MAC address of a destination is resolved once as well.
+
+Usage:
+    port = provision_port(server, config)
+    frame = Ether(src=port.mac, dst=port.resolve(dst_ip)) / ...
+    trigger = port.port.RxTriggerBasicAdd()
+    trigger.FilterSet(' and '.join(port.filter_elements() + ['udp port 4096']))
+
+The configuration gets the IP address of the port in 'ip_address', as the
+examples did before.
+"""
+from __future__ import print_function
+
+
+def _strip_prefix(address):
+    """'2001:db8::2/64' -> ('2001:db8::2', 64)"""
+    if '/' in address:
+        address, prefix_length = address.split('/')
+        return address, int(prefix_length)
+    return address, None
+
+
+def vlan_stack(config):
+    """The VLAN IDs of a port configuration, outer VLAN first
+
+    VLAN 0 (or None) means no VLAN, as in the examples' configurations.
+    """
+    vlan = config.get('vlan')
+    if not isinstance(vlan, (list, tuple)):
+        vlan = [vlan]
+    return [int(vlan_id) for vlan_id in vlan if vlan_id]
+
+
+class ProvisionedPort(object):
+    """A ByteBlower port and its addresses, as they were provisioned
+
+    The attributes are read once, they are not updated when the
+    configuration of the port changes afterwards.
+
+    :param port: The ByteBlower port
+    :type port: byteblowerll.byteblower.ByteBlowerPort
+    :param layer3: The layer 3 configuration of the port
+    :param ip_version: 4 or 6
+    """
+
+    def __init__(self, port, layer3, ip_version, mac, vlans, ip,
+                 netmask=None, prefix_length=None, gateway=None):
+        self.port = port
+        self.layer3 = layer3
+        self.ip_version = ip_version
+        self.mac = mac
+        self.vlans = vlans
+        self.ip = ip
+        self.netmask = netmask
+        self.prefix_length = prefix_length
+        self.gateway = gateway
+        # Destination IP address -> resolved MAC address
+        self._resolved = {}
+
+    def resolve(self, ip):
+        """The destination MAC address of frames to `ip`: the MAC address of
+        `ip` when it is in the same subnet, otherwise of the gateway.
+
+        Every address is resolved only once.
+        """
+        mac = self._resolved.get(ip)
+        if mac is None:
+            mac = self._resolved[ip] = self.layer3.Resolve(ip)
+        return mac
+
+    def filter_elements(self):
+        """BPF elements which match the frames to this port, e.g.
+        ['vlan 2', 'ip dst 10.1.0.2']"""
+        elements = ['vlan %d' % vlan_id for vlan_id in self.vlans]
+        if self.ip_version == 4:
+            elements.append('ip dst %s' % self.ip)
+        else:
+            elements.append('ip6 dst %s' % self.ip)
+        return elements
+
+    def layer2_headers(self, dst_mac):
+        """The scapy Ethernet header of frames sent by this port, with its
+        VLAN tags"""
+        from scapy.all import Dot1Q, Ether
+        header = Ether(src=self.mac, dst=dst_mac)
+        for vlan_id in self.vlans:
+            header = header / Dot1Q(vlan=vlan_id)
+        return header
+
+
+def provision_port(server, config):
+    """Creates and configures a ByteBlower port
+
+    :param server: The server to create the port on
+    :param config: The port configuration, see the module documentation.
+                   Its 'ip_address' is set to the IP address of the port.
+    :rtype: ProvisionedPort
+    """
+    port = server.PortCreate(config['interface'])
+    port.Layer2EthIISet().MacSet(config['mac'])
+
+    # When the config has a VLAN, add this layer to the ByteBlower port.  The
+    # extra layer ensures that the ByteBlowerPort performs basic
+    # functionality (DHCP, ARP, ...) in the configured VLAN.  Every VLAN of a
+    # stack is a Layer25Vlan, the outer one is added first.
+    #
+    # Only the VLAN ID is configured.  A Layer25Vlan can also be given a
+    # priority (PCP) and a drop eligible indicator (DEI), see the API
+    # reference.
+    #
+    # The remainder of the configuration is independent of the VLAN.  When
+    # necessary the ByteBlower adds the VLAN to the appropriate protocols.
+    vlans = vlan_stack(config)
+    for vlan_id in vlans:
+        port.Layer25VlanAdd().IDSet(vlan_id)
+
+    ip_config = config['ip']
+    netmask = None
+    prefix_length = None
+    if not isinstance(ip_config, list):
+        # Config is not static, DHCP or slaac
+        if ip_config.lower() == "dhcpv4":
+            ip_version = 4
+            port_l3 = port.Layer3IPv4Set()
+            port_l3.ProtocolDhcpGet().Perform()
+            ip = port_l3.IpGet()
+            netmask = port_l3.NetmaskGet()
+        elif ip_config.lower() == "dhcpv6":
+            ip_version = 6
+            port_l3 = port.Layer3IPv6Set()
+            port_l3.ProtocolDhcpGet().Perform()
+            ip, prefix_length = _strip_prefix(port_l3.IpDhcpGet()[0])
+        elif ip_config.lower() == "slaac":
+            ip_version = 6
+            port_l3 = port.Layer3IPv6Set()
+            port_l3.StatelessAutoconfiguration()
+            ip, prefix_length = _strip_prefix(port_l3.IpStatelessGet()[0])
+        else:
+            raise ValueError("Unknown IP configuration %r" % ip_config)
+        gateway = port_l3.GatewayGet()
+    elif len(ip_config) == 3:
+        # Static IPv4, nothing to read back
+        ip_version = 4
+        ip, netmask, gateway = ip_config
+        port_l3 = port.Layer3IPv4Set()
+        port_l3.IpSet(ip)
+        port_l3.NetmaskSet(netmask)
+        port_l3.GatewaySet(gateway)
+    elif len(ip_config) == 2:
+        # Static IPv6, the gateway is learned from router advertisements
+        ip_version = 6
+        ip, prefix_length = ip_config[0], int(ip_config[1])
+        port_l3 = port.Layer3IPv6Set()
+        port_l3.IpManualAdd("{}/{}".format(ip, prefix_length))
+        gateway = None
+    else:
+        raise ValueError("Unknown IP configuration %r" % (ip_config,))
+
+    config['ip_address'] = ip
+    return ProvisionedPort(port, port_l3, ip_version, config['mac'], vlans,
+                           ip, netmask=netmask, prefix_length=prefix_length,
+                           gateway=gateway)
@@ -0,0 +1,262 @@
+"""
+Streaming statistics on the interval results of a flow.
+All examples are guaranteed to work with Python 2.7 and above
+
+The examples only print the latest interval result.  A pass/fail decision
+needs metrics over a window, e.g. the average throughput of the last 30
+seconds.  Every building block here costs constant time per sample:
+  - RollingWindow: mean, variance, minimum and maximum over the last
+    N samples (ring buffer, Welford updates which add and remove a sample,
+    monotonic deques for the extremes)
+  - EWMA: exponentially weighted moving average
+  - Welford: mean and variance over all samples
+
+FlowStatistics combines them for the interval results of a flow, and
+ThresholdRules evaluates rules on those statistics, e.g.
+    rules = ThresholdRules([
+        # warn when the 30 second average drops below 90 Mbit/s
+        {'metric': 'throughput_avg', 'below': 90e6},
+        # stop the test when the loss is above 5%
+        {'metric': 'loss_ewma', 'above': 5.0, 'hard': True},
+    ])
+"""
+from __future__ import division
+from __future__ import print_function
+
+import math
+from collections import deque
+
+
+class RollingWindow(object):
+    """Statistics over the last `size` samples
+
+    :param size: Number of samples in the window
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.samples = deque()
+        # Welford's running mean and sum of squared deviations.  A sum of
+        # squares loses the variance to rounding at Gbps throughputs.
+        self._mean = 0.0
+        self._m2 = 0.0
+        # (index, value) pairs, the values are increasing for the minimum
+        # and decreasing for the maximum
+        self._minimum = deque()
+        self._maximum = deque()
+        self._index = 0
+
+    def add(self, value):
+        self.samples.append(value)
+        delta = value - self._mean
+        self._mean += delta / len(self.samples)
+        self._m2 += delta * (value - self._mean)
+
+        while self._minimum and self._minimum[-1][1] >= value:
+            self._minimum.pop()
+        self._minimum.append((self._index, value))
+        while self._maximum and self._maximum[-1][1] <= value:
+            self._maximum.pop()
+        self._maximum.append((self._index, value))
+        self._index += 1
+
+        if len(self.samples) > self.size:
+            old = self.samples.popleft()
+            # Welford's update in reverse
+            delta = old - self._mean
+            self._mean -= delta / len(self.samples)
+            self._m2 -= delta * (old - self._mean)
+
+        # Drop the extremes which left the window
+        first = self._index - len(self.samples)
+        if self._minimum[0][0] < first:
+            self._minimum.popleft()
+        if self._maximum[0][0] < first:
+            self._maximum.popleft()
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def full(self):
+        return len(self.samples) == self.size
+
+    @property
+    def mean(self):
+        if not self.samples:
+            return None
+        return self._mean
+
+    @property
+    def variance(self):
+        if not self.samples:
+            return None
+        # Rounding errors may cause a tiny negative result
+        return max(0.0, self._m2 / len(self.samples))
+
+    @property
+    def stddev(self):
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    @property
+    def minimum(self):
+        return self._minimum[0][1] if self._minimum else None
+
+    @property
+    def maximum(self):
+        return self._maximum[0][1] if self._maximum else None
+
+
+class EWMA(object):
+    """Exponentially weighted moving average
+
+    :param alpha: Weight of the newest sample, between 0 and 1
+    """
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def add(self, value):
+        if self.value is None:
+            self.value = float(value)
+        else:
+            self.value += self.alpha * (value - self.value)
+
+
+class Welford(object):
+    """Mean and variance over all samples, numerically stable"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class FlowStatistics(object):
+    """Rolling statistics of the interval results of a flow
+
+    :param window: Number of intervals in the rolling window
+    :param alpha: Weight of the newest interval in the EWMA of the loss
+    """
+
+    def __init__(self, window=30, alpha=0.2):
+        self.throughput = RollingWindow(window)
+        self.loss = RollingWindow(window)
+        self.loss_ewma = EWMA(alpha)
+        self.throughput_overall = Welford()
+        self.latency = RollingWindow(window)
+        self.last_timestamp = None
+        self.intervals = 0
+
+    def add_interval(self, timestamp, tx_frames, rx_frames, rx_bytes,
+                     duration_ns=1000000000, latency_ns=None):
+        """Adds one interval result
+
+        The same interval is only counted once, so it is safe to call this
+        more often than the interval duration.
+
+        :return: True when the interval was new
+        """
+        if timestamp == self.last_timestamp:
+            return False
+        self.last_timestamp = timestamp
+        self.intervals += 1
+
+        throughput = rx_bytes * 8 * 1e9 / duration_ns
+        self.throughput.add(throughput)
+        self.throughput_overall.add(throughput)
+
+        if tx_frames > 0:
+            loss = max(0.0, (tx_frames - rx_frames) * 100.0 / tx_frames)
+            self.loss.add(loss)
+            self.loss_ewma.add(loss)
+
+        if latency_ns is not None:
+            self.latency.add(latency_ns)
+        return True
+
+    def metrics(self):
+        """The current value of all metrics, by name"""
+        return {
+            'intervals': self.intervals,
+            'throughput': self.throughput.samples[-1] if self.throughput.samples else None,
+            'throughput_avg': self.throughput.mean,
+            'throughput_min': self.throughput.minimum,
+            'throughput_max': self.throughput.maximum,
+            'throughput_stddev': self.throughput.stddev,
+            'throughput_overall_avg': self.throughput_overall.mean if self.intervals else None,
+            'loss': self.loss.samples[-1] if self.loss.samples else None,
+            'loss_avg': self.loss.mean,
+            'loss_ewma': self.loss_ewma.value,
+            'loss_max': self.loss.maximum,
+            'latency_avg': self.latency.mean,
+            'latency_max': self.latency.maximum,
+            # The jitter over the window: the deviation of the latency
+            'jitter': self.latency.stddev,
+        }
+
+
+class ThresholdRules(object):
+    """Evaluates threshold rules on the metrics of FlowStatistics
+
+    Every rule is a dict with
+      - 'metric': name of the metric, see FlowStatistics.metrics()
+      - 'above' or 'below': the threshold
+      - 'hard' (optional): a violation of a hard rule stops the test
+      - 'after' (optional): number of intervals before the rule applies,
+        defaults to 1.  Use the window size to only judge full windows.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+        for rule in self.rules:
+            if 'above' not in rule and 'below' not in rule:
+                raise ValueError("Rule on '%s' needs 'above' or 'below'"
+                                 % rule['metric'])
+
+    def evaluate(self, metrics):
+        """Returns the violated rules, as list of (rule, value)"""
+        violations = []
+        for rule in self.rules:
+            if metrics['intervals'] < rule.get('after', 1):
+                continue
+            value = metrics.get(rule['metric'])
+            if value is None:
+                continue
+            if 'above' in rule and value > rule['above']:
+                violations.append((rule, value))
+            elif 'below' in rule and value < rule['below']:
+                violations.append((rule, value))
+        return violations
+
+    @staticmethod
+    def has_hard_failure(violations):
+        return any(rule.get('hard', False) for rule, _ in violations)
+
+    @staticmethod
+    def describe(violation):
+        rule, value = violation
+        if 'above' in rule:
+            condition = "above %g" % rule['above']
+        else:
+            condition = "below %g" % rule['below']
+        return "%s %s: %g is %s" % ('FAIL' if rule.get('hard') else 'WARN',
+                                    rule['metric'], value, condition)
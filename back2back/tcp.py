@@ -13,9 +13,15 @@ The ByteBlower port configuration is very flexible, you can configure
 # Needed for python2 / python3 print function compatibility
 from __future__ import print_function
 
+import os
+import sys
+
 # import the ByteBlower module
 import byteblowerll.byteblower as byteblower
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from provisioning import provision_port
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
@@ -128,13 +134,15 @@ class Example:
 
         # Create the port which will be the HTTP server (port_1)
         print("Creating HTTP Server port")
-        self.port_1 = self.provision_port(self.port_1_config)
+        server_port = self.provision_port(self.port_1_config)
+        self.port_1 = server_port.port
 
         print("Creating HTTP Client port")
         # Create the port which will be the HTTP client (port_2)
-        self.port_2 = self.provision_port(self.port_2_config)
+        self.port_2 = self.provision_port(self.port_2_config).port
 
-        http_server_ip_address = self.port_1_config['ip_address']
+        # The address was read once while provisioning, no round trip here
+        http_server_ip_address = server_port.ip
 
         # create a HTTP server
         http_server = self.port_1.ProtocolHttpServerAdd()
@@ -225,54 +233,12 @@ class Example:
         ]
 
     def provision_port(self, config):
-        port = self.server.PortCreate(config['interface'])
-        port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(config['mac'])
-
-        if 'vlan' in config:
-            vlan_id = int(config['vlan'])
-            port_l25 = port.Layer25VlanAdd()
-            port_l25.IDSet(vlan_id)
-
-        ip_config = config['ip']
-        if not isinstance(ip_config, list):
-            # Config is not static, DHCP or slaac
-            if ip_config.lower() == "dhcpv4":
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpGet()
-            elif ip_config.lower() == "dhcpv6":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpDhcpGet()
-            elif ip_config.lower() == "slaac":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.StatelessAutoconfiguration()
-                config['ip_address'] = port_l3.IpStatelessGet()
-        else:
-            # Static configuration
-            if len(ip_config) == 3:
-                # IPv4
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.IpSet(ip_config[0])
-                port_l3.NetmaskSet(ip_config[1])
-                port_l3.GatewaySet(ip_config[2])
-                config['ip_address'] = port_l3.IpGet()
-            elif len(ip_config) == 2:
-                port_l3 = port.Layer3IPv6Set()
-                # IPv6
-                address = ip_config[0]
-                prefix_length = ip_config[1]
-                ip = "{}/{}".format(address, prefix_length)
-                port_l3.IpManualAdd(ip)
-                config['ip_address'] = ip_config[0]
-
-        if not isinstance(config['ip_address'], str):
-            ip = config['ip_address'][0]
-            if '/' in ip:
-                config['ip_address'] = ip.split('/')[0]
-
-        print("Created port", port.DescriptionGet())
+        """Creates the port, see provisioning.py
+
+        :rtype: provisioning.ProvisionedPort
+        """
+        port = provision_port(self.server, config)
+        print("Created port", port.port.DescriptionGet())
         return port
 
 
@@ -21,6 +21,9 @@ import byteblowerll.byteblower as api
 import time
 import datetime
 
+from change_detection import LiveChangeDetector, describe_change, plot_lines
+from provisioning import provision_port
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': '10.10.1.202',
@@ -104,7 +107,14 @@ configuration = {
     # 'request_size': 1000000,
 
     # TOS value to use on the HTTP client (and server)
-    'tos': 0
+    'tos': 0,
+
+    # The results are stored in this SQLite database, to compare runs over
+    # time (see demo_scripts/results_db.py).  None disables storing.
+    'results_database': 'byteblower_results.db',
+
+    # Name of the device under test, stored along the results
+    'dut': None,
 }
 
 
@@ -131,6 +141,7 @@ class Example:
         self.max_duration = datetime.timedelta(seconds=int(max_duration) / 1e9)
 
         self.server = None
+        self.server_version = None
         self.port_1 = None
         self.port_2 = None
 
@@ -142,6 +153,7 @@ class Example:
 
     def check_server_version(self):
         server_version = self.server.ServiceInfoGet().VersionGet()
+        self.server_version = server_version
         version_components = tuple([int(i) for i in server_version.split('.')])
         print("Server runs version %s" % server_version)
 
@@ -165,13 +177,15 @@ class Example:
 
         # Create the port which will be the HTTP server (port_1)
         print("Creating HTTP Server port")
-        self.port_1 = self.provision_port(self.port_1_config)
+        server_port = self.provision_port(self.port_1_config)
+        self.port_1 = server_port.port
 
         print("Creating HTTP Client port")
         # Create the port which will be the HTTP client (port_2)
-        self.port_2 = self.provision_port(self.port_2_config)
+        self.port_2 = self.provision_port(self.port_2_config).port
 
-        http_server_ip_address = self.port_1_config['ip_address']
+        # The address was read once while provisioning, no round trip here
+        http_server_ip_address = server_port.ip
 
         # create an HTTP server
         http_server = self.port_1.ProtocolHttpServerAdd()  # type: api.HTTPServer
@@ -239,6 +253,20 @@ class Example:
 
         http_server_session_info = http_server.HttpSessionInfoGet(http_client.ServerClientIdGet())
 
+        # The receiving side: the client for GET, the server for PUT
+        rx_session_info = client_session_info
+        if self.http_method == api.HTTPRequestMethod.Put:
+            rx_session_info = http_server_session_info
+        rx_history = rx_session_info.ResultHistoryGet()
+
+        # Flags the moments the throughput or latency changed level, while
+        # the test runs
+        live = LiveChangeDetector(rx_history,
+                                  ["rx_throughput_bits_per_seconds",
+                                   "rx_avg_latency_nanoseconds"],
+                                  interval_result,
+                                  timestamp_key="timestamp_nanoseconds")
+
         while (
                 datetime.datetime.now() - start_time < self.max_duration
                 or client_session_info.RequestStatusGet() != api.HTTPRequestStatus.Finished
@@ -252,6 +280,7 @@ class Example:
             # when intermediate intervals are needed
             client_session_info.ResultHistoryGet().Refresh()
             http_server_session_info.ResultHistoryGet().Refresh()
+            live.poll()
 
             # wait 1 second to repeat the loop
             time.sleep(1)
@@ -259,10 +288,13 @@ class Example:
         http_client.RequestStop()
         http_server.Stop()
 
-        return self.process_results(http_server, http_client)
+        rx_history.Refresh()
+        live.finish()
+
+        return self.process_results(http_server, http_client, live)
 
-    def process_results(self, server, client):
-        # type: (api.HTTPServer, api.HTTPClient) -> dict
+    def process_results(self, server, client, live):
+        # type: (api.HTTPServer, api.HTTPClient, LiveChangeDetector) -> dict
 
         server_session = server.HttpSessionInfoGet(client.ServerClientIdGet())
         client_session = client.HttpSessionInfoGet()
@@ -293,25 +325,11 @@ class Example:
         tx_average_data_speed = tx_result.AverageDataSpeedGet()  # type: api.DataRate
         rx_average_data_speed = rx_result.AverageDataSpeedGet()  # type: api.DataRate
 
-        # fetch our history information
+        # The history information was collected while the test ran
         # for now we only include the rx side information
         # - Average speed
         # - Latency info (min, avg, max, jitter)
-        history_results = []
-        rx_history = rx_session_info.ResultHistoryGet()  # type: api.HTTPResultHistory
-        rx_history.Refresh()
-
-        for interval_snapshot in rx_history.IntervalGet():  # type: api.HTTPResultData
-            dataspeed = interval_snapshot.AverageDataSpeedGet()
-
-            history_results.append({
-                "timestamp_nanoseconds": interval_snapshot.TimestampGet(),
-                "rx_throughput_bits_per_seconds": dataspeed.bitrate(),
-                "rx_min_latency_nanoseconds": interval_snapshot.LatencyMinimumGet(0),
-                "rx_avg_latency_nanoseconds": interval_snapshot.LatencyAverageGet(0),
-                "rx_max_latency_nanoseconds": interval_snapshot.LatencyMaximumGet(0),
-                "rx_jitter_nanoseconds": interval_snapshot.JitterGet(0),
-            })
+        history_results = live.samples
 
         return {
             "request_size_bytes": self.request_size,
@@ -324,63 +342,34 @@ class Example:
             "rx_avg_latency_nanoseconds": rx_result.LatencyAverageGet(0),
             "rx_max_latency_nanoseconds": rx_result.LatencyMaximumGet(0),
             "rx_jitter_nanoseconds": rx_result.JitterGet(0),
-            "interval_results": history_results
+            "interval_results": history_results,
+            "change_points": live.change_points,
         }
 
     def provision_port(self, config):
-        port = self.server.PortCreate(config['interface'])
-        port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(config['mac'])
-
-        vlan_id = config.get('vlan', None)
-        vlan_id = int(vlan_id) if vlan_id is not None else None
-        if vlan_id:
-            port_l25 = port.Layer25VlanAdd()
-            port_l25.IDSet(vlan_id)
-
-        ip_config = config['ip']
-        if not isinstance(ip_config, list):
-            # Config is not static, DHCP or slaac
-            if ip_config.lower() == "dhcpv4":
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpGet()
-
-            elif ip_config.lower() == "dhcpv6":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.ProtocolDhcpGet().Perform()
-                config['ip_address'] = port_l3.IpDhcpGet()
-            elif ip_config.lower() == "slaac":
-                port_l3 = port.Layer3IPv6Set()
-                port_l3.StatelessAutoconfiguration()
-                config['ip_address'] = port_l3.IpStatelessGet()
-        else:
-            # Static configuration
-            if len(ip_config) == 3:
-                # IPv4
-                port_l3 = port.Layer3IPv4Set()
-                port_l3.IpSet(ip_config[0])
-                port_l3.NetmaskSet(ip_config[1])
-                port_l3.GatewaySet(ip_config[2])
-                config['ip_address'] = port_l3.IpGet()
-            elif len(ip_config) == 2:
-                port_l3 = port.Layer3IPv6Set()
-                # IPv6
-                address = ip_config[0]
-                prefix_length = ip_config[1]
-                ip = "{}/{}".format(address, prefix_length)
-                port_l3.IpManualAdd(ip)
-                config['ip_address'] = ip_config[0]
-
-        if not isinstance(config['ip_address'], str):
-            ip = config['ip_address'][0]
-            if '/' in ip:
-                config['ip_address'] = ip.split('/')[0]
-
-        print("Created port", port.DescriptionGet())
+        """Creates the port, see provisioning.py
+
+        :rtype: provisioning.ProvisionedPort
+        """
+        port = provision_port(self.server, config)
+        print("Created port", port.port.DescriptionGet())
         return port
 
 
+def interval_result(interval_snapshot):
+    # type: (api.HTTPResultData) -> dict
+    """The rx results of an interval of the history"""
+    dataspeed = interval_snapshot.AverageDataSpeedGet()
+    return {
+        "timestamp_nanoseconds": interval_snapshot.TimestampGet(),
+        "rx_throughput_bits_per_seconds": dataspeed.bitrate(),
+        "rx_min_latency_nanoseconds": interval_snapshot.LatencyMinimumGet(0),
+        "rx_avg_latency_nanoseconds": interval_snapshot.LatencyAverageGet(0),
+        "rx_max_latency_nanoseconds": interval_snapshot.LatencyMaximumGet(0),
+        "rx_jitter_nanoseconds": interval_snapshot.JitterGet(0),
+    }
+
+
 def print_results(results):
     print("The test collected the following interval results:")
     interval_results = results.get('interval_results', [])
@@ -402,6 +391,12 @@ def print_results(results):
                   snapshot.get('rx_jitter_nanoseconds', 0) / 1e6,
               ))
 
+    change_points = results.get('change_points', [])
+    if change_points:
+        print("Detected changes:")
+    for change in change_points:
+        print("    " + describe_change(change, first_timestamp))
+
     print("Total bytes transmitted: %d" % results.get('tx_data_bytes', 0))
     print("Total bytes received:    %d" % results.get('rx_data_bytes', 0))
     print("Total average throughput %.02f Mbit/s" % (
@@ -418,17 +413,18 @@ def print_results(results):
 
 def plot_highcharts(results):
     import os.path
-    try:
-        from highcharts import Highchart
-    except ImportError:
-        print("Highcharts not available, not plotting the results")
-        return
+    import sys
+
+    # The report writer is shared with the demo scripts.  It downsamples
+    # long series, so the page remains responsive for long tests.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'demo_scripts', 'plotting'))
+    from highcharts_report import ChunkedReport
 
     from pprint import pprint
     print("Raw data:")
     pprint(results)
 
-    chart = Highchart(width=1000, height=400)
     styling = '<span style="font-family: \'DejaVu Sans\', Arial, Helvetica, sans-serif; color: '
     options = {
         'title': {
@@ -456,8 +452,6 @@ def plot_highcharts(results):
             },
         ],
     }
-    chart.set_dict_options(options)
-
     throughput_series = []
     min_latency_series = []
     avg_latency_series = []
@@ -487,21 +481,48 @@ def plot_highcharts(results):
             avg_latency_ms + jitter_ms
         ))
 
-    chart.add_data_set(throughput_series, 'line', 'Throughput', yAxis=0)
-    chart.add_data_set(jitter_series, 'arearange', 'Jitter', yAxis=1)
-    chart.add_data_set(min_latency_series, 'line', 'Minimum Latency', yAxis=1)
-    chart.add_data_set(avg_latency_series, 'line', 'Average Latency', yAxis=1)
-    chart.add_data_set(max_latency_series, 'line', 'Maximum Latency', yAxis=1)
+    # Mark the detected changes on the time axis
+    options['xAxis']['plotLines'] = plot_lines(
+        results.get('change_points', []),
+        lambda timestamp_ns: (timestamp_ns - first_timestamp_ns) / 1e6)
 
     filename = os.path.basename(__file__).split('.')[0] + '.html'
-    with open(filename, 'w') as handle:
-        handle.write(chart.htmlcontent)
+    with ChunkedReport(filename, options, width=1000, height=400) as chart:
+        chart.add_data_set(throughput_series, 'line', 'Throughput', yAxis=0)
+        chart.add_data_set(jitter_series, 'arearange', 'Jitter', yAxis=1)
+        chart.add_data_set(min_latency_series, 'line', 'Minimum Latency', yAxis=1)
+        chart.add_data_set(avg_latency_series, 'line', 'Average Latency', yAxis=1)
+        chart.add_data_set(max_latency_series, 'line', 'Maximum Latency', yAxis=1)
 
     print("Plotted interval chart to %s" % (
         os.path.join(os.path.realpath(os.getcwd()), filename)
     ))
 
 
+def store_results(results, server_version):
+    import os.path
+    import sys
+
+    if configuration.get('results_database') is None:
+        return
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'demo_scripts'))
+    from results_db import ResultsDatabase
+
+    with ResultsDatabase(configuration['results_database']) as database:
+        run_id = database.add_run('tcp_oneway_latency', configuration,
+                                  server_version=server_version,
+                                  dut=configuration.get('dut'))
+        database.add_summary(run_id, results)
+        database.add_interval_results(run_id,
+                                      results.get('interval_results', []),
+                                      'timestamp_nanoseconds')
+        database.add_change_points(run_id, results.get('change_points', []))
+    print("Results stored as run %d in %s" % (
+        run_id, configuration['results_database']))
+
+
 def main():
     # When this python module is called stand-alone, the run-function must be
     # called.  This approach makes it possible to include it in a series of
@@ -512,6 +533,7 @@ def main():
 
         print_results(outcome)
         plot_highcharts(outcome)
+        store_results(outcome, example.server_version)
 
     except api.ConfigError as e:
         print(e.what())
@@ -0,0 +1,420 @@
+"""
+TCP One Way Latency under load for the ByteBlower Python API.
+All examples are guaranteed to work with Python 2.7 and above
+
+This example extends tcp_oneway_latency.py from a single HTTP client to
+many concurrent latency-enabled HTTP clients, spread over several ByteBlower
+ports.  It collects:
+  - per session: throughput and latency (minimum, average, maximum, jitter)
+  - per interval, aggregated over all sessions:
+    minimum, average, maximum, jitter and percentiles of the session
+    averages (see aggregate_interval)
+
+To keep the client side cheap when the number of sessions grows:
+  - all clients are started with a single call, using scheduled start
+  - all session histories are refreshed with a single ResultsRefresh call
+  - only the intervals which are new since the previous poll are processed
+"""
+# Needed for python2 / python3 print function compatibility
+from __future__ import division
+from __future__ import print_function
+
+import math
+import time
+
+# import the ByteBlower module
+import byteblowerll.byteblower as api
+
+import tcp_oneway_latency
+
+configuration = {
+    # Address (IP or FQDN) of the ByteBlower server to use
+    'server_address': '10.10.1.202',
+
+    # Configuration for the ByteBlower port which will be used as HTTP server.
+    # See tcp_oneway_latency.py for all IP configuration options.
+    'server_port_config': {
+        'interface': 'trunk-1-7',
+        'mac': '00:bb:01:00:00:01',
+        'ip': 'dhcpv4',
+
+        # TCP port number on which the HTTP server listens.
+        'tcp_port': 4096
+    },
+
+    # Configuration for the ByteBlower ports which will be used as HTTP
+    # clients.  Every client port gets 'sessions_per_port' HTTP clients.
+    'client_port_configs': [
+        {
+            'interface': 'trunk-1-3',
+            'mac': '00:bb:01:00:00:02',
+            'ip': 'dhcpv4',
+        },
+        {
+            'interface': 'trunk-1-4',
+            'mac': '00:bb:01:00:00:03',
+            'ip': 'dhcpv4',
+        },
+    ],
+
+    # Number of latency-enabled HTTP clients on each client port.
+    'sessions_per_port': 50,
+
+    # HTTP Method can be GET or PUT
+    'http_method': 'GET',
+    # 'http_method': 'PUT',
+
+    # duration of each session, in nanoseconds
+    'duration': 15000000000,
+
+    # Time between the scheduled start of two consecutive sessions on the
+    # same port, in nanoseconds.  Spreading the starts avoids a burst of
+    # TCP handshakes.
+    'start_interval': 10000000,
+
+    # Time between two polls of the session results, in seconds.
+    # Increase it when running many hundreds of sessions.
+    'poll_interval': 1,
+
+    # Percentiles of the average latency of the sessions to report for every
+    # interval, weighted with the bytes each session received.  These are not
+    # percentiles of the latency of the individual segments.
+    'percentiles': [50, 90, 99]
+}
+
+
+def weighted_percentile(samples, percentile):
+    """Percentile of weighted samples
+
+    :param samples: list of (value, weight) tuples, sorted on value
+    :param percentile: percentile to compute, between 0 and 100
+    :return: the smallest value for which the cumulative weight reaches
+             the requested percentile, or None without samples
+    """
+    total_weight = sum(weight for _, weight in samples)
+    if not samples or total_weight <= 0:
+        return None
+
+    threshold = total_weight * percentile / 100.0
+    cumulative = 0
+    for value, weight in samples:
+        cumulative += weight
+        if cumulative >= threshold:
+            return value
+    return samples[-1][0]
+
+
+def aggregate_interval(samples, percentiles):
+    """Aggregate the latency of one interval over all sessions
+
+    Every session contributes with the number of bytes it received in
+    the interval as weight.  The aggregated jitter is the pooled standard
+    deviation of the sessions.
+
+    The API only reports the minimum, average, maximum and jitter of every
+    session.  The percentiles are therefore byte-weighted percentiles of the
+    average latency of the sessions (e.g. 'rx_session_avg_p90...': 90% of the
+    bytes were received by sessions with at most this average latency), not
+    percentiles of the latency of the individual segments.
+
+    :param samples: list of dicts with the interval results of each session
+    :param percentiles: list of percentiles to compute
+    :return: a dict with the aggregated interval results
+    """
+    samples = [s for s in samples if s['rx_bytes'] > 0]
+    result = {
+        'sessions': len(samples),
+        'rx_bytes': sum(s['rx_bytes'] for s in samples),
+        'rx_throughput_bits_per_second': sum(s['rx_throughput_bits_per_second'] for s in samples),
+    }
+    if not samples:
+        return result
+
+    total_weight = result['rx_bytes']
+    average = sum(s['avg'] * s['rx_bytes'] for s in samples) / total_weight
+    variance = sum((s['jitter'] ** 2 + (s['avg'] - average) ** 2) * s['rx_bytes']
+                   for s in samples) / total_weight
+
+    result.update({
+        'rx_min_latency_nanoseconds': min(s['min'] for s in samples),
+        'rx_avg_latency_nanoseconds': average,
+        'rx_max_latency_nanoseconds': max(s['max'] for s in samples),
+        'rx_jitter_nanoseconds': math.sqrt(variance),
+    })
+
+    weighted = sorted((s['avg'], s['rx_bytes']) for s in samples)
+    for percentile in percentiles:
+        key = 'rx_session_avg_p%s_latency_nanoseconds' % percentile
+        result[key] = weighted_percentile(weighted, percentile)
+
+    return result
+
+
+class LatencySession(object):
+    """One latency-enabled HTTP client and its receiving session"""
+
+    def __init__(self, http_server, http_client):
+        self.http_server = http_server
+        self.http_client = http_client
+        self.rx_session_info = None
+        self.last_timestamp = 0
+
+    def connect(self):
+        """Look up the receiving session, once the client has one
+
+        :return: True when the receiving session is known
+        """
+        if self.rx_session_info is not None:
+            return True
+
+        if not self.http_client.HasSession():
+            return False
+
+        # When the HTTP Request Method is "GET", data flows from the server
+        # towards the client, otherwise from the client towards the server.
+        if self.http_client.HttpMethodGet() == api.HTTPRequestMethod.Put:
+            client_id = self.http_client.ServerClientIdGet()
+            self.rx_session_info = self.http_server.HttpSessionInfoGet(client_id)
+        else:
+            self.rx_session_info = self.http_client.HttpSessionInfoGet()
+        return True
+
+    def new_intervals(self):
+        """Returns the intervals which were not processed yet
+
+        The history is walked from the newest interval backwards, so the cost
+        only depends on the number of new intervals.
+        """
+        intervals = []
+        history = self.rx_session_info.ResultHistoryGet()
+        for index in reversed(range(history.IntervalLengthGet())):
+            interval = history.IntervalGetByIndex(index)
+            timestamp = interval.TimestampGet()
+            if timestamp <= self.last_timestamp:
+                break
+            intervals.append(interval)
+
+        if intervals:
+            self.last_timestamp = intervals[0].TimestampGet()
+        intervals.reverse()
+        return intervals
+
+
+class Example(tcp_oneway_latency.Example):
+    def __init__(self, **kwargs):
+        self.server_address = kwargs['server_address']
+        self.server_port_config = kwargs['server_port_config']
+        self.client_port_configs = kwargs['client_port_configs']
+        self.sessions_per_port = kwargs['sessions_per_port']
+
+        from byteblowerll.byteblower import ParseHTTPRequestMethodFromString
+        self.http_method = ParseHTTPRequestMethodFromString(kwargs['http_method'])
+        self.duration = kwargs['duration']
+        self.start_interval = kwargs.get('start_interval', 0)
+        self.poll_interval = kwargs.get('poll_interval', 1)
+        self.percentiles = kwargs.get('percentiles', [50, 90, 99])
+
+        self.server = None
+        self.server_port = None
+        self.client_ports = []
+
+    def cleanup(self):
+        for port in self.client_ports:
+            self.server.PortDestroy(port)
+        self.client_ports = []
+        if self.server_port is not None:
+            self.server.PortDestroy(self.server_port)
+            self.server_port = None
+        tcp_oneway_latency.Example.cleanup(self)
+
+    def run(self):
+        byteblower_instance = api.ByteBlower.InstanceGet()
+
+        print("Connecting to ByteBlower server %s..." % self.server_address)
+        self.server = byteblower_instance.ServerAdd(self.server_address)
+        self.check_server_version()
+
+        print("Creating HTTP Server port")
+        server_port = self.provision_port(self.server_port_config)
+        self.server_port = server_port.port
+        http_server_ip_address = server_port.ip
+
+        http_server = self.server_port.ProtocolHttpServerAdd()
+        server_tcp_port = self.server_port_config['tcp_port']
+        http_server.PortSet(server_tcp_port)
+        http_server.Start()
+
+        sessions = []
+        for port_config in self.client_port_configs:
+            print("Creating HTTP Client port")
+            client_port = self.provision_port(port_config).port
+            self.client_ports.append(client_port)
+
+            for i in range(self.sessions_per_port):
+                http_client = client_port.ProtocolHttpClientAdd()
+                http_client.RemoteAddressSet(http_server_ip_address)
+                http_client.RemotePortSet(server_tcp_port)
+                http_client.HttpMethodSet(self.http_method)
+                http_client.LatencyEnable(True)
+                http_client.RequestDurationSet(self.duration)
+
+                # Scheduled clients start when their port is started,
+                # each one a little later than the previous one.
+                http_client.RequestStartTypeSet(api.RequestStartType.Scheduled)
+                http_client.RequestInitialTimeToWaitSet(i * self.start_interval)
+
+                sessions.append(LatencySession(http_server, http_client))
+
+        print("Created %d HTTP clients on %d ports" % (
+            len(sessions), len(self.client_ports)))
+
+        # Start all client ports, and thus all HTTP clients, at once.
+        ports_to_start = api.ByteBlowerPortList()
+        for client_port in self.client_ports:
+            ports_to_start.push_back(client_port)
+        self.server.PortsStart(ports_to_start)
+
+        max_duration_s = (self.duration
+                          + self.sessions_per_port * self.start_interval) / 1e9
+        # A bit of extra time to setup the connections
+        max_duration_s += 2
+
+        results_to_refresh = api.AbstractRefreshableResultList()
+        pending = list(sessions)
+        intervals = {}
+        reported_timestamp = 0
+        start_moment = time.time()
+
+        while True:
+            time.sleep(self.poll_interval)
+
+            # Clients without a session yet are checked one by one, as soon
+            # as the session exists its history is added to the batch.
+            still_pending = []
+            for session in pending:
+                session.http_client.Refresh()
+                if session.connect():
+                    results_to_refresh.append(session.rx_session_info)
+                    results_to_refresh.append(session.rx_session_info.ResultHistoryGet())
+                else:
+                    still_pending.append(session)
+            pending = still_pending
+
+            # Refresh all running sessions in a single API call
+            byteblower_instance.ResultsRefresh(results_to_refresh)
+
+            for session in sessions:
+                if session.rx_session_info is None:
+                    continue
+                for interval in session.new_intervals():
+                    intervals.setdefault(interval.TimestampGet(), []).append({
+                        'rx_bytes': interval.RxByteCountTotalGet(),
+                        'rx_throughput_bits_per_second': interval.AverageDataSpeedGet().bitrate(),
+                        'min': interval.LatencyMinimumGet(0),
+                        'avg': interval.LatencyAverageGet(0),
+                        'max': interval.LatencyMaximumGet(0),
+                        'jitter': interval.JitterGet(0),
+                    })
+
+            # Report all intervals except the newest one, other sessions may
+            # still add their results to it.
+            complete = sorted(t for t in intervals if t > reported_timestamp)[:-1]
+            for timestamp in complete:
+                aggregated = aggregate_interval(intervals[timestamp], self.percentiles)
+                print_interval(timestamp, aggregated, self.percentiles)
+                reported_timestamp = timestamp
+
+            finished = all(
+                session.rx_session_info is not None
+                and session.rx_session_info.RequestStatusGet() in [
+                    api.HTTPRequestStatus.Finished, api.HTTPRequestStatus.Error]
+                for session in sessions
+            )
+            if finished or time.time() - start_moment > max_duration_s:
+                break
+
+        for session in sessions:
+            session.http_client.RequestStop()
+        http_server.Stop()
+
+        return self.process_results(sessions, intervals)
+
+    def process_results(self, sessions, intervals):
+        session_results = []
+        for session in sessions:
+            if session.rx_session_info is None:
+                continue
+            rx_result = session.rx_session_info.ResultGet()
+            session_results.append({
+                "local_tcp_port": session.http_client.LocalPortGet(),
+                "rx_throughput_bits_per_second": rx_result.AverageDataSpeedGet().bitrate(),
+                "rx_min_latency_nanoseconds": rx_result.LatencyMinimumGet(0),
+                "rx_avg_latency_nanoseconds": rx_result.LatencyAverageGet(0),
+                "rx_max_latency_nanoseconds": rx_result.LatencyMaximumGet(0),
+                "rx_jitter_nanoseconds": rx_result.JitterGet(0),
+            })
+
+        interval_results = []
+        for timestamp in sorted(intervals):
+            aggregated = aggregate_interval(intervals[timestamp], self.percentiles)
+            aggregated['timestamp_nanoseconds'] = timestamp
+            interval_results.append(aggregated)
+
+        return {
+            "sessions": len(sessions),
+            "connected_sessions": len(session_results),
+            "request_duration_nanoseconds": self.duration,
+            "session_results": session_results,
+            "interval_results": interval_results,
+        }
+
+
+def print_interval(timestamp, aggregated, percentiles):
+    if 'rx_avg_latency_nanoseconds' not in aggregated:
+        return
+
+    line = ("%s: %d sessions, %.02f Mbit/s, latency (min,avg,max,jitter): "
+            "%.03fms, %.03fms, %.03fms, %.03fms" % (
+                timestamp,
+                aggregated['sessions'],
+                aggregated['rx_throughput_bits_per_second'] / 1e6,
+                aggregated['rx_min_latency_nanoseconds'] / 1e6,
+                aggregated['rx_avg_latency_nanoseconds'] / 1e6,
+                aggregated['rx_max_latency_nanoseconds'] / 1e6,
+                aggregated['rx_jitter_nanoseconds'] / 1e6,
+            ))
+    for percentile in percentiles:
+        value = aggregated['rx_session_avg_p%s_latency_nanoseconds' % percentile]
+        line += ", session avg p%s %.03fms" % (percentile, value / 1e6)
+    print(line)
+
+
+def print_results(results):
+    print("%d of %d sessions connected" % (
+        results['connected_sessions'], results['sessions']))
+
+    session_latencies = sorted(
+        s['rx_avg_latency_nanoseconds'] for s in results['session_results'])
+    if session_latencies:
+        print("Average latency per session (min, median, max): "
+              "%.03fms, %.03fms, %.03fms" % (
+                  session_latencies[0] / 1e6,
+                  session_latencies[len(session_latencies) // 2] / 1e6,
+                  session_latencies[-1] / 1e6,
+              ))
+
+
+def main():
+    example = Example(**configuration)
+    try:
+        outcome = example.run()
+        print_results(outcome)
+
+    except api.ConfigError as e:
+        print(e.what())
+    finally:
+        example.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+    DNS query throughput and response time benchmark.
+
+    Where dns-request.py sends a single query, this example load-tests a DNS
+    server or the DNS proxy of a CPE:
+      - thousands of queries are built up front, every query with its own
+        transaction ID and name, so the answers cannot come from a cache,
+      - a single stream sends them at the configured rate,
+      - a trigger counts the responses, a capture keeps them.  The answers
+        are matched with their query by transaction ID.
+
+    The stream sends its frames in order at a fixed inter-frame gap, query k
+    leaves at (first timestamp + k * gap).  The response time of an answer
+    is its capture timestamp minus the send time of its query.  When there
+    are more queries than distinct frames, the stream repeats them: an
+    answer belongs to the latest query with its transaction ID.  Keep the
+    time to repeat a transaction ID (distinct frames * gap) well above the
+    response timeout.
+
+    The report shows the queries per second, the answer rate, the response
+    codes and the percentiles of the response time.
+
+    The port is configured with DHCP, the queries go to its gateway unless a
+    DNS server is configured.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import os
+import random
+import struct
+import sys
+import time
+from collections import defaultdict
+
+from byteblowerll.byteblower import ByteBlower
+
+# The port provisioning is shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..'))
+from provisioning import provision_port
+
+configuration = {
+    # Address (IP or FQDN) of the ByteBlower server to use
+    'server_address': 'byteblower-tutorial-1300.lab.byteblower.excentis.com',
+
+    # The port which sends the queries, e.g. on the LAN side of the CPE
+    'port_config': {
+        'interface': 'trunk-1-45',
+        'mac': '00:bb:23:21:55:12',
+        'ip': 'dhcpv4',
+    },
+
+    # The DNS server to query.  None: the gateway of the port, e.g. the DNS
+    # proxy of the CPE.
+    'dns_server': None,
+
+    # The names to query.  None: a unique name for every query under
+    # `domain`, e.g. q00042-5f3a.example.com.  A list of names is cycled.
+    'names': None,
+    'domain': 'example.com',
+
+    # Record type of the queries, 1 is A, 28 is AAAA
+    'query_type': 1,
+
+    # Number of queries to send, and the number of distinct frames.  At most
+    # 65536 frames, the number of transaction IDs.
+    'number_of_queries': 10000,
+    'distinct_queries': 10000,
+
+    # Queries per second
+    'rate': 1000,
+
+    # Answers which arrive later than this are counted as late, in seconds
+    'response_timeout': 2,
+
+    # Percentiles of the response time to report
+    'percentiles': [50, 90, 99, 99.9],
+}
+
+# DNS response codes, see RFC 1035 and RFC 2136
+RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN',
+          4: 'NOTIMP', 5: 'REFUSED'}
+
+
+def _checksum(data):
+    """The Internet checksum of the data"""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _ipv4_bytes(address):
+    return struct.pack('!4B', *[int(part) for part in address.split('.')])
+
+
+def _mac_bytes(mac):
+    return bytes(bytearray(int(part, 16) for part in mac.split(':')))
+
+
+def dns_query(transaction_id, name, query_type=1):
+    """The DNS message of a recursive query"""
+    header = struct.pack('!6H', transaction_id, 0x0100, 1, 0, 0, 0)
+    labels = b''.join(struct.pack('!B', len(label)) + label.encode('ascii')
+                      for label in name.rstrip('.').split('.'))
+    return header + labels + b'\0' + struct.pack('!HH', query_type, 1)
+
+
+class QueryFrameBuilder(object):
+    """Builds the Ethernet frames of DNS queries
+
+    Building a frame with scapy takes about a millisecond, too slow for
+    thousands of queries.  The Ethernet, VLAN, IPv4 and UDP headers are
+    packed directly, only the lengths and checksums differ per query.
+
+    :param vlans: VLAN IDs of the port, outer VLAN first
+    :param src_port: UDP source port of the queries
+    """
+
+    def __init__(self, src_mac, dst_mac, vlans, src_ip, dst_ip,
+                 src_port=53000):
+        self.ethernet = _mac_bytes(dst_mac) + _mac_bytes(src_mac)
+        for vlan_id in vlans:
+            self.ethernet += struct.pack('!HH', 0x8100, vlan_id)
+        self.ethernet += struct.pack('!H', 0x0800)
+        self.src_ip = _ipv4_bytes(src_ip)
+        self.dst_ip = _ipv4_bytes(dst_ip)
+        self.src_port = src_port
+
+    def build(self, message):
+        """The frame with the DNS message"""
+        udp_length = 8 + len(message)
+        pseudo_header = self.src_ip + self.dst_ip + struct.pack(
+            '!xBH', 17, udp_length)
+        udp = struct.pack('!4H', self.src_port, 53, udp_length, 0) + message
+        udp_checksum = _checksum(pseudo_header + udp) or 0xffff
+        udp = udp[:6] + struct.pack('!H', udp_checksum) + udp[8:]
+
+        ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + udp_length, 0, 0x4000,
+                         64, 17, 0, self.src_ip, self.dst_ip)
+        ip = ip[:10] + struct.pack('!H', _checksum(ip)) + ip[12:]
+
+        frame = self.ethernet + ip + udp
+        # Minimum Ethernet frame size, without the FCS
+        return frame + b'\0' * max(0, 60 - len(frame))
+
+
+def parse_dns_response(data):
+    """The transaction ID, response code and number of answers of a DNS
+    response in an Ethernet frame, None when it is not a DNS response
+
+    Much faster than dissecting the frame with scapy, which matters for the
+    thousands of responses of a capture.
+
+    :param data: the frame
+    :type data: bytearray
+    """
+    offset = 12
+    ethertype = (data[offset] << 8) | data[offset + 1]
+    # VLAN tags
+    while ethertype in (0x8100, 0x88a8):
+        offset += 4
+        ethertype = (data[offset] << 8) | data[offset + 1]
+    offset += 2
+    if ethertype == 0x0800:
+        protocol = data[offset + 9]
+        offset += (data[offset] & 0x0f) * 4
+    elif ethertype == 0x86dd:
+        protocol = data[offset + 6]
+        offset += 40
+    else:
+        return None
+    # UDP header and DNS header
+    if protocol != 17 or len(data) < offset + 20:
+        return None
+    if (data[offset] << 8 | data[offset + 1]) != 53:
+        return None
+    offset += 8
+    # QR bit: a response
+    if not data[offset + 2] & 0x80:
+        return None
+    transaction_id = (data[offset] << 8) | data[offset + 1]
+    rcode = data[offset + 3] & 0x0f
+    answers = (data[offset + 6] << 8) | data[offset + 7]
+    return transaction_id, rcode, answers
+
+
+def percentile(ordered, percent):
+    """Nearest-rank percentile of a sorted list, None when it is empty"""
+    if not ordered:
+        return None
+    rank = int(-(-percent * len(ordered) // 100))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class ResponseMatcher(object):
+    """Matches the answers with the queries of the stream
+
+    :param first_timestamp: Send time of the first query, in nanoseconds
+    :param interframegap: Time between two queries, in nanoseconds
+    :param number_of_queries: The number of queries sent
+    :param distinct_queries: The number of frames of the stream, query k
+                             has transaction ID k % distinct_queries
+    :param timeout: Answers later than this (in nanoseconds) are late
+    """
+
+    def __init__(self, first_timestamp, interframegap, number_of_queries,
+                 distinct_queries, timeout):
+        self.first_timestamp = first_timestamp
+        self.interframegap = interframegap
+        self.number_of_queries = number_of_queries
+        self.distinct_queries = distinct_queries
+        self.timeout = timeout
+        self.answered = set()
+        self.response_times = []
+        self.rcodes = defaultdict(int)
+        self.duplicates = 0
+        self.late = 0
+        self.unmatched = 0
+
+    def add(self, transaction_id, rcode, timestamp):
+        """Matches an answer, received at `timestamp`"""
+        if transaction_id >= self.distinct_queries:
+            self.unmatched += 1
+            return
+        # The latest query with this transaction ID, sent before the answer
+        latest = (timestamp - self.first_timestamp) // self.interframegap
+        latest = min(latest, self.number_of_queries - 1)
+        query = latest - (latest - transaction_id) % self.distinct_queries
+        if query < 0:
+            self.unmatched += 1
+            return
+        if query in self.answered:
+            self.duplicates += 1
+            return
+        response_time = timestamp - (self.first_timestamp
+                                     + query * self.interframegap)
+        if response_time > self.timeout:
+            self.late += 1
+            return
+        self.answered.add(query)
+        self.response_times.append(response_time)
+        self.rcodes[rcode] += 1
+
+    def report(self, percentiles):
+        """The answer counts and response time percentiles
+
+        :return: dict
+        """
+        ordered = sorted(self.response_times)
+        return {
+            'answered': len(self.answered),
+            'answer_rate': len(self.answered) / self.number_of_queries
+            if self.number_of_queries else None,
+            'late': self.late,
+            'duplicates': self.duplicates,
+            'unmatched': self.unmatched,
+            'rcodes': dict((RCODES.get(rcode, str(rcode)), count)
+                           for rcode, count in self.rcodes.items()),
+            'response_time_min': ordered[0] if ordered else None,
+            'response_time_max': ordered[-1] if ordered else None,
+            'response_time_percentiles': dict(
+                (percent, percentile(ordered, percent))
+                for percent in percentiles),
+        }
+
+
+class Example:
+    def __init__(self, **kwargs):
+        self.server_address = kwargs['server_address']
+        self.port_config = kwargs['port_config']
+        self.dns_server = kwargs['dns_server']
+        self.names = kwargs['names']
+        self.domain = kwargs['domain']
+        self.query_type = kwargs['query_type']
+        self.number_of_queries = kwargs['number_of_queries']
+        self.distinct_queries = min(kwargs['distinct_queries'],
+                                    self.number_of_queries, 65536)
+        self.rate = kwargs['rate']
+        self.response_timeout = kwargs['response_timeout']
+        self.percentiles = kwargs['percentiles']
+
+        self.server = None
+        self.port = None
+
+    def query_names(self):
+        """The name of every distinct query"""
+        if self.names:
+            return [self.names[i % len(self.names)]
+                    for i in range(self.distinct_queries)]
+        # A tag per run, a second run does not hit the cache of the first
+        tag = '%04x' % random.getrandbits(16)
+        return ['q%05d-%s.%s' % (i, tag, self.domain)
+                for i in range(self.distinct_queries)]
+
+    def run(self):
+        instance = ByteBlower.InstanceGet()
+
+        print("Connecting to ByteBlower server %s..." % self.server_address)
+        self.server = instance.ServerAdd(self.server_address)
+
+        port = provision_port(self.server, self.port_config)
+        self.port = port.port
+        print("Created port", self.port.DescriptionGet())
+
+        dns_server = self.dns_server or port.gateway
+        interframegap = int(round(1e9 / self.rate))
+        if self.distinct_queries * interframegap < self.response_timeout * 1e9:
+            print("Warning: transaction IDs repeat every %.2fs, within the "
+                  "response timeout" % (self.distinct_queries
+                                        * interframegap / 1e9))
+
+        print("Building %d queries for %s" % (self.distinct_queries,
+                                              dns_server))
+        builder = QueryFrameBuilder(port.mac, port.resolve(dns_server),
+                                    port.vlans, port.ip, dns_server)
+        stream = self.port.TxStreamAdd()
+        stream.NumberOfFramesSet(self.number_of_queries)
+        stream.InterFrameGapSet(interframegap)
+        for transaction_id, name in enumerate(self.query_names()):
+            frame = builder.build(dns_query(transaction_id, name,
+                                            self.query_type))
+            stream.FrameAdd().BytesSet(
+                ''.join(format(b, '02x') for b in bytearray(frame)))
+
+        # The trigger counts every response, the capture keeps them for the
+        # matching.
+        bpf_filter = ' and '.join(port.filter_elements()
+                                  + ['src host %s' % dns_server,
+                                     'udp src port 53',
+                                     'udp dst port %d' % builder.src_port])
+        trigger = self.port.RxTriggerBasicAdd()
+        trigger.FilterSet(bpf_filter)
+        capture = self.port.RxCaptureBasicAdd()
+        capture.FilterSet(bpf_filter)
+        capture.Start()
+        trigger.ResultClear()
+
+        duration = self.number_of_queries * interframegap / 1e9
+        print("Sending %d queries at %d queries/s (%.1fs)"
+              % (self.number_of_queries, self.rate, duration))
+        stream.Start()
+        time.sleep(duration + self.response_timeout)
+        capture.Stop()
+
+        stream_result = stream.ResultGet()
+        trigger_result = trigger.ResultGet()
+        capture_result = capture.ResultGet()
+        stream_result.Refresh()
+        trigger_result.Refresh()
+        capture_result.Refresh()
+
+        sent = stream_result.PacketCountGet()
+        first = stream_result.TimestampFirstGet()
+        last = stream_result.TimestampLastGet()
+        matcher = ResponseMatcher(first, interframegap, sent,
+                                  self.distinct_queries,
+                                  int(self.response_timeout * 1e9))
+        captured = 0
+        for frame in capture_result.FramesGet():
+            response = parse_dns_response(bytearray(frame.BufferGet()))
+            if response is None:
+                continue
+            captured += 1
+            matcher.add(response[0], response[1], frame.TimestampGet())
+
+        results = matcher.report(self.percentiles)
+        results.update({
+            'dns_server': dns_server,
+            'sent': sent,
+            'queries_per_second': (sent - 1) * 1e9 / (last - first)
+            if sent > 1 and last > first else None,
+            'responses': trigger_result.PacketCountGet(),
+            'captured': captured,
+        })
+        return results
+
+    def cleanup(self):
+        instance = ByteBlower.InstanceGet()
+        if self.port is not None:
+            self.server.PortDestroy(self.port)
+            self.port = None
+        if self.server is not None:
+            instance.ServerRemove(self.server)
+            self.server = None
+
+
+def print_results(results):
+    def ms(value):
+        return '-' if value is None else '%.3f ms' % (value / 1e6)
+
+    print("Queried %s" % results['dns_server'])
+    print("Sent %d queries at %s queries/s" % (
+        results['sent'], '-' if results['queries_per_second'] is None
+        else '%.1f' % results['queries_per_second']))
+    print("Received %d responses, captured %d" % (results['responses'],
+                                                  results['captured']))
+    if results['captured'] < results['responses']:
+        print("Warning: the capture missed %d responses, the response times "
+              "are based on the captured ones"
+              % (results['responses'] - results['captured']))
+    print("Answered %d queries (%s), %d late, %d duplicates, %d unmatched" % (
+        results['answered'], '-' if results['answer_rate'] is None
+        else '%.2f%%' % (100 * results['answer_rate']),
+        results['late'], results['duplicates'], results['unmatched']))
+    print("Response codes: %s" % (', '.join(
+        '%s %d' % item for item in sorted(results['rcodes'].items())) or '-'))
+    print("Response time: min %s, max %s" % (ms(results['response_time_min']),
+                                            ms(results['response_time_max'])))
+    for percent, value in sorted(results['response_time_percentiles'].items()):
+        print("  p%s: %s" % (percent, ms(value)))
+
+
+if __name__ == '__main__':
+    example = Example(**configuration)
+    try:
+        print_results(example.run())
+    finally:
+        example.cleanup()
@@ -14,14 +14,20 @@ As you will notice, adding more TCP clients is easy!
 # Needed for python2 / python3 print function compatibility
 from __future__ import print_function
 
+import os
+import sys
 import time
 
 # import the ByteBlower module
-from byteblowerll.byteblower import ByteBlower, RequestStartType
+from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import ConvertHTTPRequestStatusToString
-from byteblowerll.byteblower import HTTPRequestMethod, HTTPRequestStatus
+from byteblowerll.byteblower import HTTPRequestMethod
 from byteblowerll.byteblower import ParseHTTPRequestMethodFromString
 
+# The HTTP client launcher is shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from http_client_launcher import HTTPClientLauncher
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address':
@@ -99,7 +105,15 @@ configuration = {
                 'ip': 'dhcpv4',
             }
         },
-    ]
+    ],
+
+    # When to start each of the HTTP clients.
+    # Special value: None, all clients start at the same time.
+    # 'ramp': the clients start one after the other, at a constant rate.
+    # 'poisson': the clients arrive randomly, with the given average rate.
+    'start_stagger': None,
+    # 'start_stagger': {'type': 'ramp', 'clients_per_second': 10},
+    # 'start_stagger': {'type': 'poisson', 'clients_per_second': 10, 'seed': 1},
 }
 
 
@@ -118,6 +132,7 @@ class Example:
                 'duration': config_duration,
                 'byteblower_port': a_client['client_bb_port']
             })
+        self.start_stagger = kwargs.get('start_stagger', None)
 
         self.server = None
         self.server_bb_port = None
@@ -145,12 +160,11 @@ class Example:
 
         # This section differs from the basic TCP example.
         # We will create multiple clients onto the same the ByteBlowerPort.
+        # The launcher creates the clients and schedules when each one
+        # starts, following the configured start pattern.
+        launcher = HTTPClientLauncher(stagger=self.start_stagger)
         http_clients = []
 
-        # We'll use the max_duration for the stop condition further in
-        # the script.
-        max_duration = 0
-
         # Configure each client one-by-one.
         # This part is the same as the basic TCP example.
         for client_config in self.http_client_configs:
@@ -164,29 +178,26 @@ class Example:
             #
             # You can configure multiple clients to connect to the
             # the same server. You can even mix different HTTP Methods.
-            http_client = client_bb_port.ProtocolHttpClientAdd()
-
-            http_client.RemoteAddressSet(http_server_ip_address)
-            http_client.RemotePortSet(server_tcp_port)
+            def configure_client(http_client, index, client_config=client_config):
+                http_client.RemoteAddressSet(http_server_ip_address)
+                http_client.RemotePortSet(server_tcp_port)
 
-            http_client.HttpMethodSet(client_config['http_method'])
-            http_client.RequestDurationSet(client_config['duration'])
+                http_client.HttpMethodSet(client_config['http_method'])
+                http_client.RequestDurationSet(client_config['duration'])
 
-            # The client configured duration is in nanoseconds, we want to keep
-            # the max_duration as simple as 'seconds', so convert the value.
-            client_duration_s = client_config['duration'] / 1e9
-            max_duration = max(max_duration, client_duration_s)
+            http_clients.extend(
+                launcher.create([client_bb_port], 1, configure_client))
 
-            # The RequestStartType is the main configuration difference
-            # Between 2 TCP clients and multiple ones. Rather than starting
-            # the client directly, we'll schedule when to start.
-            http_client.RequestStartTypeSet(RequestStartType.Scheduled)
-            http_clients.append(http_client)
+        # We'll use the max_duration for the stop condition further in
+        # the script.  The client configured duration is in nanoseconds, we
+        # want to keep the max_duration as simple as 'seconds'.
+        max_duration = max([c['duration'] for c in self.http_client_configs] or [0])
+        max_duration = (max_duration + launcher.last_start_offset()) / 1e9
 
-            
         print("Server port:", self.server_bb_port.DescriptionGet())
 
-        byteblower_instance.PortsStartAll()
+        # Start all client ports at once.
+        launcher.start()
 
         # Unlike before we now have several HTTPClients running together.
         # This makes determining when the scenario is finished more
@@ -207,30 +218,18 @@ class Example:
             time.sleep(1)
 
             time_elapsed = time.time() - start_moment
-            print('%.2fs :: Waiting for clients to finish.' % time_elapsed)
 
             # Below is the second type of stop condition, a client based one.
-            any_client_running = False
-
-            # Consider a client finished when the state is either:
-            # - Finished
-            # - Error
-            finished_states = [
-                HTTPRequestStatus.Error, HTTPRequestStatus.Finished
-            ]
-
-            for http_client in http_clients:
-                # Update the local API object with the  with the info on the
-                # ByteBlowerServer.
-                http_client.Refresh()
-
-                # Check the status.
-                status = http_client.RequestStatusGet()
-                this_client_running = status not in finished_states
-                any_client_running = any_client_running or this_client_running
+            # The launcher only polls the clients which are running, clients
+            # which are Finished or in Error are not refreshed anymore.
+            counts = launcher.poll()
+            print('%.2fs :: Waiting for clients to finish '
+                  '(%d scheduled, %d connecting, %d running, %d finished).' % (
+                      time_elapsed, counts['Scheduled'], counts['Connecting'],
+                      counts['Running'], counts['Finished']))
 
             # all clients finished?  No need to wait any longer.
-            if not any_client_running:
+            if not launcher.running():
                 break
 
         # Stop the HTTP Server.
@@ -253,6 +252,9 @@ class Example:
         # Process each of the clients.
         results = []
         for client in http_clients:
+            # Finished clients were not polled anymore, fetch their
+            # final state.
+            client.Refresh()
             results.append(self.process_http_client(client))
 
         return results
@@ -0,0 +1,224 @@
+"""
+    NAT performance ramp test.
+
+    Where natperformance.py runs a single configuration, this example ramps
+    up the load in steps.  Every step increases the number of parallel TCP
+    sessions (and optionally the session size).  During each step, the
+    HTTPMultiClient results are sampled at a high rate to calculate the
+    connection setup rate and the failure rate.
+
+    The test reports the knee of the NAT device: the first step where either
+      - the aborted/refused connections grow beyond a threshold, or
+      - the connection setup rate no longer increases with the load.
+    The step before the knee is the maximum sustainable load.
+
+    The full time series of the ramp is written to a CSV file.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import byteblowerll.byteblower as byteblower
+from byteblowerll.byteblower import HTTPMultiClientStatus_Finished
+import os
+import time
+
+# Minimal config parameters.
+
+# Adapt to your setup.when necessary.
+SERVER_ADDRESS = 'byteblower-tutorial-1300.lab.byteblower.excentis.com'
+
+WAN_MAC = '00:BB:23:22:55:12'
+WAN_BB_INTERFACE = 'nontrunk-1'
+
+LAN_MAC = '00:BB:23:21:55:13'
+LAN_BB_INTERFACE = 'trunk-1-45'
+
+# The steps of the ramp.
+# Every step is a tuple:
+#     (number of sessions to run in parallel, bytes downloaded per session)
+RAMP_STEPS = [(parallel, 64 * 1000) for parallel in
+              [50, 100, 200, 400, 800, 1600, 3200]]
+
+# Duration of every step, in seconds
+STEP_DURATION = 5
+
+# Time between two samples of the results, in seconds
+SAMPLE_INTERVAL = 0.1
+
+# The knee is reached when more than this fraction of the attempted
+# connections in a step is aborted or refused ...
+MAX_FAILURE_RATIO = 0.01
+
+# ... or when the setup rate increases less than this fraction, compared
+# with the previous step.
+MIN_SETUP_RATE_GAIN = 0.05
+
+# When True, the ramp stops at the knee.
+STOP_AT_KNEE = True
+
+RESULTS_FILE = os.path.basename(__file__) + ".csv"
+
+
+def create_port(server, interface, mac_addr):
+    port = server.PortCreate(interface)
+    l2 = port.Layer2EthIISet()
+    l2.AddressSet(mac_addr)
+
+    l3 = port.Layer3IPv4Set()
+    l3.ProtocolDhcpGet().Perform()
+    return port
+
+
+def run_step(lan_port, wan_ip, server_port, parallel_sessions, session_size):
+    """Run one step of the ramp
+
+    :return: list of samples, each a dict with the cumulative counters
+    """
+    http_client = lan_port.ProtocolHttpMultiClientAdd()
+
+    http_client.LocalPortRangeSet(10000, 60000)
+    http_client.RemoteAddressSet(wan_ip)
+    http_client.RemotePortSet(server_port)
+
+    http_client.DurationSet(int(STEP_DURATION * 1000000000))  # duration is in nanoseconds
+    http_client.MaximumConcurrentRequestsSet(parallel_sessions)
+    http_client.SessionSizeSet(session_size)
+
+    http_client_result = http_client.ResultGet()
+    samples = []
+
+    http_client.Start()
+    start = time.time()
+    while http_client.StatusGet() != HTTPMultiClientStatus_Finished:
+        time.sleep(SAMPLE_INTERVAL)
+        # A single refresh per sample keeps the sampling rate high
+        http_client_result.Refresh()
+        samples.append({
+            'time': time.time() - start,
+            'attempted': http_client_result.ConnectionsAttemptedGet(),
+            'established': http_client_result.ConnectionsEstablishedGet(),
+            'aborted': http_client_result.ConnectionsAbortedGet(),
+            'refused': http_client_result.ConnectionsRefusedGet(),
+        })
+
+    lan_port.ProtocolHttpMultiClientRemove(http_client)
+    return samples
+
+
+def summarize_step(samples):
+    """Setup rate and failure ratio of one step"""
+    if not samples:
+        return {'setup_rate': 0.0, 'failure_ratio': 0.0,
+                'attempted': 0, 'established': 0, 'failed': 0}
+
+    last = samples[-1]
+    failed = last['aborted'] + last['refused']
+    duration = max(last['time'], SAMPLE_INTERVAL)
+    return {
+        'setup_rate': last['established'] / duration,
+        'failure_ratio': failed / last['attempted'] if last['attempted'] else 0.0,
+        'attempted': last['attempted'],
+        'established': last['established'],
+        'failed': failed,
+    }
+
+
+def is_knee(summary, previous):
+    """True when this step is past the maximum sustainable load"""
+    if summary['failure_ratio'] > MAX_FAILURE_RATIO:
+        return True
+    if previous is not None and previous['setup_rate'] > 0:
+        gain = summary['setup_rate'] / previous['setup_rate'] - 1
+        if gain < MIN_SETUP_RATE_GAIN:
+            return True
+    return False
+
+
+def write_time_series(filename, series):
+    keys = ['step', 'parallel_sessions', 'session_size', 'time',
+            'attempted', 'established', 'aborted', 'refused',
+            'setup_rate']
+    with open(filename, 'w') as f:
+        f.write(','.join(keys) + "\n")
+        for row in series:
+            f.write(','.join(str(row[key]) for key in keys) + "\n")
+
+
+def main():
+    # ByteBlower part of the test.
+    api = byteblower.ByteBlower.InstanceGet()
+    server = api.ServerAdd(SERVER_ADDRESS)
+
+    try:
+        wan_port = create_port(server, WAN_BB_INTERFACE, WAN_MAC)
+        wan_ip = wan_port.Layer3IPv4Get().IpGet()
+
+        lan_port = create_port(server, LAN_BB_INTERFACE, LAN_MAC)
+
+        # setup a 'standard' HTTP web server
+        http_server = wan_port.ProtocolHttpMultiServerAdd()
+        http_server.PortSet(80)
+        http_server.Start()
+        server_port = http_server.PortGet()
+
+        series = []
+        previous = None
+        sustainable = None
+        knee = None
+        for step, (parallel, session_size) in enumerate(RAMP_STEPS):
+            samples = run_step(lan_port, wan_ip, server_port,
+                               parallel, session_size)
+
+            # Instantaneous setup rate between consecutive samples
+            last_time, last_established = 0.0, 0
+            for sample in samples:
+                elapsed = sample['time'] - last_time
+                rate = (sample['established'] - last_established) / elapsed if elapsed > 0 else 0.0
+                last_time, last_established = sample['time'], sample['established']
+                sample.update({
+                    'step': step,
+                    'parallel_sessions': parallel,
+                    'session_size': session_size,
+                    'setup_rate': rate,
+                })
+                series.append(sample)
+
+            summary = summarize_step(samples)
+            print("Step %d: %d parallel sessions of %d bytes: "
+                  "%.1f connections/s, %d of %d connections failed" % (
+                      step, parallel, session_size, summary['setup_rate'],
+                      summary['failed'], summary['attempted']))
+
+            if is_knee(summary, previous):
+                # Only the first knee is reported, later steps may meet
+                # the condition as well when the ramp continues.
+                if knee is None:
+                    knee = (parallel, session_size, summary)
+                if STOP_AT_KNEE:
+                    break
+            elif knee is None:
+                sustainable = (parallel, session_size, summary)
+            previous = summary
+
+        http_server.Stop()
+
+        write_time_series(RESULTS_FILE, series)
+        print("Time series written to", RESULTS_FILE)
+
+        print("Result:")
+        if sustainable is not None:
+            print("Maximum sustainable load: {} parallel sessions, "
+                  "{:.1f} new connections per second".format(
+                      sustainable[0], sustainable[2]['setup_rate']))
+        if knee is not None:
+            print("Knee reached at:          {} parallel sessions".format(knee[0]))
+        else:
+            print("No knee found, extend RAMP_STEPS to load the device further")
+    finally:
+        # Cleanup the Server. The API will implicitly clean up
+        #  the create objects.
+        api.ServerRemove(server)
+
+
+if __name__ == '__main__':
+    main()
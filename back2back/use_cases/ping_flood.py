@@ -24,18 +24,25 @@
 """
 from __future__ import print_function
 
-import random
+import os
 import sys
 import time
 
 from byteblowerll.byteblower import ByteBlower
 from scapy.all import Raw, Ether, IP, ICMP
 
+# The address allocator is shared with the server_management examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'server_management'))
+from address_allocator import Allocator, DEFAULT_STATE_FILE
+
+# MAC addresses are reserved in a pool shared by all tests on this machine,
+# tests running at the same time never use the same address.
+allocator = Allocator(DEFAULT_STATE_FILE)
+
 
 def create_mac_address():
-    byte_val = ['00', 'bb'] + \
-               ['%02x' % random.randint(0, 255) for _ in range(6)]
-    return ':'.join(byte_val)
+    return allocator.pools['mac'].allocate()
 
 
 def create_port(server, bb_interface_name):
@@ -121,6 +128,7 @@ def main(server_address, src_interface, dst_interface, speed_mbps=999):
     finally:
         if server is not None:
             byteblower_instance.ServerRemove(server)
+        allocator.release()
 
 
 if "__main__" == __name__:
@@ -20,11 +20,20 @@ the example in a slightly different way to demonstrate what is possible
 import datetime
 import logging
 import math
+import os
 import random
+import sys
 import time
 
 from byteblowerll import byteblower
 
+# The rolling statistics are shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rolling_stats import FlowStatistics, ThresholdRules
+from history_manager import HistoryManager, interval_counters
+from aggregated_receive import AggregatedReceiver
+from flow_matrix import FlowMatrix
+
 
 class Device:
     def __init__(self, **kwargs):
@@ -213,11 +222,16 @@ class UdpTrafficProfile(object):
     - The frame size to be sent
     - The frame interval (aka inter frame gap)
 
+    With aggregate_receive, the flows towards the same device share a single
+    trigger, see aggregated_receive.py.  This scales to thousands of flows.
     """
 
     def __init__(self, **kwargs):
         self.interframegap_ns = kwargs.pop('interframegap', 1000000)
         self.frame_size = kwargs.pop('frame_size', 1020)
+        self.aggregate_receive = kwargs.pop('aggregate_receive', False)
+        # (ByteBlower port, destination IP) -> AggregatedReceiver
+        self.receivers = {}
 
     def create_between(self, name, flow_number, source, destination, number_of_frames=None, duration=None):
         """Create a flow for the current traffic profile
@@ -323,11 +337,6 @@ class UdpTrafficProfile(object):
         hexbytes = ''.join((format(b, "02x") for b in frame_content))
         frame.BytesSet(hexbytes)
 
-        # create a trigger to count the number of received frames.
-        # Similar to the stream we will need to make a slight modification
-        # for the Vlan layer.
-        trigger = destination.bbport.RxTriggerBasicAdd()
-
         # The BPF filter on a trigger is promiscuous: it will be applied to all
         # traffic that arrives at the Physical interface.
         #
@@ -343,22 +352,59 @@ class UdpTrafficProfile(object):
         else:
             filter_elements.append("ip6 dst %s" % filter_dst_ip)
 
+        # Labels to group the flows by, see FlowMatrix
+        labels = {
+            'port_pair': '%s -> %s' % (source.interface, destination.interface),
+            'vlan': ','.join(str(vlan) for vlan in source.vlans
+                             + destination.vlans) or 'none',
+        }
+
+        if self.aggregate_receive:
+            # The trigger is created by the receiver, once all flows are
+            # known, see Example.run_traffic
+            key = (destination.bbport, filter_dst_ip)
+            receiver = self.receivers.get(key)
+            if receiver is None:
+                receiver = AggregatedReceiver(destination.bbport,
+                                              filter_elements)
+                self.receivers[key] = receiver
+            receiver.add_flow(name, filter_dst_port)
+            return UdpFlow(name, stream, None, receiver=receiver,
+                           udp_port=filter_dst_port, labels=labels)
+
+        # create a trigger to count the number of received frames.
+        # Similar to the stream we will need to make a slight modification
+        # for the Vlan layer.
+        trigger = destination.bbport.RxTriggerBasicAdd()
+
         filter_elements.append("udp port %d" % filter_dst_port)
         bpf_filter = ' and '.join(filter_elements)
         trigger.FilterSet(bpf_filter)
 
-        return UdpFlow(name, stream, trigger)
+        return UdpFlow(name, stream, trigger, labels=labels)
 
 
 class UdpFlow(object):
     """Frame blasting UDP Flow.
 
+    The flow is received by its own trigger, or by an AggregatedReceiver
+    shared with other flows.  The received frames are then estimated from
+    the share of the flow in the frames of the receiver.
     """
 
-    def __init__(self, name, stream, trigger):
+    def __init__(self, name, stream, trigger, window=30, receiver=None,
+                 udp_port=None, labels=None):
         self.name = name
         self.stream = stream
         self.trigger = trigger
+        self.receiver = receiver
+        self.udp_port = udp_port
+        # e.g. the direction, VLAN and port pair of the flow
+        self.labels = dict(labels or {})
+        # Rolling statistics over the last `window` intervals
+        self.statistics = FlowStatistics(window=window)
+        # Keeps the interval results, see register_histories()
+        self.histories = None
 
     def get_duration(self):
         """Calculates the actual duration of the UDP flow"""
@@ -371,70 +417,146 @@ class UdpFlow(object):
 
         :rtype: [Union[TxStreamResult, TxStreamResultHistory, RxTriggerBasicResult, RxTriggerBasicResultHistory]]
         """
-        return [
-            self.stream.ResultGet(), self.stream.ResultHistoryGet(),
-            self.trigger.ResultGet(), self.trigger.ResultHistoryGet()
-        ]
+        results = [self.stream.ResultGet(), self.stream.ResultHistoryGet()]
+        if self.trigger is not None:
+            results += [self.trigger.ResultGet(),
+                        self.trigger.ResultHistoryGet()]
+        return results
+
+    def get_rx_trigger(self):
+        """The trigger which receives the flow, maybe shared"""
+        if self.receiver is not None:
+            return self.receiver.trigger
+        return self.trigger
+
+    def get_received(self, frames, byte_count):
+        """The part of the frames and bytes of an interval of the trigger
+        which belong to this flow"""
+        if self.receiver is None:
+            return frames, byte_count
+        flow_frames = self.receiver.received(self.udp_port, frames,
+                                             interval=True)[0]
+        if not frames:
+            return 0, 0
+        return flow_frames, int(round(byte_count * flow_frames / frames))
+
+    def register_histories(self, histories):
+        """Sizes the result histories of the flow for the test, the
+        intervals are drained by the HistoryManager
+
+        :type histories: HistoryManager
+        """
+        self.histories = histories
+        histories.register(self.name + '.tx', self.stream.ResultHistoryGet())
+        if self.receiver is None:
+            histories.register(self.name + '.rx',
+                               self.trigger.ResultHistoryGet())
+
+    def get_history_name(self, direction):
+        if direction == 'rx' and self.receiver is not None:
+            # The history of the shared trigger, see Example.run_traffic
+            return self.receiver.bpf_filter()
+        return self.name + '.' + direction
+
+    def get_intervals(self, direction, history):
+        """The interval results of the stream ('tx') or trigger ('rx')"""
+        if self.histories is None:
+            intervals = [interval_counters(interval)
+                         for interval in history.IntervalGet()]
+        else:
+            intervals = self.histories.intervals(
+                self.get_history_name(direction))
+        if direction == 'rx' and self.receiver is not None:
+            # The share of this flow in the intervals of the shared trigger
+            shared_intervals, intervals = intervals, []
+            for interval in shared_intervals:
+                frames, byte_count = self.get_received(interval['frames'],
+                                                       interval['bytes'])
+                intervals.append(dict(interval, frames=frames,
+                                      bytes=byte_count))
+        return intervals
+
+    def get_dropped_intervals(self):
+        if self.histories is None:
+            return None
+        return (self.histories.dropped(self.get_history_name('tx'))
+                + self.histories.dropped(self.get_history_name('rx')))
 
     def reset_results(self):
         """Resets all results to an empty set"""
         self.stream.ResultClear()
-        self.trigger.ResultClear()
+        if self.trigger is not None:
+            self.trigger.ResultClear()
 
     def process_interval_results(self):
-        # ideal place to collect our results over time, but for now we'll
-        # only log the last result in the snapshots
+        """Adds the latest interval to the rolling statistics
 
+        :return: True when the latest interval was not seen before
+        """
         stream_history = self.stream.ResultHistoryGet()
         stream_interval = stream_history.IntervalLatestGet()
-        trigger_history = self.trigger.ResultHistoryGet()
+        trigger_history = self.get_rx_trigger().ResultHistoryGet()
         trigger_interval = trigger_history.IntervalLatestGet()
-
-        logging.info('Flow %s: sent %d, received %d',
-                     self.name,
-                     stream_interval.PacketCountGet(),
-                     trigger_interval.PacketCountGet()
-                     )
-
-    def get_results(self):
-        stream_result = self.stream.ResultGet()
+        rx_frames, rx_bytes = self.get_received(
+            trigger_interval.PacketCountGet(), trigger_interval.ByteCountGet())
+
+        # The results are refreshed faster than the interval duration,
+        # the statistics ignore an interval which was already added.
+        is_new = self.statistics.add_interval(
+            stream_interval.TimestampGet(),
+            stream_interval.PacketCountGet(),
+            rx_frames,
+            rx_bytes,
+            duration_ns=stream_history.SamplingIntervalDurationGet())
+
+        if is_new:
+            metrics = self.statistics.metrics()
+            logging.info('Flow %s: sent %d, received %d, '
+                         'average throughput %.2f Mbit/s, loss %.2f%%',
+                         self.name,
+                         stream_interval.PacketCountGet(),
+                         rx_frames,
+                         metrics['throughput_avg'] / 1e6,
+                         metrics['loss_ewma'] or 0.0)
+        return is_new
+
+    def get_results(self, flow_result):
+        """The results of this flow
+
+        :param flow_result: The counters and loss of this flow, from
+                            FlowMatrix.flow_results()
+        """
         stream_history = self.stream.ResultHistoryGet()
-        trigger_result = self.trigger.ResultGet()
-        trigger_history = self.trigger.ResultHistoryGet()
-
-        frames_lost = stream_result.PacketCountGet() - trigger_result.PacketCountGet()
-
-        procent_lost = 100.0 * frames_lost / stream_result.PacketCountGet()
+        trigger_result = self.get_rx_trigger().ResultGet()
+        trigger_history = self.get_rx_trigger().ResultHistoryGet()
 
         return {
             'name': self.name,
             'tx': {
-                'total_bytes': stream_result.ByteCountGet(),
-                'total_frames': stream_result.PacketCountGet(),
-                'intervals': [
-                    {
-                        'timestamp': interval.TimestampGet(),
-                        'bytes': interval.ByteCountGet(),
-                        'frames': interval.PacketCountGet()
-                    } for interval in stream_history.IntervalGet()
-                ],
+                'total_bytes': flow_result['tx_bytes'],
+                'total_frames': flow_result['tx_frames'],
+                'intervals': self.get_intervals('tx', stream_history),
             },
             'rx': {
-                'total_bytes': trigger_result.ByteCountGet(),
-                'total_frames': trigger_result.PacketCountGet(),
-                'intervals': [
-                    {
-                        'timestamp': interval.TimestampGet(),
-                        'bytes': interval.ByteCountGet(),
-                        'frames': interval.PacketCountGet()
-                    } for interval in trigger_history.IntervalGet()
-                ],
+                'total_bytes': flow_result['rx_bytes'],
+                'total_frames': flow_result['rx_frames'],
+                'intervals': self.get_intervals('rx', trigger_history),
             },
-            'total_frames_lost': frames_lost,
-            'total_pct_lost': procent_lost
-
+            'total_frames_lost': flow_result['lost_frames'],
+            # None for a flow which sent nothing
+            'total_pct_lost': flow_result['loss_percent'],
+            'statistics': self.statistics.metrics(),
+            'dropped_intervals': self.get_dropped_intervals(),
+            # Standard error on the received frames of an aggregated flow
+            'rx_frames_error': self.get_rx_frames_error(trigger_result),
         }
 
+    def get_rx_frames_error(self, trigger_result):
+        if self.receiver is None:
+            return 0.0
+        return self.receiver.received(self.udp_port,
+                                      trigger_result.PacketCountGet())[1]
+
 
 class Example(object):
     def __init__(self, **kwargs):
@@ -446,6 +568,14 @@ class Example(object):
         self.number_of_upstream_flows = kwargs.pop('number_of_upstream_flows', 2)
         self.traffic_duration = kwargs.pop('traffic_duration', datetime.timedelta(seconds=10))
 
+        # Threshold rules on the rolling statistics of every flow,
+        # see rolling_stats.ThresholdRules.  A violated 'hard' rule stops
+        # the traffic before the configured duration.
+        self.rules = ThresholdRules(kwargs.pop('rules', []))
+        self.stopped_early = None
+        # Loss, throughput and fairness per group of flows, see run()
+        self.summary = {}
+
         self._server = None
 
     @property
@@ -478,22 +608,66 @@ class Example(object):
 
         duration = max([flow.get_duration() for flow in flows])
 
+        # Size the result histories for the whole test, long tests are
+        # drained while they run.
+        histories = HistoryManager(
+            (duration + extra_duration).total_seconds() * 1e9)
+        for flow in flows:
+            flow.register_histories(histories)
+
+        # The shared triggers of the aggregated flows
+        receivers = []
+        for flow in flows:
+            if flow.receiver is not None and flow.receiver not in receivers:
+                receivers.append(flow.receiver)
+        for receiver in receivers:
+            if receiver.trigger is None:
+                receiver.create()
+            receiver.reset_results()
+            histories.register(receiver.bpf_filter(),
+                               receiver.trigger.ResultHistoryGet())
+
         ports_to_start = byteblower.ByteBlowerPortList()
         ports_to_start.push_back(self.wan_port.bbport)
         ports_to_start.push_back(self.cpe_port.bbport)
         logging.info('Starting traffic for %s', duration)
         self.server.PortsStart(ports_to_start)
+        # Intervals dropped before the first drain are detected as well
+        histories.start(self.server.TimestampGet())
 
         duration += extra_duration
         stoptime = datetime.datetime.now() + duration
 
-        while datetime.datetime.now() < stoptime:
+        while datetime.datetime.now() < stoptime and not self.stopped_early:
             self.server.ResultsRefreshAll()
+            histories.drain()
+            for receiver in receivers:
+                receiver.sample()
             time.sleep(.5)
             for flow in flows:
-                flow.process_interval_results()
+                if not flow.process_interval_results():
+                    continue
+                violations = self.rules.evaluate(flow.statistics.metrics())
+                for violation in violations:
+                    logging.warning('Flow %s: %s', flow.name,
+                                    ThresholdRules.describe(violation))
+                if ThresholdRules.has_hard_failure(violations):
+                    self.stopped_early = flow.name
+
+        if self.stopped_early:
+            logging.warning('Stopping the traffic, flow %s failed a rule',
+                            self.stopped_early)
+            self.server.PortsStop(ports_to_start)
+        else:
+            logging.info('Traffic should be done')
 
-        logging.info('Traffic should be done')
+        # Update the results to the end of the traffic
+        self.server.ResultsRefreshAll()
+        histories.drain()
+        for receiver in receivers:
+            receiver.sample()
+        for warning in histories.describe_gaps():
+            logging.warning(warning)
 
     def cleanup(self):
         for device in [self.cpe_port, self.wan_port]:
@@ -526,6 +700,7 @@ class Example(object):
                                                     destination=self.cpe_port,
                                                     duration=self.traffic_duration)
             )
+            flows[-1].labels['direction'] = 'downstream'
 
         # Create all the upstream flows which are configured
         for i in range(self.number_of_upstream_flows):
@@ -538,12 +713,44 @@ class Example(object):
                                                     destination=self.wan_port,
                                                     duration=self.traffic_duration)
             )
+            flows[-1].labels['direction'] = 'upstream'
 
         # Start the traffic and with until finished
         self.run_traffic(flows)
 
-        # Get the results from the flow and return them in a list of dicts
-        return [flow.get_results() for flow in flows]
+        # The loss, throughput and fairness per direction, VLAN and port pair
+        matrix = self.create_flow_matrix(flows)
+        counters = matrix.collect(
+            duration_ns=self.traffic_duration.total_seconds() * 1e9)
+        for key in ['direction', 'vlan', 'port_pair']:
+            self.summary[key] = matrix.summary(counters, key)
+            for label, group in sorted(self.summary[key].items()):
+                logging.info('%s %s: %d flows, loss %s, fairness %s', key,
+                             label, group['flows'],
+                             '-' if group['loss_percent'] is None
+                             else '%.2f%%' % group['loss_percent'],
+                             '-' if group['fairness'] is None
+                             else '%.3f' % group['fairness'])
+
+        # Get the results from the flow and return them in a list of dicts,
+        # the counters and loss of every flow come from the matrix
+        flow_results = matrix.flow_results(counters)
+        return [flow.get_results(flow_result)
+                for flow, flow_result in zip(flows, flow_results)]
+
+    @staticmethod
+    def create_flow_matrix(flows):
+        """Collects the counters of the flows, grouped by their labels
+
+        :type flows: [UdpFlow]
+        :rtype: FlowMatrix
+        """
+        matrix = FlowMatrix()
+        for flow in flows:
+            matrix.add_flow(flow.name, flow.stream, flow.get_rx_trigger(),
+                            receiver=flow.receiver, udp_port=flow.udp_port,
+                            **flow.labels)
+        return matrix
 
 
 def run_example_vlan_nat():
@@ -617,7 +824,8 @@ def run_example_no_vlan_no_nat():
       will be sent at 1000 packets/s (frame interval is 1ms)
     - There will be 2 traffic flows from the WAN port to the CPE port
     - There will be 1 traffic flow from the CPE port to the WAN port
-    - Traffic will be sent for 3 seconds
+    - Traffic will be sent for 3 seconds, unless the loss of a flow
+      exceeds 5%
     """
     config = {
         'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
@@ -631,7 +839,12 @@ def run_example_no_vlan_no_nat():
                                              ),
         'number_of_downstream_flows': 2,
         'number_of_upstream_flows': 1,
-        'traffic_duration': datetime.timedelta(seconds=3)
+        'traffic_duration': datetime.timedelta(seconds=3),
+        'rules': [
+            # 1000 frames/s of 512 bytes is about 4 Mbit/s
+            {'metric': 'throughput_avg', 'below': 3.5e6},
+            {'metric': 'loss_ewma', 'above': 5.0, 'hard': True},
+        ],
     }
 
     with Example(**config) as example:
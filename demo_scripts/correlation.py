@@ -0,0 +1,174 @@
+#!/usr/bin/python
+"""
+Correlates the traffic results with the Wi-Fi statistics.
+
+The stream, trigger and NetworkInfoMonitor histories are sampled
+separately, their timestamps do not match exactly.  This module
+  - joins the series on the nearest timestamp (a "merge asof" on the
+    nanosecond timestamps), using sorted arrays instead of a lookup
+    per sample,
+  - detects roaming events: the moments the SSID or BSSID changes,
+  - calculates the throughput and loss before and after each event.
+
+All functions run in linear (or n log n) time in the number of samples.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy
+
+
+def merge_asof(left_timestamps, right_timestamps, tolerance=None):
+    """Finds for every left timestamp the nearest right timestamp
+
+    :param left_timestamps: Timestamps to match, in nanoseconds
+    :param right_timestamps: Timestamps to match with, in nanoseconds,
+                             sorted ascending
+    :param tolerance: Maximum distance between two matching timestamps,
+                      in nanoseconds.  None accepts any distance.
+    :return: Array with for every left timestamp the index of the nearest
+             right timestamp, or -1 when there is none within the tolerance
+    :rtype: numpy.ndarray
+    """
+    left = numpy.asarray(left_timestamps, dtype=numpy.int64)
+    right = numpy.asarray(right_timestamps, dtype=numpy.int64)
+    if len(right) == 0:
+        return numpy.full(len(left), -1, dtype=numpy.int64)
+
+    # Index of the first right timestamp at or after the left timestamp
+    after = numpy.searchsorted(right, left, side='left')
+    before = numpy.clip(after - 1, 0, len(right) - 1)
+    after = numpy.clip(after, 0, len(right) - 1)
+
+    distance_before = numpy.abs(left - right[before])
+    distance_after = numpy.abs(right[after] - left)
+    nearest = numpy.where(distance_after < distance_before, after, before)
+
+    if tolerance is not None:
+        distance = numpy.minimum(distance_before, distance_after)
+        nearest = numpy.where(distance <= tolerance, nearest, -1)
+    return nearest.astype(numpy.int64)
+
+
+def align(reference_timestamps, series, tolerance=None, default=0):
+    """Aligns multiple series on the reference timestamps
+
+    :param reference_timestamps: Timestamps of the result, in nanoseconds
+    :param series: dict name -> (timestamps, values) of the series to join
+    :param tolerance: see :func:`merge_asof`
+    :param default: Value for samples without a match
+    :return: dict name -> array with one value per reference timestamp
+    """
+    aligned = {}
+    for name, (timestamps, values) in series.items():
+        timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+        values = numpy.asarray(values)
+
+        # The histories are ordered, but make sure anyway
+        order = numpy.argsort(timestamps, kind='mergesort')
+        timestamps = timestamps[order]
+        values = values[order]
+
+        index = merge_asof(reference_timestamps, timestamps, tolerance)
+        result = numpy.full(len(index), default, dtype=values.dtype
+                            if len(values) else numpy.int64)
+        matched = index >= 0
+        result[matched] = values[index[matched]]
+        aligned[name] = result
+    return aligned
+
+
+def roaming_events(timestamps, ssids, bssids):
+    """Detects the samples where the SSID or BSSID changes
+
+    :return: list of dicts with the index and timestamp of the first sample
+             on the new access point, and the old and new SSID/BSSID
+    """
+    ssids = numpy.asarray(ssids, dtype=object)
+    bssids = numpy.asarray(bssids, dtype=object)
+    if len(ssids) < 2:
+        return []
+
+    changed = (ssids[1:] != ssids[:-1]) | (bssids[1:] != bssids[:-1])
+    events = []
+    for index in numpy.flatnonzero(changed) + 1:
+        events.append({
+            'index': int(index),
+            'timestamp': int(timestamps[index]),
+            'from_ssid': ssids[index - 1],
+            'from_bssid': bssids[index - 1],
+            'to_ssid': ssids[index],
+            'to_bssid': bssids[index],
+        })
+    return events
+
+
+def around_events(events, throughput, tx_frames=None, rx_frames=None,
+                  window=5):
+    """Throughput and loss in the samples before and after each event
+
+    Uses cumulative sums, so the cost per event does not depend on
+    the window.
+
+    :param events: Events returned by :func:`roaming_events`
+    :param throughput: Throughput per sample
+    :param tx_frames: Transmitted frames per sample (optional)
+    :param rx_frames: Received frames per sample (optional)
+    :param window: Number of samples before and after the event
+    :return: the events, extended with 'throughput_before',
+             'throughput_after' and, when the frame counts are given,
+             'loss_before' and 'loss_after' (in percent)
+    """
+    def cumulative(values):
+        return numpy.concatenate(
+            ([0], numpy.cumsum(numpy.asarray(values, dtype=numpy.float64))))
+
+    count = len(throughput)
+    throughput_sum = cumulative(throughput)
+    with_loss = tx_frames is not None and rx_frames is not None
+    if with_loss:
+        tx_sum = cumulative(tx_frames)
+        rx_sum = cumulative(rx_frames)
+
+    def average(sums, start, end):
+        if end <= start:
+            return None
+        return float((sums[end] - sums[start]) / (end - start))
+
+    def loss(start, end):
+        tx = tx_sum[end] - tx_sum[start]
+        if tx == 0:
+            return None
+        return float((tx - (rx_sum[end] - rx_sum[start])) * 100.0 / tx)
+
+    for event in events:
+        before = (max(0, event['index'] - window), event['index'])
+        after = (event['index'], min(count, event['index'] + window))
+        event['throughput_before'] = average(throughput_sum, *before)
+        event['throughput_after'] = average(throughput_sum, *after)
+        if with_loss:
+            event['loss_before'] = loss(*before)
+            event['loss_after'] = loss(*after)
+    return events
+
+
+def print_roaming_events(events):
+    def fmt(value, unit):
+        if value is None:
+            return 'n/a'
+        return '%.2f %s' % (value, unit)
+
+    if not events:
+        print("No roaming events detected")
+    for event in events:
+        print("Roamed from %s (%s) to %s (%s): throughput %s -> %s" % (
+            event['from_ssid'], event['from_bssid'],
+            event['to_ssid'], event['to_bssid'],
+            fmt(event['throughput_before'] / 1e6
+                if event['throughput_before'] is not None else None, 'Mbps'),
+            fmt(event['throughput_after'] / 1e6
+                if event['throughput_after'] is not None else None, 'Mbps')))
+        if 'loss_before' in event:
+            print("    loss %s -> %s" % (fmt(event['loss_before'], '%'),
+                                         fmt(event['loss_after'], '%')))
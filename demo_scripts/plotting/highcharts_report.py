@@ -0,0 +1,282 @@
+#!/usr/bin/python
+"""
+Highcharts reports which stay small for long tests.
+
+A test of 24 hours with one sample per second and five series would embed
+432000 points in a single html page.  The ChunkedReport
+  - embeds a downsampled overview of every series in the page:
+      * line series: Largest-Triangle-Three-Buckets (LTTB), which keeps
+        the peaks and valleys of the graph,
+      * range series (e.g. arearange): the minimum and maximum per bucket,
+  - writes the full resolution data as gzip compressed JSON chunks next to
+    the page.  When the user zooms in, the page loads the chunks of the
+    visible range.  Loading the chunks requires the page to be served by
+    a webserver (e.g. python -m http.server), opened from disk the page
+    keeps showing the overview.
+  - writes the page to disk while the series are added, one series at
+    the time is held in memory.
+
+Usage:
+    with ChunkedReport('report.html', options) as report:
+        report.add_data_set(points, 'line', 'Throughput', yAxis=0)
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import calendar
+import datetime
+import gzip
+import json
+import os
+
+HIGHCHARTS_SCRIPTS = [
+    'https://code.highcharts.com/highcharts.js',
+    'https://code.highcharts.com/highcharts-more.js',
+    'https://code.highcharts.com/modules/exporting.js',
+]
+
+
+def to_millis(x):
+    """Highcharts x value of a point: datetimes become milliseconds
+
+    Naive datetimes are interpreted as UTC, like python-highcharts does.
+    """
+    if isinstance(x, datetime.datetime):
+        return calendar.timegm(x.timetuple()) * 1000 + x.microsecond // 1000
+    return x
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    :param points: list of (x, y) points, sorted on x
+    :param threshold: number of points to keep
+    :return: list with at most `threshold` of the original points
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    def y(point):
+        return point[1] if point[1] is not None else 0
+
+    sampled = [points[0]]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket, the third corner of the triangle
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        next_points = points[next_start:next_end] or [points[-1]]
+        average_x = sum(p[0] for p in next_points) / len(next_points)
+        average_y = sum(y(p) for p in next_points) / len(next_points)
+
+        # Keep the point of this bucket with the largest triangle
+        ax, ay = points[previous][0], y(points[previous])
+        largest_area = -1
+        selected = start
+        for index in range(start, end):
+            area = abs((ax - average_x) * (y(points[index]) - ay)
+                       - (ax - points[index][0]) * (average_y - ay))
+            if area > largest_area:
+                largest_area = area
+                selected = index
+
+        sampled.append(points[selected])
+        previous = selected
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def minmax_buckets(points, threshold):
+    """Minimum and maximum per bucket, for range points (x, low, high)
+
+    :return: one point per bucket, with the lowest low and highest high
+    """
+    count = len(points)
+    if threshold >= count or threshold < 1:
+        return list(points)
+
+    def value(v, default):
+        return v if v is not None else default
+
+    sampled = []
+    bucket_size = count / threshold
+    for bucket in range(threshold):
+        chunk = points[int(bucket * bucket_size):int((bucket + 1) * bucket_size)]
+        if not chunk:
+            continue
+        low = min(value(p[1], float('inf')) for p in chunk)
+        high = max(value(p[2], float('-inf')) for p in chunk)
+        sampled.append([chunk[0][0],
+                        low if low != float('inf') else None,
+                        high if high != float('-inf') else None])
+    return sampled
+
+
+def downsample(points, threshold):
+    """Selects the downsampling method on the shape of the points"""
+    if points and len(points[0]) > 2:
+        return minmax_buckets(points, threshold)
+    return lttb(points, threshold)
+
+
+class ChunkedReport(object):
+    """Writes a Highcharts html page with downsampled series
+
+    :param filename: html file to write
+    :param options: Highcharts options, as passed to
+                    Highchart.set_dict_options()
+    :param width: Width of the chart, in pixels
+    :param height: Height of the chart, in pixels
+    :param max_points: Number of points per series in the overview.
+                       About the width of the chart is enough.
+    :param chunk_points: Number of points per chunk file
+    """
+
+    def __init__(self, filename, options, width=1000, height=400,
+                 max_points=2000, chunk_points=10000):
+        self.filename = filename
+        self.max_points = max_points
+        self.chunk_points = chunk_points
+
+        self.chunk_directory = os.path.splitext(filename)[0] + '_data'
+        self.series_count = 0
+
+        options = dict(options)
+        options['chart'] = dict(options.get('chart', {}))
+        options['chart'].update({'renderTo': 'container',
+                                 'width': width, 'height': height})
+
+        self.handle = open(filename, 'w')
+        self.handle.write('<!DOCTYPE html>\n<html>\n<head>\n'
+                          '<meta charset="utf-8">\n')
+        for script in HIGHCHARTS_SCRIPTS:
+            self.handle.write('<script src="%s"></script>\n' % script)
+        self.handle.write('</head>\n<body>\n'
+                          '<div id="container"></div>\n<script>\n')
+        self.handle.write('var report = {options: ')
+        json.dump(options, self.handle)
+        self.handle.write(', series: [], chunks: [], overview: []};\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_chunks(self, points):
+        """Writes the points in chunk files
+
+        :return: list of [first x, last x, relative path, number of points]
+                 per chunk
+        """
+        if not os.path.isdir(self.chunk_directory):
+            os.makedirs(self.chunk_directory)
+
+        chunks = []
+        for number, start in enumerate(range(0, len(points), self.chunk_points)):
+            chunk = points[start:start + self.chunk_points]
+            name = '%d_%d.json.gz' % (self.series_count, number)
+            with gzip.open(os.path.join(self.chunk_directory, name), 'wb') as f:
+                f.write(json.dumps(chunk).encode('utf-8'))
+            chunks.append([chunk[0][0], chunk[-1][0],
+                           os.path.basename(self.chunk_directory) + '/' + name,
+                           len(chunk)])
+        return chunks
+
+    def add_data_set(self, data, series_type, name, **kwargs):
+        """Adds a series, same arguments as Highchart.add_data_set()"""
+        points = [[to_millis(p[0])] + list(p[1:]) for p in data]
+        points.sort(key=lambda p: p[0])
+
+        chunks = []
+        overview = points
+        if len(points) > self.max_points:
+            chunks = self._write_chunks(points)
+            overview = downsample(points, self.max_points)
+
+        series = dict(kwargs)
+        series.update({'type': series_type, 'name': name})
+
+        self.handle.write('report.series.push(')
+        json.dump(series, self.handle)
+        self.handle.write(');\nreport.chunks.push(')
+        json.dump(chunks, self.handle)
+        self.handle.write(');\nreport.overview.push(')
+        json.dump(overview, self.handle)
+        self.handle.write(');\n')
+        self.series_count += 1
+
+    def close(self):
+        if self.handle is None:
+            return
+        self.handle.write(_LOADER_SCRIPT)
+        self.handle.write('</script>\n</body>\n</html>\n')
+        self.handle.close()
+        self.handle = None
+
+
+# Creates the chart and loads the full resolution chunks on zoom.
+_LOADER_SCRIPT = """
+function load_chunk(path) {
+    return fetch(path).then(function(response) {
+        var stream = response.body.pipeThrough(new DecompressionStream('gzip'));
+        return new Response(stream).json();
+    });
+}
+
+function show_range(chart, min, max) {
+    chart.series.forEach(function(series, index) {
+        var chunks = report.chunks[index];
+        if (!chunks.length) {
+            return;
+        }
+        if (min === undefined || max === undefined) {
+            series.setData(report.overview[index], true, false, false);
+            return;
+        }
+        var visible = chunks.filter(function(chunk) {
+            return chunk[1] >= min && chunk[0] <= max;
+        });
+        // The raw points in the zoomed range: every visible chunk
+        // contributes the part of its points which falls in the range.
+        var raw_points = visible.reduce(function(total, chunk) {
+            var span = chunk[1] - chunk[0];
+            var overlap = Math.min(chunk[1], max) - Math.max(chunk[0], min);
+            return total + (span > 0 ? chunk[3] * Math.max(0, overlap) / span
+                                     : chunk[3]);
+        }, 0);
+        // Zoomed in too little, the overview is detailed enough.
+        if (raw_points > 4 * report.overview[index].length) {
+            series.setData(report.overview[index], true, false, false);
+            return;
+        }
+        Promise.all(visible.map(function(chunk) { return load_chunk(chunk[2]); }))
+            .then(function(parts) {
+                series.setData([].concat.apply([], parts), true, false, false);
+            })
+            .catch(function(error) {
+                console.log('Could not load the detailed data: ' + error);
+            });
+    });
+}
+
+report.options.series = report.series.map(function(series, index) {
+    return Object.assign({data: report.overview[index]}, series);
+});
+report.options.xAxis = Object.assign({}, report.options.xAxis, {
+    events: {
+        afterSetExtremes: function(e) {
+            show_range(this.chart, e.userMin, e.userMax);
+        }
+    }
+});
+var chart = new Highcharts.Chart(report.options);
+"""
+
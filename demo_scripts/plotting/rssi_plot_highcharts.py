@@ -9,18 +9,22 @@ from __future__ import print_function
 
 import csv
 import datetime
+import os
+import sys
 from time import mktime
 
-from highcharts import Highchart
+import numpy
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from highcharts_report import ChunkedReport
 
-def create_highcharts(device_name, results):
+
+def create_highcharts_options(device_name, results):
     categories = []
     ssid_categories = results[3]
     for pair in ssid_categories:
         categories.append(pair[1])
 
-    chart = Highchart(width=1000, height=400)
     styling = '<span style="font-family: \'DejaVu Sans\', Arial, Helvetica, sans-serif; color: '
     options = {
         'title': {
@@ -54,28 +58,28 @@ def create_highcharts(device_name, results):
             }
         ],
     }
-    chart.set_dict_options(options)
-
-    return chart
-
+    return options
 
-def write_highcharts_html(chart):
-    with open('highcharts_rssi.html', 'w') as f:
-        # Write the headers
-        f.write(chart.htmlcontent)
 
+def plot_data(device_name, results_filename, reader=None):
+    """Writes the html report of the results file
 
-def plot_data(device_name, results_filename):
+    :param reader: Optional ResultsReader of the results file.  Pass the
+                   same reader to regenerate the report during a long test,
+                   only the rows appended in between are parsed.
+    """
     print("Reading CSV results from file ", results_filename)
     # desired_keys = ['timestamp', 'tx_frames', 'rx_frames', 'loss', 'throughput', 'rssi']
-    results = read_from_csv(results_filename)
-    chart = create_highcharts(device_name, results)
+    if reader is None:
+        reader = ResultsReader(results_filename)
+    reader.read()
+    results = reader.results()
+    options = create_highcharts_options(device_name, results)
 
-    chart.add_data_set(results[0], 'line', 'Throughput', yAxis=0)
-    chart.add_data_set(results[1], 'line', 'RSSI', color='#EC008C', yAxis=1)
-    chart.add_data_set(results[2], 'line', 'SSID/BSSID', color='#00A650', yAxis=2)
-
-    write_highcharts_html(chart)
+    with ChunkedReport('highcharts_rssi.html', options) as chart:
+        chart.add_data_set(results[0], 'line', 'Throughput', yAxis=0)
+        chart.add_data_set(results[1], 'line', 'RSSI', color='#EC008C', yAxis=1)
+        chart.add_data_set(results[2], 'line', 'SSID/BSSID', color='#00A650', yAxis=2)
 
 
 def get_millis(timestring):
@@ -85,44 +89,130 @@ def get_millis(timestring):
     return millis
 
 
+class TimestampParser(object):
+    """Converts 'YYYY-mm-dd HH:MM:SS' local times to milliseconds
+
+    The samples are one second apart, so consecutive rows share the same
+    hour.  Only the first timestamp of every hour is parsed with strptime,
+    the minutes and seconds of the others are added to the cached value.
+    """
+
+    def __init__(self):
+        self.hours = {}
+
+    def hour_millis(self, hour):
+        millis = self.hours.get(hour)
+        if millis is None:
+            millis = get_millis(hour + ':00:00')
+            self.hours[hour] = millis
+        return millis
+
+    def millis(self, timestrings):
+        """The milliseconds of a list of timestamps, as an array"""
+        count = len(timestrings)
+        hours = numpy.fromiter((self.hour_millis(t[:13]) for t in timestrings),
+                               numpy.float64, count)
+        minutes = numpy.fromiter((int(t[14:16]) for t in timestrings),
+                                 numpy.int64, count)
+        seconds = numpy.fromiter((int(t[17:19]) for t in timestrings),
+                                 numpy.int64, count)
+        return hours + (minutes * 60 + seconds) * 1000
+
+
 no_signal = 'No Signal'
 
 
-# return the index of the ssid_bssid:
-def append_ssid_bssid(categories, ssid_bssid):
-    i = 0
-    if ssid_bssid == ' <br> 00:00:00:00:00:00':
-        ssid_bssid = no_signal
-    while i < len(categories):
-        pair = categories[i]
-        if pair[1] == ssid_bssid:
-            return i
-        i += 1
-    categories.append([i, ssid_bssid])
-    return i
+class ResultsReader(object):
+    """Reads the results CSV file into the series for the chart
+
+    The reader remembers how far it got in the file: every call of read()
+    only parses the rows which were appended since the previous call.
+    This allows to update the report cheaply during a long test.
+
+    The columns are kept in the arrays millis, throughput, rssi and
+    ssid_bssid (the index in ssid_bssid_categories).
+    """
+
+    def __init__(self, results_file):
+        self.results_file = results_file
+        self.offset = 0
+        self.timestamps = TimestampParser()
+
+        self.millis = numpy.empty(0, dtype=numpy.float64)
+        self.throughput = numpy.empty(0, dtype=numpy.float64)
+        self.rssi = numpy.empty(0, dtype=numpy.float64)
+        self.ssid_bssid = numpy.empty(0, dtype=numpy.int64)
+        self.ssid_bssid_categories = [[0, no_signal]]
+        # Maps the SSID/BSSID name on its index in ssid_bssid_categories
+        self.category_index = {no_signal: 0}
+
+    def category(self, ssid_bssid):
+        if ssid_bssid == ' <br> 00:00:00:00:00:00':
+            ssid_bssid = no_signal
+        index = self.category_index.get(ssid_bssid)
+        if index is None:
+            index = len(self.ssid_bssid_categories)
+            self.ssid_bssid_categories.append([index, ssid_bssid])
+            self.category_index[ssid_bssid] = index
+        return index
+
+    def read(self):
+        """Parses the rows appended since the previous call
+
+        :return: number of new rows
+        """
+        lines = []
+        with open(self.results_file) as csvfile:
+            csvfile.seek(self.offset)
+            if self.offset == 0:
+                # skip the header
+                header = csvfile.readline()
+                if not header.endswith('\n'):
+                    return 0
+                self.offset = csvfile.tell()
+
+            while True:
+                line = csvfile.readline()
+                if not line.endswith('\n'):
+                    # End of file, or a row which is still being written
+                    break
+                lines.append(line)
+                self.offset = csvfile.tell()
+
+        rows = list(csv.reader(lines, delimiter=','))
+        if not rows:
+            return 0
+
+        count = len(rows)
+        self.millis = numpy.concatenate(
+            [self.millis, self.timestamps.millis([row[0] for row in rows])])
+        self.throughput = numpy.concatenate(
+            [self.throughput,
+             numpy.fromiter((float(row[4]) for row in rows), numpy.float64,
+                            count)])
+        self.rssi = numpy.concatenate(
+            [self.rssi,
+             numpy.fromiter((float(row[5]) for row in rows), numpy.float64,
+                            count)])
+        self.ssid_bssid = numpy.concatenate(
+            [self.ssid_bssid,
+             numpy.fromiter((self.category(row[6] + ' <br> ' + row[7])
+                             for row in rows), numpy.int64, count)])
+        return count
+
+    def results(self):
+        """The throughput, RSSI and SSID/BSSID series, as arrays of
+        [millis, value] rows, and the SSID/BSSID categories"""
+        return [numpy.column_stack([self.millis, self.throughput]),
+                numpy.column_stack([self.millis, self.rssi]),
+                numpy.column_stack([self.millis, self.ssid_bssid]),
+                self.ssid_bssid_categories]
 
 
 def read_from_csv(results_file):
-    throughput_series = []
-    rssi_series = []
-    ssid_bssid_series = []
-    ssid_bssid_categories = [[0, no_signal]]
-
-    skip_header = True
-    with open(results_file) as csvfile:
-        read_csv = csv.reader(csvfile, delimiter=',')
-        for row in read_csv:
-            if skip_header:
-                skip_header = False
-            else:
-                millis = get_millis(row[0])
-                throughput_series.append([millis, float(row[4])])
-                rssi_series.append([millis, float(row[5])])
-                ssid_bssid = row[6] + ' <br> ' + row[7]
-                index = append_ssid_bssid(ssid_bssid_categories, ssid_bssid)
-                ssid_bssid_series.append([millis, index])
-
-    return [throughput_series, rssi_series, ssid_bssid_series, ssid_bssid_categories]
+    reader = ResultsReader(results_file)
+    reader.read()
+    return reader.results()
 
 
 if __name__ == '__main__':
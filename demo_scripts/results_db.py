@@ -0,0 +1,391 @@
+#!/usr/bin/python
+"""
+Stores the results of multiple runs in a SQLite database.
+
+Every run is tagged with
+  - the example which produced it,
+  - a hash of the scenario (the configuration of the example), so runs of
+    the same scenario can be compared, even when the files were renamed,
+  - the ByteBlower server version and the device under test (DUT).
+
+A run has summary metrics (e.g. 'rx_avg_latency_nanoseconds') and interval
+series (timestamp, value).  Trend queries, like the average latency of a
+scenario over the last 30 days, are answered by the indexes, without
+loading the interval series.  The percentiles of the interval series are
+stored as summary metrics too, e.g. 'rx_avg_latency_nanoseconds_p99'.
+
+Usage from an example:
+    with ResultsDatabase('byteblower_results.db') as db:
+        run_id = db.add_run('tcp_oneway_latency', configuration,
+                            server_version=server_version, dut='CPE-1')
+        db.add_summary(run_id, {'rx_avg_latency_nanoseconds': 1234567})
+        db.add_interval_results(run_id, intervals, 'timestamp_nanoseconds')
+
+Usage from the command line:
+    python results_db.py runs
+    python results_db.py trend rx_avg_latency_nanoseconds --days 30
+    python results_db.py percentile <run id> rx_avg_latency_nanoseconds 99
+    python results_db.py import-json ipv4_tcp_history ipv4_tcp_history.json \
+        --configuration configuration.json
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import datetime
+import hashlib
+import json
+import numbers
+import sqlite3
+import time
+
+DEFAULT_DATABASE = 'byteblower_results.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    example TEXT NOT NULL,
+    scenario_hash TEXT NOT NULL,
+    scenario TEXT,
+    server_version TEXT,
+    dut TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_scenario ON runs (scenario_hash, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_example ON runs (example, started_at);
+CREATE INDEX IF NOT EXISTS runs_by_dut ON runs (dut, started_at);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    metric TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, metric)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS summaries_by_metric ON summaries (metric, run_id);
+
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    series TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, series, timestamp)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_by_value ON samples (run_id, series, value);
+"""
+
+
+# Configuration keys which do not change the scenario.  'ip_address' is
+# filled in by the examples when DHCP is used.
+IGNORED_KEYS = ('ip_address', 'results_database', 'dut')
+
+
+def _without_ignored_keys(value):
+    if isinstance(value, dict):
+        return dict((k, _without_ignored_keys(v)) for k, v in value.items()
+                    if k not in IGNORED_KEYS)
+    if isinstance(value, (list, tuple)):
+        return [_without_ignored_keys(v) for v in value]
+    return value
+
+
+def scenario_hash(configuration):
+    """Hash of a configuration, independent of the order of the keys
+
+    Values which are not JSON serializable (e.g. callbacks) are hashed by
+    their string representation.
+    """
+    canonical = json.dumps(_without_ignored_keys(configuration),
+                           sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class ResultsDatabase(object):
+    """The results of all runs, stored in a single SQLite file
+
+    :param filename: SQLite database file, created when it does not exist
+    """
+
+    def __init__(self, filename=DEFAULT_DATABASE):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+    def add_run(self, example, configuration, server_version=None, dut=None,
+                started_at=None):
+        """Registers a run
+
+        :param example: Name of the example, e.g. 'tcp_oneway_latency'
+        :param configuration: The configuration of the example, its hash
+                              identifies the scenario
+        :param started_at: POSIX timestamp in seconds, defaults to now
+        :return: the id of the run
+        """
+        if started_at is None:
+            started_at = time.time()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started_at, example, scenario_hash, "
+                "scenario, server_version, dut) VALUES (?, ?, ?, ?, ?, ?)",
+                (started_at, example, scenario_hash(configuration),
+                 json.dumps(configuration, sort_keys=True, default=str),
+                 server_version, dut))
+        return cursor.lastrowid
+
+    def add_summary(self, run_id, metrics):
+        """Stores the numeric items of `metrics` as summary of the run"""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO summaries (run_id, metric, value) "
+                "VALUES (?, ?, ?)",
+                ((run_id, metric, value) for metric, value in metrics.items()
+                 if _is_number(value)))
+
+    def add_series(self, run_id, series, samples):
+        """Stores an interval series
+
+        :param samples: iterable of (timestamp in nanoseconds, value).
+                        It is consumed while inserting, a generator
+                        avoids keeping the series in memory.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO samples "
+                "(run_id, series, timestamp, value) VALUES (?, ?, ?, ?)",
+                ((run_id, series, int(timestamp), value)
+                 for timestamp, value in samples))
+
+    def add_interval_results(self, run_id, intervals, timestamp_key,
+                             percentiles=(50, 90, 99)):
+        """Stores every numeric key of a list of interval dicts as series
+
+        The percentiles of every series are stored as summary metrics,
+        named '<series>_p<percentile>', so trend queries can use them.
+
+        :param intervals: list of dicts, as returned by most examples
+        :param timestamp_key: key of the timestamp in nanoseconds
+        """
+        keys = set()
+        for interval in intervals:
+            keys.update(key for key, value in interval.items()
+                        if key != timestamp_key and _is_number(value))
+        for key in sorted(keys):
+            self.add_series(run_id, key, (
+                (interval[timestamp_key], interval[key])
+                for interval in intervals
+                if _is_number(interval.get(key))))
+            self.add_summary(run_id, dict(
+                ('%s_p%g' % (key, p), self.percentile(run_id, key, p))
+                for p in percentiles))
+
+    def add_change_points(self, run_id, change_points):
+        """Stores the change points of a run (see back2back/change_detection.py)
+
+        Every change point becomes a sample of the series
+        'change_points.<metric>' with the severity as value, negative when
+        the metric went down.  The number of change points is stored as
+        summary metric 'change_points'.
+        """
+        for change in change_points:
+            sign = -1 if change['direction'] == 'down' else 1
+            self.add_series(run_id, 'change_points.' + change['metric'],
+                            [(change['timestamp'], sign * change['severity'])])
+        self.add_summary(run_id, {'change_points': len(change_points)})
+
+    def runs(self, example=None, days=None, limit=100):
+        """The most recent runs, newest first"""
+        query = "SELECT id, started_at, example, scenario_hash, " \
+                "server_version, dut FROM runs"
+        conditions, parameters = self._run_conditions(
+            example=example, days=days)
+        query += conditions + " ORDER BY started_at DESC LIMIT ?"
+        return self.connection.execute(query, parameters + [limit]).fetchall()
+
+    def trend(self, metric, scenario=None, example=None, dut=None, days=30):
+        """A summary metric over time
+
+        :param scenario: Scenario hash (or a prefix of it)
+        :return: list of (started_at, value, run_id, server_version, dut),
+                 oldest first
+        """
+        conditions, parameters = self._run_conditions(
+            scenario=scenario, example=example, dut=dut, days=days)
+        query = ("SELECT runs.started_at, summaries.value, runs.id, "
+                 "runs.server_version, runs.dut FROM runs "
+                 "JOIN summaries ON summaries.run_id = runs.id "
+                 "AND summaries.metric = ?" + conditions +
+                 " ORDER BY runs.started_at")
+        return self.connection.execute(query, [metric] + parameters).fetchall()
+
+    def series(self, run_id, series):
+        """Iterates the (timestamp, value) samples of a series"""
+        return self.connection.execute(
+            "SELECT timestamp, value FROM samples "
+            "WHERE run_id = ? AND series = ? ORDER BY timestamp",
+            (run_id, series))
+
+    def percentile(self, run_id, series, percentile):
+        """Percentile of a series, calculated by the database
+
+        Uses the (run_id, series, value) index, only one sample is read.
+        """
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM samples WHERE run_id = ? AND series = ?",
+            (run_id, series)).fetchone()[0]
+        if count == 0:
+            return None
+        offset = min(count - 1, int(round(percentile / 100 * (count - 1))))
+        return self.connection.execute(
+            "SELECT value FROM samples WHERE run_id = ? AND series = ? "
+            "ORDER BY value LIMIT 1 OFFSET ?",
+            (run_id, series, offset)).fetchone()[0]
+
+    @staticmethod
+    def _run_conditions(scenario=None, example=None, dut=None, days=None):
+        conditions = []
+        parameters = []
+        if scenario is not None:
+            # A prefix of the hash is enough, like git does.  The hash is
+            # hexadecimal, so the prefix followed by 'g' is an upper bound.
+            conditions.append("runs.scenario_hash >= ? AND runs.scenario_hash < ?")
+            parameters += [scenario, scenario + 'g']
+        if example is not None:
+            conditions.append("runs.example = ?")
+            parameters.append(example)
+        if dut is not None:
+            conditions.append("runs.dut = ?")
+            parameters.append(dut)
+        if days is not None:
+            conditions.append("runs.started_at >= ?")
+            parameters.append(time.time() - days * 24 * 3600)
+        if not conditions:
+            return "", parameters
+        return " WHERE " + " AND ".join(conditions), parameters
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def import_json(database, example, filename, configuration=None, dut=None,
+                server_version=None):
+    """Imports a JSON result file written by an example
+
+    Top level numbers become summary metrics.  Lists of dicts with a
+    'timestamp' or 'timestamp_nanoseconds' key become interval series.
+
+    :param configuration: The configuration of the example which wrote the
+                          file, it identifies the scenario.  By default the
+                          'configuration' item of the file.
+    """
+    with open(filename) as f:
+        results = json.load(f)
+
+    if configuration is None:
+        configuration = results.get('configuration')
+    if configuration is None:
+        raise ValueError("%s has no configuration, the scenario of the run "
+                         "is unknown" % filename)
+
+    run_id = database.add_run(example, configuration,
+                              server_version=server_version, dut=dut)
+    database.add_summary(run_id, results)
+    for key, value in results.items():
+        if key == 'change_points':
+            database.add_change_points(run_id, value)
+            continue
+        if isinstance(value, dict):
+            # e.g. {'we': ..., 'samples': [...]}
+            for sub_key, sub_value in value.items():
+                _import_intervals(database, run_id, sub_value)
+        _import_intervals(database, run_id, value)
+    return run_id
+
+
+def _import_intervals(database, run_id, value):
+    if not isinstance(value, list) or not value or not isinstance(value[0], dict):
+        return
+    for timestamp_key in ('timestamp_nanoseconds', 'timestamp'):
+        if timestamp_key in value[0]:
+            database.add_interval_results(run_id, value, timestamp_key)
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    commands = parser.add_subparsers(dest='command')
+
+    runs = commands.add_parser('runs', help='list the recent runs')
+    runs.add_argument('--example')
+    runs.add_argument('--days', type=float)
+
+    trend = commands.add_parser('trend', help='a summary metric over time')
+    trend.add_argument('metric')
+    trend.add_argument('--scenario', help='scenario hash or a prefix of it')
+    trend.add_argument('--example')
+    trend.add_argument('--dut')
+    trend.add_argument('--days', type=float, default=30)
+
+    percentile = commands.add_parser('percentile',
+                                     help='percentile of an interval series')
+    percentile.add_argument('run_id', type=int)
+    percentile.add_argument('series')
+    percentile.add_argument('percentile', type=float)
+
+    importer = commands.add_parser('import-json',
+                                   help='import a JSON result file')
+    importer.add_argument('example')
+    importer.add_argument('filename')
+    importer.add_argument('--configuration',
+                          help='JSON file with the configuration of the '
+                               'example, if the result file has none')
+    importer.add_argument('--dut')
+    importer.add_argument('--server-version')
+
+    args = parser.parse_args()
+
+    def date(started_at):
+        return str(datetime.datetime.fromtimestamp(int(started_at)))
+
+    with ResultsDatabase(args.database) as database:
+        if args.command == 'runs':
+            for row in database.runs(example=args.example, days=args.days):
+                print("%5d %s %-30s %s %s %s" % (row[0], date(row[1]), row[2],
+                                                 row[3][:10], row[4], row[5]))
+        elif args.command == 'trend':
+            for row in database.trend(args.metric, scenario=args.scenario,
+                                      example=args.example, dut=args.dut,
+                                      days=args.days):
+                print("%s %g (run %d, server %s, DUT %s)" % (
+                    date(row[0]), row[1], row[2], row[3], row[4]))
+        elif args.command == 'percentile':
+            print(database.percentile(args.run_id, args.series,
+                                      args.percentile))
+        elif args.command == 'import-json':
+            configuration = None
+            if args.configuration is not None:
+                with open(args.configuration) as f:
+                    configuration = json.load(f)
+            run_id = import_json(database, args.example, args.filename,
+                                 configuration=configuration, dut=args.dut,
+                                 server_version=args.server_version)
+            print("Imported %s as run %d" % (args.filename, run_id))
+        else:
+            parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
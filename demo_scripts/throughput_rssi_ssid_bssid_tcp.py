@@ -11,9 +11,11 @@ import random
 import sys
 import time
 
-from byteblowerll.byteblower import ByteBlower, DeviceStatus, ConfigError
+from byteblowerll.byteblower import ByteBlower, DeviceStatus
 from byteblowerll.byteblower import NetworkInterfaceType
 
+import correlation
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': '10.10.1.204',
@@ -104,6 +106,7 @@ class Example:
         self.meetingpoint = None
         self.wireless_endpoint = None
         self.network_info_monitor = None
+        self.roaming_events = []
 
     def run(self):
 
@@ -254,25 +257,19 @@ class Example:
         # { 'timestamp': ... , 'SSID': ... , 'BSSID': ... , 'throughput': ...
         results = []
 
+        # Join the throughput on the nearest timestamp of every network info
+        # snapshot.  Snapshots without HTTP interval get a throughput of 0.
         interval_snapshots = network_info_history.IntervalGet()
-        for network_info_interval in interval_snapshots:
-            # Find the corresponding HTTP snapshot
+        http_intervals = http_hist.IntervalGet()
+        throughput = correlation.align(
+            [i.TimestampGet() for i in interval_snapshots], {
+                'throughput': (
+                    [i.TimestampGet() for i in http_intervals],
+                    [int(i.AverageDataSpeedGet().bitrate()) for i in http_intervals]),
+            }, tolerance=sample_duration // 2)['throughput']
+
+        for index, network_info_interval in enumerate(interval_snapshots):
             timestamp = network_info_interval.TimestampGet()
-            try:
-                http_interval = http_hist.IntervalGetByTime(timestamp)
-                # Get the average througput for this interval
-                # type is byteblowerll.byteblower.DataRate
-                rate = http_interval.AverageDataSpeedGet()
-
-                rate_bps = rate.bitrate()
-
-            except ConfigError as e:
-                print("Couldn't fetch Throughput snapshot for timestamp", timestamp)
-                print("Number of NetworkInfo snapshots:", len(interval_snapshots))
-                print("Number of HTTP snapshots:", http_hist.IntervalLengthGet())
-                print("ConfigError:", e.what())
-
-                rate_bps = 0
 
             # Get the interfaces stored in this interval
             interfaces = network_info_interval.InterfaceGet()
@@ -281,7 +278,7 @@ class Example:
 
             result = {
                 'timestamp': timestamp,
-                'throughput': int(rate_bps),
+                'throughput': int(throughput[index]),
 
                 # Default values
                 'SSID': 'Unknown',
@@ -301,6 +298,13 @@ class Example:
 
             results.append(result)
 
+        self.roaming_events = correlation.around_events(
+            correlation.roaming_events([r['timestamp'] for r in results],
+                                       [r['SSID'] for r in results],
+                                       [r['BSSID'] for r in results]),
+            [r['throughput'] for r in results])
+        correlation.print_roaming_events(self.roaming_events)
+
         self.server.PortDestroy(self.port)
         self.wireless_endpoint.Lock(False)
         return results
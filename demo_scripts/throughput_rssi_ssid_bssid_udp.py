@@ -8,13 +8,27 @@ WirelessEndpoint --> ByteBlowerPort
 
 from __future__ import print_function
 # We want to use the ByteBlower python API, so import it
-from byteblowerll.byteblower import ByteBlower, ConfigError
+from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import DeviceStatus
 
 
 from scapy.packet import Raw
 import datetime
 import os
+import sys
+
+# The clock synchronization is shared with the wireless endpoint examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'wireless_endpoint'))
+from clock_sync import start_with_device
+
+# The sizing and draining of the result histories is shared with the
+# back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'back2back'))
+from history_manager import HistoryManager
+
+import correlation
 
 configuration = {
     # UUID of the ByteBlower WirelessEndpoint to use.
@@ -65,6 +79,10 @@ configuration = {
 
     'udp_srcport': 4096,
     'udp_dstport': 4096,
+
+    # Optional function, called every second during the test with the
+    # latest interval result of the trigger, e.g. to show live results.
+    # 'interval_callback': print,
 }
 
 
@@ -88,18 +106,25 @@ class Example:
         self.interframe_gap_nanoseconds = int(1.0 * 1e9 / frames_per_second)
         self.udp_srcport = kwargs['udp_srcport']
         self.udp_dstport = kwargs['udp_dstport']
+        self.interval_callback = kwargs.get('interval_callback')
+
+        # Samples of the traffic and the Wi-Fi statistics are matched when
+        # they are at most half a sample interval apart.
+        self.sample_tolerance_ns = 500 * 1000 * 1000
 
         self.server = None
         self.port = None
         self.meetingpoint = None
         self.wireless_endpoint = None
+        self.start_alignment = None
+        self.roaming_events = []
 
     def run(self):
         instance = ByteBlower.InstanceGet()
         assert isinstance(instance, ByteBlower)
 
         # Connect to the server
-        self.server = instance.ServerAdd(self.server_address)
+        self.server = self.connect_server(instance)
 
         # create and configure the port.
         self.port = self.server.PortCreate(self.server_interface)
@@ -124,7 +149,7 @@ class Example:
         print("Created port", self.port.DescriptionGet())
 
         # Connect to the meetingpoint
-        self.meetingpoint = instance.MeetingPointAdd(self.meetingpoint_address)
+        self.meetingpoint = self.connect_meetingpoint(instance)
 
         # If no WirelessEndpoint UUID was given, search an available one.
         if self.wireless_endpoint_uuid is None:
@@ -193,6 +218,14 @@ class Example:
 
         monitor = device_info.NetworkInfoMonitorAdd()
 
+        # Size the histories for the whole test, the intervals are kept
+        # locally while the test runs.
+        histories = HistoryManager(self.duration + 1000000000)
+        histories.register('tx', stream.ResultHistoryGet())
+        histories.register('rx', trigger.ResultHistoryGet())
+        histories.register('network_info', monitor.ResultHistoryGet(),
+                           convert=self.network_info_sample)
+
         # Now all configuration is made
         print(stream.DescriptionGet())
         print(trigger.DescriptionGet())
@@ -206,21 +239,13 @@ class Example:
 
         from time import sleep
 
-        # POSIX timestamp in nanoseconds when the wireless endpoint will start
-        starttime_posix = self.wireless_endpoint.Start()
-        # Current POSIX timestamp on the meetingpoint
-        current_time_posix = self.meetingpoint.TimestampGet()
-
-        time_to_wait_ns = starttime_posix - current_time_posix
-        # Wait 200 ms longer, to make sure the wireless endpoint has started.
-        time_to_wait_ns += 200000000
-
-        print("Waiting for", time_to_wait_ns / 1000000000.0, "to start the port")
-        sleep(time_to_wait_ns / 1000000000.0)
-
         duration_ns = self.duration + 1000000000
         print("Port will transmit for", duration_ns / 1000000000.0, "seconds")
-        self.port.Start()
+        # Start the port at the same instant as the wireless endpoint
+        self.start_alignment = start_with_device(
+            self.meetingpoint, self.wireless_endpoint, self.port.Start)
+        # Intervals dropped before the first drain are detected as well
+        histories.start(self.start_alignment.target_ns)
 
         print("Waiting for the test to finish")
         for i in range(int(duration_ns / 1000000000)):
@@ -229,6 +254,21 @@ class Example:
 
             # Refresh the trigger results
             trigger.ResultHistoryGet().Refresh()
+            histories.drain()
+
+            if self.interval_callback is not None and i > 0:
+                # Only the trigger results are live, the wireless endpoint
+                # uploads the stream results after the test.
+                trigger_interval = trigger.ResultHistoryGet().IntervalLatestGet()
+                rx_frames = trigger_interval.PacketCountGet()
+                interval_duration = trigger_interval.IntervalDurationGet()
+                self.interval_callback({
+                    'timestamp': trigger_interval.TimestampGet(),
+                    'rx_frames': rx_frames,
+                    # bits per second
+                    'throughput': (self.frame_size * rx_frames * 8 * 1e9
+                                   / interval_duration),
+                })
 
             self.wireless_endpoint.Refresh()
             status = self.wireless_endpoint.StatusGet()
@@ -245,51 +285,37 @@ class Example:
 
         self.wireless_endpoint.Lock(False)
 
-        stream_history = stream.ResultHistoryGet()
-        stream_history.Refresh()
-        trigger_history = trigger.ResultHistoryGet()
-        trigger_history.Refresh()
-        monitor_history = monitor.ResultHistoryGet()
-        monitor_history.Refresh()
+        stream.ResultHistoryGet().Refresh()
+        trigger.ResultHistoryGet().Refresh()
+        monitor.ResultHistoryGet().Refresh()
+        histories.drain()
+        for warning in histories.describe_gaps():
+            print("Warning:", warning)
+
+        # The series are joined on the nearest timestamp.
+        stream_intervals = histories.intervals('tx')
+        trigger_intervals = histories.intervals('rx')
+        network_info = histories.intervals('network_info')
+        traffic = correlation.align(
+            [i['timestamp'] for i in network_info], {
+                'tx_frames': ([i['timestamp'] for i in stream_intervals],
+                              [i['frames'] for i in stream_intervals]),
+                'rx_frames': ([i['timestamp'] for i in trigger_intervals],
+                              [i['frames'] for i in trigger_intervals]),
+            }, tolerance=self.sample_tolerance_ns)
 
         results = []
 
-        for network_info_interval in monitor_history.IntervalGet():
-            timestamp = network_info_interval.TimestampGet()
-            network_interfaces = network_info_interval.InterfaceGet()
-            network_interface = self.find_wifi_interface(network_interfaces)
-
-            result = {
-                'timestamp': timestamp,
-                'rssi': -127,
-                'ssid': '',
-                'bssid': '',
-                'tx_frames': 0,
-                'rx_frames': 0,
+        for index, network_info_sample in enumerate(network_info):
+            result = dict(network_info_sample)
+            result.update({
+                'tx_frames': int(traffic['tx_frames'][index]),
+                'rx_frames': int(traffic['rx_frames'][index]),
                 'loss': 0,
                 'throughput': 0
-            }
-            if network_interface is not None:
-                result['rssi'] = network_interface.WiFiRssiGet()
-                result['ssid'] = network_interface.WiFiSsidGet()
-                result['bssid'] = network_interface.WiFiBssidGet()
-
-            try:
-                stream_interval = stream_history.IntervalGetByTime(timestamp)
-                result['tx_frames'] = stream_interval.PacketCountGet()
-            except ConfigError as e:
-                print("ERROR: Could not get result for stream on timestamp",
-                      timestamp, ":", str(e))
-
-            try:
-                trigger_interval = trigger_history.IntervalGetByTime(timestamp)
-                result['rx_frames'] = trigger_interval.PacketCountGet()
-
-                throughput = self.frame_size * result['rx_frames'] * 8
-                result['throughput'] = throughput
-            except ConfigError as e:
-                print("ERROR: Could not get result for trigger on timestamp",
-                      timestamp, ":", str(e))
+            })
+
+            result['throughput'] = self.frame_size * result['rx_frames'] * 8
 
             if result['tx_frames'] != 0:
                 lost_frames = result['tx_frames'] - result['rx_frames']
@@ -298,8 +324,29 @@ class Example:
 
             results.append(result)
 
+        self.roaming_events = correlation.around_events(
+            correlation.roaming_events([r['timestamp'] for r in results],
+                                       [r['ssid'] for r in results],
+                                       [r['bssid'] for r in results]),
+            [r['throughput'] for r in results],
+            tx_frames=[r['tx_frames'] for r in results],
+            rx_frames=[r['rx_frames'] for r in results])
+        correlation.print_roaming_events(self.roaming_events)
+
         return results
 
+    def connect_server(self, instance):
+        """Connects to the ByteBlower server
+
+        A subclass can return a connection which is shared with other tests,
+        its cleanup() must then leave the server connected.
+        """
+        return instance.ServerAdd(self.server_address)
+
+    def connect_meetingpoint(self, instance):
+        """Connects to the meetingpoint, see connect_server()"""
+        return instance.MeetingPointAdd(self.meetingpoint_address)
+
     def cleanup(self):
         instance = ByteBlower.InstanceGet()
 
@@ -309,6 +356,22 @@ class Example:
         if self.server is not None:
             instance.ServerRemove(self.server)
 
+    def network_info_sample(self, network_info_interval):
+        """Keeps the WiFi information of a network info interval"""
+        sample = {
+            'timestamp': network_info_interval.TimestampGet(),
+            'rssi': -127,
+            'ssid': '',
+            'bssid': '',
+        }
+        network_interface = self.find_wifi_interface(
+            network_info_interval.InterfaceGet())
+        if network_interface is not None:
+            sample['rssi'] = network_interface.WiFiRssiGet()
+            sample['ssid'] = network_interface.WiFiSsidGet()
+            sample['bssid'] = network_interface.WiFiBssidGet()
+        return sample
+
     def find_wifi_interface(self, interface_list):
         """"Looks for the wireless interface
 
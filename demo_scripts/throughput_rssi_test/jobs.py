@@ -0,0 +1,300 @@
+"""
+    Test execution backend for the web interface.
+
+      * Every started run becomes a Job in the JobQueue.
+      * A bounded pool of worker threads executes the jobs.
+        A job only starts when
+          - no other job runs on the same device,
+          - the meeting point runs less than max_per_meetingpoint jobs,
+          - one of the server interfaces runs less than
+            max_per_interface jobs.
+        Jobs which can not start yet, do not block the jobs behind them.
+      * While a job runs, its interval results are available to the
+        browser, see Job.wait_for_update().
+      * Finished jobs go to the ResultStore.  The store keeps an index
+        by job id and by device, so the history can be paged without
+        going over all results.
+"""
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+class Job(object):
+    """
+        A single test run on a Wireless Endpoint.
+    """
+
+    def __init__(self, job_id, uuid, meetingpoint):
+        self.id = job_id
+        self.uuid = uuid
+        self.meetingpoint = meetingpoint
+        self.server_interface = None
+        self.state = QUEUED
+        self.error = None
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self.intervals = []
+        self.results = None
+
+        self._update = threading.Condition()
+
+    def add_interval(self, interval):
+        """
+            Called by the test while it runs, wakes up the listeners.
+        """
+        with self._update:
+            self.intervals.append(interval)
+            self._update.notify_all()
+
+    def set_state(self, state, error=None):
+        with self._update:
+            self.state = state
+            self.error = error
+            if state == RUNNING:
+                self.started_at = time.time()
+            elif state in (FINISHED, FAILED):
+                self.finished_at = time.time()
+            self._update.notify_all()
+
+    @property
+    def done(self):
+        return self.state in (FINISHED, FAILED)
+
+    def wait_for_update(self, seen_intervals, state, timeout):
+        """
+            Blocks until there are more than seen_intervals interval
+            results, the state differs from state, or the timeout expires.
+
+            Returns (new intervals, current state).
+        """
+        with self._update:
+            if len(self.intervals) == seen_intervals and self.state == state:
+                self._update.wait(timeout)
+            return self.intervals[seen_intervals:], self.state
+
+    def to_dict(self, with_results=False):
+        result = {
+            'id': self.id,
+            'uuid': self.uuid,
+            'meetingpoint': self.meetingpoint,
+            'server_interface': self.server_interface,
+            'state': self.state,
+            'error': self.error,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if with_results:
+            result['intervals'] = self.intervals
+            result['results'] = self.results
+        return result
+
+
+class ResultStore(object):
+    """
+        Keeps the finished jobs, newest first.
+
+        The jobs are appended to a JSON lines file, so the history survives
+        a restart of the webserver.  Pass filename=None to keep them
+        in memory only.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._lock = threading.Lock()
+        # Sorted on finished_at, oldest first
+        self._order = []
+        self._keys = []
+        self._by_id = {}
+        self._by_device = {}
+
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, entry):
+        key = (entry['finished_at'], entry['id'])
+        position = bisect.bisect(self._keys, key)
+        self._keys.insert(position, key)
+        self._order.insert(position, entry)
+        self._by_id[entry['id']] = entry
+
+        device_keys, device_entries = self._by_device.setdefault(
+            entry['uuid'], ([], []))
+        position = bisect.bisect(device_keys, key)
+        device_keys.insert(position, key)
+        device_entries.insert(position, entry)
+
+    def add(self, job):
+        entry = job.to_dict(with_results=True)
+        with self._lock:
+            self._index(entry)
+            if self.filename is not None:
+                with open(self.filename, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+
+    def get(self, job_id):
+        with self._lock:
+            return self._by_id.get(job_id)
+
+    def page(self, offset=0, limit=20, uuid=None):
+        """
+            Returns (total, entries) with the summaries of the finished
+            jobs, newest first.  The interval and sample results are left
+            out, use get() to retrieve them.
+        """
+        with self._lock:
+            if uuid is None:
+                entries = self._order
+            else:
+                entries = self._by_device.get(uuid, ([], []))[1]
+            total = len(entries)
+            end = max(0, total - offset)
+            start = max(0, end - limit)
+            selection = entries[start:end]
+
+        summaries = []
+        for entry in reversed(selection):
+            summary = dict(entry)
+            summary.pop('intervals', None)
+            summary.pop('results', None)
+            summaries.append(summary)
+        return total, summaries
+
+
+class JobQueue(object):
+    """
+        Runs the jobs on a bounded pool of worker threads.
+
+        :param run_job: function(job) which executes the test.
+                        It reports intervals with job.add_interval()
+                        and returns the results of the test.
+        :param server_interfaces: ByteBlower interfaces to run the tests on
+        :param store: ResultStore for the finished jobs
+        :param workers: Maximum number of jobs running at the same time
+        :param max_per_meetingpoint: Maximum number of running jobs per
+                                     meeting point
+        :param max_per_interface: Maximum number of running jobs per server
+                                  interface
+    """
+
+    def __init__(self, run_job, server_interfaces, store, workers=4,
+                 max_per_meetingpoint=4, max_per_interface=1):
+        self.run_job = run_job
+        self.server_interfaces = list(server_interfaces)
+        self.store = store
+        self.max_per_meetingpoint = max_per_meetingpoint
+        self.max_per_interface = max_per_interface
+
+        self._ids = itertools.count(1)
+        self._changed = threading.Condition()
+        self._queue = []
+        self._active = {}
+        self._busy_devices = set()
+        self._per_meetingpoint = {}
+        self._per_interface = dict((i, 0) for i in self.server_interfaces)
+
+        self._workers = []
+        for number in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name='job-worker-%d' % number)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, uuid, meetingpoint):
+        """
+            Queues a run for the device.  A device which already has a
+            queued or running job, gets that job back.
+        """
+        with self._changed:
+            for job in itertools.chain(self._queue, self._active.values()):
+                if job.uuid == uuid:
+                    return job
+
+            job = Job(next(self._ids), uuid, meetingpoint)
+            self._queue.append(job)
+            self._active[job.id] = job
+            self._changed.notify_all()
+            return job
+
+    def get(self, job_id):
+        with self._changed:
+            return self._active.get(job_id)
+
+    def active(self):
+        with self._changed:
+            return sorted(self._active.values(), key=lambda job: job.id)
+
+    def _free_interface(self):
+        for interface in self.server_interfaces:
+            if self._per_interface[interface] < self.max_per_interface:
+                return interface
+        return None
+
+    def _next_runnable(self):
+        """
+            First queued job whose device, meeting point and an interface
+            are free.  Must be called with the lock held.
+        """
+        interface = self._free_interface()
+        if interface is None:
+            return None
+
+        for job in self._queue:
+            if job.uuid in self._busy_devices:
+                continue
+            running = self._per_meetingpoint.get(job.meetingpoint, 0)
+            if running >= self.max_per_meetingpoint:
+                continue
+
+            self._queue.remove(job)
+            job.server_interface = interface
+            self._busy_devices.add(job.uuid)
+            self._per_meetingpoint[job.meetingpoint] = running + 1
+            self._per_interface[interface] += 1
+            return job
+        return None
+
+    def _release(self, job):
+        with self._changed:
+            self._busy_devices.discard(job.uuid)
+            self._per_meetingpoint[job.meetingpoint] -= 1
+            self._per_interface[job.server_interface] -= 1
+            del self._active[job.id]
+            self._changed.notify_all()
+
+    def _work(self):
+        while True:
+            with self._changed:
+                job = self._next_runnable()
+                while job is None:
+                    self._changed.wait()
+                    job = self._next_runnable()
+
+            job.set_state(RUNNING)
+            try:
+                job.results = self.run_job(job)
+                job.set_state(FINISHED)
+            except Exception as e:
+                traceback.print_exc()
+                job.set_state(FAILED, error=str(e))
+
+            # Store before releasing, so the job is always visible
+            # either as active or in the results.
+            self.store.add(job)
+            self._release(job)
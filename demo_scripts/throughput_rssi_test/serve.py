@@ -6,15 +6,64 @@
       * Clicking on a device starts the test.
          The results are displayed after the test in 
          the lefthand pane.
+
+    The device list is refreshed by a single background thread.  All
+    browsers share this snapshot:
+      * /devices returns the snapshot, with an ETag.  A request with a
+        matching If-None-Match header gets a '304 Not Modified'.
+      * /devices/events is a Server-Sent Events stream.  It sends the full
+        list once, afterwards only the devices which changed.
+    The load on the Meeting Point is thus the same, no matter how many
+    dashboards are open.
+
+    Clicking a device queues a test run, see jobs.py.  The running test
+    streams its interval results to the page (/jobs/<id>/events), the
+    finished runs can be paged through with /results.
 """
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
 from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import DeviceStatus
 from flask import Flask, render_template
+from flask import Response
 from flask import jsonify
 from flask import request
 
+from jobs import FAILED, FINISHED, JobQueue, ResultStore
+
+# The test itself is the UDP demo script, one folder up.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import throughput_rssi_ssid_bssid_udp
+
 config = {
-    'meetingpoint': 'byteblower-tutorial-1300.lab.byteblower.excentis.com'
+    'meetingpoint': 'byteblower-tutorial-1300.lab.byteblower.excentis.com',
+
+    # Time between two refreshes of the device list, in seconds.
+    'refresh_interval': 0.25,
+
+    # An idle Server-Sent Events stream sends a comment this often (in
+    # seconds), this keeps proxies from closing the connection.
+    'keepalive_interval': 15,
+
+    # The ByteBlower server and interfaces to run the tests on.
+    'server_address': 'byteblower-tutorial-1300.lab.byteblower.excentis.com',
+    'server_interfaces': ['nontrunk-1'],
+
+    # Concurrency limits of the test runs
+    'workers': 4,
+    'max_per_meetingpoint': 4,
+    'max_per_interface': 1,
+
+    # Duration of a test run, in seconds
+    'test_duration': 30,
+
+    # The finished runs are kept in this file.
+    'results_file': 'results.jsonl',
 }
 
 
@@ -29,6 +78,8 @@ def device_status_to_str(state):
 
 api = ByteBlower.InstanceGet()
 meetingPoint = api.MeetingPointAdd(config['meetingpoint'])
+# All test runs share this server connection, a run only destroys its port.
+server = api.ServerAdd(config['server_address'])
 
 
 def list_devices():
@@ -47,13 +98,195 @@ def list_devices():
     return devices_list
 
 
+class DeviceSnapshot(object):
+    """
+        The device list, shared by all requests.
+
+        A background thread calls list_devices() every refresh_interval.
+        Every change of the list increments the version and wakes up
+        the threads waiting in wait_for_change().
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self.devices = []
+        self.body = '[]'
+        self.etag = self._etag(self.body)
+        self._changed = threading.Condition()
+        self._thread = None
+
+    @staticmethod
+    def _etag(body):
+        return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._refresh_loop,
+                                        name='device-snapshot')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.update(list_devices())
+            except Exception as e:
+                # Keep serving the last snapshot, the next
+                # refresh may succeed.
+                print('Refreshing the device list failed: %s' % e)
+            time.sleep(self.refresh_interval)
+
+    def update(self, devices):
+        body = json.dumps(devices)
+        if body == self.body:
+            return
+        with self._changed:
+            self.devices = devices
+            self.body = body
+            self.etag = self._etag(body)
+            self.version += 1
+            self._changed.notify_all()
+
+    def get(self):
+        """
+            Returns (version, devices, body, etag) of the latest snapshot.
+        """
+        with self._changed:
+            return self.version, self.devices, self.body, self.etag
+
+    def wait_for_change(self, version, timeout):
+        """
+            Blocks until the snapshot is newer than version,
+            or until the timeout expires.
+        """
+        with self._changed:
+            if self.version == version:
+                self._changed.wait(timeout)
+            return self.version, self.devices
+
+
+def device_changes(old, new):
+    """
+        Compares two device lists.
+        Returns the devices which are new or changed and the uuids of
+        the devices which disappeared.
+    """
+    old_by_uuid = dict((dev['uuid'], dev) for dev in old)
+    new_uuids = set()
+    changed = []
+    for dev in new:
+        new_uuids.add(dev['uuid'])
+        if old_by_uuid.get(dev['uuid']) != dev:
+            changed.append(dev)
+    removed = [uuid for uuid in old_by_uuid if uuid not in new_uuids]
+    return changed, removed
+
+
+def sse_event(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+
+
+snapshot = DeviceSnapshot(config['refresh_interval'])
+snapshot.start()
+
+
+class WebExample(throughput_rssi_ssid_bssid_udp.Example):
+    """
+        The UDP test on the shared server and meeting point connections.
+        Concurrent runs would otherwise remove each other's connection.
+    """
+
+    def connect_server(self, instance):
+        return server
+
+    def connect_meetingpoint(self, instance):
+        # The meeting point is shared with the device snapshot
+        return meetingPoint
+
+    def cleanup(self):
+        # The server and meeting point stay connected for the other runs
+        if self.port is not None:
+            self.server.PortDestroy(self.port)
+            self.port = None
+
+
+def run_job(job):
+    """
+        Runs the UDP throughput test on the device of the job.
+    """
+    job_config = dict(throughput_rssi_ssid_bssid_udp.configuration)
+    job_config.update({
+        'wireless_endpoint_uuid': job.uuid,
+        'meetingpoint_address': job.meetingpoint,
+        'server_address': config['server_address'],
+        'server_interface': job.server_interface,
+        # Concurrent runs need a different MAC address
+        'port_mac_address': '00:bb:02:00:%02x:%02x' % (
+            (job.id >> 8) & 0xff, job.id & 0xff),
+        'duration': config['test_duration'] * 1000 * 1000 * 1000,
+        'interval_callback': job.add_interval,
+    })
+
+    example = WebExample(**job_config)
+    try:
+        return example.run()
+    finally:
+        example.cleanup()
+
+
+jobs = JobQueue(run_job, config['server_interfaces'],
+                ResultStore(config['results_file']),
+                workers=config['workers'],
+                max_per_meetingpoint=config['max_per_meetingpoint'],
+                max_per_interface=config['max_per_interface'])
+
+
 app = Flask('Wireless Endpoint: Wi-Fi statiscs', static_folder='static')
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 
 
 @app.route("/devices")
 def get_devices():
-    return jsonify(list_devices())
+    """
+        The shared device snapshot, supports conditional requests.
+    """
+    _, _, body, etag = snapshot.get()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+@app.route("/devices/events")
+def device_events():
+    """
+        Server-Sent Events stream of the device list.
+
+        The first event ('snapshot') contains all devices, the following
+        'changed' and 'removed' events only contain the differences.
+    """
+    def stream():
+        version, devices, _, _ = snapshot.get()
+        yield sse_event('snapshot', devices)
+        while True:
+            new_version, new_devices = snapshot.wait_for_change(
+                version, config['keepalive_interval'])
+            if new_version == version:
+                yield ': keepalive\n\n'
+                continue
+
+            changed, removed = device_changes(devices, new_devices)
+            if changed:
+                yield sse_event('changed', changed)
+            if removed:
+                yield sse_event('removed', removed)
+            version, devices = new_version, new_devices
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route("/poller")
@@ -69,12 +302,84 @@ def poller():
 @app.route("/start_run", methods=['POST'])
 def start_run():
     """
-        Starts at test run..
-        TODO all of it.
+        Queues a test run on the device.
+        Returns the job, its id is used to follow the run.
     """
     uuid = request.form.get('uuid', default='none', type=str)
-    print('Starting a run: %s' % uuid)
-    return "ok"
+    job = jobs.submit(uuid, config['meetingpoint'])
+    print('Queued run %d on %s' % (job.id, uuid))
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs")
+def list_jobs():
+    """
+        The queued and running jobs.
+    """
+    return jsonify([job.to_dict() for job in jobs.active()])
+
+
+@app.route("/jobs/<int:job_id>/events")
+def job_events(job_id):
+    """
+        Server-Sent Events stream of a job.
+
+        Sends a 'state' event on every state change and an 'interval'
+        event for every new interval result.  The stream ends with the
+        'state' event of the finished or failed job.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        stored = jobs.store.get(job_id)
+        if stored is None:
+            return Response(status=404)
+        return Response(sse_event('state', stored['state']),
+                        mimetype='text/event-stream')
+
+    def stream():
+        seen, state = 0, job.state
+        yield sse_event('state', state)
+        while True:
+            intervals, new_state = job.wait_for_update(
+                seen, state, config['keepalive_interval'])
+            if not intervals and new_state == state:
+                yield ': keepalive\n\n'
+                continue
+
+            for interval in intervals:
+                yield sse_event('interval', interval)
+            seen += len(intervals)
+
+            if new_state != state:
+                state = new_state
+                yield sse_event('state', state)
+                if state in (FINISHED, FAILED):
+                    return
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route("/results")
+def list_results():
+    """
+        One page of finished runs, newest first.
+        Query parameters: offset, limit and optionally uuid.
+    """
+    total, entries = jobs.store.page(
+        offset=request.args.get('offset', default=0, type=int),
+        limit=request.args.get('limit', default=20, type=int),
+        uuid=request.args.get('uuid', default=None, type=str))
+    return jsonify({'total': total, 'results': entries})
+
+
+@app.route("/results/<int:job_id>")
+def get_result(job_id):
+    entry = jobs.store.get(job_id)
+    if entry is None:
+        return Response(status=404)
+    return jsonify(entry)
 
 
 @app.route("/")
@@ -96,4 +401,5 @@ def add_header(r):
 
 
 if __name__ == "__main__":
-    app.run()
+    # Every open event stream keeps a thread busy.
+    app.run(threaded=True)
@@ -3,20 +3,65 @@ function sleep(ms) {
 }
 
 
+// Posts the device list, in the order the server sent it.
+function post_devices(devices) {
+    postMessage(JSON.stringify(Array.from(devices.values())))
+}
+
+
+// Follows the Server-Sent Events stream of the device list.
+// The server sends the full list once, afterwards only the changes.
+function follow_events() {
+    let devices = new Map();
+    let source = new EventSource("devices/events");
+
+    source.addEventListener("snapshot", function(e) {
+        devices = new Map();
+        for (let dev of JSON.parse(e.data)) {
+            devices.set(dev['uuid'], dev);
+        }
+        post_devices(devices);
+    });
+    source.addEventListener("changed", function(e) {
+        for (let dev of JSON.parse(e.data)) {
+            devices.set(dev['uuid'], dev);
+        }
+        post_devices(devices);
+    });
+    source.addEventListener("removed", function(e) {
+        for (let uuid of JSON.parse(e.data)) {
+            devices.delete(uuid);
+        }
+        post_devices(devices);
+    });
+}
+
+
 // Continously requests the last updates.
+// Only used when the browser has no EventSource support in workers.
+// The ETag makes the server skip the body when nothing changed.
 async function fetch_data() {
+    let etag = null;
     while(true) {
         var xhttp = new XMLHttpRequest();
         xhttp.onreadystatechange = function() {
               if (this.readyState == 4 && this.status == 200) {
+                etag = xhttp.getResponseHeader("ETag");
                 postMessage(xhttp.responseText)
               }
         }
         xhttp.open("GET", "devices", true);
+        if (etag !== null) {
+            xhttp.setRequestHeader("If-None-Match", etag);
+        }
         xhttp.send();
 
         await sleep(250)
     }
 }
 
-fetch_data();
+if (typeof EventSource !== "undefined") {
+    follow_events();
+} else {
+    fetch_data();
+}
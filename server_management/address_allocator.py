@@ -0,0 +1,683 @@
+"""
+Collision-free allocation of MAC addresses, IP addresses, UDP ports and
+VLAN IDs for ByteBlower ports.
+All examples are guaranteed to work with Python 2.7 and above
+
+Random MAC addresses collide once thousands of ports are created, and
+hard-coded addresses collide between tests running at the same time.  Both
+cause silent DHCP and ARP failures.  The allocator hands out every value
+only once:
+  - every pool is a bitmap: allocating and freeing a value costs O(1),
+  - every value is reserved for an owner (by default this process), all
+    values of an owner are released at once at the end of the test,
+  - with a state file the reservations are shared between processes: tests
+    running at the same time on this machine never get the same value.
+
+Usage:
+    allocator = Allocator(DEFAULT_STATE_FILE)
+    mac = allocator.pools['mac'].allocate()
+    with allocator.transaction():
+        # A single read and write of the state file for many values
+        ips = allocator.pools['ipv4'].allocate_many(1000)
+    ...
+    allocator.release()
+
+The state file is a journal of JSON lines, protected by a file lock: a
+snapshot of all reservations, followed by a line with the changes of every
+transaction.  A transaction only reads the lines which other processes
+appended since its previous transaction and appends its own changes, a
+single allocate() does not read or write the whole state.  When the
+journal grows larger than the snapshot, it is compacted into a new
+snapshot.  Reservations of processes which died on this machine are
+released automatically.
+"""
+from __future__ import print_function
+
+import contextlib
+import errno
+import getpass
+import json
+import os
+import socket
+import struct
+import tempfile
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# The state file shared by all tests of this user on this machine
+DEFAULT_STATE_FILE = os.path.join(tempfile.gettempdir(),
+                                  'byteblower_allocations.json')
+
+
+# Owner of the values which are never allocated
+EXCLUDED = 'excluded'
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class Bitmap(object):
+    """A set of the integers 0 .. size-1, with O(1) allocate and free
+
+    The bits are kept in words of 64 bits.  Words beyond the high water mark
+    were never used, words below it which have a free bit are kept on a
+    stack.
+
+    :param size: Number of values
+    """
+
+    WORD = 64
+    FULL = (1 << 64) - 1
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self._words = {}
+        self._high_water = 0
+        # Words below the high water mark with free bits, _has_room avoids
+        # duplicates on the stack
+        self._not_full = []
+        self._has_room = set()
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, index):
+        word = self._words.get(index // self.WORD, 0)
+        return bool(word >> (index % self.WORD) & 1)
+
+    def __iter__(self):
+        for number in sorted(self._words):
+            word = self._words[number]
+            while word:
+                lowest = word & -word
+                yield number * self.WORD + lowest.bit_length() - 1
+                word ^= lowest
+
+    def _room(self, number):
+        if number < self._high_water and number not in self._has_room:
+            self._has_room.add(number)
+            self._not_full.append(number)
+
+    def allocate(self):
+        """Marks the lowest free value of a word with room, returns it"""
+        while self._not_full:
+            number = self._not_full[-1]
+            word = self._words.get(number, 0)
+            free = ~word & (word + 1)
+            index = number * self.WORD + free.bit_length() - 1
+            if word != self.FULL and index < self.size:
+                break
+            self._not_full.pop()
+            self._has_room.discard(number)
+        else:
+            number = self._high_water
+            word = 0
+            free = 1
+            index = number * self.WORD
+            if index >= self.size:
+                raise PoolExhausted("All %d values are allocated" % self.size)
+            self._high_water += 1
+            self._room(number)
+
+        self._words[number] = word | free
+        self.count += 1
+        return index
+
+    def add(self, index):
+        """Marks a given value, returns False when it was taken already"""
+        if not 0 <= index < self.size:
+            raise ValueError("%d is outside of the pool" % index)
+        number, bit = divmod(index, self.WORD)
+        word = self._words.get(number, 0)
+        if word >> bit & 1:
+            return False
+        while self._high_water <= number:
+            self._high_water += 1
+            self._room(self._high_water - 1)
+        self._words[number] = word | (1 << bit)
+        self.count += 1
+        return True
+
+    def remove(self, index):
+        number, bit = divmod(index, self.WORD)
+        word = self._words.get(number, 0)
+        if not word >> bit & 1:
+            raise KeyError(index)
+        word &= ~(1 << bit)
+        if word:
+            self._words[number] = word
+        else:
+            del self._words[number]
+        self.count -= 1
+        self._room(number)
+
+    def clear(self):
+        self.__init__(self.size)
+
+
+class Pool(object):
+    """Values, each reserved by at most one owner
+
+    Subclasses convert between the values and their index in the bitmap.
+
+    :param name: Name of the pool in the state file
+    :param size: Number of values in the pool
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.allocator = None
+        self._bitmap = Bitmap(size)
+        self._owners = {}
+        self._by_owner = {}
+        # Values which are never allocated, e.g. the gateway
+        self._excluded = set()
+
+    def to_value(self, index):
+        return index
+
+    def to_index(self, value):
+        return value
+
+    def __len__(self):
+        return len(self._bitmap)
+
+    def __contains__(self, value):
+        return self.to_index(value) in self._bitmap
+
+    def _mark(self, index, owner):
+        self._owners[index] = owner
+        self._by_owner.setdefault(owner, set()).add(index)
+
+    def _unmark(self, index):
+        owner = self._owners.pop(index)
+        values = self._by_owner[owner]
+        values.discard(index)
+        if not values:
+            del self._by_owner[owner]
+
+    def _changed(self, index, owner, added):
+        if self.allocator is not None:
+            self.allocator._record(self.name, index, owner, added)
+
+    def _transaction(self):
+        if self.allocator is None:
+            return _no_transaction()
+        return self.allocator.transaction()
+
+    def _owner(self, owner):
+        if owner is not None:
+            return owner
+        if self.allocator is not None:
+            return self.allocator.owner
+        return default_owner()
+
+    def allocate(self, owner=None):
+        """Reserves a free value
+
+        :param owner: Owner of the value, by default the owner of the
+                      allocator
+        :raises PoolExhausted: when no value is free
+        """
+        return self.allocate_many(1, owner)[0]
+
+    def allocate_many(self, count, owner=None):
+        """Reserves `count` free values, all or none"""
+        owner = self._owner(owner)
+        with self._transaction():
+            if len(self._bitmap) + count > self.size:
+                raise PoolExhausted("%s: %d of %d values are free, %d requested"
+                                    % (self.name, self.size - len(self._bitmap),
+                                       self.size, count))
+            values = []
+            for _ in range(count):
+                index = self._bitmap.allocate()
+                self._mark(index, owner)
+                self._changed(index, owner, True)
+                values.append(self.to_value(index))
+            return values
+
+    def reserve(self, value, owner=None):
+        """Reserves a given value, e.g. a hard-coded address
+
+        :return: False when the value is reserved by another owner
+        """
+        owner = self._owner(owner)
+        index = self.to_index(value)
+        with self._transaction():
+            if self._bitmap.add(index):
+                self._mark(index, owner)
+                self._changed(index, owner, True)
+                return True
+            return self._owners[index] == owner
+
+    def free(self, value):
+        index = self.to_index(value)
+        with self._transaction():
+            if index in self._owners:
+                self._changed(index, self._owners[index], False)
+                self._bitmap.remove(index)
+                self._unmark(index)
+
+    def release(self, owner=None):
+        """Frees all values of an owner"""
+        owner = self._owner(owner)
+        if owner == EXCLUDED:
+            return
+        with self._transaction():
+            for index in list(self._by_owner.get(owner, ())):
+                self._changed(index, owner, False)
+                self._bitmap.remove(index)
+                self._unmark(index)
+
+    def owner_of(self, value):
+        return self._owners.get(self.to_index(value))
+
+    def owners(self):
+        return set(self._by_owner)
+
+    # -- state
+
+    def exclude(self, value):
+        """Never allocates this value"""
+        index = self.to_index(value)
+        self._excluded.add(index)
+        if self._bitmap.add(index):
+            self._mark(index, EXCLUDED)
+
+    def dump(self):
+        """The reservations as {owner: [[first, last], ...]} index ranges"""
+        return dict((owner, to_ranges(indices))
+                    for owner, indices in self._by_owner.items()
+                    if owner != EXCLUDED)
+
+    def load(self, state):
+        self._bitmap.clear()
+        self._owners = {}
+        self._by_owner = {}
+        for index in self._excluded:
+            self._bitmap.add(index)
+            self._mark(index, EXCLUDED)
+        for owner, ranges in state.items():
+            for first, last in ranges:
+                for index in range(first, last + 1):
+                    if index < self.size and self._bitmap.add(index):
+                        self._mark(index, owner)
+
+    def apply(self, owner, ranges, added):
+        """Applies the changes of a transaction of another process"""
+        for first, last in ranges:
+            for index in range(first, min(last + 1, self.size)):
+                if added:
+                    if self._bitmap.add(index):
+                        self._mark(index, owner)
+                elif self._owners.get(index) == owner:
+                    self._bitmap.remove(index)
+                    self._unmark(index)
+
+
+def to_ranges(indices):
+    """[1, 2, 3, 7] -> [[1, 3], [7, 7]]"""
+    ranges = []
+    for index in sorted(indices):
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+
+class NumberPool(Pool):
+    """Integers first .. last, e.g. UDP ports or VLAN IDs"""
+
+    def __init__(self, name, first, last):
+        Pool.__init__(self, name, last - first + 1)
+        self.first = first
+
+    def to_value(self, index):
+        return self.first + index
+
+    def to_index(self, value):
+        index = int(value) - self.first
+        if not 0 <= index < self.size:
+            raise ValueError("%s is outside of pool %s" % (value, self.name))
+        return index
+
+
+class MacPool(Pool):
+    """MAC addresses starting at `first`
+
+    :param first: The first MAC address, e.g. '00:bb:00:00:00:00'
+    :param size: Number of addresses
+    """
+
+    def __init__(self, name, first, size):
+        Pool.__init__(self, name, size)
+        self.first = self.mac_to_int(first)
+
+    @staticmethod
+    def mac_to_int(mac):
+        return int(mac.replace(':', '').replace('-', ''), 16)
+
+    def to_value(self, index):
+        number = '%012x' % (self.first + index)
+        return ':'.join(number[i:i + 2] for i in range(0, 12, 2))
+
+    def to_index(self, value):
+        index = self.mac_to_int(value) - self.first
+        if not 0 <= index < self.size:
+            raise ValueError("%s is outside of pool %s" % (value, self.name))
+        return index
+
+
+class IPv4Pool(Pool):
+    """The host addresses of an IPv4 network
+
+    The network and broadcast address are never allocated, neither are the
+    addresses in `exclude` (e.g. the gateway).
+
+    :param network: e.g. '10.1.0.0/16'
+    """
+
+    def __init__(self, name, network, exclude=()):
+        address, prefix_length = network.split('/')
+        prefix_length = int(prefix_length)
+        size = 1 << (32 - prefix_length)
+        self.network = self.ip_to_int(address) & ~(size - 1) & 0xffffffff
+        if size > 2:
+            # Without the network and the broadcast address
+            self.network += 1
+            size -= 2
+        Pool.__init__(self, name, size)
+        for excluded in exclude:
+            self.exclude(excluded)
+
+    @staticmethod
+    def ip_to_int(ip):
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+
+    def to_value(self, index):
+        return socket.inet_ntoa(struct.pack('!I', self.network + index))
+
+    def to_index(self, value):
+        index = self.ip_to_int(value) - self.network
+        if not 0 <= index < self.size:
+            raise ValueError("%s is outside of pool %s" % (value, self.name))
+        return index
+
+
+class IPv6Pool(Pool):
+    """Static IPv6 addresses: `size` addresses starting at `first`
+
+    :param first: e.g. '2001:db8::1000'
+    """
+
+    def __init__(self, name, first, size):
+        Pool.__init__(self, name, size)
+        self.first = self.ip_to_int(first)
+
+    @staticmethod
+    def ip_to_int(ip):
+        high, low = struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, ip))
+        return high << 64 | low
+
+    def to_value(self, index):
+        number = self.first + index
+        return socket.inet_ntop(socket.AF_INET6, struct.pack(
+            '!QQ', number >> 64, number & 0xffffffffffffffff))
+
+    def to_index(self, value):
+        index = self.ip_to_int(value.split('/')[0]) - self.first
+        if not 0 <= index < self.size:
+            raise ValueError("%s is outside of pool %s" % (value, self.name))
+        return index
+
+
+def default_pools():
+    """The pools of an allocator without explicit pools"""
+    return [
+        # Locally administered unicast addresses
+        MacPool('mac', '02:bb:00:00:00:00', 1 << 24),
+        IPv4Pool('ipv4', '10.64.0.0/10'),
+        IPv6Pool('ipv6', '2001:db8::1:0', 1 << 24),
+        NumberPool('udp_port', 1024, 65535),
+        NumberPool('vlan', 2, 4094),
+    ]
+
+
+def default_owner():
+    """This process: user@host:pid"""
+    return '%s@%s:%d' % (getpass.getuser(), socket.gethostname(), os.getpid())
+
+
+def _process_is_alive(owner):
+    """False when the owner is a process on this machine which stopped"""
+    try:
+        host, pid = owner.rsplit('@', 1)[1].rsplit(':', 1)
+        pid = int(pid)
+    except (IndexError, ValueError):
+        return True
+    if host != socket.gethostname():
+        return True
+    if fcntl is None:
+        # No cheap check on Windows, keep the reservation
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        # EPERM: the process exists, but belongs to another user
+        return error.errno == errno.EPERM
+    return True
+
+
+@contextlib.contextmanager
+def _no_transaction():
+    yield
+
+
+class Allocator(object):
+    """A set of pools, optionally shared through a state file
+
+    :param state_file: The JSON file which holds the reservations of all
+                       processes, None keeps them in this process only.
+    :param pools: The pools, by default see default_pools()
+    :param owner: The owner of the values allocated through this
+                  allocator, by default this process.
+    """
+
+    def __init__(self, state_file=None, pools=None, owner=None):
+        self.state_file = state_file
+        self.owner = owner or default_owner()
+        self.pools = {}
+        for pool in pools or default_pools():
+            pool.allocator = self
+            self.pools[pool.name] = pool
+        self._depth = 0
+        self._lock_file = None
+        # The state file as it was read: its generation (a new one after
+        # every compaction), the number of bytes read and the size of the
+        # snapshot
+        self._generation = None
+        self._offset = 0
+        self._snapshot_size = 0
+        # The changes of the running transaction:
+        # [[pool, owner, added, [index, ...]], ...]
+        self._changes = []
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Locks and loads the shared state, saves it afterwards
+
+        Transactions can be nested, only the outermost one reads and writes
+        the state file.
+        """
+        if self.state_file is None or self._depth:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+            return
+
+        self._depth += 1
+        self._lock()
+        try:
+            self._changes = []
+            self._load()
+            yield self
+            self._save()
+        finally:
+            self._changes = []
+            self._unlock()
+            self._depth -= 1
+
+    def _record(self, pool, index, owner, added):
+        """Keeps a change of the running transaction for the journal"""
+        if self.state_file is None:
+            return
+        if self._changes and self._changes[-1][:3] == [pool, owner, added]:
+            self._changes[-1][3].append(index)
+        else:
+            self._changes.append([pool, owner, added, [index]])
+
+    def release(self, owner=None):
+        """Frees all values of an owner, in all pools"""
+        with self.transaction():
+            for pool in self.pools.values():
+                pool.release(owner)
+
+    def release_dead_owners(self):
+        """Frees the values of processes on this machine which stopped"""
+        with self.transaction():
+            for pool in self.pools.values():
+                for owner in pool.owners():
+                    if not _process_is_alive(owner):
+                        pool.release(owner)
+
+    # -- state file
+
+    def _lock(self):
+        self._lock_file = open(self.state_file + '.lock', 'a+')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except IOError:
+                    time.sleep(0.1)
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def _load(self):
+        """Reads the changes other processes made since the previous
+        transaction, or the whole state file when it was compacted"""
+        try:
+            f = open(self.state_file, 'rb')
+        except IOError:
+            self._reset(None)
+            return
+
+        with f:
+            header = _parse_line(f.readline())
+            size = os.fstat(f.fileno()).st_size
+            generation = header.get('generation')
+            if (generation is None or generation != self._generation
+                    or size < self._offset):
+                # Another process compacted the journal, read it all
+                self._reset(generation)
+                if generation is None:
+                    # A state file without a journal: only the snapshot
+                    self._apply(header)
+                    self._offset = size
+                else:
+                    self._offset = f.tell()
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Not completely written, the writer died
+                    break
+                entry = _parse_line(line)
+                if 'snapshot' in entry:
+                    self._snapshot_size = len(line)
+                self._apply(entry)
+                self._offset += len(line)
+
+        for pool in self.pools.values():
+            for owner in pool.owners():
+                if owner != self.owner and not _process_is_alive(owner):
+                    pool.release(owner)
+
+    def _reset(self, generation):
+        for pool in self.pools.values():
+            pool.load({})
+        self._generation = generation
+        self._offset = 0
+        self._snapshot_size = 0
+
+    def _apply(self, entry):
+        if 'snapshot' in entry:
+            entry = entry['snapshot']
+        if 'changes' in entry:
+            for name, owner, added, ranges in entry['changes']:
+                if name in self.pools:
+                    self.pools[name].apply(owner, ranges, added)
+            return
+        for name, pool in self.pools.items():
+            pool.load(entry.get(name, {}))
+
+    def _save(self):
+        journal = self._offset - self._snapshot_size
+        if self._generation is None \
+                or journal > max(65536, 2 * self._snapshot_size):
+            self._compact()
+        elif self._changes:
+            changes = [[pool, owner, added, to_ranges(indices)]
+                       for pool, owner, added, indices in self._changes]
+            line = (json.dumps({'changes': changes}) + '\n').encode('utf-8')
+            with open(self.state_file, 'ab') as f:
+                f.write(line)
+            self._offset += len(line)
+
+    def _compact(self):
+        """Replaces the journal by a snapshot of the state"""
+        self._generation = uuid.uuid4().hex
+        header = (json.dumps({'generation': self._generation})
+                  + '\n').encode('utf-8')
+        snapshot = (json.dumps({'snapshot': dict(
+            (name, pool.dump()) for name, pool in self.pools.items())})
+                    + '\n').encode('utf-8')
+        temporary = self.state_file + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(header)
+            f.write(snapshot)
+        if os.path.exists(self.state_file) and os.name == 'nt':
+            os.remove(self.state_file)
+        os.rename(temporary, self.state_file)
+        self._offset = len(header) + len(snapshot)
+        self._snapshot_size = len(snapshot)
+
+
+def _parse_line(line):
+    try:
+        entry = json.loads(line.decode('utf-8'))
+    except ValueError:
+        return {}
+    return entry if isinstance(entry, dict) else {}
@@ -0,0 +1,602 @@
+"""
+    Runs a campaign of test scenarios on shared ByteBlower servers.
+
+    Every scenario is an existing example (a script with a `configuration`
+    dict and an `Example` class), optionally with configuration overrides.
+    The scheduler
+      * derives the ByteBlower interfaces and wireless endpoints each
+        scenario needs from its configuration (or takes them from the
+        scenario),
+      * plans a parallel schedule: scenarios which do not share an
+        interface or wireless endpoint run at the same time.  The longest
+        scenarios are placed first.
+      * checks UsersGet() before starting a scenario.  When another user
+        (e.g. a colleague) holds one of the interfaces, or a wireless
+        endpoint is not available, the scenario waits and other scenarios
+        go first.
+      * runs the scenarios concurrently and reports the makespan of the
+        campaign against running all scenarios one after the other.
+        The scenarios on the same server share one server handle: a
+        scenario which finishes destroys its own ports, it does not remove
+        the server under the scenarios which are still running.
+
+    As example:
+     > python campaign_scheduler.py
+"""
+from __future__ import print_function
+
+import copy
+import getpass
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import types
+
+import byteblowerll.byteblower
+from byteblowerll.byteblower import ByteBlower
+from byteblowerll.byteblower import DeviceStatus
+
+BASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+configuration = {
+    # The scenarios of the campaign.
+    #  - 'name': unique name of the scenario
+    #  - 'script': the example to run, relative to the repository
+    #  - 'config' (optional): overrides of the configuration of the example
+    #  - 'interfaces' (optional): ByteBlower interfaces used by the scenario.
+    #       By default these are found in the configuration of the example
+    #       (keys 'interface' and 'server_interface').
+    #  - 'wireless_endpoints' (optional): UUIDs of the wireless endpoints
+    #       used by the scenario.  By default 'wireless_endpoint_uuid' from
+    #       the configuration.
+    #  - 'estimated_duration': duration of the scenario in seconds, used to
+    #       plan the schedule.
+    'scenarios': [
+        {
+            'name': 'ipv4 trunk-1-13 to trunk-1-14',
+            'script': 'back2back/ipv4.py',
+            'config': {
+                'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
+                'port_1_config': {'interface': 'trunk-1-13'},
+                'port_2_config': {'interface': 'trunk-1-14'},
+            },
+            'estimated_duration': 15,
+        },
+        {
+            'name': 'ipv6 trunk-1-15 to trunk-1-16',
+            'script': 'back2back/ipv6.py',
+            'config': {
+                'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
+                'port_1_config': {'interface': 'trunk-1-15'},
+                'port_2_config': {'interface': 'trunk-1-16'},
+            },
+            'estimated_duration': 15,
+        },
+        {
+            'name': 'tcp trunk-1-13 to trunk-1-15',
+            'script': 'back2back/tcp.py',
+            'config': {
+                'server_address': 'byteblower-tp-1300.lab.byteblower.excentis.com',
+                'port_1_config': {'interface': 'trunk-1-13'},
+                'port_2_config': {'interface': 'trunk-1-15'},
+            },
+            'estimated_duration': 30,
+        },
+    ],
+
+    # Maximum number of scenarios running at the same time
+    'max_parallel': 4,
+
+    # Interval between two checks of the users on a busy interface,
+    # in seconds
+    'busy_poll_interval': 10,
+
+    # A scenario which can not start within this time (in seconds) because
+    # other users hold its interfaces, is skipped.
+    'busy_timeout': 600,
+
+    # Users on the server with these names are ourselves.
+    # The ByteBlower server names API users '<user>@<host>'.
+    'own_user_names': ['%s@%s' % (getpass.getuser(), socket.gethostname())],
+
+    # The report of the campaign is written to this file
+    'report_file': 'campaign_report.json',
+}
+
+PENDING = 'pending'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def merge_config(base, overrides):
+    """Deep merge of the overrides into a copy of the base configuration"""
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def find_values(config, keys):
+    """All values of the given keys, anywhere in a nested configuration"""
+    found = []
+    if isinstance(config, dict):
+        for key, value in sorted(config.items()):
+            if key in keys and value is not None:
+                if isinstance(value, (list, tuple)):
+                    found.extend(value)
+                else:
+                    found.append(value)
+            else:
+                found.extend(find_values(value, keys))
+    elif isinstance(config, (list, tuple)):
+        for value in config:
+            found.extend(find_values(value, keys))
+    return found
+
+
+def load_example(script, name):
+    """Loads the module of an example from its path"""
+    path = os.path.join(BASE_DIRECTORY, script)
+    # The examples import their helpers from their own directory
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.append(directory)
+    try:
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class SharedServers(object):
+    """One server handle per address, shared by all scenarios"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def get(self, address):
+        with self._lock:
+            if address not in self._servers:
+                self._servers[address] = \
+                    ByteBlower.InstanceGet().ServerAdd(address)
+            return self._servers[address]
+
+    def cleanup(self):
+        instance = ByteBlower.InstanceGet()
+        with self._lock:
+            for server in self._servers.values():
+                try:
+                    instance.ServerRemove(server)
+                except Exception:
+                    pass
+            self._servers = {}
+
+
+class ScenarioServer(object):
+    """A shared server as seen by one scenario
+
+    Keeps track of the ports the scenario creates, releasing the server
+    destroys those ports instead of removing the server.
+    """
+
+    def __init__(self, server):
+        self._server = server
+        self._ports = []
+
+    def PortCreate(self, *args):
+        port = self._server.PortCreate(*args)
+        self._ports.append(port)
+        return port
+
+    def PortDestroy(self, port):
+        if port in self._ports:
+            self._ports.remove(port)
+        self._server.PortDestroy(port)
+
+    def release(self):
+        while self._ports:
+            self._server.PortDestroy(self._ports.pop())
+
+    def __getattr__(self, name):
+        return getattr(self._server, name)
+
+
+class ScenarioInstance(object):
+    """The ByteBlower instance as seen by one scenario
+
+    ServerAdd returns the shared server of the address, ServerRemove
+    releases it.  All other calls go to the ByteBlower instance.
+    """
+
+    def __init__(self, servers):
+        self._servers = servers
+        self._handles = []
+
+    def ServerAdd(self, address):
+        handle = ScenarioServer(self._servers.get(address))
+        self._handles.append(handle)
+        return handle
+
+    def ServerRemove(self, server):
+        if isinstance(server, ScenarioServer):
+            if server in self._handles:
+                self._handles.remove(server)
+            server.release()
+        else:
+            ByteBlower.InstanceGet().ServerRemove(server)
+
+    def release(self):
+        """Releases the servers the scenario did not remove itself"""
+        while self._handles:
+            self._handles.pop().release()
+
+    def __getattr__(self, name):
+        return getattr(ByteBlower.InstanceGet(), name)
+
+
+class ScenarioApi(object):
+    """Replaces the ByteBlower class in the module of a scenario"""
+
+    def __init__(self, instance):
+        self._instance = instance
+
+    def InstanceGet(self):
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(ByteBlower, name)
+
+
+def share_servers(module, instance):
+    """Lets the example in `module` use the shared servers through
+    `instance`.
+
+    The examples import the API as `ByteBlower` or as the
+    `byteblowerll.byteblower` module (e.g. `import ... as byteblower`),
+    both names are replaced in the module of the example.
+    """
+    api = ScenarioApi(instance)
+    for name, value in list(vars(module).items()):
+        if value is ByteBlower:
+            setattr(module, name, api)
+        elif value is byteblowerll.byteblower:
+            proxy = types.ModuleType(value.__name__)
+            proxy.__dict__.update(vars(value))
+            proxy.ByteBlower = api
+            setattr(module, name, proxy)
+
+
+class Scenario(object):
+    def __init__(self, number, **kwargs):
+        self.name = kwargs['name']
+        self.script = kwargs['script']
+        self.estimated_duration = kwargs.get('estimated_duration', 60)
+
+        self.module = load_example(self.script, 'campaign_scenario_%d' % number)
+        self.config = merge_config(getattr(self.module, 'configuration', {}),
+                                   kwargs.get('config', {}))
+
+        self.server_address = self.config.get('server_address')
+        self.meetingpoint_address = (self.config.get('meetingpoint_address')
+                                     or self.server_address)
+
+        self.interfaces = kwargs.get('interfaces')
+        if self.interfaces is None:
+            self.interfaces = find_values(self.config,
+                                          ('interface', 'server_interface'))
+        self.wireless_endpoints = kwargs.get('wireless_endpoints')
+        if self.wireless_endpoints is None:
+            self.wireless_endpoints = find_values(self.config,
+                                                  ('wireless_endpoint_uuid',))
+
+        self.state = PENDING
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.retry_at = 0
+        self.busy_since = None
+        self.result = None
+
+    @property
+    def resources(self):
+        """The resources which can not be shared with another scenario"""
+        resources = set(('interface', self.server_address, interface)
+                        for interface in self.interfaces)
+        resources.update(('wireless_endpoint', self.meetingpoint_address, uuid)
+                         for uuid in self.wireless_endpoints)
+        return resources
+
+    @property
+    def duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def run(self, servers):
+        """Runs the example on the shared servers
+
+        :param servers: The server handles shared by the campaign
+        :type servers: SharedServers
+        """
+        instance = ScenarioInstance(servers)
+        share_servers(self.module, instance)
+        example = self.module.Example(**copy.deepcopy(self.config))
+        try:
+            self.result = example.run()
+        finally:
+            try:
+                example.cleanup()
+            finally:
+                instance.release()
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'script': self.script,
+            'interfaces': self.interfaces,
+            'wireless_endpoints': self.wireless_endpoints,
+            'state': self.state,
+            'error': self.error,
+            'estimated_duration': self.estimated_duration,
+            'duration': self.duration,
+        }
+
+
+def plan(scenarios, max_parallel):
+    """Plans a parallel schedule on the estimated durations
+
+    Whenever a scenario finishes, the longest pending scenarios whose
+    resources are free are started.
+
+    :return: (dict name -> (start, end), makespan), in seconds
+    """
+    if max_parallel < 1:
+        raise ValueError("max_parallel must be at least 1, not %r"
+                         % (max_parallel,))
+    pending = sorted(scenarios, key=lambda s: -s.estimated_duration)
+    running = []
+    schedule = {}
+    now = 0
+    while pending:
+        busy = set()
+        for scenario, end in running:
+            busy.update(scenario.resources)
+        for scenario in list(pending):
+            if len(running) >= max_parallel:
+                break
+            if scenario.resources & busy:
+                continue
+            end = now + scenario.estimated_duration
+            schedule[scenario.name] = (now, end)
+            running.append((scenario, end))
+            busy.update(scenario.resources)
+            pending.remove(scenario)
+
+        # Advance to the moment the first running scenario ends
+        now = min(end for _, end in running)
+        running = [(s, end) for s, end in running if end > now]
+
+    makespan = max([end for _, end in schedule.values()] or [0])
+    return schedule, makespan
+
+
+class ResourceChecker(object):
+    """Checks whether other users hold the resources of a scenario
+
+    :param own_user_names: Names of the server users which are ourselves
+    :param servers: The server handles shared by the campaign
+    :type servers: SharedServers
+    """
+
+    def __init__(self, own_user_names, servers):
+        self.own_user_names = set(own_user_names)
+        self.servers = servers
+        self.meetingpoints = {}
+
+    def _meetingpoint(self, address):
+        if address not in self.meetingpoints:
+            self.meetingpoints[address] = \
+                ByteBlower.InstanceGet().MeetingPointAdd(address)
+        return self.meetingpoints[address]
+
+    def foreign_users(self, scenario):
+        """Who holds the resources of the scenario
+
+        :return: list of (resource, user), empty when the scenario can start
+        """
+        holders = []
+        if scenario.interfaces:
+            server = self.servers.get(scenario.server_address)
+            for user in server.UsersGet():
+                interface = user.InterfaceGet().NameGet()
+                if (interface in scenario.interfaces
+                        and user.NameGet() not in self.own_user_names):
+                    holders.append((interface, user.NameGet()))
+
+        if scenario.wireless_endpoints:
+            meetingpoint = self._meetingpoint(scenario.meetingpoint_address)
+            for uuid in scenario.wireless_endpoints:
+                device = meetingpoint.DeviceGet(uuid)
+                if device.StatusGet() != DeviceStatus.Available:
+                    holders.append((uuid, 'device is %s' % device.StatusGet()))
+        return holders
+
+    def cleanup(self):
+        instance = ByteBlower.InstanceGet()
+        for meetingpoint in self.meetingpoints.values():
+            try:
+                instance.MeetingPointRemove(meetingpoint)
+            except Exception:
+                pass
+        self.meetingpoints = {}
+
+
+class Campaign(object):
+    def __init__(self, **kwargs):
+        self.scenarios = [Scenario(number, **scenario) for number, scenario
+                          in enumerate(kwargs['scenarios'])]
+        names = [scenario.name for scenario in self.scenarios]
+        if len(set(names)) != len(names):
+            raise ValueError("Scenario names must be unique")
+
+        self.max_parallel = kwargs.get('max_parallel', 4)
+        if self.max_parallel < 1:
+            raise ValueError("max_parallel must be at least 1, not %r"
+                             % (self.max_parallel,))
+        self.busy_poll_interval = kwargs.get('busy_poll_interval', 10)
+        self.busy_timeout = kwargs.get('busy_timeout', 600)
+        self.report_file = kwargs.get('report_file')
+        self.servers = SharedServers()
+        self.checker = ResourceChecker(kwargs.get('own_user_names', []),
+                                       self.servers)
+
+        self._changed = threading.Condition()
+        self._held = set()
+        self.started_at = None
+        self.finished_at = None
+
+    def _runnable(self, now):
+        """The pending scenarios which may start, longest first.
+        Must be called with the lock held."""
+        running = [s for s in self.scenarios if s.state == RUNNING]
+        free_slots = self.max_parallel - len(running)
+        candidates = []
+        reserved = set(self._held)
+        for scenario in sorted(self.scenarios,
+                               key=lambda s: -s.estimated_duration):
+            if len(candidates) >= free_slots:
+                break
+            if (scenario.state == PENDING and scenario.retry_at <= now
+                    and not scenario.resources & reserved):
+                candidates.append(scenario)
+                reserved.update(scenario.resources)
+        return candidates
+
+    def _start(self, scenario):
+        with self._changed:
+            scenario.state = RUNNING
+            scenario.started_at = time.time()
+            self._held.update(scenario.resources)
+        print("Starting", scenario.name)
+
+        def work():
+            try:
+                scenario.run(self.servers)
+                state = FINISHED
+            except Exception as e:
+                traceback.print_exc()
+                scenario.error = str(e)
+                state = FAILED
+            with self._changed:
+                scenario.state = state
+                scenario.finished_at = time.time()
+                print("Scenario", scenario.name, state,
+                      "after %.1fs" % scenario.duration)
+                self._held.difference_update(scenario.resources)
+                self._changed.notify_all()
+
+        thread = threading.Thread(target=work, name=scenario.name)
+        thread.daemon = True
+        thread.start()
+
+    def _check_and_start(self, scenario, now):
+        """Starts the scenario when nobody else holds its resources"""
+        holders = self.checker.foreign_users(scenario)
+        if not holders:
+            self._start(scenario)
+            return
+
+        if scenario.busy_since is None:
+            scenario.busy_since = now
+        if now - scenario.busy_since > self.busy_timeout:
+            scenario.state = SKIPPED
+            scenario.error = "resources held by " + ", ".join(
+                "%s (%s)" % holder for holder in holders)
+            print("Skipping", scenario.name + ":", scenario.error)
+            return
+        print("Postponing", scenario.name + ", in use:",
+              ", ".join("%s (%s)" % holder for holder in holders))
+        scenario.retry_at = now + self.busy_poll_interval
+
+    def run(self):
+        schedule, planned_makespan = plan(self.scenarios, self.max_parallel)
+        print("Planned schedule:")
+        for scenario in self.scenarios:
+            start, end = schedule[scenario.name]
+            print("  %6.0fs - %6.0fs  %s" % (start, end, scenario.name))
+
+        self.started_at = time.time()
+        try:
+            with self._changed:
+                while any(s.state in (PENDING, RUNNING) for s in self.scenarios):
+                    now = time.time()
+                    for scenario in self._runnable(now):
+                        # Starting needs the API, do not hold the lock
+                        self._changed.release()
+                        try:
+                            self._check_and_start(scenario, now)
+                        finally:
+                            self._changed.acquire()
+
+                    # Wait for a scenario to finish, or a busy one to retry
+                    retries = [s.retry_at for s in self.scenarios
+                               if s.state == PENDING and s.retry_at > now]
+                    timeout = min(retries) - now if retries else None
+                    if any(s.state == RUNNING for s in self.scenarios) or retries:
+                        self._changed.wait(timeout)
+        finally:
+            self.finished_at = time.time()
+            self.checker.cleanup()
+            self.servers.cleanup()
+
+        return self.report(planned_makespan)
+
+    def report(self, planned_makespan):
+        makespan = self.finished_at - self.started_at
+        serial = sum(s.duration for s in self.scenarios if s.duration is not None)
+        estimated_serial = sum(s.estimated_duration for s in self.scenarios)
+
+        report = {
+            'scenarios': [s.to_dict() for s in self.scenarios],
+            'planned_makespan': planned_makespan,
+            'estimated_serial_duration': estimated_serial,
+            'makespan': makespan,
+            'serial_duration': serial,
+            'speedup': serial / makespan if makespan > 0 else None,
+        }
+
+        print()
+        print("# Scenario, state, duration")
+        for scenario in self.scenarios:
+            duration = scenario.duration
+            print("%s, %s, %s" % (scenario.name, scenario.state,
+                                  "%.1fs" % duration if duration is not None
+                                  else "-"))
+        print("Planned makespan %.0fs, serially %.0fs" % (
+            planned_makespan, estimated_serial))
+        print("Campaign makespan %.1fs, serially %.1fs" % (makespan, serial))
+        if report['speedup'] is not None:
+            print("Speedup %.2fx" % report['speedup'])
+
+        if self.report_file is not None:
+            with open(self.report_file, 'w') as handle:
+                json.dump(report, handle, indent=4)
+        return report
+
+
+if __name__ == '__main__':
+    Campaign(**configuration).run()
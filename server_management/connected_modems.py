@@ -14,7 +14,6 @@
 from __future__ import print_function
 
 import sys
-import random
 import codecs
 import json
 import urllib2
@@ -23,14 +22,10 @@ from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import DHCPFailed
 from byteblowerll.byteblower import AddressResolutionFailed
 
+from address_allocator import Allocator, DEFAULT_STATE_FILE
 
-def a_mac_address():
-    """
-        Generates a MAC address
-    """
-    byte_vals = (
-        ["00", "bb"] + ["%2x" % random.randint(0, 255) for _ in xrange(4)])
-    return ":".join(byte_vals)
+# Shared by all tests on this machine, no other test uses the same MAC address
+allocator = Allocator(DEFAULT_STATE_FILE)
 
 
 def lookup_vendor_name(mac_address):
@@ -60,14 +55,19 @@ def inspect_trunk(server, trunkbase=''):
     byteblower_instance = ByteBlower.InstanceGet()
     server = byteblower_instance.ServerAdd(server)
 
-    ports = []
-    for an_bb_interface in server.InterfaceNamesGet():
-        if not an_bb_interface.startswith(trunkbase):
-            continue
+    interfaces = [an_bb_interface
+                  for an_bb_interface in server.InterfaceNamesGet()
+                  if an_bb_interface.startswith(trunkbase)]
 
+    # Reserve the MAC addresses of all ports at once.  The state file is
+    # only locked while reserving, not while the ports are created.
+    mac_addresses = allocator.pools['mac'].allocate_many(len(interfaces))
+
+    ports = []
+    for an_bb_interface, mac_address in zip(interfaces, mac_addresses):
         port = server.PortCreate(an_bb_interface)
         port_l2 = port.Layer2EthIISet()
-        port_l2.MacSet(a_mac_address())
+        port_l2.MacSet(mac_address)
 
         port_l3 = port.Layer3IPv4Set()
         port_l3.ProtocolDhcpGet().PerformAsync()
@@ -99,6 +99,8 @@ def inspect_trunk(server, trunkbase=''):
 
         server.PortDestroy(a_port)
 
+    allocator.release()
+
 
 if __name__ == "__main__":
     if not (2 <= len(sys.argv) <= 3):
@@ -0,0 +1,465 @@
+#!/usr/bin/python
+"""
+Traces the ByteBlower API calls of an example and profiles where the time
+goes: in the Python client, in round trips to the server, or waiting for
+traffic (time.sleep).
+
+The tracer wraps the objects returned by ByteBlower.InstanceGet(), every
+method call on them (and on the objects they return) is timed.  The calls
+are grouped in phases:
+    connect, provision, configure, run, collect, cleanup
+The phase follows from the called method (e.g. PortCreate starts the
+provision phase), or is set explicitly:
+    with tracer.phase('run'):
+        ...
+
+When the tracer is not enabled, nothing is patched and the examples call
+the API directly: there is no overhead at all.
+
+Usage:
+    python api_tracer.py [--json profile.json] [--folded profile.folded]
+                         <example.py> [arguments of the example]
+
+The folded file can be turned into a flame graph with e.g.
+    flamegraph.pl profile.folded > profile.svg
+or loaded in speedscope.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import contextlib
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    # Python 2.7
+    clock = time.time
+
+PHASES = ['connect', 'provision', 'configure', 'run', 'collect', 'cleanup']
+
+# Methods which start a phase.  Methods which are not listed keep the
+# current phase (e.g. DescriptionGet).
+_PHASE_OF_METHOD = {
+    'ServerAdd': 'connect',
+    'MeetingPointAdd': 'connect',
+    'ServiceInfoGet': 'connect',
+
+    'PortCreate': 'provision',
+    'Layer2EthIISet': 'provision',
+    'Layer25VlanAdd': 'provision',
+    'Layer3IPv4Set': 'provision',
+    'Layer3IPv6Set': 'provision',
+    'ProtocolDhcpGet': 'provision',
+    'Perform': 'provision',
+    'StatelessAutoconfiguration': 'provision',
+    'Resolve': 'provision',
+    'DeviceGet': 'provision',
+    'Lock': 'provision',
+
+    'TxStreamAdd': 'configure',
+    'FrameAdd': 'configure',
+    'RxTriggerBasicAdd': 'configure',
+    'RxLatencyBasicAdd': 'configure',
+    'RxLatencyDistributionAdd': 'configure',
+    'RxOutOfSequenceBasicAdd': 'configure',
+    'RxCaptureBasicAdd': 'configure',
+    'ProtocolHttpServerAdd': 'configure',
+    'ProtocolHttpClientAdd': 'configure',
+    'ProtocolHttpMultiServerAdd': 'configure',
+    'ProtocolHttpMultiClientAdd': 'configure',
+    'ProtocolIcmpAdd': 'configure',
+    'ProtocolIGMPGet': 'configure',
+    'ProtocolMLDGet': 'configure',
+
+    'Prepare': 'run',
+    'Start': 'run',
+    'PortsStart': 'run',
+    'RequestStart': 'run',
+    'Stop': 'run',
+    'PortsStop': 'run',
+    'RequestStop': 'run',
+
+    'Refresh': 'collect',
+    'ResultsRefresh': 'collect',
+    'ResultsRefreshAll': 'collect',
+    'ResultGet': 'collect',
+    'ResultHistoryGet': 'collect',
+
+    'PortDestroy': 'cleanup',
+    'ServerRemove': 'cleanup',
+    'MeetingPointRemove': 'cleanup',
+}
+
+
+def phase_of(method):
+    """The phase a method call belongs to, None keeps the current phase"""
+    phase = _PHASE_OF_METHOD.get(method)
+    if phase is None and method.endswith('Remove'):
+        return 'cleanup'
+    return phase
+
+
+def is_api_object(value):
+    """Objects of the ByteBlower API are wrapped, plain values are not"""
+    return type(value).__module__.startswith('byteblowerll')
+
+
+class CallStatistics(object):
+    __slots__ = ('count', 'total', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if self.minimum is None or duration < self.minimum:
+            self.minimum = duration
+        if duration > self.maximum:
+            self.maximum = duration
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'average': self.total / self.count if self.count else None,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+        }
+
+
+class Traced(object):
+    """Proxy of an API object, times every method call
+
+    The proxy passes isinstance() checks of the wrapped class, and SWIG
+    accepts it as argument through the `this` attribute.
+    """
+    __slots__ = ('_target', '_tracer')
+
+    def __init__(self, target, tracer):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_tracer', tracer)
+
+    @property
+    def __class__(self):
+        return type(self._target)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+        return self._tracer.wrap_attribute(self._target, name, attribute)
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __iter__(self):
+        for value in self._target:
+            yield self._tracer.wrap(value)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __getitem__(self, index):
+        return self._tracer.wrap(self._target[index])
+
+    def __bool__(self):
+        return bool(self._target)
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        return self._target == unwrap(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def __str__(self):
+        return str(self._target)
+
+
+def unwrap(value):
+    if isinstance(value, Traced):
+        return object.__getattribute__(value, '_target')
+    return value
+
+
+class Tracer(object):
+    """Records the duration of the API calls, per phase
+
+    :param wrap_sleep: Also record time.sleep(), as time spent waiting
+    """
+
+    def __init__(self, wrap_sleep=True):
+        self.wrap_sleep = wrap_sleep
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._original_instance_get = None
+        self._original_sleep = None
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.phases = {}
+        self.started_at = None
+        self.stopped_at = None
+
+    # -- recording
+
+    def _thread(self):
+        """The phase and the end of the last event, per thread"""
+        local = self._local
+        if not hasattr(local, 'phase'):
+            local.phase = 'connect'
+            local.explicit_phase = None
+            local.depth = 0
+            local.last = clock()
+        return local
+
+    def _phase_totals(self, phase):
+        totals = self.phases.get(phase)
+        if totals is None:
+            totals = self.phases[phase] = {'api': 0.0, 'sleep': 0.0,
+                                           'python': 0.0, 'calls': 0}
+        return totals
+
+    def _record(self, key, kind, phase_hint, started, ended):
+        local = self._thread()
+        with self._lock:
+            # Time between the previous event and this one is spent in
+            # the Python code of the example.
+            self._phase_totals(local.phase)['python'] += max(0.0, started - local.last)
+
+            phase = local.explicit_phase or phase_hint or local.phase
+            local.phase = phase
+            local.last = ended
+
+            totals = self._phase_totals(phase)
+            totals[kind] += ended - started
+            if kind == 'api':
+                totals['calls'] += 1
+            statistics = self.calls.get((phase, key))
+            if statistics is None:
+                statistics = self.calls[(phase, key)] = CallStatistics()
+            statistics.add(ended - started)
+
+    def wrap(self, value):
+        if is_api_object(value):
+            return Traced(value, self)
+        return value
+
+    def wrap_attribute(self, target, name, method):
+        """Wraps a method of an API object, called by the Traced proxy"""
+        return self.wrap_method(type(target).__name__, name, method)
+
+    def wrap_method(self, class_name, name, method):
+        key = class_name + '.' + name
+        hint = phase_of(name)
+
+        def traced(*args, **kwargs):
+            args = [unwrap(arg) for arg in args]
+            local = self._thread()
+            if local.depth:
+                # Called by another API call, e.g. a helper of the API
+                return self.wrap(method(*args, **kwargs))
+            local.depth += 1
+            started = clock()
+            try:
+                return self.wrap(method(*args, **kwargs))
+            finally:
+                ended = clock()
+                local.depth -= 1
+                self._record(key, 'api', hint, started, ended)
+        return traced
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Attributes everything in the block to the given phase"""
+        local = self._thread()
+        now = clock()
+        with self._lock:
+            self._phase_totals(local.phase)['python'] += max(0.0, now - local.last)
+            local.last = now
+        previous_explicit = local.explicit_phase
+        local.phase = local.explicit_phase = name
+        try:
+            yield
+        finally:
+            now = clock()
+            with self._lock:
+                self._phase_totals(name)['python'] += max(0.0, now - local.last)
+                local.last = now
+            local.explicit_phase = previous_explicit
+            local.phase = previous_explicit or local.phase
+
+    # -- installing
+
+    def enable(self):
+        """Installs the tracer: ByteBlower.InstanceGet() returns a proxy"""
+        from byteblowerll import byteblower
+
+        if self._original_instance_get is not None:
+            return
+        self.started_at = clock()
+        original = byteblower.ByteBlower.InstanceGet
+        self._original_instance_get = original
+        tracer = self
+
+        def instance_get():
+            return tracer.wrap(original())
+        byteblower.ByteBlower.InstanceGet = staticmethod(instance_get)
+
+        if self.wrap_sleep:
+            self._original_sleep = time.sleep
+
+            def sleep(seconds):
+                if tracer._thread().depth:
+                    return tracer._original_sleep(seconds)
+                started = clock()
+                try:
+                    tracer._original_sleep(seconds)
+                finally:
+                    tracer._record('time.sleep', 'sleep', None, started, clock())
+            time.sleep = sleep
+
+    def disable(self):
+        """Restores the API and time.sleep"""
+        from byteblowerll import byteblower
+
+        if self._original_instance_get is None:
+            return
+        byteblower.ByteBlower.InstanceGet = staticmethod(self._original_instance_get)
+        self._original_instance_get = None
+        if self._original_sleep is not None:
+            time.sleep = self._original_sleep
+            self._original_sleep = None
+        self.stopped_at = clock()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    # -- reporting
+
+    def profile(self):
+        """The profile per phase, in seconds"""
+        # The Python time after the last API call
+        local = self._thread()
+        end = self.stopped_at or clock()
+        phases = dict((phase, dict(totals)) for phase, totals in self.phases.items())
+        if phases:
+            phases.setdefault(local.phase, {'api': 0.0, 'sleep': 0.0,
+                                            'python': 0.0, 'calls': 0})
+            phases[local.phase]['python'] += max(0.0, end - local.last)
+
+        for phase, totals in phases.items():
+            totals['total'] = totals['api'] + totals['sleep'] + totals['python']
+            totals['methods'] = dict(
+                (key, statistics.to_dict())
+                for (call_phase, key), statistics in self.calls.items()
+                if call_phase == phase)
+
+        order = PHASES + sorted(set(phases) - set(PHASES))
+        return {
+            'duration': end - self.started_at if self.started_at else None,
+            'phases': [dict(phase=phase, **phases[phase])
+                       for phase in order if phase in phases],
+        }
+
+    def write_json(self, filename):
+        with open(filename, 'w') as handle:
+            json.dump(self.profile(), handle, indent=4, sort_keys=True)
+
+    def write_folded(self, filename):
+        """Writes the profile as folded stacks: 'phase;kind;method value'
+
+        The values are in microseconds.
+        """
+        with open(filename, 'w') as handle:
+            for phase in self.profile()['phases']:
+                name = phase['phase']
+                for key, statistics in sorted(phase['methods'].items()):
+                    kind = 'sleep' if key == 'time.sleep' else 'api'
+                    handle.write('%s;%s;%s %d\n' % (
+                        name, kind, key, round(statistics['total'] * 1e6)))
+                if phase['python'] > 0:
+                    handle.write('%s;python %d\n' % (
+                        name, round(phase['python'] * 1e6)))
+
+    def print_profile(self):
+        profile = self.profile()
+        print("# phase, total [s], api [s], calls, sleep [s], python [s]")
+        for phase in profile['phases']:
+            print("%-10s %9.3f %9.3f %7d %9.3f %9.3f" % (
+                phase['phase'], phase['total'], phase['api'], phase['calls'],
+                phase['sleep'], phase['python']))
+
+        print("# slowest methods: phase, method, count, total [s], average [ms]")
+        methods = [(statistics['total'], phase['phase'], key, statistics)
+                   for phase in profile['phases']
+                   for key, statistics in phase['methods'].items()
+                   if key != 'time.sleep']
+        for total, phase, key, statistics in sorted(methods, reverse=True)[:10]:
+            print("%-10s %-45s %7d %9.3f %9.3f" % (
+                phase, key, statistics['count'], total,
+                statistics['average'] * 1e3))
+
+
+def run_script(script, arguments):
+    """Runs an example as if it was started from the command line"""
+    script = os.path.abspath(script)
+    old_argv, old_path = sys.argv, list(sys.path)
+    sys.argv = [script] + list(arguments)
+    sys.path.insert(0, os.path.dirname(script))
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        sys.argv = old_argv
+        sys.path[:] = old_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--json', default='api_profile.json',
+                        help='write the profile as JSON to this file')
+    parser.add_argument('--folded', default='api_profile.folded',
+                        help='write the profile as folded stacks to this file')
+    parser.add_argument('--no-sleep', action='store_true',
+                        help='do not record time.sleep()')
+    parser.add_argument('script', help='the example to run')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    tracer = Tracer(wrap_sleep=not args.no_sleep)
+    try:
+        with tracer:
+            run_script(args.script, args.arguments)
+    finally:
+        tracer.print_profile()
+        if args.json:
+            tracer.write_json(args.json)
+        if args.folded:
+            tracer.write_folded(args.folded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1525 @@
+#!/usr/bin/python
+"""
+In-process fake of the ByteBlower API (byteblowerll.byteblower).
+
+The fake implements the part of the API the examples use: servers, ports
+with their layer 2 and layer 3 configuration, streams, frames, triggers,
+result snapshots and histories, HTTP clients and servers, meeting points
+and wireless endpoints.  No traffic is sent, the counters are calculated
+from the configuration of the streams and the time since they started:
+  - a stream transmits its frames at its inter-frame gap,
+  - a trigger receives the frames of the streams on the same server whose
+    destination IP address and UDP port match its filter, minus the
+    configured loss,
+  - a capture receives the frames of the same streams, at most
+    `capture_frames` of them,
+  - an HTTP client runs for its request duration at a fixed speed.
+
+The fake makes it possible to measure how the client side of an example
+scales, without a ByteBlower server.  Every call which would make a round
+trip to the server waits `latency` seconds.
+
+Usage:
+    import fake_byteblower
+    fake_byteblower.install(latency=0.0005, loss=0.01)
+
+    # From now on, the examples import the fake
+    from byteblowerll.byteblower import ByteBlower
+"""
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import re
+import sys
+import threading
+import time
+import types
+
+API_VERSION = '2.x.fake'
+
+# Options of the fake, see install()
+options = {
+    # Time of a round trip to the server, in seconds
+    'latency': 0.0,
+    # Fraction of the frames which get lost
+    'loss': 0.0,
+    # Speed of the HTTP sessions, in bits per second
+    'http_speed': 100e6,
+    # Duration of an interval of the result histories, in nanoseconds
+    'interval_duration': 1000000000,
+    # Wireless endpoints registered on every meeting point
+    'wireless_endpoints': 4,
+    # Size of the buffer of a capture, in frames
+    'capture_frames': 10000,
+}
+
+
+def _now():
+    """The current time in nanoseconds since the epoch"""
+    return int(time.time() * 1e9)
+
+
+# Frames sent to a destination, by (server, destination, timestamp).  All
+# triggers with the same filter share the sum, it is valid during a refresh.
+_sent_cache = {}
+
+
+def _round_trip():
+    if options['latency'] > 0:
+        time.sleep(options['latency'])
+
+
+def remote(method):
+    """Marks a method which makes a round trip to the server"""
+    def call(*args, **kwargs):
+        _round_trip()
+        return method(*args, **kwargs)
+    call.__name__ = method.__name__
+    call.__doc__ = method.__doc__
+    return call
+
+
+# -- exceptions
+
+class ByteBlowerAPIException(Exception):
+    def getMessage(self):
+        return str(self)
+
+    def what(self):
+        return str(self)
+
+
+class ConfigError(ByteBlowerAPIException):
+    pass
+
+
+class DomainError(ByteBlowerAPIException):
+    pass
+
+
+class TechnicalError(ByteBlowerAPIException):
+    pass
+
+
+class DHCPFailed(ByteBlowerAPIException):
+    pass
+
+
+class AddressResolutionFailed(ByteBlowerAPIException):
+    pass
+
+
+# -- enumerations
+
+class HTTPRequestStatus(object):
+    Configuration = 0
+    Scheduled = 1
+    Connecting = 2
+    Running = 3
+    Finished = 4
+    Error = 5
+    Stopped = 6
+
+
+class HTTPRequestMethod(object):
+    Get = 0
+    Put = 1
+
+
+class RequestStartType(object):
+    Direct = 0
+    Scheduled = 1
+
+
+class DeviceStatus(object):
+    Unknown = 0
+    Available = 1
+    Reserved = 2
+    Armed = 3
+    Starting = 4
+    Running = 5
+    Unavailable = 6
+
+
+DeviceStatus_Available = DeviceStatus.Available
+HTTPMultiClientStatus_Finished = HTTPRequestStatus.Finished
+
+
+class MulticastSourceFilter(object):
+    Include = 0
+    Exclude = 1
+
+
+def ParseHTTPRequestMethodFromString(method):
+    return {'GET': HTTPRequestMethod.Get,
+            'PUT': HTTPRequestMethod.Put}[method.upper()]
+
+
+def ConvertHTTPRequestStatusToString(status):
+    for name, value in vars(HTTPRequestStatus).items():
+        if value == status and not name.startswith('_'):
+            return name
+    return 'Unknown'
+
+
+# -- lists
+
+class AbstractRefreshableResultList(list):
+    def push_back(self, value):
+        self.append(value)
+
+    def size(self):
+        return len(self)
+
+
+ByteBlowerPortList = AbstractRefreshableResultList
+StringList = AbstractRefreshableResultList
+WirelessEndpointList = AbstractRefreshableResultList
+
+
+# -- generic objects
+
+class Object(object):
+    """Base of all fake API objects
+
+    Methods which are not implemented explicitly, behave as plain
+    configuration: XxxSet(value) stores the value, XxxGet() returns it.
+    Both are round trips to the server, except for the objects which hold
+    results or information which was fetched before (_local_getters).
+    """
+
+    # The getters only read what a Refresh() or another call fetched before
+    _local_getters = False
+
+    def __init__(self, parent=None):
+        self._parent = parent
+        self._settings = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name.endswith('Set') or name.endswith('Enable'):
+            key = name[:-3] if name.endswith('Set') else name
+
+            @remote
+            def setter(value=True):
+                self._settings[key] = value
+            return setter
+        if name.endswith('Get'):
+            key = name[:-3]
+
+            def getter(*args):
+                return self._settings.get(key, 0)
+            if self._local_getters:
+                return getter
+            return remote(getter)
+        raise AttributeError("%s has no attribute %s"
+                             % (type(self).__name__, name))
+
+    def ParentGet(self):
+        return self._parent
+
+    @remote
+    def DescriptionGet(self):
+        return '%s %s' % (type(self).__name__, self._settings)
+
+
+class DataRate(object):
+    def __init__(self, bits_per_second):
+        self._bps = bits_per_second
+
+    def bitrate(self):
+        return self._bps
+
+    def MbpsGet(self):
+        return self._bps / 1e6
+
+    def toString(self):
+        return '%.3f Mbps' % (self._bps / 1e6)
+
+
+class ResultData(Object):
+    """A single snapshot: an interval or cumulative result"""
+
+    _local_getters = True
+
+
+    def __init__(self, timestamp, packets, size, interval_duration,
+                 first=None, last=None):
+        Object.__init__(self)
+        self._timestamp = timestamp
+        self._packets = packets
+        self._size = size
+        self._interval_duration = interval_duration
+        self._first = first
+        self._last = last
+
+    def TimestampGet(self):
+        return self._timestamp
+
+    def PacketCountGet(self):
+        return self._packets
+
+    def ByteCountGet(self):
+        return self._packets * self._size
+
+    def IntervalDurationGet(self):
+        return self._interval_duration
+
+    def TimestampFirstGet(self):
+        return self._first or self._timestamp
+
+    def TimestampLastGet(self):
+        return self._last or self._timestamp
+
+    def FramesizeMinimumGet(self):
+        return self._size
+
+    FramesizeMaximumGet = FramesizeMinimumGet
+
+
+class CounterResult(Object):
+    """Result snapshot of a stream or trigger, updated by Refresh()"""
+
+    def __init__(self, source):
+        Object.__init__(self, source)
+        self._source = source
+        self._snapshot = ResultData(0, 0, 0, 0)
+
+    def Refresh(self):
+        _round_trip()
+        _sent_cache.clear()
+        self._update(_now())
+
+    def _update(self, now):
+        self._snapshot = ResultData(now, self._source._count(now),
+                                    self._source._frame_size(),
+                                    options['interval_duration'],
+                                    first=self._source._first_timestamp(),
+                                    last=now)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._snapshot, name)
+
+
+class CounterHistory(Object):
+    """Interval results of a stream or trigger, updated by Refresh()"""
+
+    _local_getters = True
+
+
+    def __init__(self, source):
+        Object.__init__(self, source)
+        self._source = source
+        self._buffer_length = 10
+        self._intervals = []
+        self._cumulative = ResultData(0, 0, 0, 0)
+
+    def Refresh(self):
+        _round_trip()
+        _sent_cache.clear()
+        self._update(_now())
+
+    def _update(self, now):
+        duration = options['interval_duration']
+        start = self._source._first_timestamp()
+        size = self._source._frame_size()
+        intervals = []
+        if start is not None:
+            # Intervals are aligned on the interval duration, only the
+            # complete intervals are available.
+            first = max(start - start % duration,
+                        now - now % duration - self._buffer_length * duration)
+            previous = self._source._count(first)
+            for begin in range(first, now - now % duration, duration):
+                count = self._source._count(begin + duration)
+                intervals.append(ResultData(begin, count - previous, size,
+                                            duration))
+                previous = count
+        self._intervals = intervals
+        self._cumulative = ResultData(now, self._source._count(now), size,
+                                      duration, first=start, last=now)
+
+    def IntervalLatestGet(self):
+        if not self._intervals:
+            return ResultData(0, 0, 0, options['interval_duration'])
+        return self._intervals[-1]
+
+    def IntervalGet(self):
+        return list(self._intervals)
+
+    def IntervalLengthGet(self):
+        return len(self._intervals)
+
+    def IntervalGetByIndex(self, index):
+        return self._intervals[index]
+
+    def CumulativeLatestGet(self):
+        return self._cumulative
+
+    def CumulativeGet(self):
+        return [self._cumulative]
+
+    def SamplingBufferLengthSet(self, length):
+        self._buffer_length = length
+
+    def SamplingBufferLengthGet(self):
+        return self._buffer_length
+
+    def SamplingIntervalDurationGet(self):
+        return options['interval_duration']
+
+    def Clear(self):
+        self._intervals = []
+
+
+# -- traffic
+
+class Frame(Object):
+    def __init__(self, stream):
+        Object.__init__(self, stream)
+        self._bytes = ''
+        self._key = None
+
+    @remote
+    def BytesSet(self, hexbytes):
+        self._bytes = hexbytes
+        self._key = parse_destination(bytearray.fromhex(hexbytes))
+        self._parent._parent._server._index_stream(self._parent)
+
+    @remote
+    def BytesGet(self):
+        return self._bytes
+
+
+def parse_destination(data):
+    """(destination IP, destination UDP port) of a frame, or None"""
+    offset = 12
+    ethertype = (data[offset] << 8) | data[offset + 1]
+    while ethertype in (0x8100, 0x88a8):
+        offset += 4
+        ethertype = (data[offset] << 8) | data[offset + 1]
+    offset += 2
+    if ethertype == 0x0800:
+        header_length = (data[offset] & 0x0f) * 4
+        protocol = data[offset + 9]
+        destination = '.'.join(str(b) for b in data[offset + 16:offset + 20])
+        offset += header_length
+    elif ethertype == 0x86dd:
+        protocol = data[offset + 6]
+        words = [(data[i] << 8) | data[i + 1]
+                 for i in range(offset + 24, offset + 40, 2)]
+        destination = _short_ipv6(words)
+        offset += 40
+    else:
+        return None
+    if protocol != 17:
+        return destination, None
+    return destination, (data[offset + 2] << 8) | data[offset + 3]
+
+
+def _short_ipv6(words):
+    """Compressed notation of an IPv6 address, as in a BPF filter"""
+    text = ':'.join('%x' % word for word in words)
+    # Replace the longest run of zeros with '::'
+    best = None
+    for match in re.finditer(r'(^|:)0(:0)+(:|$)', text):
+        if best is None or len(match.group()) > len(best.group()):
+            best = match
+    if best is not None:
+        text = text[:best.start()] + '::' + text[best.end():]
+    return text
+
+
+class TxStream(Object):
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._frames = []
+        # Keys of the stream in the index of the server
+        self._index_keys = set()
+        self._number_of_frames = 0
+        self._interframe_gap = 1000000
+        self._initial_time_to_wait = 0
+        self._started_at = None
+        self._result = CounterResult(self)
+        self._history = CounterHistory(self)
+
+    @remote
+    def FrameAdd(self):
+        frame = Frame(self)
+        self._frames.append(frame)
+        return frame
+
+    def FrameGet(self):
+        return self._frames
+
+    @remote
+    def NumberOfFramesSet(self, count):
+        self._number_of_frames = count
+
+    @remote
+    def NumberOfFramesGet(self):
+        return self._number_of_frames
+
+    @remote
+    def InterFrameGapSet(self, gap):
+        self._interframe_gap = gap
+
+    @remote
+    def InterFrameGapGet(self):
+        return self._interframe_gap
+
+    @remote
+    def InitialTimeToWaitSet(self, wait):
+        self._initial_time_to_wait = wait
+
+    @remote
+    def InitialTimeToWaitGet(self):
+        return self._initial_time_to_wait
+
+    @remote
+    def Start(self):
+        self._start(_now())
+
+    @remote
+    def Stop(self):
+        now = _now()
+        if self._started_at is not None:
+            self._number_of_frames = self._count(now)
+        _sent_cache.clear()
+
+    def _start(self, now):
+        self._started_at = now
+        _sent_cache.clear()
+
+    def _first_timestamp(self):
+        if self._started_at is None:
+            return None
+        return self._started_at + self._initial_time_to_wait
+
+    def _count(self, timestamp):
+        first = self._first_timestamp()
+        if first is None or timestamp < first:
+            return 0
+        sent = (timestamp - first) // self._interframe_gap + 1
+        return int(min(sent, self._number_of_frames))
+
+    def _frame_size(self):
+        if not self._frames:
+            return 0
+        return len(self._frames[0]._bytes) // 2
+
+    def ResultGet(self):
+        return self._result
+
+    def ResultHistoryGet(self):
+        return self._history
+
+    @remote
+    def ResultClear(self):
+        pass
+
+
+_FILTER_DESTINATION = re.compile(r'\bip6? dst ([0-9a-fA-F.:]+)')
+_FILTER_PORT = re.compile(r'\budp (?:dst )?port (\d+)')
+_FILTER_PORTRANGE = re.compile(r'\budp (?:dst )?portrange (\d+)-(\d+)')
+
+
+def parse_filter(bpf_filter):
+    """The (destination IP, destination UDP port) keys a filter matches"""
+    destination = _FILTER_DESTINATION.search(bpf_filter)
+    destination = destination.group(1) if destination else None
+    ports = [int(port) for port in _FILTER_PORT.findall(bpf_filter)]
+    for first, last in _FILTER_PORTRANGE.findall(bpf_filter):
+        ports.extend(range(int(first), int(last) + 1))
+    if not ports:
+        return ((destination, None),)
+    return tuple((destination, port) for port in ports)
+
+
+class RxTriggerBasic(Object):
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._filter = ''
+        self._keys = ()
+        self._cleared = 0
+        self._result = CounterResult(self)
+        self._history = CounterHistory(self)
+
+    @remote
+    def FilterSet(self, bpf_filter):
+        self._filter = bpf_filter
+        self._keys = parse_filter(bpf_filter)
+
+    @remote
+    def FilterGet(self):
+        return self._filter
+
+    def _streams(self):
+        server = self._parent._server
+        if len(self._keys) == 1:
+            return server._streams_to(self._keys[0])
+        return [stream for key in self._keys
+                for stream in server._streams_to(key)]
+
+    def _first_timestamp(self):
+        starts = [s._first_timestamp() for s in self._streams()]
+        starts = [s for s in starts if s is not None]
+        return min(starts) if starts else None
+
+    def _count(self, timestamp):
+        key = (id(self._parent._server), self._keys, timestamp)
+        sent = _sent_cache.get(key)
+        if sent is None:
+            sent = sum(s._count(timestamp) for s in self._streams())
+            _sent_cache[key] = sent
+        received = int(sent * (1 - options['loss']))
+        return max(0, received - self._cleared)
+
+    def _frame_size(self):
+        streams = self._streams()
+        return streams[0]._frame_size() if streams else 0
+
+    def ResultGet(self):
+        return self._result
+
+    def ResultHistoryGet(self):
+        return self._history
+
+    @remote
+    def ResultClear(self):
+        self._cleared += self._count(_now())
+
+
+class RxCaptureBasic(Object):
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._filter = ''
+        self._keys = ()
+        self._started_at = None
+        self._stopped_at = None
+        self._result = CaptureResult(self)
+
+    @remote
+    def FilterSet(self, bpf_filter):
+        self._filter = bpf_filter
+        self._keys = parse_filter(bpf_filter)
+
+    @remote
+    def FilterGet(self):
+        return self._filter
+
+    @remote
+    def Start(self):
+        self._started_at = _now()
+        self._stopped_at = None
+
+    @remote
+    def Stop(self):
+        self._stopped_at = _now()
+
+    def ResultGet(self):
+        return self._result
+
+    def _frames(self):
+        """The received frames, spread over the streams like the traffic"""
+        if self._started_at is None:
+            return []
+        end = self._stopped_at or _now()
+        server = self._parent._server
+        counts = []
+        for key in self._keys:
+            for stream in server._streams_to(key):
+                received = int((stream._count(end)
+                                - stream._count(self._started_at))
+                               * (1 - options['loss']))
+                if received > 0 and stream._frames:
+                    counts.append((stream, received))
+        total = sum(count for _, count in counts)
+        scale = min(1.0, options['capture_frames'] / total) if total else 0
+        frames = []
+        for stream, count in counts:
+            data = bytes(bytearray.fromhex(stream._frames[0]._bytes))
+            frames.extend(CaptureFrame(data, self._started_at)
+                          for _ in range(int(round(count * scale))))
+        return frames
+
+
+class CaptureFrame(Object):
+    _local_getters = True
+
+    def __init__(self, data, timestamp):
+        Object.__init__(self)
+        self._data = data
+        self._timestamp = timestamp
+
+    def BufferGet(self):
+        return self._data
+
+    def TimestampGet(self):
+        return self._timestamp
+
+
+class CaptureResult(Object):
+    _local_getters = True
+
+    def __init__(self, capture):
+        Object.__init__(self, capture)
+        self._frames = []
+
+    def Refresh(self):
+        _round_trip()
+        self._frames = self._parent._frames()
+
+    def PacketCountGet(self):
+        return len(self._frames)
+
+    def FramesGet(self):
+        return list(self._frames)
+
+
+# -- HTTP
+
+class HTTPResultSnapshot(Object):
+    _local_getters = True
+
+    def __init__(self, session):
+        Object.__init__(self, session)
+        self._session = session
+        self._tx = self._rx = 0
+        self._timestamp = 0
+
+    def Refresh(self):
+        _round_trip()
+        self._update(_now())
+
+    def _update(self, now):
+        self._timestamp = now
+        self._tx, self._rx = self._session._bytes(self._timestamp)
+
+    def TimestampGet(self):
+        return self._timestamp
+
+    def TxByteCountTotalGet(self):
+        return self._tx
+
+    def RxByteCountTotalGet(self):
+        return self._rx
+
+    def AverageDataSpeedGet(self):
+        return DataRate(options['http_speed']
+                        if self._tx or self._rx else 0)
+
+    def LatencyMinimumGet(self, *args):
+        return 1000000
+
+    LatencyAverageGet = LatencyMaximumGet = LatencyMinimumGet
+
+    def JitterGet(self, *args):
+        return 100000
+
+    def CongestionWindowMinimumGet(self):
+        return 14600
+
+    def CongestionWindowMaximumGet(self):
+        return 1048576
+
+    CongestionWindowCurrentGet = CongestionWindowMaximumGet
+
+    def RoundTripTimeMinimumGet(self):
+        return 1000000
+
+    RoundTripTimeMaximumGet = RoundTripTimeCurrentGet = RoundTripTimeMinimumGet
+
+
+class HTTPResultHistory(Object):
+    _local_getters = True
+
+    def __init__(self, session):
+        Object.__init__(self, session)
+        self._session = session
+        self._intervals = []
+
+    def Refresh(self):
+        _round_trip()
+        self._update(_now())
+
+    def _update(self, now):
+        duration = options['interval_duration']
+        start = self._session._client._started_at
+        self._intervals = []
+        if start is None:
+            return
+        for begin in range(start - start % duration, now - now % duration,
+                           duration):
+            snapshot = HTTPResultSnapshot(self._session)
+            snapshot._timestamp = begin
+            before = self._session._bytes(begin)
+            after = self._session._bytes(begin + duration)
+            snapshot._tx = after[0] - before[0]
+            snapshot._rx = after[1] - before[1]
+            self._intervals.append(snapshot)
+
+    def IntervalGet(self):
+        return list(self._intervals)
+
+    def IntervalLatestGet(self):
+        return self._intervals[-1] if self._intervals else HTTPResultSnapshot(self._session)
+
+    def IntervalLengthGet(self):
+        return len(self._intervals)
+
+    def IntervalGetByIndex(self, index):
+        return self._intervals[index]
+
+    def CumulativeLatestGet(self):
+        snapshot = HTTPResultSnapshot(self._session)
+        snapshot._update(_now())
+        return snapshot
+
+    def SamplingIntervalDurationGet(self):
+        return options['interval_duration']
+
+
+class TCPSessionInfo(Object):
+    def __init__(self, session):
+        Object.__init__(self, session)
+        self._result = HTTPResultSnapshot(session)
+        self._history = HTTPResultHistory(session)
+
+    def ResultGet(self):
+        return self._result
+
+    def ResultHistoryGet(self):
+        return self._history
+
+    def Refresh(self):
+        _round_trip()
+        self._update(_now())
+
+    def _update(self, now):
+        self._result._update(now)
+
+
+class HTTPSessionInfo(Object):
+    def __init__(self, client):
+        Object.__init__(self, client)
+        self._client = client
+        self._result = HTTPResultSnapshot(self)
+        self._history = HTTPResultHistory(self)
+        self._tcp = TCPSessionInfo(self)
+        self._status = HTTPRequestStatus.Running
+
+    def _bytes(self, timestamp):
+        """Bytes transmitted and received by the client up to timestamp"""
+        start = self._client._session_start()
+        if start is None or timestamp < start:
+            return 0, 0
+        elapsed = min(timestamp - start, self._client._duration())
+        transferred = int(elapsed * options['http_speed'] / 8e9)
+        if self._client._method == HTTPRequestMethod.Get:
+            return 0, transferred
+        return transferred, 0
+
+    def Refresh(self):
+        _round_trip()
+        self._update(_now())
+
+    def _update(self, now):
+        self._status = self._client._status(now)
+        self._result._update(now)
+
+    def RequestStatusGet(self):
+        return self._status
+
+    def ResultGet(self):
+        return self._result
+
+    def ResultHistoryGet(self):
+        return self._history
+
+    def TcpSessionInfoGet(self):
+        return self._tcp
+
+
+class HTTPClient(Object):
+    _local_ports = itertools.count(32768)
+
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._method = HTTPRequestMethod.Get
+        self._request_duration = None
+        self._request_size = None
+        self._initial_time_to_wait = 0
+        self._start_type = RequestStartType.Direct
+        self._started_at = None
+        self._stopped_at = None
+        self._local_port = next(HTTPClient._local_ports)
+        self._session = HTTPSessionInfo(self)
+        self._status_value = HTTPRequestStatus.Configuration
+
+    @remote
+    def HttpMethodSet(self, method):
+        self._method = method
+
+    @remote
+    def HttpMethodGet(self):
+        return self._method
+
+    @remote
+    def RequestDurationSet(self, duration):
+        self._request_duration = duration
+
+    @remote
+    def RequestDurationGet(self):
+        return self._request_duration or 0
+
+    @remote
+    def RequestSizeSet(self, size):
+        self._request_size = size
+
+    @remote
+    def RequestInitialTimeToWaitSet(self, wait):
+        self._initial_time_to_wait = wait
+
+    @remote
+    def RequestStartTypeSet(self, start_type):
+        self._start_type = start_type
+
+    @remote
+    def RequestStart(self):
+        self._started_at = _now()
+
+    @remote
+    def RequestStop(self):
+        self._stopped_at = _now()
+
+    def _start(self, now):
+        if self._start_type == RequestStartType.Scheduled:
+            self._started_at = now
+
+    def _session_start(self):
+        if self._started_at is None:
+            return None
+        return self._started_at + self._initial_time_to_wait
+
+    def _duration(self):
+        if self._request_duration:
+            return self._request_duration
+        if self._request_size:
+            return int(self._request_size * 8e9 / options['http_speed'])
+        return 10000000000
+
+    def _status(self, now):
+        start = self._session_start()
+        if start is None:
+            return HTTPRequestStatus.Configuration
+        if now < start:
+            return HTTPRequestStatus.Scheduled
+        end = start + self._duration()
+        if self._stopped_at is not None:
+            end = min(end, self._stopped_at)
+        if now < end:
+            return HTTPRequestStatus.Running
+        return HTTPRequestStatus.Finished
+
+    def Refresh(self):
+        _round_trip()
+        self._status_value = self._status(_now())
+
+    def RequestStatusGet(self):
+        return self._status_value
+
+    @remote
+    def WaitUntilConnected(self, timeout):
+        """Waits until the session started, at most `timeout` nanoseconds"""
+        start = self._session_start()
+        if start is None:
+            raise ConfigError("The HTTP request was not started")
+        wait = min(start - _now(), timeout)
+        if wait > 0:
+            time.sleep(wait / 1e9)
+        if _now() < start:
+            raise TechnicalError("The HTTP client did not connect within "
+                                 "%d ns" % timeout)
+
+    @remote
+    def WaitUntilFinished(self, timeout):
+        """Waits until the request finished, at most `timeout` nanoseconds"""
+        start = self._session_start()
+        if start is None:
+            raise ConfigError("The HTTP request was not started")
+        end = start + self._duration()
+        wait = min(end - _now(), timeout)
+        if wait > 0:
+            time.sleep(wait / 1e9)
+        return _now() >= end
+
+    def HasSession(self):
+        start = self._session_start()
+        return start is not None and _now() >= start
+
+    def HttpSessionInfoGet(self):
+        return self._session
+
+    @remote
+    def LocalPortGet(self):
+        return self._local_port
+
+    @remote
+    def ServerClientIdGet(self):
+        return '%s:%d' % (self._parent._l3_address(), self._local_port)
+
+    @remote
+    def FinishedGet(self):
+        return self._status(_now()) == HTTPRequestStatus.Finished
+
+
+class HTTPServer(Object):
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._running = False
+
+    @remote
+    def Start(self):
+        self._running = True
+
+    @remote
+    def Stop(self):
+        self._running = False
+
+    def _clients(self):
+        port = self._settings.get('Port', 80)
+        server = self._parent._server
+        return [client for p in server._ports for client in p._http_clients
+                if client._settings.get('RemotePort') == port
+                and client._session_start() is not None]
+
+    @remote
+    def ClientIdentifiersGet(self):
+        return StringList(c.ServerClientIdGet() for c in self._clients())
+
+    @remote
+    def HttpSessionInfoGet(self, identifier):
+        for client in self._clients():
+            if client.ServerClientIdGet() == identifier:
+                return client._session
+        raise ConfigError("Unknown client %s" % identifier)
+
+
+# -- ports and servers
+
+class Layer2EthII(Object):
+    def __init__(self, port):
+        Object.__init__(self, port)
+        self._mac = '00:ff:00:00:00:00'
+
+    @remote
+    def MacSet(self, mac):
+        self._mac = mac
+
+    @remote
+    def MacGet(self):
+        return self._mac
+
+
+class Layer25Vlan(Object):
+    pass
+
+
+class DHCPProtocol(Object):
+    @remote
+    def Perform(self):
+        self._parent._assign()
+
+
+class Layer3(Object):
+    def __init__(self, port, version):
+        Object.__init__(self, port)
+        self._version = version
+        self._ip = None
+        self._netmask = '255.255.255.0'
+        self._gateway = None
+        self._dhcp = DHCPProtocol(self)
+
+    def _assign(self):
+        server = self._parent._server
+        number = next(server._addresses)
+        if self._version == 4:
+            self._ip = '10.%d.%d.%d' % (number >> 16 & 255, number >> 8 & 255,
+                                        number & 255 or 1)
+            self._netmask = '255.0.0.0'
+            self._gateway = '10.0.0.1'
+        else:
+            self._ip = '2001:db8::%x' % number
+            self._gateway = 'fe80::1'
+
+    def ProtocolDhcpGet(self):
+        return self._dhcp
+
+    @remote
+    def IpSet(self, ip):
+        self._ip = ip
+
+    @remote
+    def IpGet(self):
+        if self._version == 6:
+            return StringList([self._ip + '/64'] if self._ip else [])
+        return self._ip
+
+    @remote
+    def IpManualAdd(self, ip):
+        self._ip = ip.split('/')[0]
+
+    IpManualSet = IpManualAdd
+
+    @remote
+    def IpDhcpGet(self):
+        return StringList([self._ip + '/64'] if self._ip else [])
+
+    IpStatelessGet = IpDhcpGet
+
+    @remote
+    def StatelessAutoconfiguration(self):
+        self._assign()
+
+    @remote
+    def NetmaskSet(self, netmask):
+        self._netmask = netmask
+
+    @remote
+    def NetmaskGet(self):
+        return self._netmask
+
+    @remote
+    def GatewaySet(self, gateway):
+        self._gateway = gateway
+
+    @remote
+    def GatewayGet(self):
+        return self._gateway
+
+    @remote
+    def Resolve(self, address):
+        number = sum(bytearray(address.encode('ascii'))) & 0xffff
+        return '00:ff:ee:00:%02x:%02x' % (number >> 8, number & 255)
+
+
+class ByteBlowerPort(Object):
+    def __init__(self, server, interface):
+        Object.__init__(self, server)
+        self._server = server
+        self._interface = interface
+        self._l2 = Layer2EthII(self)
+        self._l3 = None
+        self._vlans = []
+        self._streams = []
+        self._triggers = []
+        self._http_clients = []
+        self._http_servers = []
+
+    def _l3_address(self):
+        return self._l3._ip if self._l3 is not None else None
+
+    @remote
+    def InterfaceNameGet(self):
+        return self._interface
+
+    @remote
+    def Layer2EthIISet(self):
+        return self._l2
+
+    def Layer2EthIIGet(self):
+        return self._l2
+
+    @remote
+    def Layer25VlanAdd(self):
+        vlan = Layer25Vlan(self)
+        self._vlans.append(vlan)
+        return vlan
+
+    @remote
+    def Layer3IPv4Set(self):
+        self._l3 = Layer3(self, 4)
+        return self._l3
+
+    @remote
+    def Layer3IPv6Set(self):
+        self._l3 = Layer3(self, 6)
+        return self._l3
+
+    def Layer3IPv4Get(self):
+        return self._l3
+
+    Layer3IPv6Get = Layer3IPv4Get
+
+    @remote
+    def TxStreamAdd(self):
+        stream = TxStream(self)
+        self._streams.append(stream)
+        return stream
+
+    @remote
+    def TxStreamRemove(self, stream):
+        self._streams.remove(stream)
+        self._server._unindex_stream(stream)
+
+    @remote
+    def RxTriggerBasicAdd(self):
+        trigger = RxTriggerBasic(self)
+        self._triggers.append(trigger)
+        return trigger
+
+    @remote
+    def RxTriggerBasicRemove(self, trigger):
+        self._triggers.remove(trigger)
+
+    @remote
+    def RxCaptureBasicAdd(self):
+        return RxCaptureBasic(self)
+
+    @remote
+    def RxCaptureBasicRemove(self, capture):
+        pass
+
+    @remote
+    def ProtocolHttpClientAdd(self):
+        client = HTTPClient(self)
+        self._http_clients.append(client)
+        return client
+
+    @remote
+    def ProtocolHttpClientRemove(self, client):
+        self._http_clients.remove(client)
+
+    @remote
+    def ProtocolHttpServerAdd(self):
+        server = HTTPServer(self)
+        self._http_servers.append(server)
+        return server
+
+    @remote
+    def ProtocolHttpServerRemove(self, server):
+        self._http_servers.remove(server)
+
+    def _start(self, now):
+        for stream in self._streams:
+            stream._start(now)
+        for client in self._http_clients:
+            client._start(now)
+
+    @remote
+    def Start(self):
+        self._start(_now())
+
+    @remote
+    def Stop(self):
+        for stream in self._streams:
+            stream.Stop()
+
+    @remote
+    def DescriptionGet(self):
+        return 'ByteBlowerPort on %s (%s, %s), %d streams, %d triggers' % (
+            self._interface, self._l2._mac, self._l3_address(),
+            len(self._streams), len(self._triggers))
+
+
+class User(Object):
+    _local_getters = True
+
+    def __init__(self, name, interface):
+        Object.__init__(self)
+        self._name = name
+        self._interface = NetworkInterface(interface)
+
+    def NameGet(self):
+        return self._name
+
+    def InterfaceGet(self):
+        return self._interface
+
+
+class NetworkInterface(Object):
+    _local_getters = True
+
+    def __init__(self, name):
+        Object.__init__(self)
+        self._name = name
+
+    def NameGet(self):
+        return self._name
+
+
+class ServiceInfo(Object):
+    _local_getters = True
+
+    def VersionGet(self):
+        return '2.20.0'
+
+
+class ByteBlowerServer(Object):
+    def __init__(self, address):
+        Object.__init__(self)
+        self._address = address
+        self._ports = []
+        self._addresses = itertools.count(2)
+        # (destination IP, destination UDP port) -> streams
+        self._stream_index = {}
+
+    def _index_stream(self, stream):
+        self._unindex_stream(stream)
+        stream._index_keys = set(frame._key for frame in stream._frames
+                                 if frame._key is not None)
+        for key in stream._index_keys:
+            self._stream_index.setdefault(key, []).append(stream)
+
+    def _unindex_stream(self, stream):
+        for key in stream._index_keys:
+            self._stream_index[key].remove(stream)
+        stream._index_keys = set()
+
+    def _streams_to(self, key):
+        if key is None:
+            return []
+        return self._stream_index.get(key, [])
+
+    @remote
+    def PortCreate(self, interface):
+        port = ByteBlowerPort(self, interface)
+        self._ports.append(port)
+        return port
+
+    @remote
+    def PortDestroy(self, port):
+        if port in self._ports:
+            self._ports.remove(port)
+            for stream in port._streams:
+                self._unindex_stream(stream)
+
+    @remote
+    def PortsStart(self, ports):
+        now = _now()
+        for port in ports:
+            port._start(now)
+
+    @remote
+    def PortsStop(self, ports):
+        for port in ports:
+            port.Stop()
+
+    @remote
+    def ResultsRefreshAll(self):
+        _sent_cache.clear()
+        now = _now()
+        for port in self._ports:
+            for item in itertools.chain(port._streams, port._triggers):
+                item._result._update(now)
+                item._history._update(now)
+
+    @remote
+    def UsersGet(self):
+        return [User('fake@localhost', port._interface) for port in self._ports]
+
+    @remote
+    def ServiceInfoGet(self):
+        return ServiceInfo()
+
+    @remote
+    def TimestampGet(self):
+        return _now()
+
+    @remote
+    def DescriptionGet(self):
+        return 'Fake ByteBlower server %s with %d ports' % (
+            self._address, len(self._ports))
+
+
+# -- meeting point
+
+class NetworkInfo(Object):
+    _local_getters = True
+
+    def __init__(self, device):
+        Object.__init__(self, device)
+        self._ip = '192.168.1.%d' % (100 + device._number)
+
+    def IPv4Get(self):
+        return self._ip
+
+    def IPv6GlobalGet(self):
+        return StringList()
+
+
+class DeviceInfo(Object):
+    _local_getters = True
+
+    def __init__(self, device):
+        Object.__init__(self, device)
+        self._network_info = NetworkInfo(device)
+
+    def GivenNameGet(self):
+        return 'Fake endpoint %d' % self._parent._number
+
+    def NetworkInfoGet(self):
+        return self._network_info
+
+
+class WirelessEndpoint(ByteBlowerPort):
+    def __init__(self, meetingpoint, number):
+        ByteBlowerPort.__init__(self, meetingpoint._server, 'wireless')
+        self._number = number
+        self._uuid = '00000000-0000-4000-8000-%012d' % number
+        self._info = DeviceInfo(self)
+        self._locked = False
+        self._running_until = None
+
+    def DeviceIdentifierGet(self):
+        return self._uuid
+
+    def DeviceInfoGet(self):
+        return self._info
+
+    def _l3_address(self):
+        return self._info._network_info._ip
+
+    @remote
+    def Lock(self, locked):
+        self._locked = locked
+
+    @remote
+    def StatusGet(self):
+        if self._running_until is not None and _now() < self._running_until:
+            return DeviceStatus.Running
+        return DeviceStatus.Reserved if self._locked else DeviceStatus.Available
+
+    @remote
+    def Prepare(self):
+        pass
+
+    @remote
+    def Start(self):
+        start = _now() + 1000000000
+        self._start(start)
+        durations = [c._duration() + c._initial_time_to_wait
+                     for c in self._http_clients]
+        durations += [s._number_of_frames * s._interframe_gap
+                      for s in self._streams]
+        self._running_until = start + max(durations or [0])
+        return start
+
+    @remote
+    def ResultGet(self):
+        pass
+
+    @remote
+    def DescriptionGet(self):
+        return 'Fake wireless endpoint %s' % self._uuid
+
+
+class MeetingPoint(Object):
+    def __init__(self, address):
+        Object.__init__(self)
+        self._address = address
+        self._server = ByteBlowerServer(address)
+        self._devices = [WirelessEndpoint(self, number)
+                         for number in range(options['wireless_endpoints'])]
+
+    @remote
+    def DeviceListGet(self):
+        return WirelessEndpointList(self._devices)
+
+    @remote
+    def DeviceGet(self, uuid):
+        for device in self._devices:
+            if device._uuid == uuid:
+                return device
+        raise ConfigError("Unknown device %s" % uuid)
+
+    @remote
+    def UsersGet(self):
+        return []
+
+    @remote
+    def TimestampGet(self):
+        return _now()
+
+    @remote
+    def ServiceInfoGet(self):
+        return ServiceInfo()
+
+
+# -- the entry point
+
+class ByteBlower(object):
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def InstanceGet():
+        with ByteBlower._lock:
+            if ByteBlower._instance is None:
+                ByteBlower._instance = ByteBlower()
+            return ByteBlower._instance
+
+    def APIVersionGet(self):
+        return API_VERSION
+
+    @remote
+    def ServerAdd(self, address):
+        return ByteBlowerServer(address)
+
+    def ServerRemove(self, server):
+        pass
+
+    @remote
+    def MeetingPointAdd(self, address):
+        return MeetingPoint(address)
+
+    def MeetingPointRemove(self, meetingpoint):
+        pass
+
+    @remote
+    def ResultsRefresh(self, results):
+        _sent_cache.clear()
+        now = _now()
+        for result in results:
+            result._update(now)
+
+    @remote
+    def PortsStart(self, ports):
+        now = _now()
+        for port in ports:
+            port._start(now)
+
+    @remote
+    def PortsStop(self, ports):
+        for port in ports:
+            port.Stop()
+
+
+def install(**kwargs):
+    """Makes `import byteblowerll.byteblower` import the fake
+
+    :param kwargs: Options of the fake, see `options`
+    """
+    unknown = set(kwargs) - set(options)
+    if unknown:
+        raise ValueError("Unknown options: %s" % ', '.join(sorted(unknown)))
+    options.update(kwargs)
+
+    module = sys.modules[__name__]
+    # The classes pretend to be part of the API, e.g. for the API tracer
+    for value in vars(module).values():
+        if isinstance(value, type) and value.__module__ == __name__:
+            value.__module__ = 'byteblowerll.byteblower'
+    package = sys.modules.get('byteblowerll')
+    if package is None or getattr(package, 'byteblower', None) is not module:
+        package = types.ModuleType('byteblowerll')
+        package.__path__ = []
+        package.byteblower = module
+    sys.modules['byteblowerll'] = package
+    sys.modules['byteblowerll.byteblower'] = module
+    return module
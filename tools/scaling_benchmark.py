@@ -0,0 +1,399 @@
+#!/usr/bin/python
+"""
+Measures how the client side of the examples scales with the number of
+flows, on the in-process fake of the ByteBlower API (fake_byteblower.py).
+
+For every scenario and number of flows the benchmark measures:
+  - setup: the time to create and configure all flows,
+  - poll: the time of one iteration of the result loop of the example,
+    refreshing and processing the results of all flows,
+  - memory: the memory allocated per flow during the setup (Python 3 only).
+
+The scenarios use the building blocks of the examples themselves:
+  - ipv4_multiflow: Example.provision_port and Example.create_flow of
+    back2back/ipv4_multiflow.py, results refreshed with ResultsRefresh
+  - udp_traffic: Device and UdpTrafficProfile of
+    back2back/use_cases/udp_traffic_with_resolving.py, results refreshed
+    with ResultsRefreshAll and processed by the rolling statistics
+  - http_clients: the HTTPClientLauncher used by
+    back2back/use_cases/multi_interface_tcp.py
+  - ipv4_multiflow_aggregated, udp_traffic_aggregated: the same with a
+    single trigger per receiving port (aggregate_receive), the received
+    frames per flow are estimated from a sampling capture
+
+The examples build their frames with scapy, it must be installed.
+
+Usage:
+    python scaling_benchmark.py [--flows 1 10 100] [--latency 0.0005]
+                                [--json benchmark.json] [scenario ...]
+
+With a latency, every round trip to the (fake) server takes that long:
+the setup time then shows the number of API calls per flow.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.7
+    tracemalloc = None
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    # Python 2.7
+    clock = time.time
+
+import fake_byteblower
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(_HERE, '..', 'back2back'))
+sys.path.append(os.path.join(_HERE, '..', 'back2back', 'use_cases'))
+
+configuration = {
+    # Scenarios to run, see SCENARIOS
+    'scenarios': ['ipv4_multiflow', 'ipv4_multiflow_aggregated',
+                  'udp_traffic', 'udp_traffic_aggregated', 'http_clients'],
+
+    # Number of flows to measure
+    'flow_counts': [1, 10, 100, 1000, 10000],
+
+    # Number of poll iterations to average
+    'polls': 5,
+
+    # Options of the fake ByteBlower API, see fake_byteblower.options
+    'fake': {
+        # Round trip time to the server, in seconds
+        'latency': 0.0,
+        'loss': 0.01,
+        # Short intervals, every poll processes a new interval
+        'interval_duration': 10000000,
+    },
+
+    # When set, the results are also written to this JSON file
+    'json_file': None,
+}
+
+
+class Scenario(object):
+    """A scenario creates `flows` flows on a fake server
+
+    Subclasses implement setup(), poll() and cleanup().  load() imports
+    the modules of the example, this is not part of the measured setup.
+    """
+    name = None
+
+    def __init__(self, flows):
+        self.flows = flows
+        self.instance = None
+        self.server = None
+
+    def load(self):
+        pass
+
+    def connect(self):
+        from byteblowerll.byteblower import ByteBlower
+        self.instance = ByteBlower.InstanceGet()
+        self.server = self.instance.ServerAdd('fake-server')
+
+    def cleanup(self):
+        self.instance.ServerRemove(self.server)
+
+
+def _quiet(function, *args, **kwargs):
+    """Calls function with its print output discarded"""
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        return function(*args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+class Ipv4Multiflow(Scenario):
+    name = 'ipv4_multiflow'
+    aggregate_receive = False
+
+    def load(self):
+        import ipv4_multiflow
+        # The flows import scapy to build their frame
+        import scapy.all
+        self.module = ipv4_multiflow
+
+    def setup(self):
+        from byteblowerll.byteblower import AbstractRefreshableResultList
+        from byteblowerll.byteblower import ByteBlowerPortList
+
+        config = copy.deepcopy(self.module.configuration)
+        config['number_of_downstream_flows'] = self.flows
+        config['number_of_upstream_flows'] = 0
+        config['aggregate_receive'] = self.aggregate_receive
+        self.example = self.module.Example(**config)
+
+        self.connect()
+        self.example.server = self.server
+        self.example.port_1 = _quiet(self.example.provision_port,
+                                     self.example.port_1_config)
+        self.example.port_2 = _quiet(self.example.provision_port,
+                                     self.example.port_2_config)
+
+        self.results = AbstractRefreshableResultList()
+        port_1, port_2 = self.example.port_1, self.example.port_2
+        self.flow_objects = []
+        for _ in range(self.flows):
+            udp_port = self.example.udp_dst
+            stream, trigger = self.example.create_flow(port_1, port_2)
+            self.flow_objects.append((port_1, port_2, stream, trigger,
+                                      udp_port))
+            self.results.append(stream.ResultGet())
+            self.results.append(stream.ResultHistoryGet())
+            if trigger is not None:
+                self.results.append(trigger.ResultGet())
+                self.results.append(trigger.ResultHistoryGet())
+        for receiver in self.example.receivers.values():
+            receiver.create()
+            for result in receiver.get_results_to_refresh():
+                self.results.append(result)
+        self.matrix = self.example.create_flow_matrix(self.flow_objects)
+
+        for _, _, stream, trigger, udp_port in self.flow_objects:
+            if trigger is not None:
+                trigger.ResultClear()
+        for receiver in self.example.receivers.values():
+            receiver.reset_results()
+        ports = ByteBlowerPortList()
+        ports.push_back(self.example.port_1.port)
+        self.server.PortsStart(ports)
+
+    def poll(self):
+        self.instance.ResultsRefresh(self.results)
+        for receiver in self.example.receivers.values():
+            receiver.sample()
+        counters = self.matrix.collect(interval=True)
+        counters.loss_percent()
+        self.matrix.summary(counters, 'direction')
+
+    def cleanup(self):
+        self.example.cleanup()
+
+
+class Ipv4MultiflowAggregated(Ipv4Multiflow):
+    name = 'ipv4_multiflow_aggregated'
+    aggregate_receive = True
+
+
+class UdpTraffic(Scenario):
+    name = 'udp_traffic'
+    aggregate_receive = False
+
+    def load(self):
+        import udp_traffic_with_resolving
+        import scapy.all
+        self.module = udp_traffic_with_resolving
+
+    def setup(self):
+        udp_traffic = self.module
+
+        self.connect()
+        self.wan = udp_traffic.Device(interface='nontrunk-1', ip='10.1.0.2',
+                                      netmask='255.255.255.0',
+                                      gateway='10.1.0.1')
+        self.cpe = udp_traffic.Device(interface='trunk-1-13', dhcp=True)
+        self.wan.create_on_server(self.server)
+        self.cpe.create_on_server(self.server)
+
+        profile = udp_traffic.UdpTrafficProfile(
+            interframegap=1000000, aggregate_receive=self.aggregate_receive)
+        self.udp_flows = [
+            profile.create_between('flow %d' % number, number, self.wan,
+                                   self.cpe, number_of_frames=100000)
+            for number in range(self.flows)
+        ]
+        for flow in self.udp_flows:
+            flow.reset_results()
+        self.receivers = list(profile.receivers.values())
+        for receiver in self.receivers:
+            receiver.create()
+
+        from byteblowerll.byteblower import ByteBlowerPortList
+        ports = ByteBlowerPortList()
+        ports.push_back(self.wan.bbport)
+        self.server.PortsStart(ports)
+        self.rules = udp_traffic.ThresholdRules([
+            {'metric': 'loss_ewma', 'above': 5.0, 'hard': True},
+        ])
+
+    def poll(self):
+        self.server.ResultsRefreshAll()
+        for receiver in self.receivers:
+            receiver.sample()
+        for flow in self.udp_flows:
+            if flow.process_interval_results():
+                self.rules.evaluate(flow.statistics.metrics())
+
+    def cleanup(self):
+        for device in [self.cpe, self.wan]:
+            self.server.PortDestroy(device.bbport)
+        Scenario.cleanup(self)
+
+
+class UdpTrafficAggregated(UdpTraffic):
+    name = 'udp_traffic_aggregated'
+    aggregate_receive = True
+
+
+class HttpClients(Scenario):
+    name = 'http_clients'
+
+    def setup(self):
+        from byteblowerll.byteblower import HTTPRequestMethod
+        from http_client_launcher import HTTPClientLauncher
+
+        self.connect()
+        self.ports = []
+        for interface in ['nontrunk-1', 'trunk-1-13']:
+            port = self.server.PortCreate(interface)
+            port.Layer2EthIISet().MacSet('00:bb:01:00:00:%02x'
+                                         % (len(self.ports) + 1))
+            port.Layer3IPv4Set().ProtocolDhcpGet().Perform()
+            self.ports.append(port)
+
+        http_server = self.ports[0].ProtocolHttpServerAdd()
+        http_server.PortSet(80)
+        http_server.Start()
+        server_ip = self.ports[0].Layer3IPv4Get().IpGet()
+
+        def configure(http_client, index):
+            http_client.RemoteAddressSet(server_ip)
+            http_client.RemotePortSet(80)
+            http_client.HttpMethodSet(HTTPRequestMethod.Get)
+            http_client.RequestDurationSet(60 * 1000000000)
+
+        # All clients start at once, every poll refreshes all of them
+        self.launcher = HTTPClientLauncher(batch_size=self.flows)
+        self.launcher.create(self.ports[1:], self.flows, configure)
+        self.launcher.start()
+
+    def poll(self):
+        self.launcher.poll()
+
+    def cleanup(self):
+        for port in self.ports:
+            self.server.PortDestroy(port)
+        Scenario.cleanup(self)
+
+
+SCENARIOS = dict((scenario.name, scenario)
+                 for scenario in [Ipv4Multiflow, Ipv4MultiflowAggregated,
+                                  UdpTraffic, UdpTrafficAggregated,
+                                  HttpClients])
+
+
+def measure(scenario_class, flows, polls):
+    """Runs a scenario with `flows` flows
+
+    :return: dict with the setup time, poll time (both in seconds) and the
+             memory per flow (in bytes, None on Python 2.7)
+    """
+    scenario = scenario_class(flows)
+    scenario.load()
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    start = clock()
+    scenario.setup()
+    setup_time = clock() - start
+
+    memory = None
+    if tracemalloc is not None:
+        memory = tracemalloc.get_traced_memory()[0] / flows
+        tracemalloc.stop()
+
+    poll_times = []
+    for _ in range(polls):
+        # Let the (fake) traffic progress to the next interval
+        time.sleep(fake_byteblower.options['interval_duration'] / 1e9)
+        start = clock()
+        scenario.poll()
+        poll_times.append(clock() - start)
+
+    scenario.cleanup()
+    return {
+        'scenario': scenario_class.name,
+        'flows': flows,
+        'setup': setup_time,
+        'setup_per_flow': setup_time / flows,
+        'poll': sum(poll_times) / len(poll_times),
+        'poll_per_flow': sum(poll_times) / len(poll_times) / flows,
+        'memory_per_flow': memory,
+    }
+
+
+def print_result(result):
+    memory = result['memory_per_flow']
+    print("%-15s %6d flows  setup %8.3fs (%7.1fus/flow)  "
+          "poll %8.4fs (%6.1fus/flow)  memory %s" % (
+              result['scenario'], result['flows'],
+              result['setup'], result['setup_per_flow'] * 1e6,
+              result['poll'], result['poll_per_flow'] * 1e6,
+              '%.1f kB/flow' % (memory / 1024) if memory is not None else '-'))
+
+
+def main(config):
+    fake_byteblower.install(**config['fake'])
+
+    results = []
+    for name in config['scenarios']:
+        for flows in config['flow_counts']:
+            result = measure(SCENARIOS[name], flows, config['polls'])
+            print_result(result)
+            results.append(result)
+
+    if config['json_file']:
+        with open(config['json_file'], 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*',
+                        help='Scenarios to run (%s), all by default'
+                             % ', '.join(sorted(SCENARIOS)))
+    parser.add_argument('--flows', nargs='+', type=int,
+                        help='Numbers of flows to measure')
+    parser.add_argument('--latency', type=float,
+                        help='Round trip time of every API call, in seconds')
+    parser.add_argument('--polls', type=int,
+                        help='Number of poll iterations to average')
+    parser.add_argument('--json', dest='json_file',
+                        help='Write the results to this JSON file')
+    arguments = parser.parse_args()
+    for name in arguments.scenarios:
+        if name not in SCENARIOS:
+            parser.error("Unknown scenario '%s'" % name)
+
+    if arguments.scenarios:
+        configuration['scenarios'] = arguments.scenarios
+    if arguments.flows:
+        configuration['flow_counts'] = arguments.flows
+    if arguments.latency is not None:
+        configuration['fake']['latency'] = arguments.latency
+    if arguments.polls:
+        configuration['polls'] = arguments.polls
+    if arguments.json_file:
+        configuration['json_file'] = arguments.json_file
+
+    main(configuration)
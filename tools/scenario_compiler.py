@@ -0,0 +1,1202 @@
+#!/usr/bin/python
+"""
+Runs a test described in a scenario file, instead of a Python script.
+
+A scenario file (JSON, or YAML when PyYAML is installed) describes the
+servers, ByteBlower ports, wireless endpoints, UDP flows, TCP (HTTP)
+sessions and the timing of a test, see scenarios/ for examples.  The
+compiler turns it into API calls:
+  - the whole scenario is validated before the first API call: unknown
+    references, missing or invalid settings, values out of range (e.g. an
+    inter-frame gap of 0 or a frame size beyond the Ethernet limits) and
+    conflicting UDP ports are all reported at once,
+  - shared objects are created only once: ports, servers or wireless
+    endpoints which are declared twice, the HTTP server of many TCP
+    sessions, the address resolution between two ports and the frame of
+    the flows between two endpoints,
+  - the calls are ordered in steps: connect, ports, addresses, resolve,
+    frames, servers, flows, receivers, prepare, start.  Within a step the
+    independent actions run in parallel (e.g. the DHCP of all ports), the
+    results of all flows are refreshed in a single call.
+
+With --dry-run nothing is sent to a server: the compiler reports the steps
+with the number of API calls and the predicted setup time, from a cost
+model of a round trip and of the slow operations (DHCP, address
+resolution, preparing a wireless endpoint).
+
+Usage:
+    python scenario_compiler.py [--dry-run] [--round-trip 0.002]
+                                [--workers 16] [--json results.json]
+                                scenario.json
+"""
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import copy
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+
+try:
+    import yaml
+except ImportError:
+    # Only JSON scenarios
+    yaml = None
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# The receivers and flow matrix are shared with the back2back examples, the
+# address allocator with the server management examples and the clock
+# synchronization with the wireless endpoint examples.
+sys.path.append(os.path.join(_HERE, '..', 'back2back'))
+sys.path.append(os.path.join(_HERE, '..', 'server_management'))
+sys.path.append(os.path.join(_HERE, '..', 'wireless_endpoint'))
+from aggregated_receive import AggregatedReceiver
+
+configuration = {
+    # The scenario to run
+    'scenario': os.path.join(_HERE, 'scenarios', 'udp_and_tcp.json'),
+
+    # Only report the plan and its predicted cost, without a server
+    'dry_run': False,
+
+    # Maximum number of actions of a step which run at the same time
+    'workers': 16,
+
+    # When set, the results are also written to this JSON file
+    'json_file': None,
+
+    # Cost model of the dry run, in seconds
+    'costs': {
+        # A round trip to the server (every API call)
+        'round_trip': 0.002,
+        # A DHCP exchange, on top of its API call
+        'dhcp': 1.0,
+        # IPv6 stateless autoconfiguration
+        'slaac': 2.0,
+        # An address resolution (ARP or neighbour discovery)
+        'resolve': 0.05,
+        # Uploading the configuration to a wireless endpoint
+        'prepare': 1.0,
+        # Building a frame with scapy, locally
+        'frame': 0.01,
+    },
+}
+
+# Number of timestamp samples to synchronize with a meeting point
+CLOCK_SAMPLES = 8
+
+
+class ScenarioError(Exception):
+    """The scenario is invalid, `errors` lists all problems"""
+
+    def __init__(self, errors):
+        Exception.__init__(self, "%d error(s) in the scenario:\n  %s"
+                           % (len(errors), '\n  '.join(errors)))
+        self.errors = errors
+
+
+def load(filename):
+    """Reads a scenario from a JSON or YAML file"""
+    with open(filename) as f:
+        if os.path.splitext(filename)[1].lower() in ('.yaml', '.yml'):
+            if yaml is None:
+                raise ScenarioError(["%s: reading YAML needs PyYAML "
+                                     "(pip install pyyaml)" % filename])
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+# -- validation
+
+class _Validator(object):
+    """Collects the errors while the scenario is normalized"""
+
+    def __init__(self):
+        self.errors = []
+
+    def error(self, where, message, *args):
+        self.errors.append("%s: %s" % (where, message % args))
+
+    def get(self, where, section, key, types, default=None, required=False,
+            minimum=None, maximum=None):
+        if key not in section:
+            if required:
+                self.error(where, "'%s' is required", key)
+            return default
+        value = section[key]
+        if not isinstance(value, types):
+            self.error(where, "'%s' has an invalid value %r", key, value)
+            return default
+        if minimum is not None and value < minimum:
+            if maximum is None:
+                self.error(where, "'%s' must be at least %s, not %r",
+                           key, minimum, value)
+            else:
+                self.error(where, "'%s' must be between %s and %s, not %r",
+                           key, minimum, maximum, value)
+            return default
+        if maximum is not None and value > maximum:
+            self.error(where, "'%s' must be between %s and %s, not %r",
+                       key, minimum, maximum, value)
+            return default
+        return value
+
+    def reference(self, where, name, known, kind):
+        if name is not None and name not in known:
+            self.error(where, "unknown %s '%s'", kind, name)
+            return None
+        return name
+
+
+_STRING = (type(u''), str)
+_NUMBER = (int, float)
+
+# Size of an Ethernet frame without the FCS, in bytes
+MIN_FRAME_SIZE = 60
+MAX_FRAME_SIZE = 1514
+
+
+def _ip_type(where, ip, validator):
+    """4 or 6, from the 'ip' setting of a port"""
+    if isinstance(ip, _STRING):
+        if ip.lower() == 'dhcpv4':
+            return 4
+        if ip.lower() in ('dhcpv6', 'slaac'):
+            return 6
+    elif isinstance(ip, list) and len(ip) == 3:
+        return 4
+    elif isinstance(ip, list) and len(ip) == 2:
+        return 6
+    validator.error(where, "'ip' must be dhcpv4, dhcpv6, slaac, "
+                    "[ip, netmask, gateway] or [ipv6, prefix length]")
+    return None
+
+
+def validate(scenario):
+    """Checks the scenario and fills in the defaults
+
+    :return: the normalized scenario, with the flows expanded (`count`) and
+             the objects declared twice merged
+    :raises ScenarioError: with all problems of the scenario
+    """
+    validator = _Validator()
+    if not isinstance(scenario, dict):
+        raise ScenarioError(["the scenario must be a mapping"])
+
+    result = {'servers': {}, 'meetingpoints': {}, 'ports': {},
+              'wireless_endpoints': {}, 'udp_flows': [], 'tcp_flows': [],
+              'aliases': {}}
+
+    # Objects declared twice (same identity) are merged into the first one
+    def deduplicate(name, identity, seen):
+        if identity in seen:
+            result['aliases'][name] = seen[identity]
+            return seen[identity]
+        seen[identity] = name
+        return name
+
+    for kind in ['servers', 'meetingpoints']:
+        seen = {}
+        for name, item in sorted((scenario.get(kind) or {}).items()):
+            where = "%s.%s" % (kind, name)
+            address = validator.get(where, item, 'address', _STRING,
+                                    required=True)
+            if deduplicate(name, address, seen) == name:
+                result[kind][name] = {'address': address}
+
+    def resolve_alias(name):
+        return result['aliases'].get(name, name)
+
+    seen = {}
+    for name, item in sorted((scenario.get('ports') or {}).items()):
+        where = "ports.%s" % name
+        server = validator.reference(
+            where, validator.get(where, item, 'server', _STRING,
+                                 required=True),
+            scenario.get('servers') or {}, 'server')
+        port = {
+            'server': resolve_alias(server),
+            'interface': validator.get(where, item, 'interface', _STRING,
+                                       required=True),
+            'mac': validator.get(where, item, 'mac', _STRING),
+            'ip': item.get('ip', 'dhcpv4'),
+            'vlan': validator.get(where, item, 'vlan', int),
+        }
+        port['iptype'] = _ip_type(where, port['ip'], validator)
+        identity = json.dumps(port, sort_keys=True)
+        if port['mac'] is None:
+            # Every port without a MAC address gets its own
+            identity = name
+        if deduplicate(name, identity, seen) == name:
+            result['ports'][name] = port
+
+    # The same interface and MAC address with a different configuration
+    macs = {}
+    for name, port in sorted(result['ports'].items()):
+        if port['mac'] is None:
+            continue
+        key = (port['server'], port['interface'], port['mac'].lower())
+        if key in macs:
+            validator.error("ports.%s" % name, "same interface and MAC "
+                            "address as port '%s'", macs[key])
+        macs[key] = name
+
+    seen = {}
+    for name, item in sorted((scenario.get('wireless_endpoints') or {}).items()):
+        where = "wireless_endpoints.%s" % name
+        meetingpoint = validator.reference(
+            where, validator.get(where, item, 'meetingpoint', _STRING,
+                                 required=True),
+            scenario.get('meetingpoints') or {}, 'meeting point')
+        endpoint = {
+            'meetingpoint': resolve_alias(meetingpoint),
+            'uuid': validator.get(where, item, 'uuid', _STRING,
+                                  required=True),
+        }
+        identity = (endpoint['meetingpoint'], endpoint['uuid'])
+        if deduplicate(name, identity, seen) == name:
+            result['wireless_endpoints'][name] = endpoint
+
+    endpoints = set(scenario.get('ports') or {})
+    endpoints |= set(scenario.get('wireless_endpoints') or {})
+    timing = scenario.get('timing') or {}
+    default_duration = validator.get('timing', timing, 'duration_s', _NUMBER)
+    if default_duration is not None and default_duration <= 0:
+        validator.error('timing', "'duration_s' must be positive, not %r",
+                        default_duration)
+        default_duration = None
+
+    # UDP destination ports in use, per receiving endpoint
+    udp_ports = {}
+    for index, item in enumerate(scenario.get('flows') or []):
+        where = "flows[%d]" % index
+        name = validator.get(where, item, 'name', _STRING,
+                             default='flow %d' % (index + 1))
+        where = "flows.%s" % name
+        flow_type = validator.get(where, item, 'type', _STRING, default='udp')
+        count = validator.get(where, item, 'count', int, default=1,
+                              minimum=1)
+        duration = validator.get(where, item, 'duration_s', _NUMBER,
+                                 default=default_duration)
+        if duration is not None and duration <= 0:
+            validator.error(where, "'duration_s' must be positive, not %r",
+                            duration)
+            continue
+
+        if flow_type == 'udp':
+            source = resolve_alias(validator.reference(
+                where, validator.get(where, item, 'source', _STRING,
+                                     required=True), endpoints, 'endpoint'))
+            destination = resolve_alias(validator.reference(
+                where, validator.get(where, item, 'destination', _STRING,
+                                     required=True), endpoints, 'endpoint'))
+            interframegap = validator.get(where, item, 'interframegap_ns',
+                                          int, default=1000000, minimum=1)
+            number_of_frames = validator.get(where, item, 'number_of_frames',
+                                             int, minimum=1)
+            if number_of_frames is None:
+                if duration is None:
+                    validator.error(where, "'number_of_frames' or "
+                                    "'duration_s' is required")
+                    continue
+                number_of_frames = int(math.ceil(duration * 1e9
+                                                 / interframegap))
+            flow = {
+                'source': source,
+                'destination': destination,
+                'frame_size': validator.get(where, item, 'frame_size', int,
+                                            default=512,
+                                            minimum=MIN_FRAME_SIZE,
+                                            maximum=MAX_FRAME_SIZE),
+                'interframegap_ns': interframegap,
+                'number_of_frames': number_of_frames,
+                'aggregate': validator.get(where, item, 'aggregate', bool,
+                                           default=False),
+            }
+            wireless = result['wireless_endpoints']
+            if source is None or destination is None:
+                continue
+            if source in wireless and destination in wireless:
+                validator.error(where, "traffic between two wireless "
+                                "endpoints is not supported")
+                continue
+            if flow['aggregate'] and destination in wireless:
+                validator.error(where, "only flows to a ByteBlower port "
+                                "can be aggregated")
+            iptypes = set(result['ports'][e]['iptype']
+                          for e in (source, destination)
+                          if e in result['ports'])
+            if len(iptypes) > 1:
+                validator.error(where, "the source and destination have a "
+                                "different IP version")
+            if (source in wireless or destination in wireless) \
+                    and iptypes != set([4]):
+                validator.error(where, "wireless endpoints only support "
+                                "IPv4 flows here")
+
+            # Consecutive UDP ports, unique per receiving endpoint
+            used = udp_ports.setdefault(destination, set())
+            first = validator.get(where, item, 'udp_port', int,
+                                  minimum=1, maximum=65535)
+            if first is None:
+                first = max(used | set([4095])) + 1
+            for number in range(count):
+                udp_port = first + number
+                if udp_port > 65535:
+                    validator.error(where, "%d flows from UDP port %d do not "
+                                    "fit below 65536", count, first)
+                    break
+                if udp_port in used:
+                    validator.error(where, "UDP port %d is already used "
+                                    "towards '%s'", udp_port, destination)
+                    break
+                used.add(udp_port)
+                expanded = dict(flow, udp_port=udp_port,
+                                name=name if count == 1
+                                else "%s %d" % (name, number + 1))
+                result['udp_flows'].append(expanded)
+
+        elif flow_type == 'tcp':
+            client = resolve_alias(validator.reference(
+                where, validator.get(where, item, 'client', _STRING,
+                                     required=True), endpoints, 'endpoint'))
+            server = resolve_alias(validator.reference(
+                where, validator.get(where, item, 'server', _STRING,
+                                     required=True), endpoints, 'endpoint'))
+            if server is not None and server not in result['ports']:
+                validator.error(where, "the HTTP server must run on a "
+                                "ByteBlower port")
+            if duration is None:
+                validator.error(where, "'duration_s' is required")
+                continue
+            method = validator.get(where, item, 'method', _STRING,
+                                   default='GET').upper()
+            if method not in ('GET', 'PUT'):
+                validator.error(where, "'method' must be GET or PUT")
+            for number in range(count):
+                result['tcp_flows'].append({
+                    'name': name if count == 1 else "%s %d" % (name,
+                                                               number + 1),
+                    'client': client,
+                    'server': server,
+                    'method': method,
+                    'duration_ns': int(duration * 1e9),
+                    'tcp_port': validator.get(where, item, 'tcp_port', int,
+                                              default=80, minimum=1,
+                                              maximum=65535),
+                })
+        else:
+            validator.error(where, "'type' must be udp or tcp")
+
+    if not result['udp_flows'] and not result['tcp_flows'] \
+            and not validator.errors:
+        validator.error('flows', "the scenario has no flows")
+
+    result['timing'] = {
+        'poll_interval_s': validator.get('timing', timing, 'poll_interval_s',
+                                         _NUMBER, default=1),
+        'rollout_s': validator.get('timing', timing, 'rollout_s', _NUMBER,
+                                   default=2),
+    }
+    durations = [f['number_of_frames'] * f['interframegap_ns'] / 1e9
+                 for f in result['udp_flows']]
+    durations += [f['duration_ns'] / 1e9 for f in result['tcp_flows']]
+    result['timing']['duration_s'] = max(durations or [0])
+
+    if validator.errors:
+        raise ScenarioError(validator.errors)
+    return result
+
+
+# -- plan
+
+class Action(object):
+    """A unit of work of a step
+
+    :param calls: The number of API calls (round trips) the action makes
+    :param wait: Time spent waiting on the network, besides the calls
+    """
+
+    def __init__(self, description, function, calls, wait=0.0):
+        self.description = description
+        self.function = function
+        self.calls = calls
+        self.wait = wait
+
+    def cost(self, costs):
+        return self.calls * costs['round_trip'] + self.wait
+
+
+class Step(object):
+    """Actions which only depend on earlier steps
+
+    :param parallel: Whether the actions may run at the same time
+    """
+
+    def __init__(self, name, parallel=True):
+        self.name = name
+        self.parallel = parallel
+        self.actions = []
+
+    def add(self, description, function, calls, wait=0.0):
+        self.actions.append(Action(description, function, calls, wait))
+
+    @property
+    def calls(self):
+        return sum(action.calls for action in self.actions)
+
+    def predict(self, costs, workers):
+        """Predicted duration of the step, in seconds"""
+        action_costs = [action.cost(costs) for action in self.actions]
+        if not action_costs:
+            return 0.0
+        if not self.parallel:
+            return sum(action_costs)
+        return max(max(action_costs), sum(action_costs) / workers)
+
+    def run(self, context, workers):
+        if not self.parallel or len(self.actions) <= 1:
+            for action in self.actions:
+                action.function(context)
+            return
+        _run_parallel([action.function for action in self.actions], context,
+                      workers)
+
+
+def _run_parallel(functions, context, workers):
+    """Calls all functions, at most `workers` at the same time"""
+    pending = list(reversed(functions))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                if not pending or errors:
+                    return
+                function = pending.pop()
+            try:
+                function(context)
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(min(workers, len(functions)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+class Context(object):
+    """The API objects created while the plan runs"""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.instance = None
+        self.servers = {}
+        self.meetingpoints = {}
+        self.ports = {}
+        # MAC address of every port, as it was configured
+        self.macs = {}
+        self.wireless_endpoints = {}
+        # IP address of every endpoint
+        self.addresses = {}
+        # Destination MAC address, by (source port, destination endpoint)
+        self.resolved = {}
+        # Frame template, by (source port, destination endpoint, frame size)
+        self.templates = {}
+        # HTTP server, by (port, TCP port)
+        self.http_servers = {}
+        # The receiver of the aggregated flows, by destination port
+        self.receivers = {}
+        # name -> dict with the API objects of the flow
+        self.udp_flows = {}
+        self.tcp_flows = {}
+        self.start_times = []
+        self.lock = threading.Lock()
+
+
+class Plan(object):
+    """The steps to set up a validated scenario"""
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.steps = []
+
+    def step(self, name, parallel=True):
+        step = Step(name, parallel)
+        self.steps.append(step)
+        return step
+
+    @property
+    def calls(self):
+        return sum(step.calls for step in self.steps)
+
+    def predict(self, costs, workers):
+        return sum(step.predict(costs, workers) for step in self.steps)
+
+    def poll_calls(self):
+        """API calls of one iteration of the result loop"""
+        calls = 1 if self.scenario['udp_flows'] else 0
+        # See AggregatedReceiver.sample
+        receivers = set(f['destination'] for f in self.scenario['udp_flows']
+                        if f['aggregate'])
+        return calls + 6 * len(receivers)
+
+    def report(self, costs, workers):
+        """Prints the steps, their API calls and predicted durations"""
+        print("%-10s %8s %10s %12s" % ('step', 'actions', 'API calls',
+                                       'predicted'))
+        for step in self.steps:
+            print("%-10s %8d %10d %11.2fs" % (
+                step.name, len(step.actions), step.calls,
+                step.predict(costs, workers)))
+        print("%-10s %8s %10d %11.2fs" % (
+            'setup', '', self.calls, self.predict(costs, workers)))
+        duration = self.scenario['timing']['duration_s'] \
+            + self.scenario['timing']['rollout_s']
+        print("Traffic runs %.1fs, every poll makes %d API calls"
+              % (duration, self.poll_calls()))
+        merged = self.scenario['aliases']
+        if merged:
+            print("Merged duplicates: %s" % ', '.join(
+                "%s -> %s" % item for item in sorted(merged.items())))
+
+    def run(self, context, workers):
+        for step in self.steps:
+            step.run(context, workers)
+
+
+def _hex(data):
+    return ''.join(format(b, '02x') for b in bytearray(data))
+
+
+def _ones_complement_sum(data):
+    """16-bit one's complement sum of the data, not folded"""
+    data = bytes(data)
+    if len(data) % 2:
+        data += b'\0'
+    return sum(struct.unpack('!%dH' % (len(data) // 2), data))
+
+
+def _fold(total):
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return total
+
+
+class FrameTemplate(object):
+    """A UDP frame between two endpoints, the UDP ports are filled in per
+    flow
+
+    scapy builds the frame only once, the checksum of a flow follows from
+    the partial sum of the template: the UDP ports are the only difference.
+    """
+
+    def __init__(self, frame, udp_offset, ipv6):
+        self.frame = bytearray(frame)
+        self.udp_offset = udp_offset
+        udp = self.frame[udp_offset:]
+        if ipv6:
+            pseudo = self.frame[udp_offset - 32:udp_offset] \
+                + struct.pack('!IxxxB', len(udp), 17)
+        else:
+            pseudo = self.frame[udp_offset - 8:udp_offset] \
+                + struct.pack('!xBH', 17, len(udp))
+        # The template has UDP ports and checksum 0
+        self.partial_sum = _ones_complement_sum(pseudo) \
+            + _ones_complement_sum(udp)
+
+    @classmethod
+    def build(cls, src_mac, dst_mac, vlan, src_ip, dst_ip, frame_size):
+        from scapy.layers.inet import UDP, IP, Ether
+        from scapy.layers.inet6 import IPv6
+        from scapy.all import Raw, Dot1Q
+        ipv6 = ':' in dst_ip
+        frame = Ether(src=src_mac, dst=dst_mac)
+        if vlan is not None:
+            frame /= Dot1Q(vlan=vlan)
+        if ipv6:
+            frame /= IPv6(src=src_ip, dst=dst_ip)
+        else:
+            frame /= IP(src=src_ip, dst=dst_ip)
+        udp_offset = len(frame)
+        frame /= UDP(sport=0, dport=0, chksum=0)
+        overhead = udp_offset + 8
+        frame /= Raw(b'a' * max(0, frame_size - overhead))
+        return cls(bytes(frame), udp_offset, ipv6)
+
+    def hexbytes(self, src_port, dst_port):
+        frame = bytearray(self.frame)
+        offset = self.udp_offset
+        checksum = ~_fold(self.partial_sum + src_port + dst_port) & 0xffff
+        struct.pack_into('!HH', frame, offset, src_port, dst_port)
+        struct.pack_into('!H', frame, offset + 6, checksum or 0xffff)
+        return _hex(frame)
+
+
+def compile_scenario(scenario, costs=None):
+    """Turns a validated scenario into a plan
+
+    :param scenario: see validate()
+    :rtype: Plan
+    """
+    costs = costs or configuration['costs']
+    plan = Plan(scenario)
+    ports = scenario['ports']
+    wireless = scenario['wireless_endpoints']
+    udp_flows = scenario['udp_flows']
+    tcp_flows = scenario['tcp_flows']
+
+    # connect
+    step = plan.step('connect')
+    for name, server in sorted(scenario['servers'].items()):
+        step.add("connect to server %s" % name,
+                 _connect_server(name, server['address']), calls=1)
+    for name, meetingpoint in sorted(scenario['meetingpoints'].items()):
+        step.add("connect to meeting point %s" % name,
+                 _connect_meetingpoint(name, meetingpoint['address']),
+                 calls=1)
+
+    # create the ports, every port on its own
+    step = plan.step('ports')
+    for name, port in sorted(ports.items()):
+        calls = 4 + (2 if port['vlan'] is not None else 0)
+        step.add("create port %s" % name, _create_port(name, port), calls)
+
+    # addresses: DHCP and autoconfiguration of all ports at once
+    step = plan.step('addresses')
+    for name, port in sorted(ports.items()):
+        ip = port['ip']
+        if isinstance(ip, list):
+            calls, wait = (3 if port['iptype'] == 4 else 1), 0.0
+        elif ip.lower() == 'slaac':
+            # autoconfiguration and reading the address
+            calls, wait = 2, costs['slaac']
+        else:
+            calls, wait = 2, costs['dhcp']
+        step.add("address of port %s" % name, _configure_address(name, port),
+                 calls, wait)
+    for name, endpoint in sorted(wireless.items()):
+        step.add("lock wireless endpoint %s" % name,
+                 _lock_wireless_endpoint(name, endpoint), calls=2)
+
+    # address resolution, once per pair of endpoints
+    step = plan.step('resolve')
+    pairs = sorted(set((f['source'], f['destination']) for f in udp_flows
+                       if f['source'] in ports))
+    for pair in pairs:
+        step.add("resolve %s -> %s" % pair, _resolve(*pair), calls=1,
+                 wait=costs['resolve'])
+
+    # frames, built once per pair of endpoints and frame size
+    step = plan.step('frames', parallel=False)
+    templates = sorted(set(
+        (f['source'], f['destination'], f['frame_size']) for f in udp_flows
+        if f['source'] in ports))
+    for key in templates:
+        step.add("frame %s -> %s, %d bytes" % key, _build_template(key),
+                 calls=0, wait=costs['frame'])
+
+    # HTTP servers, shared by all sessions to the same port and TCP port
+    step = plan.step('servers')
+    for key in sorted(set((f['server'], f['tcp_port']) for f in tcp_flows)):
+        step.add("HTTP server on %s:%d" % key, _create_http_server(*key),
+                 calls=3)
+
+    # the flows, the flows of an endpoint one after the other
+    step = plan.step('flows')
+    by_endpoint = {}
+    for flow in udp_flows:
+        by_endpoint.setdefault(flow['source'], []).append(('udp', flow))
+    for flow in tcp_flows:
+        by_endpoint.setdefault(flow['client'], []).append(('tcp', flow))
+    for endpoint, flows in sorted(by_endpoint.items()):
+        calls = 0
+        for flow_type, flow in flows:
+            if flow_type == 'tcp':
+                calls += 6 if endpoint in wireless else 5
+            else:
+                # Stream on a wireless endpoint or on a port
+                calls += 8 if endpoint in wireless else 5
+                if flow['destination'] in wireless:
+                    calls += 5
+                elif not flow['aggregate']:
+                    calls += 2
+        step.add("%d flows of %s" % (len(flows), endpoint),
+                 _create_flows(endpoint, flows), calls)
+
+    # a single trigger per destination for the aggregated flows
+    step = plan.step('receivers')
+    receivers = {}
+    for flow in udp_flows:
+        if flow['aggregate']:
+            receivers.setdefault(flow['destination'], []).append(flow)
+    for destination, flows in sorted(receivers.items()):
+        step.add("receiver of %d flows to %s" % (len(flows), destination),
+                 _create_receiver(destination, flows), calls=5)
+
+    # upload the configuration to the wireless endpoints
+    step = plan.step('prepare')
+    for name in sorted(wireless):
+        step.add("prepare wireless endpoint %s" % name,
+                 _prepare(name), calls=1, wait=costs['prepare'])
+
+    # start everything at once
+    step = plan.step('start', parallel=False)
+    calls = len(wireless)
+    if wireless:
+        calls += CLOCK_SAMPLES
+    calls += len(set(ports[f['source']]['server'] for f in udp_flows
+                     if f['source'] in ports))
+    calls += len([f for f in tcp_flows if f['client'] in ports])
+    step.add("start the traffic", _start, calls)
+    return plan
+
+
+# -- the actions
+
+def _connect_server(name, address):
+    def action(context):
+        context.servers[name] = context.instance.ServerAdd(address)
+    return action
+
+
+def _connect_meetingpoint(name, address):
+    def action(context):
+        context.meetingpoints[name] = context.instance.MeetingPointAdd(address)
+    return action
+
+
+def _create_port(name, config):
+    def action(context):
+        mac = config['mac']
+        if mac is None:
+            from address_allocator import Allocator, DEFAULT_STATE_FILE
+            with context.lock:
+                if getattr(context, 'allocator', None) is None:
+                    context.allocator = Allocator(DEFAULT_STATE_FILE)
+                mac = context.allocator.pools['mac'].allocate()
+        port = context.servers[config['server']].PortCreate(
+            config['interface'])
+        port.Layer2EthIISet().MacSet(mac)
+        context.macs[name] = mac
+        if config['vlan'] is not None:
+            port.Layer25VlanAdd().IDSet(config['vlan'])
+        if config['iptype'] == 4:
+            port.Layer3IPv4Set()
+        else:
+            port.Layer3IPv6Set()
+        context.ports[name] = port
+    return action
+
+
+def _configure_address(name, config):
+    def action(context):
+        port = context.ports[name]
+        ip = config['ip']
+        if config['iptype'] == 4:
+            l3 = port.Layer3IPv4Get()
+            if isinstance(ip, list):
+                l3.IpSet(ip[0])
+                l3.NetmaskSet(ip[1])
+                l3.GatewaySet(ip[2])
+                address = ip[0]
+            else:
+                l3.ProtocolDhcpGet().Perform()
+                address = l3.IpGet()
+        else:
+            l3 = port.Layer3IPv6Get()
+            if isinstance(ip, list):
+                l3.IpManualAdd("%s/%s" % (ip[0], ip[1]))
+                address = ip[0]
+            elif ip.lower() == 'slaac':
+                l3.StatelessAutoconfiguration()
+                address = l3.IpStatelessGet()[0]
+            else:
+                l3.ProtocolDhcpGet().Perform()
+                address = l3.IpDhcpGet()[0]
+        context.addresses[name] = str(address).split('/')[0]
+    return action
+
+
+def _lock_wireless_endpoint(name, config):
+    def action(context):
+        meetingpoint = context.meetingpoints[config['meetingpoint']]
+        endpoint = meetingpoint.DeviceGet(config['uuid'])
+        endpoint.Lock(True)
+        context.wireless_endpoints[name] = endpoint
+        context.addresses[name] = \
+            endpoint.DeviceInfoGet().NetworkInfoGet().IPv4Get()
+    return action
+
+
+def _resolve(source, destination):
+    def action(context):
+        port = context.ports[source]
+        l3 = port.Layer3IPv4Get() if ':' not in context.addresses[source] \
+            else port.Layer3IPv6Get()
+        context.resolved[(source, destination)] = \
+            l3.Resolve(context.addresses[destination])
+    return action
+
+
+def _build_template(key):
+    source, destination, frame_size = key
+
+    def action(context):
+        config = context.scenario['ports'][source]
+        context.templates[key] = FrameTemplate.build(
+            context.macs[source], context.resolved[(source, destination)],
+            config['vlan'], context.addresses[source],
+            context.addresses[destination], frame_size)
+    return action
+
+
+def _create_http_server(port_name, tcp_port):
+    def action(context):
+        http_server = context.ports[port_name].ProtocolHttpServerAdd()
+        http_server.PortSet(tcp_port)
+        http_server.Start()
+        context.http_servers[(port_name, tcp_port)] = http_server
+    return action
+
+
+def _trigger_filter(context, flow, with_port=True):
+    destination = flow['destination']
+    elements = []
+    vlan = context.scenario['ports'][destination]['vlan']
+    if vlan is not None:
+        elements.append("vlan %d" % vlan)
+    address = context.addresses[destination]
+    elements.append(("ip6 dst %s" if ':' in address else "ip dst %s")
+                    % address)
+    if with_port:
+        elements.append("udp dst port %d" % flow['udp_port'])
+    return elements
+
+
+def _create_flows(endpoint, flows):
+    def action(context):
+        for flow_type, flow in flows:
+            if flow_type == 'tcp':
+                objects = _create_tcp_flow(context, flow)
+                with context.lock:
+                    context.tcp_flows[flow['name']] = objects
+            else:
+                objects = _create_udp_flow(context, flow)
+                with context.lock:
+                    context.udp_flows[flow['name']] = objects
+    return action
+
+
+def _create_udp_flow(context, flow):
+    scenario = context.scenario
+    source = flow['source']
+    destination = flow['destination']
+    objects = {'flow': flow, 'trigger': None}
+
+    if source in scenario['wireless_endpoints']:
+        endpoint = context.wireless_endpoints[source]
+        stream = endpoint.TxStreamAdd()
+        stream.InterFrameGapSet(flow['interframegap_ns'])
+        stream.NumberOfFramesSet(flow['number_of_frames'])
+        payload = 'a' * max(0, flow['frame_size'] - 42)
+        stream.FrameAdd().PayloadSet(_hex(payload.encode('ascii')))
+        stream.DestinationAddressSet(context.addresses[destination])
+        stream.DestinationPortSet(flow['udp_port'])
+        stream.SourcePortSet(flow['udp_port'])
+    else:
+        stream = context.ports[source].TxStreamAdd()
+        stream.NumberOfFramesSet(flow['number_of_frames'])
+        stream.InterFrameGapSet(flow['interframegap_ns'])
+        template = context.templates[(source, destination,
+                                      flow['frame_size'])]
+        stream.FrameAdd().BytesSet(template.hexbytes(flow['udp_port'],
+                                                     flow['udp_port']))
+    objects['stream'] = stream
+
+    if destination in scenario['wireless_endpoints']:
+        trigger = context.wireless_endpoints[destination].RxTriggerBasicAdd()
+        duration = flow['number_of_frames'] * flow['interframegap_ns'] \
+            + int(scenario['timing']['rollout_s'] * 1e9)
+        trigger.DurationSet(duration)
+        trigger.FilterUdpSourcePortSet(flow['udp_port'])
+        trigger.FilterUdpDestinationPortSet(flow['udp_port'])
+        trigger.FilterSourceAddressSet(context.addresses[source])
+        objects['trigger'] = trigger
+    elif not flow['aggregate']:
+        trigger = context.ports[destination].RxTriggerBasicAdd()
+        trigger.FilterSet(' and '.join(_trigger_filter(context, flow)))
+        objects['trigger'] = trigger
+    return objects
+
+
+def _create_tcp_flow(context, flow):
+    client_name = flow['client']
+    wireless = client_name in context.scenario['wireless_endpoints']
+    if wireless:
+        client_endpoint = context.wireless_endpoints[client_name]
+    else:
+        client_endpoint = context.ports[client_name]
+    from byteblowerll.byteblower import ParseHTTPRequestMethodFromString
+    http_client = client_endpoint.ProtocolHttpClientAdd()
+    http_client.RemoteAddressSet(context.addresses[flow['server']])
+    http_client.RemotePortSet(flow['tcp_port'])
+    http_client.HttpMethodSet(ParseHTTPRequestMethodFromString(flow['method']))
+    http_client.RequestDurationSet(flow['duration_ns'])
+    if wireless:
+        # Started together with the wireless endpoint
+        http_client.RequestInitialTimeToWaitSet(0)
+    return {'flow': flow, 'client': http_client,
+            'server': context.http_servers[(flow['server'], flow['tcp_port'])]}
+
+
+def _create_receiver(destination, flows):
+    def action(context):
+        port = context.ports[destination]
+        receiver = AggregatedReceiver(
+            port, _trigger_filter(context, flows[0], with_port=False))
+        for flow in flows:
+            receiver.add_flow(flow['name'], flow['udp_port'])
+        receiver.create()
+        context.receivers[destination] = receiver
+        with context.lock:
+            for flow in flows:
+                context.udp_flows[flow['name']]['receiver'] = receiver
+    return action
+
+
+def _prepare(name):
+    def action(context):
+        context.wireless_endpoints[name].Prepare()
+    return action
+
+
+def _start(context):
+    from byteblowerll.byteblower import ByteBlowerPortList
+    scenario = context.scenario
+
+    start_times = [context.wireless_endpoints[name].Start()
+                   for name in sorted(context.wireless_endpoints)]
+
+    # The ports with streams, per server
+    transmitting = {}
+    for flow in scenario['udp_flows']:
+        if flow['source'] in scenario['ports']:
+            server = scenario['ports'][flow['source']]['server']
+            transmitting.setdefault(server, set()).add(flow['source'])
+
+    def start_ports():
+        for server, port_names in sorted(transmitting.items()):
+            port_list = ByteBlowerPortList()
+            for name in sorted(port_names):
+                port_list.push_back(context.ports[name])
+            context.servers[server].PortsStart(port_list)
+        for objects in context.tcp_flows.values():
+            if objects['flow']['client'] in scenario['ports']:
+                objects['client'].RequestStart()
+
+    if start_times:
+        # Start the ports when the wireless endpoints start
+        from clock_sync import ClockSync
+        meetingpoint = context.meetingpoints[sorted(context.meetingpoints)[0]]
+        clock = ClockSync(meetingpoint, samples=CLOCK_SAMPLES)
+        clock.synchronize()
+        clock.start_at(max(start_times), start_ports)
+    else:
+        start_ports()
+
+
+# -- running
+
+def _wait_for_traffic(context, refresh):
+    """Polls the results until the traffic and the wireless endpoints are
+    done"""
+    from byteblowerll.byteblower import DeviceStatus
+    timing = context.scenario['timing']
+    end = time.time() + timing['duration_s'] + timing['rollout_s']
+    running = [DeviceStatus.Starting, DeviceStatus.Running]
+    while True:
+        time.sleep(timing['poll_interval_s'])
+        refresh()
+        if time.time() < end:
+            continue
+        if not any(endpoint.StatusGet() in running
+                   for endpoint in context.wireless_endpoints.values()):
+            break
+
+
+def run_plan(plan, workers):
+    """Sets up the scenario, runs the traffic and collects the results
+
+    :return: dict with the results of the UDP flows, per source and
+             destination, and of the TCP sessions
+    """
+    from byteblowerll.byteblower import AbstractRefreshableResultList
+    from byteblowerll.byteblower import ByteBlower
+    from flow_matrix import FlowMatrix
+
+    context = Context(plan.scenario)
+    context.instance = ByteBlower.InstanceGet()
+    try:
+        started = time.time()
+        plan.run(context, workers)
+        setup_time = time.time() - started
+        print("Setup took %.2fs" % setup_time)
+
+        matrix = FlowMatrix()
+        results = AbstractRefreshableResultList()
+        for flow in plan.scenario['udp_flows']:
+            objects = context.udp_flows[flow['name']]
+            receiver = objects.get('receiver')
+            trigger = receiver.trigger if receiver else objects['trigger']
+            matrix.add_flow(flow['name'], objects['stream'], trigger,
+                            receiver=receiver, udp_port=flow['udp_port'],
+                            pair="%s -> %s" % (flow['source'],
+                                               flow['destination']))
+            results.push_back(objects['stream'].ResultGet())
+            if objects['trigger'] is not None:
+                results.push_back(objects['trigger'].ResultGet())
+        for receiver in context.receivers.values():
+            results.push_back(receiver.trigger.ResultGet())
+
+        def refresh():
+            # The results of all flows in a single call
+            if len(matrix):
+                context.instance.ResultsRefresh(results)
+            for receiver in context.receivers.values():
+                receiver.sample()
+
+        _wait_for_traffic(context, refresh)
+
+        for endpoint in context.wireless_endpoints.values():
+            # The endpoints upload their results after the test
+            endpoint.ResultGet()
+        refresh()
+
+        return {
+            'setup_time': setup_time,
+            'udp': _udp_results(matrix, plan.scenario),
+            'tcp': _tcp_results(context),
+        }
+    finally:
+        _cleanup(context)
+
+
+def _udp_results(matrix, scenario):
+    if not len(matrix):
+        return {'flows': [], 'pairs': {}}
+    duration_ns = scenario['timing']['duration_s'] * 1e9
+    counters = matrix.collect(duration_ns=duration_ns)
+    return {
+        'flows': matrix.flow_results(counters),
+        'pairs': matrix.summary(counters, 'pair'),
+    }
+
+
+def _tcp_results(context):
+    results = []
+    for key, http_server in sorted(context.http_servers.items()):
+        for client_id in http_server.ClientIdentifiersGet():
+            session = http_server.HttpSessionInfoGet(client_id)
+            result = session.ResultGet()
+            result.Refresh()
+            results.append({
+                'server': "%s:%d" % key,
+                'client': client_id,
+                'rx_bytes': result.RxByteCountTotalGet(),
+                'tx_bytes': result.TxByteCountTotalGet(),
+                'throughput': result.AverageDataSpeedGet().bitrate(),
+            })
+    return results
+
+
+def _cleanup(context):
+    for endpoint in context.wireless_endpoints.values():
+        endpoint.Lock(False)
+    for name, port in context.ports.items():
+        server = context.scenario['ports'][name]['server']
+        context.servers[server].PortDestroy(port)
+    for meetingpoint in context.meetingpoints.values():
+        context.instance.MeetingPointRemove(meetingpoint)
+    for server in context.servers.values():
+        context.instance.ServerRemove(server)
+    if getattr(context, 'allocator', None) is not None:
+        context.allocator.release()
+
+
+def print_results(results):
+    for flow in results['udp']['flows']:
+        print("%-24s sent %8d frames, received %8d frames, loss %s" % (
+            flow['name'], flow['tx_frames'], flow['rx_frames'],
+            '-' if flow['loss_percent'] is None
+            else '%.2f%%' % flow['loss_percent']))
+    for pair, group in sorted(results['udp']['pairs'].items()):
+        print("%-24s %d flows, loss %s, fairness %s" % (
+            pair, group['flows'],
+            '-' if group['loss_percent'] is None
+            else '%.2f%%' % group['loss_percent'],
+            '-' if group['fairness'] is None else '%.3f' % group['fairness']))
+    for session in results['tcp']:
+        print("HTTP %-19s client %s: %.2f Mbit/s" % (
+            session['server'], session['client'], session['throughput'] / 1e6))
+
+
+def main(config):
+    scenario = validate(load(config['scenario']))
+    plan = compile_scenario(scenario, config['costs'])
+    plan.report(config['costs'], config['workers'])
+    if config['dry_run']:
+        return None
+
+    results = run_plan(plan, config['workers'])
+    print_results(results)
+    if config['json_file']:
+        with open(config['json_file'], 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenario', nargs='?',
+                        help='The scenario file (JSON or YAML)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Report the API calls and predicted setup time '
+                             'without connecting to a server')
+    parser.add_argument('--round-trip', type=float,
+                        help='Round trip time to the server for the dry '
+                             'run, in seconds')
+    parser.add_argument('--workers', type=int,
+                        help='Maximum number of parallel actions per step')
+    parser.add_argument('--json', dest='json_file',
+                        help='Write the results to this JSON file')
+    arguments = parser.parse_args()
+
+    config = copy.deepcopy(configuration)
+    if arguments.scenario:
+        config['scenario'] = arguments.scenario
+    config['dry_run'] = arguments.dry_run
+    if arguments.round_trip is not None:
+        config['costs']['round_trip'] = arguments.round_trip
+    if arguments.workers:
+        config['workers'] = arguments.workers
+    if arguments.json_file:
+        config['json_file'] = arguments.json_file
+
+    try:
+        main(config)
+    except ScenarioError as error:
+        print(error)
+        sys.exit(1)
@@ -0,0 +1,664 @@
+#!/usr/bin/python
+"""
+Records the ByteBlower API calls of an example and replays them later,
+without a ByteBlower server.
+
+Recording runs the example against a real server.  Every API call is logged
+with its arguments, its return value (or exception) and its timing, in a
+compact binary log.  Replaying runs the same example again, the API calls
+are served from the log.  The analysis, plotting and result collection
+code of the example then runs on real data, on any machine.
+
+Usage:
+    python session_replay.py record session.bblog ../back2back/tcp_oneway_latency.py
+    python session_replay.py replay session.bblog ../back2back/tcp_oneway_latency.py
+    python session_replay.py info session.bblog
+
+While replaying, time is virtual: time.sleep() returns immediately (or
+--speed times faster than recorded) while time.time() and
+datetime.datetime.now() advance as if the example really waited.  Loops
+which wait for the traffic to finish, run the same number of iterations.
+
+Calls are matched per object, method and arguments, in the recorded order.
+When an example asks a result more often than during the recording, the
+last recorded value is returned again.  A call which was never recorded
+raises a ReplayError.
+
+The log format:
+    magic 'BBAPILOG', format version (1 byte), followed by a zlib stream of
+    records.  Every record starts with its type:
+      K  constants of the API module (enumerations), as list of pairs
+      O  new object: object id, class name
+      C  call: object id, method, arguments, start and duration in
+         microseconds, followed by the result or an exception (X: class
+         name and message)
+    Values are tagged: integers are zigzag varints, strings are written
+    once and referenced by index afterwards, API objects by their id.
+"""
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import datetime
+import struct
+import sys
+import threading
+import time
+import zlib
+
+import api_tracer
+from api_tracer import Tracer, clock, is_api_object, unwrap
+
+MAGIC = b'BBAPILOG'
+VERSION = 1
+
+
+class ReplayError(Exception):
+    pass
+
+
+class Ref(object):
+    """Reference to an API object in the log"""
+    __slots__ = ('id',)
+
+    def __init__(self, object_id):
+        self.id = object_id
+
+    def __eq__(self, other):
+        return isinstance(other, Ref) and other.id == self.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(('ref', self.id))
+
+    def __repr__(self):
+        return '<object %d>' % self.id
+
+
+def _is_sequence(value):
+    if isinstance(value, (str, bytes)):
+        return False
+    return hasattr(type(value), '__iter__') and hasattr(type(value), '__len__')
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+# -- binary encoding
+
+class Writer(object):
+    """Writes records to a compressed log file"""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC + struct.pack('B', VERSION))
+        self.compressor = zlib.compressobj(9)
+        self.strings = {}
+        self.buffer = bytearray()
+
+    def varint(self, number):
+        while number > 0x7f:
+            self.buffer.append((number & 0x7f) | 0x80)
+            number >>= 7
+        self.buffer.append(number)
+
+    def tag(self, tag):
+        self.buffer.append(ord(tag))
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is not None:
+            self.tag('S')
+            self.varint(index)
+            return
+        self.strings[text] = len(self.strings)
+        data = text.encode('utf-8')
+        self.tag('s')
+        self.varint(len(data))
+        self.buffer.extend(data)
+
+    def value(self, value):
+        if value is None:
+            self.tag('N')
+        elif value is True:
+            self.tag('T')
+        elif value is False:
+            self.tag('F')
+        elif isinstance(value, Ref):
+            self.tag('R')
+            self.varint(value.id)
+        elif isinstance(value, int) or type(value).__name__ == 'long':
+            self.tag('I')
+            # zigzag, small negative numbers stay small
+            self.varint(value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            self.tag('D')
+            self.buffer.extend(struct.pack('<d', value))
+        elif isinstance(value, list):
+            self.tag('L')
+            self.varint(len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, bytes) and not isinstance(value, str):
+            self.tag('B')
+            self.varint(len(value))
+            self.buffer.extend(value)
+        else:
+            self.string(value if isinstance(value, str) else value.decode('utf-8'))
+
+    def flush(self):
+        self.file.write(self.compressor.compress(bytes(self.buffer)))
+        del self.buffer[:]
+
+    def close(self):
+        self.flush()
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+
+class Reader(object):
+    """Reads the records of a log file"""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            header = f.read(len(MAGIC) + 1)
+            if header[:len(MAGIC)] != MAGIC:
+                raise ReplayError("%s is not an API session log" % filename)
+            version = bytearray(header)[-1]
+            if version != VERSION:
+                raise ReplayError("Unsupported log version %d" % version)
+            self.data = bytearray(zlib.decompress(f.read()))
+        self.position = 0
+        self.strings = []
+
+    def byte(self):
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def tag(self):
+        return chr(self.byte())
+
+    def varint(self):
+        number = shift = 0
+        while True:
+            byte = self.byte()
+            number |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    def value(self):
+        tag = self.tag()
+        if tag == 'N':
+            return None
+        if tag == 'T':
+            return True
+        if tag == 'F':
+            return False
+        if tag == 'R':
+            return Ref(self.varint())
+        if tag == 'I':
+            number = self.varint()
+            return number >> 1 if not number & 1 else -((number + 1) >> 1)
+        if tag == 'D':
+            value, = struct.unpack_from('<d', bytes(self.data[self.position:self.position + 8]))
+            self.position += 8
+            return value
+        if tag == 'L':
+            return [self.value() for _ in range(self.varint())]
+        if tag == 'B':
+            length = self.varint()
+            self.position += length
+            return bytes(self.data[self.position - length:self.position])
+        if tag == 'S':
+            return self.strings[self.varint()]
+        if tag == 's':
+            length = self.varint()
+            self.position += length
+            text = self.data[self.position - length:self.position].decode('utf-8')
+            if sys.version_info[0] == 2:
+                text = text.encode('utf-8')
+            self.strings.append(text)
+            return text
+        raise ReplayError("Corrupt log, unknown tag %r at %d" % (tag, self.position))
+
+    def records(self):
+        """Yields the records as tuples, the first item is the type"""
+        while self.position < len(self.data):
+            kind = self.tag()
+            if kind == 'K':
+                yield kind, self.value()
+            elif kind == 'O':
+                yield kind, self.varint(), self.value()
+            elif kind == 'C':
+                object_id = self.varint()
+                method = self.value()
+                arguments = self.value()
+                started = self.varint()
+                duration = self.varint()
+                if self.tag() == 'X':
+                    outcome = ('error', self.value(), self.value())
+                else:
+                    self.position -= 1
+                    outcome = ('result', self.value())
+                yield kind, object_id, method, arguments, started, duration, outcome
+            else:
+                raise ReplayError("Corrupt log, unknown record %r" % kind)
+
+
+# -- recording
+
+class Recorder(Tracer):
+    """Logs every API call of the traced objects
+
+    The recorder is a Tracer: after the recording the profile of the run
+    is available as well.
+
+    :param filename: The log file to write
+    """
+
+    def __init__(self, filename, wrap_sleep=True):
+        Tracer.__init__(self, wrap_sleep=wrap_sleep)
+        self.filename = filename
+        self.writer = None
+        self._objects = {}
+        self._write_lock = threading.Lock()
+        self.recorded_calls = 0
+
+    def _identity(self, target):
+        # SWIG returns a new Python proxy for every call, the pointer to
+        # the C++ object identifies the object itself.
+        try:
+            return type(target).__name__, int(target.this)
+        except (AttributeError, TypeError, ValueError):
+            return id(target)
+
+    def _object_id(self, target):
+        identity = self._identity(target)
+        known = self._objects.get(identity)
+        if known is not None:
+            return known[1]
+        object_id = len(self._objects)
+        # Keep the object alive, so its identity is not reused
+        self._objects[identity] = (target, object_id)
+        self.writer.tag('O')
+        self.writer.varint(object_id)
+        self.writer.value(type(target).__name__)
+        return object_id
+
+    def encode(self, value):
+        """Converts a value to the types the log can hold"""
+        value = unwrap(value)
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        if _is_sequence(value):
+            return [self.encode(item) for item in value]
+        if is_api_object(value):
+            return Ref(self._object_id(value))
+        if type(value).__name__ == 'long':
+            return value
+        return repr(value)
+
+    def wrap_attribute(self, target, name, method):
+        traced = Tracer.wrap_attribute(self, target, name, method)
+        recorder = self
+
+        def recorded(*args, **kwargs):
+            if recorder._thread().depth:
+                return traced(*args, **kwargs)
+            started = clock()
+            try:
+                result = traced(*args, **kwargs)
+            except Exception as error:
+                recorder._write_call(target, name, args, started, clock(),
+                                     error=error)
+                raise
+            recorder._write_call(target, name, args, started, clock(),
+                                 result=result)
+            return result
+        return recorded
+
+    def _write_call(self, target, name, args, started, ended, result=None,
+                    error=None):
+        with self._write_lock:
+            if self.writer is None:
+                return
+            writer = self.writer
+            object_id = self._object_id(target)
+            arguments = self.encode(list(args))
+            if error is None:
+                encoded = self.encode(result)
+            writer.tag('C')
+            writer.varint(object_id)
+            writer.value(name)
+            writer.value(arguments)
+            writer.varint(int((started - self.started_at) * 1e6))
+            writer.varint(int((ended - started) * 1e6))
+            if error is not None:
+                writer.tag('X')
+                writer.value(type(error).__name__)
+                writer.value(str(error))
+            else:
+                writer.value(encoded)
+            self.recorded_calls += 1
+            if len(writer.buffer) > 65536:
+                writer.flush()
+
+    def _constants(self):
+        """The integer constants of the API, e.g. HTTPRequestStatus.Finished"""
+        from byteblowerll import byteblower
+
+        constants = []
+        for name, value in sorted(vars(byteblower).items()):
+            if name.startswith('_'):
+                continue
+            if isinstance(value, int) and not isinstance(value, bool):
+                constants.append([name, value])
+            elif isinstance(value, type):
+                for attribute, member in sorted(vars(value).items()):
+                    if (not attribute.startswith('_') and isinstance(member, int)
+                            and not isinstance(member, bool)):
+                        constants.append([name + '.' + attribute, member])
+        return constants
+
+    def enable(self):
+        if self.writer is None:
+            self.writer = Writer(self.filename)
+            self.writer.tag('K')
+            self.writer.value(self._constants())
+            # The ByteBlower instance is the first object, the root of
+            # the replayed session
+            from byteblowerll import byteblower
+            with self._write_lock:
+                self._object_id(byteblower.ByteBlower.InstanceGet())
+        Tracer.enable(self)
+
+    def disable(self):
+        Tracer.disable(self)
+        with self._write_lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+
+# -- replaying
+
+class VirtualClock(object):
+    """Replaces time.sleep, time.time and datetime.datetime.now
+
+    :param speed: How much faster than real time the sleeps run,
+                  None does not sleep at all.
+    """
+
+    def __init__(self, speed=None):
+        self.speed = speed
+        self.offset = 0.0
+        self._originals = None
+
+    def sleep(self, seconds):
+        real = seconds / self.speed if self.speed else 0.0
+        self.offset += seconds - real
+        if real > 0:
+            self._originals[1](real)
+
+    def time(self):
+        return self._originals[0]() + self.offset
+
+    def enable(self):
+        if self._originals is not None:
+            return
+        self._originals = (time.time, time.sleep, datetime.datetime)
+        virtual = self
+
+        class VirtualDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return cls.fromtimestamp(virtual.time(), tz)
+
+            @classmethod
+            def today(cls):
+                return cls.fromtimestamp(virtual.time())
+
+        time.time = self.time
+        time.sleep = self.sleep
+        datetime.datetime = VirtualDatetime
+
+    def disable(self):
+        if self._originals is None:
+            return
+        time.time, time.sleep, datetime.datetime = self._originals
+        self._originals = None
+
+
+class ReplayObject(object):
+    """Stands in for an API object of the recording"""
+    __slots__ = ('_id', '_session')
+
+    def __init__(self, object_id, session):
+        object.__setattr__(self, '_id', object_id)
+        object.__setattr__(self, '_session', session)
+
+    @property
+    def __class__(self):
+        return self._session.class_of(self._id)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        session, object_id = self._session, self._id
+
+        def call(*args):
+            return session.call(object_id, name, args)
+        call.__name__ = name
+        return call
+
+    def __eq__(self, other):
+        return isinstance(other, ReplayObject) and other._id == self._id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._id)
+
+    def __repr__(self):
+        return '<replayed %s %d>' % (self._session.class_names[self._id], self._id)
+
+
+class ReplaySession(object):
+    """Serves the API calls of a recorded session
+
+    :param filename: The log file
+    :param speed: Speed of the virtual clock, see VirtualClock
+    :param timing: Also reproduce the recorded duration of the API calls
+    """
+
+    def __init__(self, filename, speed=None, timing=False):
+        self.clock = VirtualClock(speed)
+        self.timing = timing
+        self.class_names = {}
+        self.constants = []
+        # (object id, method, arguments) -> list of outcomes, and the
+        # index of the next one to serve
+        self.calls = {}
+        self.served = {}
+        self.recorded_calls = 0
+        self.unmatched = []
+        self._objects = {}
+        self._module = None
+        self._original_instance_get = None
+
+        for record in Reader(filename).records():
+            if record[0] == 'K':
+                self.constants = record[1]
+            elif record[0] == 'O':
+                self.class_names[record[1]] = record[2]
+            else:
+                _, object_id, method, arguments, _, duration, outcome = record
+                key = (object_id, method, _hashable(arguments))
+                self.calls.setdefault(key, []).append((outcome, duration))
+                self.recorded_calls += 1
+
+    def class_of(self, object_id):
+        return getattr(self._module, self.class_names[object_id], ReplayObject)
+
+    def proxy(self, object_id):
+        proxy = self._objects.get(object_id)
+        if proxy is None:
+            proxy = self._objects[object_id] = ReplayObject(object_id, self)
+        return proxy
+
+    def encode(self, value):
+        if isinstance(value, ReplayObject):
+            return Ref(value._id)
+        if isinstance(value, (list, tuple)):
+            return tuple(self.encode(item) for item in value)
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        return repr(value)
+
+    def decode(self, value):
+        if isinstance(value, Ref):
+            return self.proxy(value.id)
+        if isinstance(value, list):
+            return self._module.AbstractRefreshableResultList(
+                self.decode(item) for item in value)
+        return value
+
+    def call(self, object_id, method, args):
+        key = (object_id, method, self.encode(list(args)))
+        outcomes = self.calls.get(key)
+        if outcomes is None:
+            self.unmatched.append(key)
+            raise ReplayError("%s.%s%r was not recorded" % (
+                self.class_names.get(object_id, '?'), method, key[2]))
+
+        # Repeat the last outcome when the example asks more often
+        index = self.served.get(key, 0)
+        self.served[key] = index + 1
+        outcome, duration = outcomes[min(index, len(outcomes) - 1)]
+        if self.timing:
+            self.clock.sleep(duration / 1e6)
+
+        if outcome[0] == 'error':
+            exception = getattr(self._module, outcome[1], None)
+            if not (isinstance(exception, type) and issubclass(exception, Exception)):
+                exception = ReplayError
+            raise exception(outcome[2])
+        return self.decode(outcome[1])
+
+    def enable(self):
+        """Installs the replayed API and the virtual clock"""
+        import fake_byteblower
+
+        if self._original_instance_get is not None:
+            return
+        module = self._module = fake_byteblower.install()
+        for name, value in self.constants:
+            if '.' in name:
+                class_name, attribute = name.split('.', 1)
+                if not isinstance(getattr(module, class_name, None), type):
+                    setattr(module, class_name, type(class_name, (object,), {}))
+                setattr(getattr(module, class_name), attribute, value)
+            else:
+                setattr(module, name, value)
+
+        self._original_instance_get = module.ByteBlower.InstanceGet
+        root = self.proxy(0)
+        module.ByteBlower.InstanceGet = staticmethod(lambda: root)
+        self.clock.enable()
+
+    def disable(self):
+        if self._original_instance_get is None:
+            return
+        self._module.ByteBlower.InstanceGet = staticmethod(self._original_instance_get)
+        self._original_instance_get = None
+        self.clock.disable()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def print_summary(self):
+        served = sum(min(count, len(self.calls[key]))
+                     for key, count in self.served.items())
+        print("Replayed %d of %d recorded calls, %d calls were not recorded"
+              % (served, self.recorded_calls, len(self.unmatched)))
+
+
+def print_info(filename):
+    """Prints the calls in a log, per method"""
+    calls = {}
+    objects = 0
+    last = 0
+    for record in Reader(filename).records():
+        if record[0] == 'O':
+            objects += 1
+        elif record[0] == 'C':
+            _, object_id, method, _, started, duration, outcome = record
+            statistics = calls.setdefault(method, api_tracer.CallStatistics())
+            statistics.add(duration / 1e6)
+            last = max(last, started + duration)
+    print("%d calls on %d objects, recorded in %.1fs"
+          % (sum(s.count for s in calls.values()), objects, last / 1e6))
+    for method, statistics in sorted(calls.items(),
+                                     key=lambda item: -item[1].total):
+        print("  %-40s %6d calls %9.3fs" % (method, statistics.count,
+                                            statistics.total))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command')
+
+    record = commands.add_parser('record', help='record a run of an example')
+    record.add_argument('log', help='the log file to write')
+    record.add_argument('script', help='the example to run')
+    record.add_argument('arguments', nargs=argparse.REMAINDER)
+
+    replay = commands.add_parser('replay', help='replay a recorded run')
+    replay.add_argument('--speed', type=float, default=None,
+                        help='run the sleeps this many times faster than '
+                             'recorded, by default they do not wait at all')
+    replay.add_argument('--timing', action='store_true',
+                        help='reproduce the recorded duration of the calls')
+    replay.add_argument('log', help='the recorded log file')
+    replay.add_argument('script', help='the example to run')
+    replay.add_argument('arguments', nargs=argparse.REMAINDER)
+
+    info = commands.add_parser('info', help='summarize a recorded log')
+    info.add_argument('log', help='the recorded log file')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        recorder = Recorder(args.log)
+        try:
+            with recorder:
+                api_tracer.run_script(args.script, args.arguments)
+        finally:
+            print("Recorded %d API calls in %s" % (recorder.recorded_calls,
+                                                   args.log))
+    elif args.command == 'replay':
+        session = ReplaySession(args.log, speed=args.speed, timing=args.timing)
+        try:
+            with session:
+                api_tracer.run_script(args.script, args.arguments)
+        finally:
+            session.print_summary()
+    elif args.command == 'info':
+        print_info(args.log)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
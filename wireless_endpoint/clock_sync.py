@@ -0,0 +1,223 @@
+"""
+Clock offset estimation between this host and a ByteBlower MeetingPoint.
+
+The wireless endpoint examples receive the start time of the device as a POSIX
+timestamp (in nanoseconds) on the clock of the MeetingPoint.  To start a
+ByteBlower port at that instant, we need to know how the local clock relates
+to the MeetingPoint clock.
+
+A single call to `MeetingPoint.TimestampGet()` is not enough for that: the
+answer is already a bit old when it arrives.  This module takes several
+timestamp samples, NTP-style:
+
+    t0 = local time before the request
+    ts = MeetingPoint timestamp
+    t1 = local time after the request
+
+    round trip time  = t1 - t0
+    offset           = ts - (t0 + t1) / 2
+
+The sample with the smallest round trip time is the most accurate one, the
+true offset is within half of that round trip time of the estimate.
+
+Usage:
+    clock = ClockSync(meetingpoint)
+    clock.synchronize()
+
+    starttime_posix = wireless_endpoint.Start()
+    alignment = clock.start_at(starttime_posix, stream.Start)
+    print(alignment.describe())
+
+or, with the progress messages of the examples:
+    alignment = start_with_device(meetingpoint, wireless_endpoint,
+                                  stream.Start)
+
+This module is guaranteed to work with Python 2.7 and above.
+
+Copyright 2024, Excentis N.V.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+
+def local_time_ns():
+    """Current POSIX time of this host in nanoseconds"""
+    return int(time.time() * 1e9)
+
+
+class ClockOffset(object):
+    """Result of a clock synchronization
+
+    :ivar offset_ns: MeetingPoint clock minus local clock, in nanoseconds
+    :ivar round_trip_ns: Round trip time of the best sample, in nanoseconds
+    :ivar samples: Number of samples taken
+    """
+
+    def __init__(self, offset_ns, round_trip_ns, samples):
+        self.offset_ns = offset_ns
+        self.round_trip_ns = round_trip_ns
+        self.samples = samples
+
+    @property
+    def error_bound_ns(self):
+        """Maximum error on the offset, in nanoseconds"""
+        return self.round_trip_ns // 2
+
+    def to_local(self, meetingpoint_ns):
+        """Convert a MeetingPoint timestamp to a local timestamp"""
+        return meetingpoint_ns - self.offset_ns
+
+    def to_meetingpoint(self, local_ns):
+        """Convert a local timestamp to a MeetingPoint timestamp"""
+        return local_ns + self.offset_ns
+
+
+class StartAlignment(object):
+    """Achieved alignment of a scheduled start
+
+    :ivar target_ns: Requested start instant (MeetingPoint clock)
+    :ivar estimated_ns: Estimated instant the start request reached the
+                        server (MeetingPoint clock)
+    :ivar error_bound_ns: Uncertainty on `estimated_ns`
+    """
+
+    def __init__(self, target_ns, estimated_ns, error_bound_ns):
+        self.target_ns = target_ns
+        self.estimated_ns = estimated_ns
+        self.error_bound_ns = error_bound_ns
+
+    @property
+    def alignment_ns(self):
+        """Estimated start instant minus requested start instant"""
+        return self.estimated_ns - self.target_ns
+
+    def describe(self):
+        return "Port started %.3f ms after the device (+/- %.3f ms)" % (
+            self.alignment_ns / 1e6, self.error_bound_ns / 1e6)
+
+    def to_dict(self):
+        return {
+            'target_ns': self.target_ns,
+            'estimated_ns': self.estimated_ns,
+            'alignment_ns': self.alignment_ns,
+            'error_bound_ns': self.error_bound_ns,
+        }
+
+
+class ClockSync(object):
+    """Estimates the MeetingPoint clock and schedules actions on it
+
+    :param meetingpoint: The MeetingPoint to synchronize with
+    :type meetingpoint: :class:`byteblowerll.byteblower.MeetingPoint`
+    :param samples: Number of timestamp samples to take
+    :type samples: int
+    :param clock: Function returning the local time in nanoseconds
+    """
+
+    def __init__(self, meetingpoint, samples=8, clock=local_time_ns):
+        self.meetingpoint = meetingpoint
+        self.samples = samples
+        self.clock = clock
+        self.offset = None
+
+    def synchronize(self):
+        """Sample the MeetingPoint clock and estimate the offset
+
+        :return: The estimated clock offset
+        :rtype: :class:`ClockOffset`
+        """
+        best = None
+        for _ in range(self.samples):
+            t0 = self.clock()
+            ts = self.meetingpoint.TimestampGet()
+            t1 = self.clock()
+
+            round_trip = t1 - t0
+            if best is None or round_trip < best[0]:
+                best = (round_trip, ts - (t0 + t1) // 2)
+
+        round_trip, offset = best
+        self.offset = ClockOffset(offset, round_trip, self.samples)
+        return self.offset
+
+    def now_ns(self):
+        """Current time on the MeetingPoint clock, in nanoseconds"""
+        if self.offset is None:
+            self.synchronize()
+        return self.offset.to_meetingpoint(self.clock())
+
+    def start_at(self, start_posix_ns, start_function, margin_ns=None):
+        """Call `start_function` so it takes effect at `start_posix_ns`
+
+        The start request needs half a round trip to reach the server, so it
+        is sent that much earlier.  By default, the start is delayed by the
+        error bound of the offset, which guarantees the port never starts
+        before the device does.
+
+        :param start_posix_ns: Start instant on the MeetingPoint clock, e.g.
+                               the return value of `WirelessEndpoint.Start()`
+        :param start_function: Function to call, e.g. `stream.Start`
+        :param margin_ns: Extra delay after the start instant.  Special
+                          value: None, use the error bound of the offset.
+        :return: The achieved alignment
+        :rtype: :class:`StartAlignment`
+        """
+        if self.offset is None:
+            self.synchronize()
+
+        if margin_ns is None:
+            margin_ns = self.offset.error_bound_ns
+
+        target = start_posix_ns + margin_ns
+        one_way = self.offset.round_trip_ns // 2
+        send_at = self.offset.to_local(target) - one_way
+
+        # Sleep most of the time, spin the last few milliseconds,
+        # time.sleep() is not accurate enough for that.
+        while True:
+            remaining = send_at - self.clock()
+            if remaining <= 0:
+                break
+            if remaining > 2000000:
+                time.sleep((remaining - 2000000) / 1e9)
+
+        t0 = self.clock()
+        start_function()
+        t1 = self.clock()
+
+        estimated = self.offset.to_meetingpoint((t0 + t1) // 2)
+        error_bound = self.offset.error_bound_ns + (t1 - t0) // 2
+        return StartAlignment(start_posix_ns, estimated, error_bound)
+
+
+def start_with_device(meetingpoint, wireless_endpoint, start_function):
+    """Starts the wireless endpoint and calls `start_function` at the same
+    instant
+
+    Estimates the clock offset with the meetingpoint first.  The port is
+    started the error bound of the offset after the wireless endpoint,
+    usually well below a millisecond, so it never starts before the device.
+    Without the clock offset, a safety margin of seconds would be needed.
+
+    :param meetingpoint: The MeetingPoint of the wireless endpoint
+    :param wireless_endpoint: The prepared wireless endpoint
+    :param start_function: Function to call, e.g. `port.Start`
+    :return: The achieved alignment
+    :rtype: :class:`StartAlignment`
+    """
+    clock = ClockSync(meetingpoint)
+    offset = clock.synchronize()
+    print("Clock offset with the meetingpoint:", offset.offset_ns / 1e6,
+          "ms (+/-", offset.error_bound_ns / 1e6, "ms)")
+
+    # POSIX timestamp in nanoseconds when the wireless endpoint will start
+    starttime_posix = wireless_endpoint.Start()
+
+    print("Waiting for", (starttime_posix - clock.now_ns()) / 1e9,
+          "seconds to start the port")
+    alignment = clock.start_at(starttime_posix, start_function)
+    print(alignment.describe())
+    return alignment
@@ -7,6 +7,7 @@ from __future__ import print_function
 
 import datetime
 import math
+import os
 import random
 import sys
 import time
@@ -18,6 +19,13 @@ from byteblowerll.byteblower import ParseHTTPRequestMethodFromString
 from scapy.layers.inet import UDP, IP, Ether
 from scapy.all import Raw
 
+from udp_ports import UdpPortAllocator
+
+# The sizing of the result histories is shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'back2back'))
+from history_manager import size_history
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     #'server_address': 'byteblower-tutorial-3100.lab.byteblower.excentis.com',
@@ -136,24 +144,31 @@ class UDPTraffic:
 
     """
 
-    next_free_UDP_port = 4096
+    # This is an important part when working with the
+    # Wireless Endpoints.
+    # Unlike the ByteBlower Server, every trigger
+    # and every stream requires a different UDP Port.
+    # The ports are handed out per device, a port is free on both
+    # the Wireless Endpoint and the ByteBlower port of the flow: the
+    # triggers on the ByteBlower port filter on the UDP port too.
+    # The ports are returned when the flow is released.
+    udp_ports = UdpPortAllocator()
     lower_layer_overhead = 14 + 20 + 8  # MAC + IPv4 + UDP
 
-    @staticmethod
-    def free_udp():
+    def free_udp(self, wep_port, bb_port):
         """
-        Helper method to retrieve the next free UDP port.
-        This is an important part when working with the
-        Wireless Endpoints.
-        Unlike the ByteBlower Server, every trigger
-        and every stream requires a different UDP Port.
+        Helper method to reserve a UDP port for this flow which is free
+        on both the Wireless Endpoint and the ByteBlower port.
         """
-        current = UDPTrafficUp.next_free_UDP_port
-        UDPTrafficUp.next_free_UDP_port += 1
+        self.wep_port = wep_port
+        self.bb_port = bb_port
+        self.udp_port = UDPTraffic.udp_ports.allocate(wep_port, bb_port)
+        return self.udp_port
 
-        if UDPTrafficUp.next_free_UDP_port >= 2 ** 16:
-            UDPTrafficUp.next_free_UDP_port = 4096
-        return current
+    def release(self):
+        """Returns the UDP port of this flow to both devices"""
+        UDPTraffic.udp_ports.release(self.udp_port, self.wep_port,
+                                     self.bb_port)
 
     @staticmethod
     def speed_to_ifg(bit_speed, frame_size):
@@ -208,7 +223,7 @@ class UDPTrafficDown(UDPTraffic):
         ipv4_udp_down.py
     """
     def __init__(self, wep_port, bb_port, traffic_config):
-        current_port = self.free_udp()
+        current_port = self.free_udp(wep_port, bb_port)
 
         # Configure the ByteBlower server to stream out the UDP traffic.
         self.stream = bb_port.TxStreamAdd()
@@ -241,7 +256,7 @@ class UDPTrafficDown(UDPTraffic):
 
         frame_count = duration_s * (bit_speed / 8) / total_size
         self.stream.NumberOfFramesSet(int(frame_count))
-        self.stream.ResultHistoryGet().SamplingBufferLengthSet(int(duration_s) + 20)
+        size_history(self.stream.ResultHistoryGet(), duration_s * 1e9)
 
         # Configure the trigger at the Wireless Endpont. 
         self.trigger = wep_port.RxTriggerBasicAdd()
@@ -263,7 +278,7 @@ class UDPTrafficUp(UDPTraffic):
         ipv4_udp_up.py
     """
     def __init__(self, wep_port, bb_port, traffic_config):
-        current_port = self.free_udp()
+        current_port = self.free_udp(wep_port, bb_port)
         self.stream = wep_port.TxStreamAdd()
 
         total_size = traffic_config.get("framesize", 1024)
@@ -287,7 +302,7 @@ class UDPTrafficUp(UDPTraffic):
 
         self.trigger = bb_port.RxTriggerBasicAdd()
         self.trigger.FilterSet("ip and udp dst port {}".format(current_port))
-        self.trigger.ResultHistoryGet().SamplingBufferLengthSet(int(duration_s) + 20)
+        size_history(self.trigger.ResultHistoryGet(), duration_s * 1e9)
 
 
 class Example:
@@ -308,6 +323,7 @@ class Example:
         self.port = None
         self.meetingpoint = None
         self.wireless_endpoint = None
+        self.traffic_flows = []
 
     def run(self):
         instance = ByteBlower.InstanceGet()
@@ -359,7 +375,7 @@ class Example:
         # The Wi-Fi statistics are captured as soon as the scenario starts.
         monitor = device_info.NetworkInfoMonitorAdd()
 
-        traffic_flows = []
+        traffic_flows = self.traffic_flows
         for traffic_config in self.traffic:
             traffic_type = traffic_config["type"]
             if "tcp" == traffic_type:
@@ -437,6 +453,11 @@ class Example:
         instance = ByteBlower.InstanceGet()
 
         # Cleanup
+        for flow in self.traffic_flows:
+            if isinstance(flow, UDPTraffic):
+                flow.release()
+        self.traffic_flows = []
+
         if self.meetingpoint is not None:
             instance.MeetingPointRemove(self.meetingpoint)
         if self.server is not None:
@@ -12,8 +12,8 @@ This example is guaranteed to work with Python 2.7 and above.
 
 By default, no graphs are generated.
 If you want graphs, put the write_html_charts variable to True.
-Then you also have to pip install python-highcharts
-Note: python-highcharts only works for Python versions until 3.10.
+The graphs are written by demo_scripts/plotting/highcharts_report.py,
+which downsamples long series and stores the full data next to the page.
 
 This is an example of a realistic traffic pattern.
 A ByteBlower port is used to simulate the game server.
@@ -45,11 +45,15 @@ from __future__ import print_function
 
 import json
 import math
+import os
+import sys
 import time
 from datetime import datetime
 
 from byteblowerll import byteblower as api
 
+from clock_sync import start_with_device
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': '10.10.1.202',
@@ -197,6 +201,7 @@ class Example:
         self.port = None
         self.meetingpoint = None
         self.wireless_endpoint = None
+        self.start_alignment = None
 
         self.qed_percentiles = kwargs.pop('qed_percentiles')
         self.time_now = time.strftime(" - %Y%m%d-%H%M%S")
@@ -455,19 +460,9 @@ class Example:
         us_latency_trigger.ResultClear()
 
         from time import sleep
-        # POSIX timestamp in nanoseconds when the wireless endpoint will start
-        starttime_posix = self.wireless_endpoint.Start()
-        # Current POSIX timestamp on the meetingpoint
-        current_time_posix = self.meetingpoint.TimestampGet()
-
-        time_to_wait_ns = starttime_posix - current_time_posix
-        # Wait 200 ms longer, to make sure the ByteBlower endpoint has started.
-        time_to_wait_ns += 200000000
-
-        print("Waiting for", time_to_wait_ns / 1000000000.0, "to start the port")
-        sleep(time_to_wait_ns / 1000000000.0)
-
-        down_stream.Start()
+        # Start the port at the same instant as the wireless endpoint
+        self.start_alignment = start_with_device(
+            self.meetingpoint, self.wireless_endpoint, down_stream.Start)
 
         # Getting the Histograms over time:
         # us_latency_result: api.LatencyDistributionResultSnapshot = us_latency_trigger.ResultGet()
@@ -524,7 +519,8 @@ class Example:
 
         output_dict = {
             'downstream': ds_buckets_history,
-            'upstream': us_buckets_history
+            'upstream': us_buckets_history,
+            'start_alignment': self.start_alignment.to_dict()
         }
 
         return output_dict
@@ -760,9 +756,7 @@ class Example:
         print("Device back available")
 
 
-def create_highcharts(title, range_min, range_max):
-    from highcharts import Highchart
-    chart = Highchart(width=1000, height=600)
+def create_highcharts_options(title, range_min, range_max):
     styling = '<span style="font-family: \'DejaVu Sans\', Arial, Helvetica, sans-serif; color: '
     options = {
         'title': {
@@ -815,9 +809,7 @@ def create_highcharts(title, range_min, range_max):
             }
         }
     }
-    chart.set_dict_options(options)
-
-    return chart
+    return options
 
 
 class RangeType():
@@ -854,23 +846,27 @@ def calculate_cumulative_percentages(below, buckets, total):
 
 
 def write_html_chart(title, pass_fail, qed, range_min, range_max):
-    chart = create_highcharts(title + ' - ' + pass_fail, range_min, range_max)
-    sorted_list = sorted(qed, key=lambda x: x['qed_series'])
-    for item in sorted_list:
-        series = item.get('qed_series')
-        qta = item.get('qed_qta')
-        axis = item.get('qed_axis')
-        if axis is None:
-            axis = 0
-        if qta:
-            chart.add_data_set(
-                item.get('qed_values'), 'areaspline', str(series), yAxis=axis, threshold=int(qta),
-                negativeFillColor='transparent')
-        else:
-            chart.add_data_set(
-                item.get('qed_values'), 'areaspline', str(series), yAxis=axis, fillColor='transparent')
+    # The report writer is shared with the demo scripts
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'demo_scripts', 'plotting'))
+    from highcharts_report import ChunkedReport
 
-    chart.save_file(title)
+    options = create_highcharts_options(title + ' - ' + pass_fail, range_min, range_max)
+    sorted_list = sorted(qed, key=lambda x: x['qed_series'])
+    with ChunkedReport(title + '.html', options, width=1000, height=600) as chart:
+        for item in sorted_list:
+            series = item.get('qed_series')
+            qta = item.get('qed_qta')
+            axis = item.get('qed_axis')
+            if axis is None:
+                axis = 0
+            if qta:
+                chart.add_data_set(
+                    item.get('qed_values'), 'areaspline', str(series), yAxis=axis, threshold=int(qta),
+                    negativeFillColor='transparent')
+            else:
+                chart.add_data_set(
+                    item.get('qed_values'), 'areaspline', str(series), yAxis=axis, fillColor='transparent')
 
 
 if __name__ == "__main__":
@@ -11,6 +11,8 @@ import time
 
 from byteblowerll import byteblower as api
 
+from clock_sync import start_with_device
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': '10.10.1.203',
@@ -92,6 +94,7 @@ class Example:
         self.port = None
         self.meetingpoint = None
         self.wireless_endpoint = None
+        self.start_alignment = None
 
     def run(self):
         byteblower_instance = api.ByteBlower.InstanceGet()
@@ -239,19 +242,9 @@ class Example:
         latency_trigger.ResultClear()
 
         from time import sleep
-        # POSIX timestamp in nanoseconds when the wireless endpoint will start
-        starttime_posix = self.wireless_endpoint.Start()
-        # Current POSIX timestamp on the meetingpoint
-        current_time_posix = self.meetingpoint.TimestampGet()
-
-        time_to_wait_ns = starttime_posix - current_time_posix
-        # Wait 200 ms longer, to make sure the wireless endpoint has started.
-        time_to_wait_ns += 200000000
-
-        print("Waiting for", time_to_wait_ns / 1000000000.0, "to start the port")
-        sleep(time_to_wait_ns / 1000000000.0)
-
-        stream.Start()
+        # Start the port at the same instant as the wireless endpoint
+        self.start_alignment = start_with_device(
+            self.meetingpoint, self.wireless_endpoint, stream.Start)
 
         print("Waiting for the test to finish")
         sleep(duration_ns / 1000000000.0)
@@ -3,12 +3,18 @@ from __future__ import print_function
 import datetime
 import json
 import math
+import os
 import random
 import sys
 import time
 
 from byteblowerll import byteblower as api
 
+# The change detection is shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'back2back'))
+from change_detection import LiveChangeDetector
+
 configuration = {
     # Address (IP or FQDN) of the ByteBlower server to use
     'server_address': 'byteblower-dev-1300-1.lab.byteblower.excentis.com',
@@ -59,7 +65,11 @@ configuration = {
     'duration': 10000000000,
 
     # TOS value to use on the HTTP client (and server)
-    'tos': 0
+    'tos': 0,
+
+    # The results are stored in this SQLite database, to compare runs over
+    # time (see demo_scripts/results_db.py).  None disables storing.
+    'results_database': 'byteblower_results.db',
 }
 
 
@@ -88,6 +98,7 @@ class Example:
         self.tos = kwargs['tos']
 
         self.server = None
+        self.server_version = None
         self.port = None
         self.meetingpoint = None
         self.wireless_endpoint = None
@@ -106,6 +117,7 @@ class Example:
 
         # Connect to the server
         self.server = instance.ServerAdd(self.server_address)
+        self.server_version = self.server.ServiceInfoGet().VersionGet()
 
         # create and configure the port.
         self.port = self.server.PortCreate(self.server_interface)
@@ -198,15 +210,29 @@ class Example:
         # - DeviceStatus_Running
         # As soon the device has finished the test, it will return to
         # 'DeviceStatus_Reserved', since we have a Lock on the device.
+        #
+        # The HTTP server runs on the ByteBlower port, its TCP results are
+        # available while the test runs.  The changes in throughput and
+        # round trip time are reported as soon as they are detected.
         status = self.wireless_endpoint.StatusGet()
         start_moment = datetime.datetime.now()
+        tcp_history = None
+        live = None
         while status != api.DeviceStatus.Reserved:
             time.sleep(1)
             status = self.wireless_endpoint.StatusGet()
             now = datetime.datetime.now()
+            client_idents = http_server.ClientIdentifiersGet()
             print(str(now), ":: Running for", str(now - start_moment), "::",
-                  http_server.ClientIdentifiersGet().size(),
-                  "client(s) connected")
+                  client_idents.size(), "client(s) connected")
+
+            if tcp_history is None and client_idents.size() > 0:
+                http_session = http_server.HttpSessionInfoGet(client_idents[0])
+                tcp_history = http_session.TcpSessionInfoGet().ResultHistoryGet()
+                live = self.follow_changes(tcp_history)
+            if live is not None:
+                tcp_history.Refresh()
+                live.poll()
 
         # Wireless Endpoint has returned. Collect and process the results.
 
@@ -224,7 +250,10 @@ class Example:
         http_hist.Refresh()
 
         # save the results to CSV, this allows further analysis afterwards
-        collected_results = self.collect_results(http_session)
+        if tcp_history is None:
+            tcp_history = http_session.TcpSessionInfoGet().ResultHistoryGet()
+            live = self.follow_changes(tcp_history)
+        collected_results = self.collect_results(tcp_history, live)
 
         cumulative_result = http_hist.CumulativeLatestGet()
         mbit_s = cumulative_result.AverageDataSpeedGet().MbpsGet()
@@ -267,33 +296,47 @@ class Example:
         # No device found, return None
         return None
 
-    def collect_results(self, http_session):
-        """" Function that writes the results to CSV files.
+    def follow_changes(self, tcp_history):
+        """Follows the TCP results of the session while the test runs
+
+        Flags the moments the throughput or round trip time changed level.
+
+        :rtype: change_detection.LiveChangeDetector
         """
+        return LiveChangeDetector(tcp_history,
+                                  ['tcp_tx_bytes', 'tcp_rx_bytes',
+                                   'tcp_roundtriptime_current'],
+                                  self.tcp_sample)
 
-        tcp_session = http_session.TcpSessionInfoGet()
-        tcp_history = tcp_session.ResultHistoryGet()
+    @staticmethod
+    def tcp_sample(tcp_sample):
+        # type: (api.TCPResultData) -> dict
+        return {
+            'timestamp': tcp_sample.TimestampGet(),
+            'tcp_tx_bytes': tcp_sample.TxByteCountTotalGet(),
+            'tcp_rx_bytes': tcp_sample.RxByteCountTotalGet(),
+            'tcp_roundtriptime_min': tcp_sample.RoundTripTimeMinimumGet(),
+            'tcp_roundtriptime_max': tcp_sample.RoundTripTimeMaximumGet(),
+            'tcp_roundtriptime_current': tcp_sample.RoundTripTimeCurrentGet(),
+            'tcp_congestionwindow_current': tcp_sample.CongestionWindowCurrentGet(),
+        }
 
-        samples = []
+    def collect_results(self, tcp_history, live):
+        """" Function that writes the results to CSV files.
 
-        for tcp_sample in tcp_history.IntervalGet():  # type: api.TCPResultData
-            sample_timestamp = tcp_sample.TimestampGet()
-            samples.append({
-                'timestamp': sample_timestamp,
-                'tcp_tx_bytes': tcp_sample.TxByteCountTotalGet(),
-                'tcp_rx_bytes': tcp_sample.RxByteCountTotalGet(),
-                'tcp_roundtriptime_min': tcp_sample.RoundTripTimeMinimumGet(),
-                'tcp_roundtriptime_max': tcp_sample.RoundTripTimeMaximumGet(),
-                'tcp_roundtriptime_current': tcp_sample.RoundTripTimeCurrentGet(),
-                'tcp_congestionwindow_current': tcp_sample.CongestionWindowCurrentGet(),
-            })
+        The samples which were not processed while the test ran are
+        processed first.
+        """
+        tcp_history.Refresh()
+        live.finish()
 
         return {
             'we': {
                 'uuid': self.wireless_endpoint.DeviceIdentifierGet(),
                 'givenname': self.wireless_endpoint.DeviceInfoGet().GivenNameGet()
             },
-            'samples': samples
+            'samples': live.samples,
+            'change_points': live.change_points,
         }
 
     @staticmethod
@@ -324,3 +367,19 @@ if __name__ == '__main__':
 
     with open('ipv4_tcp_history.json', 'w') as handle:
         json.dump(results, handle, indent=4)
+
+    if configuration.get('results_database') is not None:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     '..', 'demo_scripts'))
+        from results_db import ResultsDatabase
+
+        with ResultsDatabase(configuration['results_database']) as database:
+            run_id = database.add_run(
+                'ipv4_tcp_history', configuration,
+                server_version=example.server_version,
+                dut=results['we']['givenname'])
+            database.add_interval_results(run_id, results['samples'],
+                                          'timestamp')
+            database.add_change_points(run_id, results['change_points'])
+        print("Results stored as run", run_id, "in",
+              configuration['results_database'])
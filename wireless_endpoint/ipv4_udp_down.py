@@ -7,10 +7,21 @@ ByteBlowerPort --> WirelessEndpoint
 """
 
 from __future__ import print_function
+
+import json
+import os
+import sys
+
 # We want to use the ByteBlower python API, so import it
 from byteblowerll.byteblower import ByteBlower
 from byteblowerll.byteblower import DeviceStatus
 
+# The change detection is shared with the back2back examples
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'back2back'))
+from change_detection import ChangeDetector, describe_change
+from history_manager import size_history
+
 # We will use scapy to build the frames, scapy will be imported when needed.
 
 
@@ -194,6 +205,9 @@ class Example:
         trigger.FilterUdpDestinationPortSet(self.udp_dstport)
         trigger.FilterSourceAddressSet(port_ipv4)
 
+        # Keep an interval result for every interval of the test
+        size_history(trigger.ResultHistoryGet(), duration_ns)
+
         # Now all configuration is made
         print(stream.DescriptionGet())
         print(trigger.DescriptionGet())
@@ -243,11 +257,45 @@ class Example:
         print("Transmitted", tx_packets, "packets")
         print("Received   ", rx_packets, "packets")
 
+        intervals, change_points = self.collect_intervals(trigger)
+
         return {
             'tx': tx_packets,
-            'rx': rx_packets
+            'rx': rx_packets,
+            'intervals': intervals,
+            'change_points': change_points,
         }
 
+    @staticmethod
+    def collect_intervals(trigger):
+        """
+        Collects the interval results of the trigger, and flags the moments
+        the received throughput changed level.
+        :return: the interval results and the change points
+        """
+        history = trigger.ResultHistoryGet()
+        history.Refresh()
+        interval_duration = history.SamplingIntervalDurationGet()
+
+        detector = ChangeDetector(['rx_throughput_bits_per_second'])
+        intervals = []
+        for interval in history.IntervalGet():
+            intervals.append({
+                'timestamp': interval.TimestampGet(),
+                'rx_packets': interval.PacketCountGet(),
+                'rx_bytes': interval.ByteCountGet(),
+                'rx_throughput_bits_per_second':
+                    interval.ByteCountGet() * 8 * 1e9 / interval_duration,
+            })
+            detector.add(intervals[-1]['timestamp'], intervals[-1])
+        detector.flush()
+
+        first_timestamp = intervals[0]['timestamp'] if intervals else 0
+        for change in detector.change_points:
+            print("Change detected at", describe_change(change, first_timestamp))
+
+        return intervals, detector.change_points
+
     def cleanup(self):
         instance = ByteBlower.InstanceGet()
 
@@ -277,6 +325,9 @@ class Example:
 if __name__ == '__main__':
     example = Example(**configuration)
     try:
-        example.run()
+        results = example.run()
     finally:
         example.cleanup()
+
+    with open('ipv4_udp_down.json', 'w') as handle:
+        json.dump(results, handle, indent=4)
@@ -0,0 +1,132 @@
+"""
+UDP port allocation for the flows of Wireless Endpoints.
+
+Unlike on a ByteBlower server, every stream and every trigger on a Wireless
+Endpoint needs its own UDP port.  A single counter for all flows wraps
+around after 61440 flows and hands out ports which are still in use.
+
+The allocator keeps the ports per device:
+  - a port is handed out only once, until it is released,
+  - released ports go to a free list, they are reused in the order they
+    were released (the oldest one first, so late frames of a finished flow
+    do not end up in a new one),
+  - allocating and releasing on a single device take constant time, all
+    calls are thread safe.
+
+A flow which is received by a trigger on a ByteBlower port needs a port which
+is free on both ends: the trigger filters on the UDP port, two Wireless
+Endpoints sending to the same ByteBlower port with the same UDP port would be
+counted by each other's trigger.  allocate() and release() take all devices
+of the flow.
+
+Usage:
+    ports = UdpPortAllocator()
+    port = ports.allocate(wireless_endpoint, byteblower_port)
+    ...
+    ports.release(port, wireless_endpoint, byteblower_port)
+
+This module is guaranteed to work with Python 2.7 and above.
+"""
+
+from __future__ import print_function
+
+import threading
+from collections import deque
+
+
+class PortsExhausted(Exception):
+    pass
+
+
+class _DevicePorts(object):
+    """The ports of a single device"""
+
+    def __init__(self, first):
+        # Ports from here on were never used
+        self.next_unused = first
+        self.free = deque()
+        self.in_use = set()
+
+
+class UdpPortAllocator(object):
+    """Unique UDP ports per device
+
+    :param first: The lowest port to hand out
+    :param last: The highest port to hand out
+    """
+
+    def __init__(self, first=4096, last=65535):
+        self.first = first
+        self.last = last
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    @staticmethod
+    def device_key(device):
+        """Wireless Endpoints are known by their UUID, other devices
+        (e.g. a ByteBlower port) by themselves"""
+        get_identifier = getattr(device, 'DeviceIdentifierGet', None)
+        if get_identifier is not None:
+            return get_identifier()
+        return device
+
+    def _ports(self, device):
+        key = self.device_key(device)
+        ports = self._devices.get(key)
+        if ports is None:
+            ports = self._devices[key] = _DevicePorts(self.first)
+        return ports
+
+    def allocate(self, *devices):
+        """A UDP port which is not in use on any of the devices
+
+        :raises PortsExhausted: when no port is free on all devices
+        """
+        with self._lock:
+            all_ports = [self._ports(device) for device in devices]
+            first, others = all_ports[0], all_ports[1:]
+
+            port = None
+            for index, candidate in enumerate(first.free):
+                if all(candidate not in ports.in_use for ports in others):
+                    port = candidate
+                    del first.free[index]
+                    break
+            if port is None:
+                port = max(ports.next_unused for ports in all_ports)
+                if port > self.last:
+                    raise PortsExhausted(
+                        "All UDP ports %d-%d are in use on %s"
+                        % (self.first, self.last,
+                           ', '.join(str(self.device_key(device))
+                                     for device in devices)))
+
+            for ports in all_ports:
+                if port < ports.next_unused:
+                    if port in ports.free:
+                        ports.free.remove(port)
+                else:
+                    # The ports which are skipped on this device stay free
+                    ports.free.extend(range(ports.next_unused, port))
+                    ports.next_unused = port + 1
+                ports.in_use.add(port)
+            return port
+
+    def release(self, port, *devices):
+        """Returns a port to the devices, e.g. when the flow is removed"""
+        with self._lock:
+            for device in devices:
+                ports = self._ports(device)
+                if port in ports.in_use:
+                    ports.in_use.remove(port)
+                    ports.free.append(port)
+
+    def release_device(self, device):
+        """Forgets all ports of a device"""
+        with self._lock:
+            self._devices.pop(self.device_key(device), None)
+
+    def in_use(self, device):
+        """The ports of the device which are in use"""
+        with self._lock:
+            return set(self._ports(device).in_use)